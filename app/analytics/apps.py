@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class AnalyticsConfig(AppConfig):
     name = 'analytics'
+
+    def ready(self):
+        # Mantenemos el cubo de mermas diarias al guardar o eliminar mermas
+        from analytics import cubo_mermas
+        cubo_mermas.conectar()
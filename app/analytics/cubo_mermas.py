@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.db.models.signals import post_save, post_delete
+
+from core import models
+
+
+"""
+-----------------------------------------------------------------------------------
+Cubo de mermas diarias.
+
+El reporte de mermas en el tiempo lee MermaDiaria, que acumula las MermaIngrediente
+por almacen, ingrediente y fecha (la 'fecha_final' de la merma). Cada vez que
+cambian las mermas de un día se recalculan las celdas de ese día.
+
+Las operaciones masivas (bulk_create, update) no disparan señales, así que quien
+las use debe llamar 'actualizar()' con el almacen y las fechas afectadas (ver
+ReporteMermasCreateSerializer).
+
+Dos requests pueden recalcular el mismo día de un almacen al mismo tiempo, así
+que la lectura de las mermas y el reemplazo de las celdas se hacen con la fila del
+almacen bloqueada.
+-----------------------------------------------------------------------------------
+"""
+
+
+"""
+-----------------------------------------------------------------------------------
+Recalcula las celdas del cubo de un almacen para las fechas indicadas con una sola
+lectura agrupada de sus MermaIngrediente
+-----------------------------------------------------------------------------------
+"""
+def actualizar(almacen_id, fechas):
+
+    fechas = {fecha for fecha in fechas if fecha is not None}
+    if not fechas:
+        return
+
+    with transaction.atomic():
+        # Leemos las mermas ya con el almacen bloqueado para ver lo último confirmado
+        list(models.Almacen.objects.select_for_update().filter(id=almacen_id).values_list('id', flat=True))
+
+        celdas = (models.MermaIngrediente.objects
+                    .filter(almacen_id=almacen_id, fecha_final__in=fechas)
+                    .values('ingrediente', 'fecha_final')
+                    .annotate(suma_ventas=Sum('consumo_ventas'), suma_real=Sum('consumo_real'), num_mermas=Count('id'))
+                    .order_by()
+                )
+
+        mermas_diarias = []
+        for celda in celdas:
+            # La merma y el porcentaje del día se calculan igual que los de una MermaIngrediente
+            merma, porcentaje = models.calcular_merma(celda['suma_ventas'], celda['suma_real'])
+            mermas_diarias.append(models.MermaDiaria(
+                almacen_id=almacen_id,
+                ingrediente_id=celda['ingrediente'],
+                fecha=celda['fecha_final'],
+                consumo_ventas=celda['suma_ventas'],
+                consumo_real=celda['suma_real'],
+                merma=merma,
+                porcentaje=porcentaje,
+                num_mermas=celda['num_mermas']
+            ))
+
+        models.MermaDiaria.objects.filter(almacen_id=almacen_id, fecha__in=fechas).delete()
+        models.MermaDiaria.objects.bulk_create(mermas_diarias)
+
+def actualizar_merma(sender, instance, **kwargs):
+    actualizar(instance.almacen_id, [instance.fecha_final])
+
+
+def conectar():
+    post_save.connect(actualizar_merma, sender=models.MermaIngrediente, dispatch_uid='cubo_mermas_merma_save')
+    post_delete.connect(actualizar_merma, sender=models.MermaIngrediente, dispatch_uid='cubo_mermas_merma_delete')
@@ -0,0 +1,174 @@
+from django.http import StreamingHttpResponse, FileResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from core import models
+from analytics import motor_restock
+from analytics import snapshots_restock
+from analytics import reporte_restock_02 as restock_02
+from analytics import reporte_stock
+from analytics import reporte_costo_stock
+from analytics.reporte_costo_stock import redondear
+
+import csv
+import tempfile
+
+
+"""
+-----------------------------------------------------------------------------------
+Exportación de los reportes a CSV y XLSX.
+
+Las filas de cada reporte se generan una por una leyendo los querysets con
+'iterator()' (en PostgreSQL es un cursor del lado del servidor), así que la memoria
+no crece con el número de sucursales, almacenes o botellas exportadas:
+
+- CSV: cada fila se escribe al response conforme se genera (StreamingHttpResponse)
+- XLSX: openpyxl en modo 'write_only' escribe las filas a un archivo temporal que
+  después se envía con FileResponse
+-----------------------------------------------------------------------------------
+"""
+FORMATOS = ('csv', 'xlsx')
+
+# Filas que se leen del cursor por viaje a la base de datos
+TAMANO_LOTE = 2000
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+"""
+-----------------------------------------------------------------------------------
+Buffer para 'csv.writer' que regresa la fila escrita en lugar de guardarla
+-----------------------------------------------------------------------------------
+"""
+class Eco:
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(filas):
+
+    writer = csv.writer(Eco())
+
+    # BOM para que Excel abra el archivo como UTF-8
+    yield '\ufeff'
+
+    for fila in filas:
+        yield writer.writerow(fila)
+
+
+def respuesta_csv(nombre, filas):
+
+    response = StreamingHttpResponse(generar_csv(filas), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="{}.csv"'.format(nombre)
+    return response
+
+
+def respuesta_xlsx(nombre, filas):
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(nombre[:31])
+    for fila in filas:
+        hoja.append(fila)
+
+    archivo = tempfile.TemporaryFile()
+    libro.save(archivo)
+    archivo.seek(0)
+
+    return FileResponse(archivo, as_attachment=True, filename='{}.xlsx'.format(nombre), content_type=CONTENT_TYPE_XLSX)
+
+
+def respuesta(formato, nombre, filas):
+
+    if formato == 'xlsx':
+        return respuesta_xlsx(nombre, filas)
+
+    return respuesta_csv(nombre, filas)
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Stock: unidades por Producto de cada sucursal (sin botellas vacías ni
+perdidas)
+-----------------------------------------------------------------------------------
+"""
+def filas_stock(sucursales_id):
+
+    yield ['Sucursal', 'Producto', 'Categoria', 'Unidades']
+
+    productos = reporte_stock.get_productos_stock(sucursales_id)
+
+    for _, sucursal, _, nombre_marca, categoria, unidades in productos.iterator(chunk_size=TAMANO_LOTE):
+        yield [sucursal, nombre_marca, categoria, unidades]
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Costo de Stock: volumen y costo de cada botella (sin botellas vacías).
+Se filtra por almacen o por sucursales.
+-----------------------------------------------------------------------------------
+"""
+def filas_costo_stock(almacen_id=None, sucursales_id=None):
+
+    yield ['Sucursal', 'Almacen', 'Folio', 'Ingrediente', 'Capacidad', 'Precio Unitario', 'Peso Actual', 'Volumen ml', 'Costo ml', 'Costo Botella']
+
+    botellas = reporte_costo_stock.get_botellas_costo(almacen_id=almacen_id, sucursales_id=sucursales_id)
+
+    botellas = botellas.values_list(
+        'almacen__sucursal__nombre', 'almacen__nombre', 'folio', 'ingrediente', 'capacidad',
+        'precio_unitario', 'peso_actual', 'volumen_ml', 'costo_ml', 'costo_botella'
+    ).order_by('almacen__sucursal__nombre', 'almacen__nombre', 'almacen_id', 'folio')
+
+    for (sucursal, almacen, folio, ingrediente, capacidad, precio_unitario, peso_actual, volumen_ml, costo_ml, costo_botella) in botellas.iterator(chunk_size=TAMANO_LOTE):
+        yield [
+            sucursal, almacen, folio, ingrediente, capacidad,
+            redondear(precio_unitario), peso_actual, redondear(volumen_ml), redondear(costo_ml), redondear(costo_botella)
+        ]
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Mermas x Tiempo: mermas diarias por ingrediente (ver cubo_mermas.py).
+Se filtra por almacen o por sucursales.
+-----------------------------------------------------------------------------------
+"""
+def filas_mermas_tiempo(fecha_inicial, fecha_final, almacen_id=None, sucursales_id=None):
+
+    yield ['Sucursal', 'Almacen', 'Ingrediente', 'Categoria', 'Fecha', 'Consumo Facturado', 'Consumo Real', 'Merma', 'Porcentaje', 'Tragos']
+
+    mermas = models.MermaDiaria.objects.filter(fecha__gte=fecha_inicial, fecha__lte=fecha_final)
+    if almacen_id is not None:
+        mermas = mermas.filter(almacen_id=almacen_id)
+    else:
+        mermas = mermas.filter(almacen__sucursal__in=sucursales_id)
+
+    mermas = mermas.values_list(
+        'almacen__sucursal__nombre', 'almacen__nombre', 'ingrediente__nombre', 'ingrediente__categoria__nombre',
+        'fecha', 'consumo_ventas', 'consumo_real', 'merma', 'porcentaje'
+    ).order_by('almacen__sucursal__nombre', 'almacen__nombre', 'almacen_id', 'ingrediente__nombre', 'fecha')
+
+    for (sucursal, almacen, ingrediente, categoria, fecha, consumo_ventas, consumo_real, merma, porcentaje) in mermas.iterator(chunk_size=TAMANO_LOTE):
+        merma = redondear(merma)
+        yield [
+            sucursal, almacen, ingrediente, categoria, fecha.strftime('%Y-%m-%d'),
+            redondear(consumo_ventas) or 0, redondear(consumo_real) or 0, merma, redondear(porcentaje),
+            round((merma / 60) * -1, 1)
+        ]
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Restock 02: los productos a surtir de cada sucursal, tomados de su
+SnapshotRestock (ver snapshots_restock.py). Solo hay un snapshot en memoria a la vez.
+-----------------------------------------------------------------------------------
+"""
+def filas_restock_02(sucursales_id, dias=motor_restock.DIAS, dias_entrega=motor_restock.DIAS_ENTREGA):
+
+    columnas = ['Producto', 'Capacidad', 'Precio', 'Demanda', 'Stock', 'Faltante', 'Compra', 'Subtotal', 'IVA', 'Total']
+    yield ['Sucursal'] + columnas
+
+    for sucursal_id in sucursales_id:
+        snapshot = snapshots_restock.get_snapshot(sucursal_id, dias, dias_entrega)
+        reporte = restock_02.formatear(snapshot.sucursal, snapshots_restock.get_productos(snapshot), timezone.localtime(snapshot.fecha_actualizacion).date())
+
+        for producto in reporte.get('data', []):
+            yield [snapshot.sucursal.nombre] + [producto[columna] for columna in columnas]
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core import models
+from analytics import snapshots_restock
+
+
+class Command(BaseCommand):
+    """Django command to recompute the restock snapshots of every sucursal (meant to run nightly from cron)"""
+
+    help = 'Recalcula los snapshots del reporte de Restock de todas las sucursales (o solo de las indicadas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursal', type=int, action='append', help='Id de la sucursal a actualizar (se puede repetir)')
+
+    def handle(self, *args, **options):
+
+        sucursales = models.Sucursal.objects.order_by('id')
+        if options['sucursal']:
+            sucursales = sucursales.filter(id__in=options['sucursal'])
+
+        sucursales = list(sucursales.values_list('id', 'nombre'))
+
+        for sucursal_id, nombre in sucursales:
+            snapshots_restock.actualizar_sucursal(sucursal_id)
+            self.stdout.write('Sucursal {} ({}) actualizada'.format(nombre, sucursal_id))
+
+        self.stdout.write(self.style.SUCCESS('{} sucursales actualizadas'.format(len(sucursales))))
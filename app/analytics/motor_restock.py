@@ -0,0 +1,153 @@
+from django.db.models import F, Q, Sum, Avg, ExpressionWrapper, DecimalField, IntegerField, Case, When
+from django.db.models.functions import Cast, Ceil, Coalesce, Greatest
+from django.utils import timezone
+from core import models
+from core import linea_tiempo
+
+import datetime
+
+
+"""
+-----------------------------------------------------------------------------------
+Motor del reporte de Restock.
+
+Calcula por Producto de una sucursal, en un solo query agrupado:
+
+- 'stock_ml': volumen actual de las botellas
+- 'demanda_ml': consumo de las botellas en los últimos 'dias' días
+- 'necesidad_ml': demanda para cubrir los próximos 'dias' días más el tiempo de
+  entrega del proveedor ('dias_entrega')
+- 'faltante_ml': necesidad que no alcanza a cubrir el stock
+- 'compra': botellas a comprar para cubrir el faltante
+
+Los endpoints 'get_reporte_restock' y 'get_reporte_restock_02' solo le dan formato
+al resultado (ver reporte_restock.py y reporte_restock_02.py).
+-----------------------------------------------------------------------------------
+"""
+DIAS = 7
+DIAS_ENTREGA = 0
+
+# Límites de los parámetros que aceptan los endpoints
+MAX_DIAS = 90
+MAX_DIAS_ENTREGA = 60
+
+
+"""
+-----------------------------------------------------------------------------------
+Botellas de la sucursal relevantes para el periodo, anotadas con su 'consumo_ml'
+y su 'volumen_actual':
+
+- Las que ya estaban antes y no han salido
+- Las que ya estaban antes y salieron
+- Las que entraron y salieron en el periodo
+- Las que entraron en el periodo y no han salido
+-----------------------------------------------------------------------------------
+"""
+def get_botellas_periodo(sucursal_id, fecha_inicial, fecha_final):
+
+    botellas = models.Botella.objects.filter(sucursal__id=sucursal_id).filter(
+        Q(fecha_registro__lte=fecha_inicial, fecha_baja=None) |
+        Q(fecha_registro__lte=fecha_inicial, fecha_baja__gte=fecha_inicial, fecha_baja__lte=fecha_final) |
+        Q(fecha_registro__gte=fecha_inicial, fecha_baja__lte=fecha_final) |
+        Q(fecha_registro__gte=fecha_inicial, fecha_baja=None)
+    )
+
+    periodo = linea_tiempo.expresiones_periodo(fecha_inicial, fecha_final)
+
+    botellas = botellas.annotate(
+        num_inspecciones=Coalesce(F('linea_tiempo__num_inspecciones'), 0),
+        inspecciones_periodo=periodo['inspecciones_periodo'],
+        inspecciones_peso_ok_count=periodo['inspecciones_peso_ok_count'],
+        peso_inicio_periodo=periodo['peso_primera_pesada'],
+    )
+
+    # Peso de la botella al inicio del periodo
+    botellas = botellas.annotate(
+        peso_inspeccion_inicial=Case(
+
+            # La botella no tiene inspecciones
+            When(num_inspecciones=0, then=F('peso_inicial')),
+
+            # Ninguna inspección ocurrió en el periodo analizado
+            When(inspecciones_periodo=None, then=F('peso_actual')),
+
+            # Su única inspección ocurrió en el periodo analizado
+            When(num_inspecciones=1, then=F('peso_inicial')),
+
+            # Tiene más de una inspección y al menos una en el periodo, pero ninguna con peso
+            When(inspecciones_peso_ok_count=None, then=F('peso_actual')),
+
+            # Tiene más de una inspección y al menos una con peso en el periodo
+            default=F('peso_inicio_periodo'),
+            output_field=IntegerField()
+        )
+    )
+
+    densidad = 2 - F('producto__ingrediente__factor_peso')
+
+    return botellas.annotate(
+        consumo_ml=ExpressionWrapper((F('peso_inspeccion_inicial') - F('peso_actual')) * densidad, output_field=DecimalField()),
+        volumen_actual=ExpressionWrapper((F('peso_actual') - F('peso_cristal')) * densidad, output_field=DecimalField()),
+    )
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna la lista de Productos que hay que surtir, ordenada por 'compra' de mayor a
+menor:
+
+[
+    {
+        'producto_id': 1,
+        'producto': 'JW BLACK 750',
+        'capacidad': 750,
+        'precio_lista': Decimal('560.50'),     # Precio del Producto
+        'precio_promedio': Decimal('580.00'),  # Precio promedio de sus botellas
+        'stock_ml': Decimal('747.60'),
+        'demanda_ml': Decimal('1495.20'),
+        'necesidad_ml': Decimal('1495.20'),
+        'faltante_ml': Decimal('747.60'),
+        'compra': 1
+    },
+]
+
+Todo se calcula en la base de datos: las botellas del periodo se agrupan por
+Producto y el faltante y la compra se calculan sobre los agregados.
+-----------------------------------------------------------------------------------
+"""
+def calcular(sucursal_id, dias=DIAS, dias_entrega=DIAS_ENTREGA, fecha_final=None):
+
+    fecha_final = fecha_final or timezone.localdate()
+    fecha_inicial = fecha_final - datetime.timedelta(days=dias)
+
+    botellas = get_botellas_periodo(sucursal_id, fecha_inicial, fecha_final)
+
+    productos = (botellas
+        .values('producto_id', 'producto__nombre_marca', 'producto__capacidad', 'producto__precio_unitario')
+        .annotate(
+            precio_promedio=Avg('precio_unitario'),
+            stock_ml=Sum('volumen_actual'),
+            demanda_ml=Sum('consumo_ml'),
+        )
+        .annotate(necesidad_ml=ExpressionWrapper(F('demanda_ml') * (dias + dias_entrega) / dias, output_field=DecimalField()))
+        .annotate(faltante_ml=Greatest(F('necesidad_ml') - F('stock_ml'), 0, output_field=DecimalField()))
+        .annotate(compra=Cast(Ceil(F('faltante_ml') / F('producto__capacidad')), IntegerField()))
+        .filter(faltante_ml__gt=0)
+        .order_by('-compra', 'producto__nombre_marca')
+    )
+
+    return [
+        {
+            'producto_id': producto['producto_id'],
+            'producto': producto['producto__nombre_marca'],
+            'capacidad': producto['producto__capacidad'],
+            'precio_lista': producto['producto__precio_unitario'],
+            'precio_promedio': producto['precio_promedio'],
+            'stock_ml': producto['stock_ml'],
+            'demanda_ml': producto['demanda_ml'],
+            'necesidad_ml': producto['necesidad_ml'],
+            'faltante_ml': producto['faltante_ml'],
+            'compra': producto['compra'],
+        }
+        for producto in productos
+    ]
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, connections
+
+
+"""
+-----------------------------------------------------------------------------------
+Ejecución en paralelo de cálculos independientes por sucursal.
+
+Cada hilo usa su propia conexión a la base de datos (Django las guarda por hilo),
+así que los queries de las sucursales corren al mismo tiempo en PostgreSQL. Al
+terminar cada tarea el hilo cierra su conexión para no dejarla abierta.
+
+Se ejecuta uno por uno cuando:
+
+- Hay una sola tarea o ANALYTICS_HILOS es 1
+- Estamos dentro de una transacción: las conexiones de los hilos no verían los
+  datos que todavía no se confirman (p. ej. en los tests)
+-----------------------------------------------------------------------------------
+"""
+def get_hilos():
+    return getattr(settings, 'ANALYTICS_HILOS', 4)
+
+
+def ejecutar_tarea(funcion, llave):
+
+    try:
+        return funcion(llave)
+    finally:
+        connections.close_all()
+
+
+"""
+-----------------------------------------------------------------------------------
+Aplica 'funcion' a cada llave y retorna un diccionario {llave: resultado} en el
+orden de las llaves
+-----------------------------------------------------------------------------------
+"""
+def ejecutar(funcion, llaves):
+
+    llaves = list(llaves)
+    hilos = min(get_hilos(), len(llaves))
+
+    if hilos < 2 or connection.in_atomic_block:
+        return {llave: funcion(llave) for llave in llaves}
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        resultados = pool.map(lambda llave: ejecutar_tarea(funcion, llave), llaves)
+        return dict(zip(llaves, resultados))
@@ -6,72 +6,77 @@ import datetime
 from decimal import Decimal, ROUND_UP
 
 
-def get_costo_stock(almacen):
+# Campos de cada botella en el reporte
+COLUMNAS = ('folio', 'ingrediente', 'capacidad', 'precio_unitario', 'peso_actual', 'volumen_ml', 'costo_ml', 'costo_botella')
 
-    # Si no hay botellas registradas en el almacen, entonces status = 0
-    if almacen.botellas_almacen.all().count() == 0:
-        return {'status': '0'}
 
-    # Tomamos todas las botellas del almacen
-    botellas = models.Botella.objects.filter(almacen=almacen)
+def redondear(valor):
+    return None if valor is None else float(Decimal(valor).quantize(Decimal('.01'), rounding=ROUND_UP))
+
 
-    # Excluimos las botellas vacias
-    botellas = botellas.exclude(estado='0')
+"""
+-------------------------------------------------------------------------
+Agrega a un queryset de Botellas los campos 'volumen_ml', 'costo_ml' y
+'costo_botella'
+-------------------------------------------------------------------------
+"""
+def anotar_costos(botellas):
 
-    #----------------------------------------------------------------------
-    # Agregamos el campo 'volumen_ml'
-    volumen_botellas = botellas.annotate(
+    return botellas.annotate(
         volumen_ml=ExpressionWrapper(
             (F('peso_actual') - F('peso_cristal')) * (2 - F('producto__ingrediente__factor_peso')),
             output_field=DecimalField()
-        )
+        ),
+        costo_ml=ExpressionWrapper(F('precio_unitario') / F('capacidad'), output_field=DecimalField()),
+    ).annotate(
+        costo_botella=ExpressionWrapper(F('costo_ml') * F('volumen_ml'), output_field=DecimalField())
     )
 
-    #----------------------------------------------------------------------
-    # Agregamos el campo 'costo_ml'
-    costo_ml_botellas = volumen_botellas.annotate(
-        costo_ml=ExpressionWrapper(
-            F('precio_unitario') / F('capacidad'),
-            output_field=DecimalField()
-        )
-    )
 
-    #----------------------------------------------------------------------
-    # Agregamos el campo 'costo_botella'
-    costo_botellas = costo_ml_botellas.annotate(
-        costo_botella=ExpressionWrapper(
-            F('costo_ml') * F('volumen_ml'),
-            output_field=DecimalField()
-        )
-    )
+"""
+-------------------------------------------------------------------------
+Queryset con el volumen y el costo de las botellas en stock (sin botellas
+vacías) de un almacen o de varias sucursales.
 
-    #----------------------------------------------------------------------
-    # Calculamos el costo total del stock
-    costo_total = costo_botellas.aggregate(Sum('costo_botella', output_field=DecimalField()))
+También lo usan el reporte de varias sucursales y la exportación.
+-------------------------------------------------------------------------
+"""
+def get_botellas_costo(almacen_id=None, sucursales_id=None):
 
+    botellas = models.Botella.objects.exclude(estado=models.Botella.VACIA)
 
-    print('COSTO BOTELLAS')
-    print(costo_botellas.values('folio', 'ingrediente', 'capacidad', 'precio_unitario', 'peso_actual', 'volumen_ml', 'costo_ml', 'costo_botella'))
+    if almacen_id is not None:
+        botellas = botellas.filter(almacen_id=almacen_id)
+    else:
+        botellas = botellas.filter(almacen__sucursal__in=sucursales_id)
 
-    lista_costos = list(costo_botellas.values('folio', 'ingrediente', 'capacidad', 'precio_unitario', 'peso_actual', 'volumen_ml', 'costo_ml', 'costo_botella'))
+    return anotar_costos(botellas)
 
-    for item in lista_costos:
-        item['precio_unitario'] = float(item['precio_unitario'].quantize(Decimal('.01'), rounding=ROUND_UP))
-        item['volumen_ml'] = float(item['volumen_ml'].quantize(Decimal('.01'), rounding=ROUND_UP))
-        item['costo_ml'] = float(item['costo_ml'].quantize(Decimal('.01'), rounding=ROUND_UP))
-        item['costo_botella'] = float(item['costo_botella'].quantize(Decimal('.01'), rounding=ROUND_UP))
-        #print(costo)
 
-    print('::: LISTA COSTOS :::')
-    print(lista_costos)
+def formatear_botella(botella):
+
+    return {
+        'folio': botella['folio'],
+        'ingrediente': botella['ingrediente'],
+        'capacidad': botella['capacidad'],
+        'precio_unitario': redondear(botella['precio_unitario']),
+        'peso_actual': botella['peso_actual'],
+        'volumen_ml': redondear(botella['volumen_ml']),
+        'costo_ml': redondear(botella['costo_ml']),
+        'costo_botella': redondear(botella['costo_botella'])
+    }
 
-    fecha = datetime.date.today()
-    fecha = fecha.strftime("%d/%m/%Y")
 
-    costo_total = float(costo_total['costo_botella__sum'].quantize(Decimal('.01'), rounding=ROUND_UP))
+def get_costo_stock(almacen):
 
-    print("::: COSTO TOTAL STOCK :::")
-    print(costo_total)
+    botellas = list(get_botellas_costo(almacen_id=almacen.id).values(*COLUMNAS).order_by('folio'))
+
+    # Si no hay botellas en stock en el almacen, entonces status = 0
+    if len(botellas) == 0:
+        return {'status': '0'}
+
+    fecha = datetime.date.today()
+    fecha = fecha.strftime("%d/%m/%Y")
 
     reporte = {
         'status': '1',
@@ -79,9 +84,8 @@ def get_costo_stock(almacen):
         'nombre_almacen': almacen.nombre,
         'sucursal': almacen.sucursal.nombre,
         'fecha': fecha,
-        'costo_total': costo_total,
-        'data': lista_costos
+        'costo_total': redondear(sum(botella['costo_botella'] or 0 for botella in botellas)),
+        'data': [formatear_botella(botella) for botella in botellas]
     }
 
     return reporte
-
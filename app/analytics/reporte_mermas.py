@@ -1,5 +1,5 @@
 from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Func, ExpressionWrapper, DecimalField, BooleanField, CharField, DateTimeField, Case, When, IntegerField, Value
-from django.db.models.functions import Greatest
+from django.db.models.functions import Greatest, Coalesce, NullIf
 from core import models
 from decimal import Decimal, ROUND_UP
 
@@ -30,20 +30,12 @@ def calcular_consumos(inspeccion, fecha_inicial, fecha_final):
     -------------------------------------------------------------------------
     Snippets útiles
 
+    Los pesos de la última y penúltima inspección de cada botella salen
+    de su línea de tiempo (ver core/linea_tiempo.py)
     -------------------------------------------------------------------------
     """
-    # Subquery: Selección de 'peso_botella' de la penúltima inspeccion
-    sq_peso_penultima_inspeccion = Subquery(models.ItemInspeccion.objects
-                                        .filter(botella=OuterRef('pk'))
-                                        .order_by('-timestamp_inspeccion')
-                                        .values('peso_botella')[1:2]
-                                    )
-    # Subquery: Selección de 'peso_botella' de la última inspeccion
-    sq_peso_ultima_inspeccion = Subquery(models.ItemInspeccion.objects
-                                    .filter(botella=OuterRef('pk'))
-                                    .order_by('-timestamp_inspeccion')
-                                    .values('peso_botella')[:1]
-                                )
+    peso_penultima_inspeccion = F('linea_tiempo__peso_penultima_inspeccion')
+    peso_ultima_inspeccion = F('linea_tiempo__peso_ultima_inspeccion')
 
     # Lista de ingredientes presentes en la Inspeccion
     items_inspeccion_2 = inspeccion.items_inspeccionados.all()
@@ -59,8 +51,9 @@ def calcular_consumos(inspeccion, fecha_inicial, fecha_final):
     # Seleccionamos todas las botellas cuyo ingrediente sea parte de la lista de ingredientes a inspeccionar
     botellas = botellas.filter(producto__ingrediente__in=ingredientes_inspeccion)
 
-    # Agregamos 'num_inspecciones'
-    botellas_num_inspecciones = botellas.annotate(num_inspecciones=Count('inspecciones_botella'))
+    # Agregamos 'num_inspecciones'. Lo tomamos de la línea de tiempo en vez de usar Count() para no agrupar
+    # el queryset de botellas y poder agrupar el consumo real por ingrediente en una sola query
+    botellas_num_inspecciones = botellas.annotate(num_inspecciones=Coalesce(F('linea_tiempo__num_inspecciones'), 0))
 
     #print('::: BOTELLAS CON INGREDIENTES A INSPECCIONAR :::')
     #print(botellas_num_inspecciones.values())
@@ -71,7 +64,7 @@ def calcular_consumos(inspeccion, fecha_inicial, fecha_final):
     botellas_peso_anterior = botellas_num_inspecciones.annotate(
         peso_anterior=Case(
             # Botellas presentas en la la inspección y con múltiples inspecciones
-            When(Q(id__in=items_inspeccion) & Q(num_inspecciones__gt=1), then=sq_peso_penultima_inspeccion),
+            When(Q(id__in=items_inspeccion) & Q(num_inspecciones__gt=1), then=peso_penultima_inspeccion),
             # Botellas presentes en la Inspección con 1 inspección
             When(Q(id__in=items_inspeccion) & Q(num_inspecciones=1), then=F('peso_inicial')),
             # Botellas VACIAS pero cuyo ingrediente es parte de los ingredientes a inspeccionar
@@ -79,7 +72,7 @@ def calcular_consumos(inspeccion, fecha_inicial, fecha_final):
             When(Q(estado='0') & Q(fecha_registro__gte=fecha_inicial, fecha_registro__lte=fecha_final), then=F('peso_inicial')),
             # Botellas VACIAS cuyo ingrediente es parte de los ingredientes a inspeccionar,
             # que se consumieron entre ambas inspecciones, pero que ya estaban registradas desde antes y tienen minimo 1 inspeccion
-            When(Q(estado='0') & Q(fecha_baja__gte=fecha_inicial, fecha_baja__lte=fecha_final, fecha_registro__lte=fecha_inicial) & Q(num_inspecciones__gt=0), then=sq_peso_ultima_inspeccion),
+            When(Q(estado='0') & Q(fecha_baja__gte=fecha_inicial, fecha_baja__lte=fecha_final, fecha_registro__lte=fecha_inicial) & Q(num_inspecciones__gt=0), then=peso_ultima_inspeccion),
             # Botellas VACIAS cuyo ingrediente es parte de los ingredientes a inspeccionar,
             # que se consumieron entre ambas inspecciones, pero que ya estaban registradas desde antes y tienen cero inspecciones
             When(Q(estado='0') & Q(fecha_baja__gte=fecha_inicial, fecha_baja__lte=fecha_final, fecha_registro__lte=fecha_inicial) & Q(num_inspecciones=0), then=F('peso_inicial'))
@@ -139,22 +132,36 @@ def calcular_consumos(inspeccion, fecha_inicial, fecha_final):
     Calculamos el CONSUMO DE VENTAS y CONSUMO REAL por ingrediente
     -----------------------------------------------------------------
     """
+    # Sumamos el consumo real de todos los ingredientes en una sola query
+    consumos_reales = (consumo_botellas
+                        .order_by()
+                        .values('producto__ingrediente')
+                        .annotate(consumo_real=Sum('consumo_ml'))
+                        .values_list('producto__ingrediente', 'consumo_real')
+                    )
+    consumos_reales = dict(consumos_reales)
+
+    # Sumamos el consumo de ventas de todos los ingredientes en una sola query
+    consumos_ventas = (models.ConsumoRecetaVendida.objects
+                        .filter(
+                            ingrediente__in=ingredientes_inspeccion,
+                            fecha__gte=fecha_inicial,
+                            fecha__lte=fecha_final,
+                            almacen=almacen
+                        )
+                        .order_by()
+                        .values('ingrediente')
+                        .annotate(consumo_ventas=Sum('volumen'))
+                        .values_list('ingrediente', 'consumo_ventas')
+                    )
+    consumos_ventas = dict(consumos_ventas)
+
+    # Consolidamos los ingredientes, su consumo de ventas y consumo real en una lista
     consumos = []
     for ingrediente in ingredientes_inspeccion:
-        # Sumamos el consumo real por ingrediente
-        botellas_ingrediente = consumo_botellas.filter(producto__ingrediente__id=ingrediente.id)
-        consumo_real = botellas_ingrediente.aggregate(consumo_real=Sum('consumo_ml'))
+        consumo_ventas = {'consumo_ventas': consumos_ventas.get(ingrediente.id)}
+        consumo_real = {'consumo_real': consumos_reales.get(ingrediente.id)}
 
-        # Sumamos el consumo de ventas por ingrediente
-        consumos_recetas = models.ConsumoRecetaVendida.objects.filter(
-            ingrediente=ingrediente,
-            fecha__gte=fecha_inicial,
-            fecha__lte=fecha_final,
-            venta__caja__almacen=almacen
-        )
-        consumo_ventas = consumos_recetas.aggregate(consumo_ventas=Sum('volumen'))
-
-        # Consolidamos los ingredientes, su consumo de ventas y consumo real en una lista
         ingrediente_consumo = (ingrediente, consumo_ventas, consumo_real)
         consumos.append(ingrediente_consumo)
 
@@ -192,7 +199,7 @@ def get_ventas_merma(merma_id):
             ingrediente=ingrediente,
             fecha__gte=merma.fecha_inicial,
             fecha__lte=merma.fecha_final,
-            venta__caja__almacen=merma.almacen
+            almacen=merma.almacen
         )
 
         consumos = consumos.values('venta')
@@ -249,78 +256,32 @@ def get_botellas_merma(merma_id):
 
     """
     ------------------------------------------------------
-    SUBQUERIES UTILES
+    VALORES UTILES
+
+    Los conteos, fechas y pesos de las inspecciones de
+    cada botella salen de su línea de tiempo
     ------------------------------------------------------
     """
-    # SUBQUERY: Las inspecciones cuyo 'peso_botella' = None
-    sq_inspecciones_none = Subquery(models.ItemInspeccion.objects
-                                .filter(botella=OuterRef('pk'), peso_botella=None)
-                                .order_by()
-                                .values('peso_botella')[:1]
-    )
-
-    # SUBQUERY: El numero de inspecciones que cuyo 'peso_botella' = None
-    sq_inspeccion_none_count = Subquery(models.ItemInspeccion.objects
-                                    .filter(botella=OuterRef('pk'))
-                                    .exclude(~Q(peso_botella=None))
-                                    .values('botella__pk')
-                                    .order_by('-timestamp_inspeccion')
-                                    .annotate(inspeccion_none=Count('id'))
-                                    .values('inspeccion_none')[:1]
-    )
-
-    # SUBQUERY: El número de inspecciones con 'peso_botella' = None
-    sq_peso_botella_none = Subquery(models.ItemInspeccion.objects
-                            .filter(botella=OuterRef('pk'))
-                            .exclude(~Q(peso_botella=None))
-                            .values('botella__pk')
-                            .annotate(inspeccion_peso_none=Count('id'))
-                            .values('inspeccion_peso_none')
-    )
-
-    # SUBQUERY: Fecha de la inspeccion con 'peso_botella' = None
-    sq_fecha_inspeccion_none = Subquery(models.ItemInspeccion.objects
-                                    .filter(botella=OuterRef('pk'))
-                                    .exclude(~Q(peso_botella=None))
-                                    .order_by('-timestamp_inspeccion')
-                                    .values('timestamp_inspeccion')[:1]
-
-    )
+    # El número de inspecciones de la botella
+    num_inspecciones = Coalesce(F('linea_tiempo__num_inspecciones'), 0)
 
-    # SUBQUERY: Fecha de la inspeccion con 'peso_botella' = OK
-    sq_fecha_inspeccion_ok = Subquery(models.ItemInspeccion.objects
-                                    .filter(botella=OuterRef('pk'))
-                                    .exclude(peso_botella=None)
-                                    .order_by('-timestamp_inspeccion')
-                                    .values('timestamp_inspeccion')[:1]
+    # La cantidad de inspecciones cuyo 'peso_botella' está OK (es decir, distinto a None)
+    peso_botella_ok = NullIf(F('linea_tiempo__num_pesadas'), 0)
 
-    )
+    # El número de inspecciones con 'peso_botella' = None
+    peso_botella_none = NullIf(F('linea_tiempo__num_inspecciones') - F('linea_tiempo__num_pesadas'), 0)
 
-    # SUBQUERY: Peso de la botella en su inspección más reciente, descartando pesos = None
-    sq_peso_ultima_inspeccion = Subquery(models.ItemInspeccion.objects
-                                    .filter(botella=OuterRef('pk'))
-                                    .order_by('-timestamp_inspeccion')
-                                    .exclude(peso_botella=None)
-                                    .values('peso_botella')[:1]
-    )
+    # Fecha de la inspeccion más reciente con 'peso_botella' = None
+    fecha_inspeccion_none = F('linea_tiempo__timestamp_ultima_sin_peso')
 
+    # Fecha de la inspeccion más reciente con 'peso_botella' = OK
+    fecha_inspeccion_ok = F('linea_tiempo__timestamp_ultima_pesada')
 
-    # SUBQUERY: Peso anterior de la botella (el peso registrado en el penúltimo ItemInspeccion)
-    sq_peso_anterior = Subquery(models.ItemInspeccion.objects
-                                .filter(botella=OuterRef('pk'))
-                                .order_by('-timestamp_inspeccion')
-                                .exclude(peso_botella=None)
-                                .values('peso_botella')[1:2]
-    )
+    # Peso de la botella en su inspección más reciente, descartando pesos = None
+    peso_ultima_inspeccion = F('linea_tiempo__peso_ultima_pesada')
 
-    # SUBQUERY: La cantidad de inspecciones cuyo 'peso_botella' está OK (es decir, distinto a None)
-    sq_peso_botella_ok = Subquery(models.ItemInspeccion.objects
-                            .filter(botella=OuterRef('pk'))
-                            .exclude(peso_botella=None)
-                            .values('botella__pk')
-                            .annotate(inspeccion_peso_ok=Count('id'))
-                            .values('inspeccion_peso_ok')
-    )
+    # Peso anterior de la botella (el peso registrado en la penúltima inspección, descartando pesos = None)
+    peso_anterior = F('linea_tiempo__peso_penultima_pesada')
 
     #---------------------------------------------------------------------
     # Agregamos el estado de la botella (pero con texto, no números)
@@ -349,28 +310,28 @@ def get_botellas_merma(merma_id):
 
     #---------------------------------------------------------------------
     # Agregamos el número de inspecciones de cada botella
-    botellas_inspecciones = botellas_estado.annotate(num_inspecciones=Count('inspecciones_botella'))
+    botellas_inspecciones = botellas_estado.annotate(num_inspecciones=num_inspecciones)
     #botellas_inspecciones = botellas_status_none.annotate(num_inspecciones=Count('inspecciones_botella'))
 
     #---------------------------------------------------------------------
     # Agregamos el 'inspecciones_ok_count': el Numero de inspecciones cuyo 'peso_botella' está OK
-    botellas_inspecciones_peso_ok = botellas_inspecciones.annotate(inspecciones_peso_ok_count=ExpressionWrapper(sq_peso_botella_ok, output_field=IntegerField()))
+    botellas_inspecciones_peso_ok = botellas_inspecciones.annotate(inspecciones_peso_ok_count=ExpressionWrapper(peso_botella_ok, output_field=IntegerField()))
 
     #---------------------------------------------------------------------
     # Agregamos 'inspeccion_none_count': el numero de inspecciones con 'peso_botella' = None
-    botellas_inspeccion_none = botellas_inspecciones_peso_ok.annotate(inspeccion_none_count=ExpressionWrapper(sq_peso_botella_none, output_field=IntegerField()))
+    botellas_inspeccion_none = botellas_inspecciones_peso_ok.annotate(inspeccion_none_count=ExpressionWrapper(peso_botella_none, output_field=IntegerField()))
 
     print('::: BOTELLAS - NONE COUNT :::')
     print(botellas_inspeccion_none.values('folio', 'producto__ingrediente__nombre', 'inspeccion_none_count'))
     #---------------------------------------------------------------------
     # Agregamos 'fecha_inspeccion_none': la fecha de la inspeccion cuyo 'peso_botella' = None
-    botellas_fecha_inspeccion_none = botellas_inspeccion_none.annotate(fecha_inspeccion_none=ExpressionWrapper(sq_fecha_inspeccion_none, output_field=DateTimeField()))
+    botellas_fecha_inspeccion_none = botellas_inspeccion_none.annotate(fecha_inspeccion_none=ExpressionWrapper(fecha_inspeccion_none, output_field=DateTimeField()))
 
     print('::: BOTELLAS - FECHA INSPECCION NONE :::')
     print(botellas_fecha_inspeccion_none.values('folio', 'fecha_inspeccion_none'))
     #---------------------------------------------------------------------
     # Agregamos 'fecha_inspeccion_ok' la fecha de la inspeccion cuyo 'peso_botella' = OK
-    botellas_fecha_inspeccion_ok = botellas_fecha_inspeccion_none.annotate(fecha_inspeccion_ok=ExpressionWrapper(sq_fecha_inspeccion_ok, output_field=DateTimeField()))
+    botellas_fecha_inspeccion_ok = botellas_fecha_inspeccion_none.annotate(fecha_inspeccion_ok=ExpressionWrapper(fecha_inspeccion_ok, output_field=DateTimeField()))
 
     print('::: BOTELLAS - FECHA INSPECCION OK :::')
     print(botellas_fecha_inspeccion_ok.values('folio', 'fecha_inspeccion_ok'))
@@ -384,15 +345,15 @@ def get_botellas_merma(merma_id):
         peso_anterior=Case(
 
             # CASO: La botella tiene 2 inspecciones, la más reciente tiene 'peso_botella' = None
-            #When(Q(num_inspecciones=2) & Q(inspecciones_none_check=True) & Q(fecha_inspeccion_none__gt=F('fecha_inspeccion_ok')), then=(sq_peso_ultima_inspeccion)),
-            When(Q(num_inspecciones=2) & Q(inspeccion_none_count=1) & Q(fecha_inspeccion_none__gt=F('fecha_inspeccion_ok')), then=(sq_peso_ultima_inspeccion)),
+            #When(Q(num_inspecciones=2) & Q(inspecciones_none_check=True) & Q(fecha_inspeccion_none__gt=F('fecha_inspeccion_ok')), then=(peso_ultima_inspeccion)),
+            When(Q(num_inspecciones=2) & Q(inspeccion_none_count=1) & Q(fecha_inspeccion_none__gt=F('fecha_inspeccion_ok')), then=(peso_ultima_inspeccion)),
 
             # CASO: La botella tiene 2 inspecciones, la más reciente tiene 'peso_botella' = OK
             #When(Q(num_inspecciones=2) & Q(inspecciones_none_check=True) & Q(fecha_inspeccion_none__lt=F('fecha_inspeccion_ok')), then=F('peso_inicial')),
             When(Q(num_inspecciones=2) & Q(inspeccion_none_count=1) & Q(fecha_inspeccion_none__lt=F('fecha_inspeccion_ok')), then=F('peso_inicial')),
 
             # CASO: La botella tiene más de 2 inspecciones, al menos una tiene 'peso_botella' OK
-            When(Q(num_inspecciones__gt=2) & Q(inspecciones_peso_ok_count__gte=1), then=(sq_peso_anterior)),
+            When(Q(num_inspecciones__gt=2) & Q(inspecciones_peso_ok_count__gte=1), then=(peso_anterior)),
 
             # CASO: La botella tiene al menos 2 inspecciones, ninguna tiene 'peso_botella' OK
             When(Q(num_inspecciones__gt=1) & Q(inspecciones_peso_ok_count=None), then=F('peso_inicial')),
@@ -1,141 +1,100 @@
-from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Func, ExpressionWrapper, DecimalField, IntegerField, Case, When
+from django.db import connection
+from django.db.models import CharField, FloatField
+from django.db.models.functions import Cast, Coalesce
 from core import models
-from decimal import Decimal, ROUND_UP
 
 import datetime
-import math
-import json
 import pandas as pd
-import numpy as np
 
-from django.utils.timezone import make_aware
-from django.core.exceptions import ObjectDoesNotExist
 
-
-def get_mermas_tiempo(almacen_id, fecha_inicial, fecha_final):
-
-    # Tomamos el almacen
-    almacen = models.Almacen.objects.get(id=almacen_id)
-
-    # Convertimos las fechas a date
-    fecha_inicial = datetime.datetime.strptime(fecha_inicial, '%Y-%m-%d').date()
-    fecha_final = datetime.datetime.strptime(fecha_final, '%Y-%m-%d').date()
-
-    # Tomamos las mermas de todos los ingredientes para el periodo indicado
-    mermas = models.MermaIngrediente.objects.filter(almacen=almacen, fecha_final__gte=fecha_inicial, fecha_final__lte=fecha_final)
-
-    # Si el queryset está vacío, notificamos al usuario
-    if not mermas.exists():
-        return {'status': 'error', 'message': 'No hay mermas registradas en el periodo seleccionado.'}
-
-    # Añadimos el nombre del ingrediente
-    mermas = mermas.annotate(nombre_ingrediente=F('ingrediente__nombre'))
-
-    # Añadimos la categoría
-    mermas = mermas.annotate(categoria=F('ingrediente__categoria__nombre'))
-
-    # Seleccionamos los campos deseados
-    mermas = mermas.values(
-        'nombre_ingrediente',
-        'categoria',
-        'fecha_final',
-        'consumo_ventas',
-        'consumo_real',
-        'merma',
-        'porcentaje'
-    ).order_by('nombre_ingrediente', 'fecha_final')
-    #print('::: MERMAS VALUES :::')
-    #print(mermas)
-
-    def construir_lista_mermas(queryset):
-        """
-        Esta función construye una lista de diccionarios con las mermas del queryset
-        """
-
-        lista_registros = []
-
-        for item in queryset:
-
-            registro = {}
-
-            merma = float(item['merma'].quantize(Decimal('.01'), rounding=ROUND_UP))
-            porcentaje = float(item['porcentaje'].quantize(Decimal('.01'), rounding=ROUND_UP))
-            consumo_facturado = 0 if item['consumo_ventas'] is None else float(item['consumo_ventas'].quantize(Decimal('.01'), rounding=ROUND_UP))
-            consumo_real = 0 if item['consumo_real'] is None else float(item['consumo_real'].quantize(Decimal('.01'), rounding=ROUND_UP))
-            fecha_final = item['fecha_final'].strftime('%Y-%m-%d')
-            
-            registro['Ingrediente'] = item['nombre_ingrediente']
-            registro['Categoria'] = item['categoria']
-            registro['Fecha'] = fecha_final
-            registro['Consumo Facturado'] = consumo_facturado
-            registro['Consumo Real'] = consumo_real
-            registro['Merma'] = merma
-            registro['Porcentaje'] = porcentaje
-
-            lista_registros.append(registro)
-
-        return lista_registros
-
-    # Convertimos el queryset de las mermas en una lista
-    lista_mermas = construir_lista_mermas(mermas)
-
-    """
-    -----------------------------------------------------
-    Construimos el response
-    -----------------------------------------------------
-    """
-
-    df = pd.DataFrame(lista_mermas)
-    #print('::: DATAFRAME MERMAS :::')
-    #print(df)
+COLUMNAS = ['Ingrediente', 'Categoria', 'Fecha', 'Consumo Facturado', 'Consumo Real', 'Merma', 'Porcentaje']
+COLUMNAS_SERIE = ['Fecha', 'Consumo Facturado', 'Consumo Real', 'Merma', 'Porcentaje', 'Tragos']
+
+
+"""
+-----------------------------------------------------------------------------------
+Lee del cubo de mermas diarias (ver cubo_mermas.py) las mermas del queryset
+indicado: una fila por almacen, ingrediente y día, ordenadas por almacen,
+ingrediente (por nombre) y fecha. Son dos queries: el cubo y los ingredientes.
+-----------------------------------------------------------------------------------
+"""
+def leer_cubo(mermas):
+
+    # Los valores salen de la base de datos como float y texto, y las filas se leen
+    # directo del cursor para no construir un Decimal y un date ni pasar por los
+    # conversores del ORM en cada celda
+    mermas = (mermas
+        .values_list(
+            'almacen_id',
+            'ingrediente_id',
+            Cast('fecha', CharField()),
+            Cast(Coalesce('consumo_ventas', 0), FloatField()),
+            Cast(Coalesce('consumo_real', 0), FloatField()),
+            Cast('merma', FloatField()),
+            Cast('porcentaje', FloatField())
+        )
+        .order_by('almacen_id', 'ingrediente_id', 'fecha')
+    )
+
+    sql, params = mermas.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=['almacen_id', 'ingrediente_id'] + COLUMNAS[2:])
+
+    if df.empty:
+        return df
+
+    # Tomamos el nombre y la categoría de los ingredientes, ordenados por nombre
+    ingredientes = (models.Ingrediente.objects
+        .filter(id__in=df['ingrediente_id'].unique().tolist())
+        .values_list('id', 'nombre', 'categoria__nombre')
+        .order_by('nombre', 'id')
+    )
+    df_ingredientes = pd.DataFrame.from_records(list(ingredientes), columns=['ingrediente_id', 'Ingrediente', 'Categoria'])
+    df_ingredientes['orden'] = range(len(df_ingredientes))
+
+    # Ordenamos las mermas por almacen, ingrediente (por nombre) y fecha
+    df = df_ingredientes.merge(df, on='ingrediente_id').sort_values(['almacen_id', 'orden', 'Fecha'], kind='stable')
+    df = df[['almacen_id'] + COLUMNAS].reset_index(drop=True)
 
     # Agregamos la columna de tragos y redondeamos las decimales
-    df['Tragos'] = (df['Merma']/60)*-1
+    df['Tragos'] = (df['Merma'] / 60) * -1
     df = df.round({'Tragos': 1})
 
-    # Convertimos la columna 'Fecha' a datetime
-    #df['Fecha'] = pd.to_datetime(df['Fecha'])
+    return df
 
-    """
-    Dividimos el dataframe en varios dataframes, uno para cada ingrediente
-    """
-    lista_dataframes = []
 
-    for ingrediente in list(df.Ingrediente.unique()):
-        df_ingrediente = df.loc[df.Ingrediente == ingrediente, :]
-        lista_dataframes.append(df_ingrediente)
+"""
+-----------------------------------------------------------------------------------
+Construye las series y la tabla del reporte con las mermas de un almacen. Las
+series por ingrediente y la tabla con el acumulado se construyen con un 'groupby'
+sobre un solo DataFrame.
+-----------------------------------------------------------------------------------
+"""
+def construir(df):
 
     """
-    Construimos las series de los ingredientes
+    Construimos las series de los ingredientes, ordenadas por nombre
+    - Los registros se convierten una sola vez y cada serie toma los suyos con las
+      posiciones que da el groupby
     """
-    series = []
-
-    for dframe in lista_dataframes:
-        dframe.set_index(['Ingrediente','Categoria'], inplace=True)
-        serie_producto = {
-            'Ingrediente': dframe.index[0][0],
-            'Categoria': dframe.index[0][1]
+    columnas = [df[columna].tolist() for columna in COLUMNAS_SERIE]
+    registros = [dict(zip(COLUMNAS_SERIE, valores)) for valores in zip(*columnas)]
+
+    series = [
+        {
+            'Ingrediente': ingrediente,
+            'Categoria': categoria,
+            'data': [registros[posicion] for posicion in posiciones]
         }
-        data = []
-        registro = dframe.to_dict(orient='records')
-        #data.append(registro)
-        serie_producto['data'] = registro
-        series.append(serie_producto)
-    
-    #print('::: SERIES :::')
-    #print(series)
+        for (ingrediente, categoria), posiciones in df.groupby(['Ingrediente', 'Categoria'], sort=False).indices.items()
+    ]
 
     """
     Construimos un objeto con los datos para la tabla del reporte
     - La tabla muestra el acumulado de las mermas por ingrediente
     """
-    df_tabla = df
-    #print('::: DF TABLA :::')
-    #print(df_tabla)
-
-    df_tabla = df_tabla.groupby(['Ingrediente', 'Categoria']).sum()
-    #print('::: DF TABLA - GROUPBY :::')
-    #print(df_tabla)
+    df_tabla = df.groupby(['Ingrediente', 'Categoria'])[['Consumo Facturado', 'Consumo Real', 'Merma']].sum()
 
     df_tabla['Porcentaje'] = (df_tabla['Merma'] / df_tabla['Consumo Facturado']) * 100
     df_tabla['Tragos'] = (df_tabla['Merma'] / 60) * -1
@@ -143,6 +102,32 @@ def get_mermas_tiempo(almacen_id, fecha_inicial, fecha_final):
     df_tabla.reset_index(inplace=True)
     tabla = df_tabla.to_dict(orient='records')
 
+    return {
+        'series': series,
+        'tabla': tabla
+    }
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de mermas en el tiempo para un almacen.
+-----------------------------------------------------------------------------------
+"""
+def get_mermas_tiempo(almacen_id, fecha_inicial, fecha_final):
+
+    # Tomamos el almacen
+    almacen = models.Almacen.objects.select_related('sucursal').get(id=almacen_id)
+
+    # Convertimos las fechas a date
+    fecha_inicial = datetime.datetime.strptime(fecha_inicial, '%Y-%m-%d').date()
+    fecha_final = datetime.datetime.strptime(fecha_final, '%Y-%m-%d').date()
+
+    # Tomamos las mermas diarias de todos los ingredientes para el periodo indicado
+    df = leer_cubo(models.MermaDiaria.objects.filter(almacen=almacen, fecha__gte=fecha_inicial, fecha__lte=fecha_final))
+
+    # Si no hay mermas, notificamos al usuario
+    if df.empty:
+        return {'status': 'error', 'message': 'No hay mermas registradas en el periodo seleccionado.'}
 
     """
     Retornamos el response
@@ -153,12 +138,7 @@ def get_mermas_tiempo(almacen_id, fecha_inicial, fecha_final):
         'almacen': almacen.nombre,
         'fecha_inicial': fecha_inicial.strftime('%Y-%m-%d'),
         'fecha_final': fecha_final.strftime('%Y-%m-%d'),
-        'data':{
-            'series': series,
-            'tabla': tabla
-        }
+        'data': construir(df)
     }
 
     return response
-
-
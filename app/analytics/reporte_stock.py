@@ -1,5 +1,6 @@
 from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Func, ExpressionWrapper, DecimalField, IntegerField, Case, When
 from core import models
+from analytics import reporte_costo_stock
 from decimal import Decimal
 import decimal
 import datetime
@@ -31,78 +32,64 @@ def get_stock(sucursal):
 
     """
 
-    # Si no hay botellas registradas en la sucursal, retornamos error:
-    if sucursal.botellas_sucursal.all().count() == 0:
-        return {
-            'status': 'error',
-            'message': 'Esta sucursal no tiene botellas registradas.'
-        }
+    productos = [
+        {'id': producto_id, 'nombre_marca': nombre_marca, 'ingrediente__categoria__nombre': categoria, 'unidades': unidades}
+        for _, _, producto_id, nombre_marca, categoria, unidades in get_productos_stock([sucursal.id])
+    ]
 
-    # Tomamos todas las botellas de la sucursal
-    botellas = models.Botella.objects.filter(sucursal=sucursal)
-    # Excluimos las botellas vacías y perdidas
-    botellas = botellas.exclude(estado='0')
-    botellas = botellas.exclude(estado='3')
-    # Creamos una lista con los ids de los productos asociados a las botellas
-    botellas = botellas.values('producto')
-
-    # Tomamos solo los productos que tienen botellas nuevas o usadas 
-    productos = models.Producto.objects.filter(id__in=botellas).values('id', 'nombre_marca', 'ingrediente__categoria__nombre')
-
-    # Tomamos todos los blueprints
-    #productos = models.Producto.objects.all().values('id', 'nombre_marca', 'ingrediente__categoria__nombre')
-    #print('::: QUERYSET PRODUCTOS - CATEGORIA :::')
-    #print(productos)
-    
-    # Agregamos el campo 'unidades' que indique el numero de botellas por blueprint y excluimos aquellos con cero unidades
-    #productos = productos.annotate(unidades=Count('botellas')).exclude(unidades=0)
-
-    sq_num_botellas_producto = Subquery(models.Botella.objects
-                                    .filter(producto=OuterRef('pk'), sucursal=sucursal)
-                                    .exclude(Q(estado='0') | Q(estado='3'))
-                                    .values('producto__pk')
-                                    .annotate(num_botellas=Count('id'))
-                                    .values('num_botellas')
-    )
+    # Tomamos la fecha
+    fecha = datetime.date.today()
+    fecha = fecha.strftime("%d/%m/%Y")
 
-    productos = productos.annotate(unidades=sq_num_botellas_producto)
-    productos = productos.exclude(unidades=0)
+    return formatear(sucursal, productos, fecha)
 
-    # Ordenamos los productos del queryset por nombre
-    productos = productos.order_by('nombre_marca')
 
-    #print('::: QUERYSET PRODUCTOS - COUNT BOTELLAS :::')
-    #print(productos.values('ingrediente__nombre', 'unidades'))
+"""
+-------------------------------------------------------------------------
+Queryset con las unidades en stock (sin botellas vacías ni perdidas) de
+cada Producto de las sucursales indicadas, agrupadas en un solo query.
 
-    # Creamos una lista con todos los productos
-    lista_productos = list(productos)
-    #print('::: LISTA DE PRODUCTOS :::')
-    #print(lista_productos)
+Cada fila es (sucursal_id, nombre de la sucursal, producto_id,
+nombre_marca, categoria, unidades), ordenadas por sucursal y producto.
+También lo usan el reporte de varias sucursales y la exportación.
+-------------------------------------------------------------------------
+"""
+def get_productos_stock(sucursales_id):
+
+    return (models.Botella.objects
+        .filter(sucursal__in=sucursales_id, producto__isnull=False)
+        .exclude(estado__in=[models.Botella.VACIA, models.Botella.PERDIDA])
+        .values_list('sucursal_id', 'sucursal__nombre', 'producto_id', 'producto__nombre_marca', 'producto__ingrediente__categoria__nombre')
+        .annotate(unidades=Count('id'))
+        .order_by('sucursal__nombre', 'sucursal_id', 'producto__nombre_marca')
+    )
 
-    # Calculamos el número total de productos en la sucursal
-    total_productos = productos.aggregate(Sum('unidades', output_field=IntegerField()))
-    #print('::: TOTAL PRODUCTOS :::')
-    #print(total_productos)
 
-    # Tomamos la fecha
-    fecha = datetime.date.today()
-    fecha = fecha.strftime("%d/%m/%Y")
-    #print('::: FECHA :::')
-    #print(fecha)
+"""
+-------------------------------------------------------------------------
+Construye el reporte de stock de una sucursal a partir de sus productos
+(ver 'get_productos_stock')
+-------------------------------------------------------------------------
+"""
+def formatear(sucursal, productos, fecha):
 
-    # Construimos el reporte
-    reporte = {
+    # Si no hay botellas en stock en la sucursal, retornamos error
+    if len(productos) == 0:
+        return {
+            'status': 'error',
+            'message': 'Esta sucursal no tiene botellas registradas.'
+        }
+
+    return {
         'status': 'success',
         'data': {
             'sucursal': sucursal.nombre,
             'fecha': fecha,
-            'total_botellas': total_productos,
-            'botellas': lista_productos
+            'total_botellas': {'unidades__sum': sum(producto['unidades'] for producto in productos)},
+            'botellas': productos
         }
     }
 
-    return reporte
-
 
 """
 -------------------------------------------------------------------------
@@ -149,33 +136,8 @@ def get_stock_detalle(producto_id, sucursal_id):
                 'message': 'No hay botellas asociadas a este producto.'
             }
 
-        #----------------------------------------------------------------------
-        # Agregamos el campo 'volumen_ml'
-        botellas = botellas.annotate(
-            volumen_ml=ExpressionWrapper(
-                #(F('peso_actual') - F('peso_cristal')) * F('producto__ingrediente__factor_peso'),
-                (F('peso_actual') - F('peso_cristal')) * (2 - F('producto__ingrediente__factor_peso')),
-                output_field=DecimalField()
-            )   
-        )
-
-        #----------------------------------------------------------------------
-        # Agregamos el campo 'costo_ml'
-        botellas = botellas.annotate(
-            costo_ml=ExpressionWrapper(
-                F('precio_unitario') / F('capacidad'),
-                output_field=DecimalField()
-            )
-        )
-
-        #----------------------------------------------------------------------
-        # Agregamos el campo 'costo_botella'
-        botellas = botellas.annotate(
-            costo_botella=ExpressionWrapper(
-                F('costo_ml') * F('volumen_ml'),
-                output_field=DecimalField()
-            )
-        )
+        # Agregamos los campos 'volumen_ml', 'costo_ml' y 'costo_botella'
+        botellas = reporte_costo_stock.anotar_costos(botellas)
 
         # Ordenamos las botellas por volumen contenido
         botellas = botellas.order_by('volumen_ml')
@@ -0,0 +1,180 @@
+from django.utils import timezone
+from core import models
+from analytics import motor_restock
+from analytics import snapshots_restock
+from analytics import reporte_restock_02 as restock_02
+from analytics import reporte_mermas_tiempo
+from analytics import reporte_stock
+from analytics import reporte_costo_stock
+from decimal import Decimal
+
+import datetime
+
+
+"""
+-----------------------------------------------------------------------------------
+Reportes de varias sucursales (p. ej. todas las de un Cliente) en un solo request.
+
+En lugar de ejecutar el reporte de cada sucursal por separado, cada reporte lee
+todas las sucursales con un solo query agrupado y reparte el resultado por
+sucursal. La respuesta es un diccionario {sucursal_id: reporte}, ordenado por el
+nombre de la sucursal, donde cada reporte tiene el mismo formato que el de una
+sucursal (o un almacen) en su endpoint individual.
+
+El restock sale de los snapshots (ver snapshots_restock.py): los vigentes se leen
+juntos y los que hay que recalcular se calculan en paralelo.
+-----------------------------------------------------------------------------------
+"""
+def get_sucursales(sucursales_id):
+
+    return list(models.Sucursal.objects.filter(id__in=sucursales_id).order_by('nombre', 'id'))
+
+
+def get_fecha():
+    return datetime.date.today().strftime("%d/%m/%Y")
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Stock: unidades por Producto de cada sucursal (ver reporte_stock.py)
+-----------------------------------------------------------------------------------
+"""
+def get_stock(sucursales_id):
+
+    sucursales = get_sucursales(sucursales_id)
+
+    botellas = {sucursal.id: [] for sucursal in sucursales}
+    for sucursal_id, _, producto_id, nombre_marca, categoria, unidades in reporte_stock.get_productos_stock(sucursales_id):
+        botellas[sucursal_id].append({
+            'id': producto_id,
+            'nombre_marca': nombre_marca,
+            'ingrediente__categoria__nombre': categoria,
+            'unidades': unidades
+        })
+
+    fecha = get_fecha()
+    reportes = {sucursal.id: reporte_stock.formatear(sucursal, botellas[sucursal.id], fecha) for sucursal in sucursales}
+
+    return reportes
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Costo de Stock: el reporte de cada almacen de la sucursal (ver
+reporte_costo_stock.py) y el costo total de la sucursal
+-----------------------------------------------------------------------------------
+"""
+def get_costo_stock(sucursales_id):
+
+    sucursales = get_sucursales(sucursales_id)
+
+    botellas = (reporte_costo_stock.get_botellas_costo(sucursales_id=sucursales_id)
+        .values('almacen__sucursal_id', 'almacen_id', 'almacen__nombre', *reporte_costo_stock.COLUMNAS)
+        .order_by('almacen__sucursal_id', 'almacen__nombre', 'almacen_id', 'folio')
+    )
+
+    # Acumulamos las botellas y el costo de cada almacen
+    almacenes = {sucursal.id: {} for sucursal in sucursales}
+    for botella in botellas:
+
+        sucursal_id, almacen_id = botella['almacen__sucursal_id'], botella['almacen_id']
+        if almacen_id not in almacenes[sucursal_id]:
+            almacenes[sucursal_id][almacen_id] = {'nombre_almacen': botella['almacen__nombre'], 'costo_total': Decimal(0), 'data': []}
+
+        almacen = almacenes[sucursal_id][almacen_id]
+        almacen['costo_total'] += botella['costo_botella'] or 0
+        almacen['data'].append(reporte_costo_stock.formatear_botella(botella))
+
+    fecha = get_fecha()
+    reportes = {}
+    for sucursal in sucursales:
+
+        reportes_almacenes = [
+            {
+                'status': '1',
+                'almacen_id': almacen_id,
+                'nombre_almacen': almacen['nombre_almacen'],
+                'sucursal': sucursal.nombre,
+                'fecha': fecha,
+                'costo_total': reporte_costo_stock.redondear(almacen['costo_total']),
+                'data': almacen['data']
+            }
+            for almacen_id, almacen in almacenes[sucursal.id].items()
+        ]
+
+        reportes[sucursal.id] = {
+            'sucursal': sucursal.nombre,
+            'fecha': fecha,
+            'costo_total': reporte_costo_stock.redondear(sum(almacen['costo_total'] for almacen in almacenes[sucursal.id].values())),
+            'almacenes': reportes_almacenes
+        }
+
+    return reportes
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Restock 02 de cada sucursal, tomado de sus snapshots
+-----------------------------------------------------------------------------------
+"""
+def get_restock(sucursales_id, dias=motor_restock.DIAS, dias_entrega=motor_restock.DIAS_ENTREGA, refrescar=False):
+
+    sucursales = get_sucursales(sucursales_id)
+    snapshots = snapshots_restock.get_snapshots([sucursal.id for sucursal in sucursales], dias, dias_entrega, refrescar=refrescar)
+
+    reportes = {}
+    for sucursal in sucursales:
+
+        snapshot = snapshots[sucursal.id]
+        fecha_actualizacion = timezone.localtime(snapshot.fecha_actualizacion)
+
+        reporte = restock_02.formatear(sucursal, snapshots_restock.get_productos(snapshot), fecha_actualizacion.date())
+        reporte['actualizado'] = fecha_actualizacion.isoformat()
+        reportes[sucursal.id] = reporte
+
+    return reportes
+
+
+"""
+-----------------------------------------------------------------------------------
+Reporte de Mermas x Tiempo: las series y la tabla de cada almacen de la sucursal
+con mermas en el periodo (ver reporte_mermas_tiempo.py)
+-----------------------------------------------------------------------------------
+"""
+def get_mermas_tiempo(sucursales_id, fecha_inicial, fecha_final):
+
+    sucursales = get_sucursales(sucursales_id)
+
+    almacenes = (models.Almacen.objects
+        .filter(sucursal__in=sucursales_id)
+        .values_list('id', 'nombre', 'sucursal_id')
+        .order_by('nombre', 'id')
+    )
+
+    df = reporte_mermas_tiempo.leer_cubo(
+        models.MermaDiaria.objects.filter(almacen__sucursal__in=sucursales_id, fecha__gte=fecha_inicial, fecha__lte=fecha_final)
+    )
+    grupos = df.groupby('almacen_id').indices if not df.empty else {}
+
+    reportes = {
+        sucursal.id: {
+            'sucursal': sucursal.nombre,
+            'fecha_inicial': fecha_inicial.strftime('%Y-%m-%d'),
+            'fecha_final': fecha_final.strftime('%Y-%m-%d'),
+            'almacenes': []
+        }
+        for sucursal in sucursales
+    }
+
+    for almacen_id, nombre, sucursal_id in almacenes:
+
+        if almacen_id not in grupos:
+            continue
+
+        reportes[sucursal_id]['almacenes'].append({
+            'almacen_id': almacen_id,
+            'almacen': nombre,
+            'data': reporte_mermas_tiempo.construir(df.iloc[grupos[almacen_id]].reset_index(drop=True))
+        })
+
+    return reportes
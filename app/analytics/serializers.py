@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework import serializers
 from core import models
 from analytics import reporte_mermas as rm
+from analytics import cubo_mermas
 import datetime
 from django.utils.timezone import make_aware
 
@@ -61,26 +63,39 @@ class ReporteMermasCreateSerializer(serializers.ModelSerializer):
             # Ejecutamos el script del Reporte de Mermas
             consumos = rm.calcular_consumos(inspeccion, fecha_inicial, fecha_final)
 
-            # Creamos la instancia de ReporteMermas
-            reporte_mermas = models.ReporteMermas.objects.create(
-                inspeccion=inspeccion,
-                almacen=almacen,
-                fecha_inicial=fecha_inicial,
-                fecha_final=fecha_final
-            )
-
-            # Creamos las mermas del reporte
-            for (ingrediente, consumo_ventas, consumo_real) in consumos:
-                models.MermaIngrediente.objects.create(
-                    ingrediente=ingrediente,
-                    reporte=reporte_mermas,
+            # Creamos el reporte y sus mermas en una sola transacción
+            with transaction.atomic():
+
+                # Creamos la instancia de ReporteMermas
+                reporte_mermas = models.ReporteMermas.objects.create(
+                    inspeccion=inspeccion,
+                    almacen=almacen,
                     fecha_inicial=fecha_inicial,
-                    fecha_final=fecha_final,
-                    consumo_ventas=consumo_ventas['consumo_ventas'],
-                    consumo_real=consumo_real['consumo_real'],
-                    almacen=almacen
+                    fecha_final=fecha_final
                 )
 
+                # Creamos las mermas del reporte
+                mermas = []
+                for (ingrediente, consumo_ventas, consumo_real) in consumos:
+                    merma, porcentaje = models.calcular_merma(consumo_ventas['consumo_ventas'], consumo_real['consumo_real'])
+
+                    mermas.append(models.MermaIngrediente(
+                        ingrediente=ingrediente,
+                        reporte=reporte_mermas,
+                        fecha_inicial=fecha_inicial,
+                        fecha_final=fecha_final,
+                        consumo_ventas=consumo_ventas['consumo_ventas'],
+                        consumo_real=consumo_real['consumo_real'],
+                        merma=merma,
+                        porcentaje=porcentaje,
+                        almacen=almacen
+                    ))
+
+                models.MermaIngrediente.objects.bulk_create(mermas)
+
+                # El bulk_create no dispara señales; actualizamos el cubo de mermas diarias
+                cubo_mermas.actualizar(almacen.id, [fecha_final])
+
             # Retornamos la instancia de ReporteMermas
             return reporte_mermas 
 
@@ -0,0 +1,151 @@
+from django.utils import timezone
+from core import models
+from analytics import motor_restock
+from analytics import paralelo
+from decimal import Decimal
+
+
+"""
+-----------------------------------------------------------------------------------
+Snapshots del motor de restock.
+
+El resultado del motor (ver motor_restock.py) solo cambia cuando cambian los pesos
+de las botellas, así que el de los parámetros default (motor_restock.DIAS y
+motor_restock.DIAS_ENTREGA) se guarda en un SnapshotRestock por sucursal y los
+reportes de Restock leen ese registro.
+
+Con otros 'dias' o 'dias_entrega' el snapshot se calcula en el request y no se
+guarda: así el número de snapshots (y lo que hay que recalcular al cerrar una
+inspección) no depende de los parámetros que manden los clientes.
+
+El snapshot default se recalcula:
+
+- Con el comando 'actualizar_snapshots_restock' (pensado para correr cada noche)
+- Al cerrar una Inspeccion de la sucursal
+- Cuando el request lo pide con '?refresh=1'
+- Cuando es de un día anterior, porque la ventana de demanda ya se movió
+-----------------------------------------------------------------------------------
+"""
+CAMPOS_DECIMALES = ['precio_lista', 'precio_promedio', 'stock_ml', 'demanda_ml', 'necesidad_ml', 'faltante_ml']
+
+
+"""
+-----------------------------------------------------------------------------------
+Convierte los Productos del motor a JSON (los Decimal se guardan como texto para
+no perder precisión) y de regreso.
+-----------------------------------------------------------------------------------
+"""
+def serializar(productos):
+
+    return [
+        {campo: str(valor) if campo in CAMPOS_DECIMALES and valor is not None else valor for campo, valor in producto.items()}
+        for producto in productos
+    ]
+
+
+def get_productos(snapshot):
+
+    return [
+        {campo: Decimal(valor) if campo in CAMPOS_DECIMALES and valor is not None else valor for campo, valor in producto.items()}
+        for producto in snapshot.productos
+    ]
+
+
+def es_default(dias, dias_entrega):
+    return (dias, dias_entrega) == (motor_restock.DIAS, motor_restock.DIAS_ENTREGA)
+
+
+"""
+-----------------------------------------------------------------------------------
+Recalcula el snapshot de una sucursal. Solo se guarda el de los parámetros
+default; el de otros parámetros se retorna sin guardar.
+-----------------------------------------------------------------------------------
+"""
+def actualizar(sucursal_id, dias=motor_restock.DIAS, dias_entrega=motor_restock.DIAS_ENTREGA):
+
+    productos = motor_restock.calcular(sucursal_id, dias, dias_entrega)
+
+    if not es_default(dias, dias_entrega):
+        return models.SnapshotRestock(
+            sucursal=models.Sucursal.objects.get(id=sucursal_id),
+            dias=dias,
+            dias_entrega=dias_entrega,
+            productos=serializar(productos),
+            fecha_actualizacion=timezone.now()
+        )
+
+    snapshot, created = models.SnapshotRestock.objects.update_or_create(
+        sucursal_id=sucursal_id,
+        dias=dias,
+        dias_entrega=dias_entrega,
+        defaults={'productos': serializar(productos)}
+    )
+
+    return snapshot
+
+
+"""
+-----------------------------------------------------------------------------------
+Recalcula el snapshot default de una sucursal y borra los snapshots de otros
+parámetros que se hayan guardado antes
+-----------------------------------------------------------------------------------
+"""
+def actualizar_sucursal(sucursal_id):
+
+    (models.SnapshotRestock.objects
+        .filter(sucursal_id=sucursal_id)
+        .exclude(dias=motor_restock.DIAS, dias_entrega=motor_restock.DIAS_ENTREGA)
+        .delete()
+    )
+
+    return actualizar(sucursal_id)
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna el snapshot vigente de una sucursal. Si no existe, es de un día anterior,
+se pide 'refrescar' o no es de los parámetros default, se recalcula. Si está
+vigente es un solo query.
+-----------------------------------------------------------------------------------
+"""
+def get_snapshot(sucursal_id, dias=motor_restock.DIAS, dias_entrega=motor_restock.DIAS_ENTREGA, refrescar=False):
+
+    if not refrescar and es_default(dias, dias_entrega):
+        snapshot = (models.SnapshotRestock.objects
+            .select_related('sucursal')
+            .filter(sucursal_id=sucursal_id, dias=dias, dias_entrega=dias_entrega)
+            .first()
+        )
+        if snapshot is not None and vigente(snapshot):
+            return snapshot
+
+    return actualizar(sucursal_id, dias, dias_entrega)
+
+
+def vigente(snapshot):
+    return timezone.localdate(snapshot.fecha_actualizacion) == timezone.localdate()
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna los snapshots vigentes de varias sucursales, {sucursal_id: snapshot}.
+
+Los vigentes se leen en un solo query y los que hay que recalcular (no existen,
+son de un día anterior, se pide 'refrescar' o no son de los parámetros default)
+se calculan en paralelo, uno por sucursal (ver paralelo.py).
+-----------------------------------------------------------------------------------
+"""
+def get_snapshots(sucursales_id, dias=motor_restock.DIAS, dias_entrega=motor_restock.DIAS_ENTREGA, refrescar=False):
+
+    snapshots = {}
+    if not refrescar and es_default(dias, dias_entrega):
+        vigentes = (models.SnapshotRestock.objects
+            .select_related('sucursal')
+            .filter(sucursal_id__in=sucursales_id, dias=dias, dias_entrega=dias_entrega)
+        )
+        snapshots = {snapshot.sucursal_id: snapshot for snapshot in vigentes if vigente(snapshot)}
+
+    pendientes = [sucursal_id for sucursal_id in sucursales_id if sucursal_id not in snapshots]
+    snapshots.update(paralelo.ejecutar(lambda sucursal_id: actualizar(sucursal_id, dias, dias_entrega), pendientes))
+
+    return {sucursal_id: snapshots[sucursal_id] for sucursal_id in sucursales_id}
@@ -0,0 +1,169 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from openpyxl import load_workbook
+
+from core import models
+
+import csv
+import datetime
+import io
+
+
+class ExportacionesTests(TestCase):
+    """ Tests para la exportación de los reportes a CSV y XLSX """
+
+    def setUp(self):
+
+        self.client = APIClient()
+
+        cliente = models.Cliente.objects.create(nombre='MAGNO BRASSERIE')
+        self.magno = models.Sucursal.objects.create(nombre='MAGNO-BRASSERIE', cliente=cliente)
+        self.atomic = models.Sucursal.objects.create(nombre='ATOMIC-THAI', cliente=cliente)
+        self.otra = models.Sucursal.objects.create(nombre='OTRA', cliente=models.Cliente.objects.create(nombre='OTRO CLIENTE'))
+
+        self.barra_magno = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.magno)
+        self.barra_atomic = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.atomic)
+        self.barra_otra = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.otra)
+
+        self.usuario = get_user_model().objects.create(email='test@foodstack.mx', password='password123')
+        self.usuario.sucursales.add(self.magno, self.atomic)
+        self.client.force_authenticate(self.usuario)
+
+        categoria = models.Categoria.objects.create(nombre='WHISKY')
+        self.whisky = models.Ingrediente.objects.create(codigo='WHIS001', nombre='JW BLACK', categoria=categoria, factor_peso=0.95)
+        self.jw_black = models.Producto.objects.create(folio='Ii0000000001', nombre_marca='JW BLACK 750', ingrediente=self.whisky, capacidad=750, precio_unitario=560.50)
+
+        def botella(folio, almacen, peso_actual=1200, estado='2'):
+            return models.Botella.objects.create(
+                folio=folio, producto=self.jw_black, sucursal=almacen.sucursal, almacen=almacen, estado=estado,
+                ingrediente='JW BLACK', capacidad=750, peso_cristal=500, peso_inicial=1200, peso_actual=peso_actual,
+                precio_unitario=self.jw_black.precio_unitario
+            )
+
+        botella('B00000000001', self.barra_magno, peso_actual=800, estado='1')
+        botella('B00000000002', self.barra_magno)
+        botella('B00000000003', self.barra_magno, peso_actual=500, estado='0')
+        botella('B00000000004', self.barra_atomic)
+        botella('B00000000005', self.barra_otra)
+
+        for almacen in [self.barra_magno, self.barra_atomic, self.barra_otra]:
+            models.MermaIngrediente.objects.create(
+                ingrediente=self.whisky,
+                almacen=almacen,
+                fecha_inicial=datetime.date(2020, 2, 1),
+                fecha_final=datetime.date(2020, 2, 2),
+                consumo_ventas=1000,
+                consumo_real=1120,
+            )
+
+    def leer_csv(self, response):
+        self.assertTrue(response.streaming)
+        contenido = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(io.StringIO(contenido)))
+
+    #-----------------------------------------------------------------------------
+    def test_exportar_reporte_stock(self):
+        """ Testear la exportación del reporte de stock de una sucursal y de todas las sucursales del usuario """
+
+        res = self.client.get(reverse('analytics:exportar-reporte-stock-sucursal', args=[self.magno.id]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="reporte-stock.csv"', res['Content-Disposition'])
+        self.assertEqual(self.leer_csv(res), [
+            ['Sucursal', 'Producto', 'Categoria', 'Unidades'],
+            ['MAGNO-BRASSERIE', 'JW BLACK 750', 'WHISKY', '2'],
+        ])
+
+        # Sin sucursal se exportan las sucursales del usuario, y solo esas
+        res = self.client.get(reverse('analytics:exportar-reporte-stock'))
+        filas = self.leer_csv(res)
+        self.assertEqual([fila[0] for fila in filas[1:]], ['ATOMIC-THAI', 'MAGNO-BRASSERIE'])
+
+        # Una sucursal que no es del usuario
+        res = self.client.get(reverse('analytics:exportar-reporte-stock-sucursal', args=[self.otra.id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = self.client.get(reverse('analytics:exportar-reporte-stock'), {'formato': 'pdf'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    #-----------------------------------------------------------------------------
+    def test_exportar_sucursales_usuario_sin_cache(self):
+        """ Testear que las sucursales del usuario a exportar no se toman del cache de permisos """
+
+        res = self.client.get(reverse('analytics:exportar-reporte-stock'))
+        self.assertEqual(len(self.leer_csv(res)), 3)
+
+        # Sin disparar m2m_changed, como si la sucursal se retirara desde otro proceso
+        get_user_model().sucursales.through.objects.filter(user=self.usuario, sucursal=self.atomic).delete()
+
+        res = self.client.get(reverse('analytics:exportar-reporte-stock'))
+        self.assertEqual([fila[0] for fila in self.leer_csv(res)[1:]], ['MAGNO-BRASSERIE'])
+
+    #-----------------------------------------------------------------------------
+    def test_exportar_reporte_costo_stock(self):
+        """ Testear la exportación del reporte de costo de stock """
+
+        res = self.client.get(reverse('analytics:exportar-reporte-costo-stock-almacen', args=[self.barra_magno.id]))
+        filas = self.leer_csv(res)
+
+        self.assertEqual(filas[0][2:], ['Folio', 'Ingrediente', 'Capacidad', 'Precio Unitario', 'Peso Actual', 'Volumen ml', 'Costo ml', 'Costo Botella'])
+        # La botella vacía no se exporta
+        self.assertEqual([fila[2] for fila in filas[1:]], ['B00000000001', 'B00000000002'])
+        # (800 - 500) * (2 - 0.95) = 315 ml a 560.50 / 750 por ml
+        self.assertEqual(filas[1][7:], ['315.0', '0.75', '235.41'])
+
+        res = self.client.get(reverse('analytics:exportar-reporte-costo-stock'))
+        self.assertEqual(len(self.leer_csv(res)), 4)
+
+        res = self.client.get(reverse('analytics:exportar-reporte-costo-stock-almacen', args=[self.barra_otra.id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    #-----------------------------------------------------------------------------
+    def test_exportar_reporte_mermas_tiempo(self):
+        """ Testear la exportación del reporte de mermas en el tiempo """
+
+        fechas = {'fecha_inicial': '2020-02-01', 'fecha_final': '2020-02-07'}
+
+        res = self.client.get(reverse('analytics:exportar-reporte-mermas-tiempo-almacen', kwargs=dict(fechas, almacen_id=self.barra_magno.id)))
+        self.assertEqual(self.leer_csv(res)[1], ['MAGNO-BRASSERIE', 'BARRA 1', 'JW BLACK', 'WHISKY', '2020-02-02', '1000.0', '1120.0', '-120.0', '-12.0', '2.0'])
+
+        res = self.client.get(reverse('analytics:exportar-reporte-mermas-tiempo', kwargs=fechas))
+        self.assertEqual([fila[0] for fila in self.leer_csv(res)[1:]], ['ATOMIC-THAI', 'MAGNO-BRASSERIE'])
+
+        res = self.client.get(reverse('analytics:exportar-reporte-mermas-tiempo', kwargs={'fecha_inicial': '2020-02-31', 'fecha_final': '2020-03-01'}))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    #-----------------------------------------------------------------------------
+    def test_exportar_reporte_restock_02(self):
+        """ Testear la exportación del reporte de restock """
+
+        res = self.client.get(reverse('analytics:exportar-reporte-restock-02'))
+        filas = self.leer_csv(res)
+
+        self.assertEqual(filas[0], ['Sucursal', 'Producto', 'Capacidad', 'Precio', 'Demanda', 'Stock', 'Faltante', 'Compra', 'Subtotal', 'IVA', 'Total'])
+        # Solo MAGNO-BRASSERIE tuvo consumo
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][:3], ['MAGNO-BRASSERIE', 'JW BLACK 750', '750'])
+        self.assertTrue(models.SnapshotRestock.objects.filter(sucursal=self.atomic).exists())
+
+        res = self.client.get(reverse('analytics:exportar-reporte-restock-02'), {'dias': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    #-----------------------------------------------------------------------------
+    def test_exportar_xlsx(self):
+        """ Testear la exportación a XLSX """
+
+        res = self.client.get(reverse('analytics:exportar-reporte-stock'), {'formato': 'xlsx'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('reporte-stock.xlsx', res['Content-Disposition'])
+
+        libro = load_workbook(io.BytesIO(b''.join(res.streaming_content)), read_only=True)
+        filas = list(libro.active.values)
+        self.assertEqual(filas, [
+            ('Sucursal', 'Producto', 'Categoria', 'Unidades'),
+            ('ATOMIC-THAI', 'JW BLACK 750', 'WHISKY', 1),
+            ('MAGNO-BRASSERIE', 'JW BLACK 750', 'WHISKY', 2),
+        ])
@@ -0,0 +1,331 @@
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.timezone import make_aware
+from rest_framework import status
+from rest_framework.test import APIClient
+from freezegun import freeze_time
+from decimal import Decimal
+
+from core import models
+from analytics import motor_restock
+from analytics import snapshots_restock
+
+from io import StringIO
+import datetime
+import math
+
+
+"""
+-----------------------------------------------------------------------------------
+Implementación de referencia del motor de restock, en Python y sin subqueries:
+recorre las botellas y sus inspecciones una por una.
+-----------------------------------------------------------------------------------
+"""
+def calcular_restock_python(sucursal_id, dias, dias_entrega, fecha_final):
+
+    def inicio_dia(fecha):
+        return make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+    inicio = inicio_dia(fecha_final - datetime.timedelta(days=dias))
+    fin = inicio_dia(fecha_final)
+
+    productos = {}
+
+    for botella in models.Botella.objects.filter(sucursal__id=sucursal_id).select_related('producto__ingrediente'):
+
+        registro, baja = botella.fecha_registro, botella.fecha_baja
+        en_periodo = (
+            (registro <= inicio and baja is None) or
+            (registro <= inicio and baja is not None and inicio <= baja <= fin) or
+            (registro >= inicio and baja is not None and baja <= fin) or
+            (registro >= inicio and baja is None)
+        )
+        if not en_periodo:
+            continue
+
+        inspecciones = list(botella.inspecciones_botella.order_by('timestamp_inspeccion', 'id'))
+        inspecciones_periodo = [item for item in inspecciones if inicio <= item.timestamp_inspeccion <= fin]
+        pesadas_periodo = [item for item in inspecciones_periodo if item.peso_botella is not None]
+
+        if len(inspecciones) == 0:
+            peso_inicio = botella.peso_inicial
+        elif len(inspecciones_periodo) == 0:
+            peso_inicio = botella.peso_actual
+        elif len(inspecciones) == 1:
+            peso_inicio = botella.peso_inicial
+        elif len(pesadas_periodo) == 0:
+            peso_inicio = botella.peso_actual
+        else:
+            peso_inicio = pesadas_periodo[0].peso_botella
+
+        densidad = 2 - botella.producto.ingrediente.factor_peso
+        producto = productos.setdefault(botella.producto_id, {
+            'producto': botella.producto.nombre_marca,
+            'capacidad': botella.producto.capacidad,
+            'stock_ml': Decimal(0),
+            'demanda_ml': Decimal(0),
+        })
+        producto['stock_ml'] += (botella.peso_actual - botella.peso_cristal) * densidad
+        producto['demanda_ml'] += (peso_inicio - botella.peso_actual) * densidad
+
+    resultado = {}
+    for producto_id, producto in productos.items():
+        necesidad = producto['demanda_ml'] * (dias + dias_entrega) / dias
+        faltante = max(necesidad - producto['stock_ml'], 0)
+        if faltante > 0:
+            resultado[producto_id] = dict(producto, faltante_ml=faltante, compra=math.ceil(faltante / producto['capacidad']))
+
+    return resultado
+
+
+class MotorRestockTests(TestCase):
+    """ Tests para el motor del reporte de Restock """
+
+    def setUp(self):
+
+        self.client = APIClient()
+
+        cliente = models.Cliente.objects.create(nombre='MAGNO BRASSERIE')
+        self.sucursal = models.Sucursal.objects.create(nombre='MAGNO-BRASSERIE', cliente=cliente)
+        self.almacen = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.sucursal)
+        otra_sucursal = models.Sucursal.objects.create(nombre='ATOMIC-THAI', cliente=cliente)
+
+        self.usuario = get_user_model().objects.create(email='test@foodstack.mx', password='password123')
+        self.usuario.sucursales.add(self.sucursal)
+        self.client.force_authenticate(self.usuario)
+
+        categoria = models.Categoria.objects.create(nombre='WHISKY')
+        whisky = models.Ingrediente.objects.create(codigo='WHIS001', nombre='JW BLACK', categoria=categoria, factor_peso=0.95)
+        tequila = models.Ingrediente.objects.create(codigo='TEQU001', nombre='HERRADURA BLANCO', categoria=categoria, factor_peso=0.90)
+        licor = models.Ingrediente.objects.create(codigo='LICO001', nombre='LICOR 43', categoria=categoria, factor_peso=1.05)
+
+        self.jw_black = models.Producto.objects.create(folio='Ii0000000001', nombre_marca='JW BLACK 750', ingrediente=whisky, capacidad=750, precio_unitario=560.50)
+        self.herradura = models.Producto.objects.create(folio='Ii0000000002', nombre_marca='HERRADURA BLANCO 700', ingrediente=tequila, capacidad=700, precio_unitario=296.50)
+        licor_43 = models.Producto.objects.create(folio='Ii0000000003', nombre_marca='LICOR 43 750', ingrediente=licor, capacidad=750, precio_unitario=347.50)
+
+        def botella(folio, producto, fecha_registro, peso_inicial=1200, peso_actual=1200, fecha_baja=None, sucursal=None):
+            with freeze_time(fecha_registro):
+                return models.Botella.objects.create(
+                    folio=folio, producto=producto, sucursal=sucursal or self.sucursal, almacen=self.almacen,
+                    peso_cristal=500, peso_inicial=peso_inicial, peso_actual=peso_actual,
+                    fecha_baja=make_aware(datetime.datetime.strptime(fecha_baja, '%Y-%m-%d')) if fecha_baja else None,
+                    precio_unitario=producto.precio_unitario
+                )
+
+        def inspeccionar(botella, fecha, peso):
+            with freeze_time(fecha):
+                inspeccion = models.Inspeccion.objects.create(almacen=self.almacen, sucursal=self.sucursal)
+                models.ItemInspeccion.objects.create(inspeccion=inspeccion, botella=botella, peso_botella=peso)
+
+        # Inspecciones antes y dentro del periodo, todas con peso
+        b1 = botella('B00000000001', self.jw_black, '2019-05-01', peso_actual=800)
+        inspeccionar(b1, '2019-05-20 12:00', 1100)
+        inspeccionar(b1, '2019-06-04 12:00', 1000)
+        inspeccionar(b1, '2019-06-08 12:00', 800)
+
+        # Entró en el periodo, no tiene inspecciones y ya está vacía
+        botella('B00000000002', self.jw_black, '2019-06-05', peso_actual=500)
+
+        # Su única inspección fue antes del periodo
+        b3 = botella('B00000000003', self.jw_black, '2019-05-01', peso_actual=700)
+        inspeccionar(b3, '2019-05-25 12:00', 700)
+
+        # La primera inspección del periodo no tiene peso
+        b4 = botella('B00000000004', self.jw_black, '2019-05-01', peso_actual=700)
+        inspeccionar(b4, '2019-06-04 12:00', None)
+        inspeccionar(b4, '2019-06-06 12:00', 950)
+        inspeccionar(b4, '2019-06-09 12:00', 700)
+
+        # Una sola inspección, dentro del periodo
+        b5 = botella('B00000000005', self.herradura, '2019-06-04', peso_inicial=1150, peso_actual=600)
+        inspeccionar(b5, '2019-06-06 12:00', 600)
+
+        # Salió en el periodo; sus inspecciones no tienen peso
+        b6 = botella('B00000000006', self.herradura, '2019-05-01', peso_actual=500, fecha_baja='2019-06-07')
+        inspeccionar(b6, '2019-06-04 12:00', None)
+        inspeccionar(b6, '2019-06-07 12:00', None)
+
+        # Salió antes del periodo
+        botella('B00000000007', self.herradura, '2019-05-01', peso_actual=500, fecha_baja='2019-05-20')
+
+        # Otra sucursal
+        b8 = botella('B00000000008', self.herradura, '2019-05-01', peso_actual=500, sucursal=otra_sucursal)
+        inspeccionar(b8, '2019-06-04 12:00', 1000)
+        inspeccionar(b8, '2019-06-06 12:00', 500)
+
+        # Sin consumo
+        botella('B00000000009', licor_43, '2019-05-01')
+
+    #-----------------------------------------------------------------------------
+    def test_motor_vs_referencia(self):
+        """ Testear que el motor SQL da los mismos resultados que la referencia en Python """
+
+        fecha_final = datetime.date(2019, 6, 10)
+
+        for dias, dias_entrega in [(7, 0), (7, 3), (14, 0), (3, 2), (30, 7)]:
+
+            with CaptureQueriesContext(connection) as queries:
+                productos = motor_restock.calcular(self.sucursal.id, dias, dias_entrega, fecha_final)
+            referencia = calcular_restock_python(self.sucursal.id, dias, dias_entrega, fecha_final)
+
+            # Todo el cálculo en un solo query
+            self.assertEqual(len(queries.captured_queries), 1)
+
+            self.assertEqual({producto['producto_id'] for producto in productos}, set(referencia))
+            for producto in productos:
+                esperado = referencia[producto['producto_id']]
+                self.assertEqual(producto['producto'], esperado['producto'])
+                self.assertAlmostEqual(producto['stock_ml'], esperado['stock_ml'], places=2)
+                self.assertAlmostEqual(producto['demanda_ml'], esperado['demanda_ml'], places=2)
+                self.assertAlmostEqual(producto['faltante_ml'], esperado['faltante_ml'], places=2)
+                self.assertEqual(producto['compra'], esperado['compra'])
+
+        # Con 7 días hay que surtir JW BLACK y HERRADURA, pero no LICOR 43
+        productos = motor_restock.calcular(self.sucursal.id, 7, 0, fecha_final)
+        self.assertEqual([producto['producto'] for producto in productos], ['HERRADURA BLANCO 700', 'JW BLACK 750'])
+
+    #-----------------------------------------------------------------------------
+    def test_motor_dias_entrega(self):
+        """ Testear que el tiempo de entrega aumenta la necesidad en proporción a la ventana """
+
+        fecha_final = datetime.date(2019, 6, 10)
+
+        sin_entrega = {p['producto_id']: p for p in motor_restock.calcular(self.sucursal.id, 7, 0, fecha_final)}
+        con_entrega = {p['producto_id']: p for p in motor_restock.calcular(self.sucursal.id, 7, 7, fecha_final)}
+
+        for producto_id, producto in sin_entrega.items():
+            self.assertAlmostEqual(con_entrega[producto_id]['necesidad_ml'], producto['demanda_ml'] * 2, places=2)
+            self.assertGreaterEqual(con_entrega[producto_id]['compra'], producto['compra'])
+
+    #-----------------------------------------------------------------------------
+    def test_endpoints_restock_parametros(self):
+        """ Testear los parámetros 'dias' y 'dias_entrega' de los endpoints de Restock """
+
+        for nombre in ['analytics:get-reporte-restock', 'analytics:get-reporte-restock-02']:
+            url = reverse(nombre, args=[self.sucursal.id])
+
+            with freeze_time('2019-06-10'):
+                res = self.client.get(url, {'dias': 7, 'dias_entrega': 7})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['status'], 'success')
+
+            res = self.client.get(url, {'dias': 0})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+            res = self.client.get(url, {'dias_entrega': 'x'})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+            res = self.client.get(url, {'dias': motor_restock.MAX_DIAS + 1})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+            res = self.client.get(url, {'dias_entrega': motor_restock.MAX_DIAS_ENTREGA + 1})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Los parámetros que no son los default se calculan en el request y no se guardan
+        self.assertFalse(models.SnapshotRestock.objects.exists())
+
+        with freeze_time('2019-06-10'):
+            res = self.client.get(reverse('analytics:get-reporte-restock', args=[self.sucursal.id]), {'dias_entrega': 7})
+        self.assertEqual(res.data['data'][0]['producto'], 'JW BLACK 750')
+        self.assertEqual(res.data['data'][0]['compra_sugerida'], 3)
+
+    #-----------------------------------------------------------------------------
+    def test_snapshot_restock(self):
+        """ Testear que el snapshot se guarda y se lee en un solo query mientras sea del mismo día """
+
+        with freeze_time('2019-06-10 10:00'):
+            snapshot = snapshots_restock.get_snapshot(self.sucursal.id)
+            esperado = motor_restock.calcular(self.sucursal.id)
+
+            self.assertEqual(snapshots_restock.get_productos(snapshot), esperado)
+
+        with freeze_time('2019-06-10 18:00'):
+            with self.assertNumQueries(1):
+                snapshot_leido = snapshots_restock.get_snapshot(self.sucursal.id)
+                snapshot_leido.sucursal.nombre
+            self.assertEqual(snapshot_leido.fecha_actualizacion, snapshot.fecha_actualizacion)
+
+        # Al día siguiente la ventana de demanda se movió y el snapshot se recalcula
+        with freeze_time('2019-06-11 10:00'):
+            snapshot_nuevo = snapshots_restock.get_snapshot(self.sucursal.id)
+        self.assertGreater(snapshot_nuevo.fecha_actualizacion, snapshot.fecha_actualizacion)
+        self.assertEqual(models.SnapshotRestock.objects.filter(sucursal=self.sucursal).count(), 1)
+
+    #-----------------------------------------------------------------------------
+    def test_endpoints_restock_snapshot_refresh(self):
+        """ Testear que los endpoints sirven el snapshot y lo recalculan con '?refresh=1' """
+
+        url = reverse('analytics:get-reporte-restock', args=[self.sucursal.id])
+        url_02 = reverse('analytics:get-reporte-restock-02', args=[self.sucursal.id])
+
+        with freeze_time('2019-06-10 10:00'):
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        actualizado = res.data['actualizado']
+        self.assertEqual(actualizado, timezone.localtime(models.SnapshotRestock.objects.get().fecha_actualizacion).isoformat())
+        self.assertEqual(res.data['fecha'], '10/06/2019')
+        compra_herradura = res.data['data'][0]['compra_sugerida']
+
+        # Llegan botellas nuevas de HERRADURA; el snapshot todavía no las ve
+        for folio in ['B00000000010', 'B00000000011']:
+            models.Botella.objects.create(
+                folio=folio, producto=self.herradura, sucursal=self.sucursal, almacen=self.almacen,
+                peso_cristal=500, peso_inicial=1200, peso_actual=1200, precio_unitario=self.herradura.precio_unitario
+            )
+
+        with freeze_time('2019-06-10 12:00'):
+            res = self.client.get(url)
+            res_02 = self.client.get(url_02)
+        self.assertEqual(res.data['data'][0]['compra_sugerida'], compra_herradura)
+        self.assertEqual(res.data['actualizado'], actualizado)
+        self.assertEqual(res_02.data['data'][0]['Producto'], 'HERRADURA BLANCO 700')
+
+        with freeze_time('2019-06-10 12:00'):
+            res = self.client.get(url, {'refresh': 1})
+            res_02 = self.client.get(url_02, {'refresh': 1})
+        self.assertGreater(res.data['actualizado'], actualizado)
+        self.assertNotIn('HERRADURA BLANCO 700', [item['producto'] for item in res.data['data']])
+        self.assertNotIn('HERRADURA BLANCO 700', [item['Producto'] for item in res_02.data['data']])
+
+    #-----------------------------------------------------------------------------
+    def test_snapshot_cerrar_inspeccion(self):
+        """ Testear que cerrar una inspección recalcula el snapshot default de la sucursal """
+
+        # Un snapshot de otros parámetros guardado antes de que solo se guardara el default
+        with freeze_time('2019-06-10 10:00'):
+            models.SnapshotRestock.objects.create(sucursal=self.sucursal, dias=7, dias_entrega=3)
+
+        with freeze_time('2019-06-10 12:00'):
+            inspeccion = models.Inspeccion.objects.create(almacen=self.almacen, sucursal=self.sucursal)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.patch(reverse('inventarios:cerrar-inspeccion'), {'inspeccion': inspeccion.id})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # Se creó el snapshot de los parámetros default y se borró el otro
+        snapshot = models.SnapshotRestock.objects.get(sucursal=self.sucursal)
+        self.assertEqual((snapshot.dias, snapshot.dias_entrega), (7, 0))
+        self.assertEqual(snapshot.fecha_actualizacion, datetime.datetime(2019, 6, 10, 12, 0, tzinfo=datetime.timezone.utc))
+
+        # Con otros parámetros el snapshot se calcula sin guardarse
+        with freeze_time('2019-06-10 12:00'):
+            snapshot = snapshots_restock.get_snapshot(self.sucursal.id, 7, 3)
+            self.assertEqual(snapshots_restock.get_productos(snapshot), motor_restock.calcular(self.sucursal.id, 7, 3))
+        self.assertIsNone(snapshot.pk)
+        self.assertEqual(models.SnapshotRestock.objects.filter(sucursal=self.sucursal).count(), 1)
+
+    #-----------------------------------------------------------------------------
+    def test_comando_actualizar_snapshots_restock(self):
+        """ Testear el comando que recalcula los snapshots de restock """
+
+        with freeze_time('2019-06-10 03:00'):
+            call_command('actualizar_snapshots_restock', sucursal=[self.sucursal.id], stdout=StringIO())
+
+        snapshot = models.SnapshotRestock.objects.get(sucursal=self.sucursal)
+        self.assertEqual((snapshot.dias, snapshot.dias_entrega), (motor_restock.DIAS, motor_restock.DIAS_ENTREGA))
+        self.assertEqual(len(snapshot.productos), 2)
+        self.assertFalse(models.SnapshotRestock.objects.exclude(sucursal=self.sucursal).exists())
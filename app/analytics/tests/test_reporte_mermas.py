@@ -1,4 +1,6 @@
 from django.test import TestCase
+from django.db import connection, IntegrityError
+from django.test.utils import CaptureQueriesContext
 from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Func, ExpressionWrapper, DecimalField, IntegerField, Case, When
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -860,6 +862,22 @@ class AnalyticsTests(TestCase):
         self.assertEqual(self.cr_maestro_dobel.volumen, consumos[0][1]['consumo_ventas'])   
         self.assertAlmostEqual(float(consumos[0][2]['consumo_real']), 432.60)
 
+
+    #----------------------------------------------------------------------
+    def test_script_reporte_numero_queries(self):
+        """
+        ----------------------------------------------------------------------
+        Testear que el consumo real y el consumo de ventas se calculan con una
+        query agrupada cada uno, sin importar el número de ingredientes
+        ----------------------------------------------------------------------
+        """
+
+        # 1 query para los ingredientes de la inspección + 1 para el consumo real + 1 para el consumo de ventas
+        with self.assertNumQueries(3):
+            consumos = reporte_mermas.calcular_consumos(self.inspeccion_2,  self.inspeccion_1.timestamp_alta, self.inspeccion_2.timestamp_alta)
+
+        self.assertEqual(len(consumos), 3)
+
     
     #----------------------------------------------------------------------
     @patch('analytics.reporte_mermas.calcular_consumos')
@@ -1296,11 +1314,7 @@ class AnalyticsTests(TestCase):
 
 
         # Checamos el status del response
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
-        
-        # Checamos el mensaje del response
-        mensaje = 'No estas autorizado para consultar reportes de esta sucursal.'
-        self.assertEqual(response.data['mensaje'], mensaje)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     
     #----------------------------------------------------------------------------------
@@ -1860,4 +1874,49 @@ class AnalyticsTests(TestCase):
         print(response.data)
 
 
-        self.assertEqual(response.data['status'], 'success')
\ No newline at end of file
+        self.assertEqual(response.data['status'], 'success')
+
+
+    #----------------------------------------------------------------------
+    @patch('analytics.reporte_mermas.calcular_consumos')
+    def test_crear_reporte_mermas_bulk(self, mock_consumos):
+
+        """
+        ----------------------------------------------------------------------
+        Testear que las mermas del reporte se insertan con una sola query y
+        que el reporte no se guarda si falla la creación de las mermas
+        ----------------------------------------------------------------------
+        """
+        mock_consumos.return_value = [
+            (self.licor_43, {'consumo_ventas': Decimal(60)}, {'consumo_real': Decimal(90)}),
+            (self.herradura_blanco, {'consumo_ventas': None}, {'consumo_real': Decimal(90)}),
+            (self.jw_black, {'consumo_ventas': Decimal(60)}, {'consumo_real': None})
+        ]
+
+        payload = {'inspeccion': self.inspeccion_2.id}
+        url = reverse('analytics:crear-reporte-mermas')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, payload)
+
+        inserts_mermas = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "core_mermaingrediente"')]
+        self.assertEqual(len(inserts_mermas), 1)
+
+        reporte_creado = models.ReporteMermas.objects.get(id=response.data['id'])
+        mermas = reporte_creado.mermas_reporte.order_by('id')
+        self.assertEqual(mermas.count(), 3)
+        self.assertEqual((mermas[1].merma, mermas[1].porcentaje), (Decimal(-90), Decimal(-100)))
+        self.assertEqual((mermas[2].merma, mermas[2].porcentaje), (Decimal(60), Decimal(100)))
+
+        # El cubo de mermas diarias se actualiza aunque el bulk_create no dispare señales
+        merma_diaria = models.MermaDiaria.objects.get(almacen=reporte_creado.almacen, ingrediente=self.jw_black, fecha=reporte_creado.fecha_final)
+        self.assertEqual((merma_diaria.merma, merma_diaria.porcentaje, merma_diaria.num_mermas), (Decimal(60), Decimal(100), 1))
+
+        # Si falla la inserción de las mermas, no queda un reporte huérfano
+        reporte_creado.delete()
+        reportes = models.ReporteMermas.objects.count()
+        with patch('core.models.MermaIngrediente.objects.bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post(url, payload)
+
+        self.assertEqual(models.ReporteMermas.objects.count(), reportes)
@@ -1,4 +1,6 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Func, ExpressionWrapper, DecimalField, Case, When
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -16,6 +18,7 @@ from decimal import Decimal, ROUND_DOWN, ROUND_UP
 import json
 from freezegun import freeze_time
 from analytics import reporte_mermas_tiempo as rm
+from analytics import cubo_mermas
 
 
 class AnalyticsTests(TestCase):
@@ -275,3 +278,131 @@ class AnalyticsTests(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'error')
+
+    #-----------------------------------------------------------------------------
+    def test_script_reporte_series(self):
+
+        """
+        -----------------------------------------------------------------------
+        Testear las series y la tabla del reporte
+        -----------------------------------------------------------------------
+        """
+
+        reporte = rm.get_mermas_tiempo(self.barra_1.id, self.fecha_inicial, self.fecha_final)
+
+        series = reporte['data']['series']
+        self.assertEqual([serie['Ingrediente'] for serie in series], ['HERRADURA BLANCO', 'LICOR 43', 'MAESTRO DOBEL'])
+        self.assertEqual(series[0]['Categoria'], 'TEQUILA')
+        self.assertEqual(series[0]['data'], [
+            {'Fecha': '2020-02-01', 'Consumo Facturado': 2000.0, 'Consumo Real': 2100.0, 'Merma': -100.0, 'Porcentaje': -5.0, 'Tragos': 1.7},
+            {'Fecha': '2020-02-02', 'Consumo Facturado': 1000.0, 'Consumo Real': 1100.0, 'Merma': -100.0, 'Porcentaje': -10.0, 'Tragos': 1.7},
+        ])
+
+        tabla = reporte['data']['tabla']
+        self.assertEqual(tabla[1], {
+            'Ingrediente': 'LICOR 43',
+            'Categoria': 'LICOR',
+            'Consumo Facturado': 3000.0,
+            'Consumo Real': 3600.0,
+            'Merma': -600.0,
+            'Porcentaje': -20.0,
+            'Tragos': 10.0
+        })
+
+        # Fuera del periodo no hay mermas
+        reporte = rm.get_mermas_tiempo(self.barra_1.id, '2020-03-01', '2020-03-31')
+        self.assertEqual(reporte['status'], 'error')
+
+    #-----------------------------------------------------------------------------
+    def test_cubo_mermas(self):
+
+        """
+        -----------------------------------------------------------------------
+        Testear que el cubo de mermas diarias se actualiza al guardar y
+        eliminar mermas
+        -----------------------------------------------------------------------
+        """
+
+        self.assertEqual(models.MermaDiaria.objects.filter(almacen=self.barra_1).count(), 6)
+
+        # Una segunda merma del mismo día se acumula en la celda del día
+        merma_extra = models.MermaIngrediente.objects.create(
+            ingrediente=self.herradura_blanco,
+            almacen=self.barra_1,
+            fecha_inicial=datetime.date(2020, 2, 1),
+            fecha_final=datetime.date(2020, 2, 2),
+            consumo_ventas=None,
+            consumo_real=300,
+        )
+        merma_diaria = models.MermaDiaria.objects.get(almacen=self.barra_1, ingrediente=self.herradura_blanco, fecha=datetime.date(2020, 2, 2))
+        self.assertEqual(merma_diaria.consumo_ventas, Decimal(1000))
+        self.assertEqual(merma_diaria.consumo_real, Decimal(1400))
+        self.assertEqual(merma_diaria.merma, Decimal(-400))
+        self.assertEqual(merma_diaria.porcentaje, Decimal(-40))
+        self.assertEqual(merma_diaria.num_mermas, 2)
+
+        reporte = rm.get_mermas_tiempo(self.barra_1.id, self.fecha_inicial, self.fecha_final)
+        self.assertEqual(reporte['data']['series'][0]['data'][1]['Merma'], -400.0)
+        self.assertEqual(reporte['data']['tabla'][0]['Merma'], -500.0)
+
+        # Al eliminar la merma la celda vuelve a su valor original
+        merma_extra.delete()
+        merma_diaria = models.MermaDiaria.objects.get(almacen=self.barra_1, ingrediente=self.herradura_blanco, fecha=datetime.date(2020, 2, 2))
+        self.assertEqual((merma_diaria.merma, merma_diaria.num_mermas), (Decimal(-100), 1))
+
+        # Al eliminar un reporte se eliminan las celdas de sus mermas
+        self.reporte_mermas_2.delete()
+        self.assertEqual(list(models.MermaDiaria.objects.filter(almacen=self.barra_1).values_list('fecha', flat=True).distinct()), [datetime.date(2020, 2, 1)])
+
+    #-----------------------------------------------------------------------------
+    def test_cubo_mermas_bloquea_almacen(self):
+
+        """
+        -----------------------------------------------------------------------
+        Testear que el almacen se bloquea antes de leer las mermas y
+        reemplazar las celdas del cubo
+        -----------------------------------------------------------------------
+        """
+
+        with CaptureQueriesContext(connection) as queries:
+            cubo_mermas.actualizar(self.barra_1.id, [datetime.date(2020, 2, 2)])
+
+        sql = [query['sql'] for query in queries.captured_queries]
+        bloqueo = next(i for i, query in enumerate(sql) if 'FOR UPDATE' in query)
+        lectura = next(i for i, query in enumerate(sql) if 'FROM "core_mermaingrediente"' in query)
+        borrado = next(i for i, query in enumerate(sql) if query.startswith('DELETE FROM "core_mermadiaria"'))
+
+        self.assertIn('"core_almacen"', sql[bloqueo])
+        self.assertLess(bloqueo, lectura)
+        self.assertLess(lectura, borrado)
+        self.assertEqual(models.MermaDiaria.objects.filter(almacen=self.barra_1, fecha=datetime.date(2020, 2, 2)).count(), 3)
+
+    #-----------------------------------------------------------------------------
+    def test_script_reporte_numero_queries(self):
+
+        """
+        -----------------------------------------------------------------------
+        Testear que el número de queries del reporte no depende del número
+        de ingredientes
+        -----------------------------------------------------------------------
+        """
+
+        categoria = models.Categoria.objects.create(nombre='VODKA')
+        for i in range(50):
+            ingrediente = models.Ingrediente.objects.create(codigo='VODK{:03d}'.format(i), nombre='VODKA {:03d}'.format(i), categoria=categoria, factor_peso=0.95)
+            models.MermaIngrediente.objects.create(
+                ingrediente=ingrediente,
+                reporte=self.reporte_mermas_2,
+                almacen=self.barra_1,
+                fecha_inicial=self.reporte_mermas_2.fecha_inicial,
+                fecha_final=self.reporte_mermas_2.fecha_final,
+                consumo_ventas=1000,
+                consumo_real=1000 + i,
+            )
+
+        # El almacen (con su sucursal), las mermas diarias y los nombres de los ingredientes
+        with self.assertNumQueries(3):
+            reporte = rm.get_mermas_tiempo(self.barra_1.id, self.fecha_inicial, self.fecha_final)
+
+        self.assertEqual(len(reporte['data']['series']), 53)
+        self.assertEqual(len(reporte['data']['tabla']), 53)
@@ -314,7 +314,7 @@ class AnalyticsTests(TestCase):
         # Construimos el request
         parametros = {
             'codigo_pos': '999',
-            'sucursal_id': 999
+            'sucursal_id': self.magno_brasserie.id
         }
         url = reverse('analytics:get-detalle-sin-registro', kwargs=parametros)
         response = self.client.get(url)
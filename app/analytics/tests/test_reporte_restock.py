@@ -1117,13 +1117,15 @@ class AnalyticsTests(TestCase):
         #print(reporte)
 
 
+        # Mismo cálculo que el Reporte de Restock, con el precio promedio de las botellas
         self.assertEqual(reporte['status'], 'success')
-        self.assertAlmostEqual(reporte['costo_total'], 1016.16)
+        self.assertAlmostEqual(reporte['costo_total'], 1688.96)
 
-        self.assertEqual(reporte['data'][0]['Producto'], 'HERRADURA BLANCO 700')
-        self.assertAlmostEqual(reporte['data'][0]['Compra'], 1.0)
+        self.assertEqual(reporte['data'][0]['Producto'], 'JW BLACK 750')
+        self.assertAlmostEqual(reporte['data'][0]['Compra'], 2.0)
+        self.assertAlmostEqual(reporte['data'][0]['Faltante'], 1495.2)
 
-        self.assertEqual(reporte['data'][1]['Producto'], 'JW BLACK 750')
+        self.assertEqual(reporte['data'][1]['Producto'], 'HERRADURA BLANCO 700')
         self.assertAlmostEqual(reporte['data'][1]['Compra'], 1.0)
 
 
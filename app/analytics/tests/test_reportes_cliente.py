@@ -0,0 +1,218 @@
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import models
+from analytics import paralelo
+from analytics import reportes_cliente
+from analytics import reporte_stock
+from analytics import reporte_costo_stock
+
+import datetime
+import threading
+
+
+class ReportesClienteTests(TestCase):
+    """ Tests para los reportes de varias sucursales en un solo request """
+
+    def setUp(self):
+
+        self.client = APIClient()
+
+        self.cliente = models.Cliente.objects.create(nombre='MAGNO BRASSERIE')
+        self.magno = models.Sucursal.objects.create(nombre='MAGNO-BRASSERIE', cliente=self.cliente)
+        self.atomic = models.Sucursal.objects.create(nombre='ATOMIC-THAI', cliente=self.cliente)
+        self.sin_acceso = models.Sucursal.objects.create(nombre='SIN ACCESO', cliente=self.cliente)
+        self.otro_cliente = models.Cliente.objects.create(nombre='OTRO CLIENTE')
+        self.otra = models.Sucursal.objects.create(nombre='OTRA', cliente=self.otro_cliente)
+
+        self.barra_magno = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.magno)
+        self.bodega_magno = models.Almacen.objects.create(nombre='BODEGA', numero=2, sucursal=self.magno)
+        self.barra_atomic = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.atomic)
+        self.barra_otra = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.otra)
+
+        self.usuario = get_user_model().objects.create(email='test@foodstack.mx', password='password123')
+        self.usuario.sucursales.add(self.magno, self.atomic, self.otra)
+        self.client.force_authenticate(self.usuario)
+
+        categoria = models.Categoria.objects.create(nombre='WHISKY')
+        self.whisky = models.Ingrediente.objects.create(codigo='WHIS001', nombre='JW BLACK', categoria=categoria, factor_peso=0.95)
+        self.jw_black = models.Producto.objects.create(folio='Ii0000000001', nombre_marca='JW BLACK 750', ingrediente=self.whisky, capacidad=750, precio_unitario=560.50)
+
+        def botella(folio, almacen, peso_actual=1200, estado='2'):
+            return models.Botella.objects.create(
+                folio=folio, producto=self.jw_black, sucursal=almacen.sucursal, almacen=almacen, estado=estado,
+                ingrediente='JW BLACK', capacidad=750, peso_cristal=500, peso_inicial=1200, peso_actual=peso_actual,
+                precio_unitario=self.jw_black.precio_unitario
+            )
+
+        botella('B00000000001', self.barra_magno, peso_actual=800, estado='1')
+        botella('B00000000002', self.bodega_magno)
+        botella('B00000000003', self.barra_magno, peso_actual=500, estado='0')
+        botella('B00000000004', self.barra_atomic)
+        botella('B00000000005', self.barra_otra)
+
+        for almacen, consumo_real in [(self.barra_magno, 1120), (self.bodega_magno, 1060), (self.barra_otra, 1000)]:
+            models.MermaIngrediente.objects.create(
+                ingrediente=self.whisky,
+                almacen=almacen,
+                fecha_inicial=datetime.date(2020, 2, 1),
+                fecha_final=datetime.date(2020, 2, 2),
+                consumo_ventas=1000,
+                consumo_real=consumo_real,
+            )
+
+    #-----------------------------------------------------------------------------
+    def test_reporte_stock_cliente(self):
+        """ Testear el reporte de stock de las sucursales de un cliente """
+
+        sucursales_id = [self.magno.id, self.atomic.id]
+
+        # Las sucursales se leen en un query y todas las botellas en otro
+        with self.assertNumQueries(2):
+            reportes = reportes_cliente.get_stock(sucursales_id)
+
+        # Los reportes van por sucursal, ordenados por nombre
+        self.assertEqual(list(reportes), [self.atomic.id, self.magno.id])
+
+        reporte = reportes[self.magno.id]
+        self.assertEqual(reporte['data']['sucursal'], 'MAGNO-BRASSERIE')
+        self.assertEqual(reporte['data']['total_botellas'], {'unidades__sum': 2})
+        self.assertEqual(reporte['data']['botellas'], [
+            {'id': self.jw_black.id, 'nombre_marca': 'JW BLACK 750', 'ingrediente__categoria__nombre': 'WHISKY', 'unidades': 2}
+        ])
+
+        # Por el endpoint solo salen las sucursales del cliente a las que tiene acceso el usuario
+        res = self.client.get(reverse('analytics:get-reporte-stock-cliente', args=[self.cliente.id]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(res.data['sucursales']), [self.atomic.id, self.magno.id])
+        self.assertEqual(res.data['sucursales'][self.atomic.id]['data']['total_botellas'], {'unidades__sum': 1})
+
+        # El reporte de cada sucursal es el mismo que el de su endpoint individual, también sin botellas en stock
+        self.assertEqual(reportes[self.magno.id], reporte_stock.get_stock(self.magno))
+        self.assertEqual(reportes_cliente.get_stock([self.sin_acceso.id])[self.sin_acceso.id], reporte_stock.get_stock(self.sin_acceso))
+
+    #-----------------------------------------------------------------------------
+    def test_reporte_costo_stock_cliente(self):
+        """ Testear el reporte de costo de stock de varias sucursales """
+
+        res = self.client.get(reverse('analytics:get-reporte-costo-stock-sucursales'), {'sucursales': '{},{}'.format(self.magno.id, self.otra.id)})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        reportes = res.data['sucursales']
+        self.assertEqual(list(reportes), [self.magno.id, self.otra.id])
+
+        # Un reporte por almacen, sin la botella vacía
+        reporte = reportes[self.magno.id]
+        self.assertEqual([almacen['nombre_almacen'] for almacen in reporte['almacenes']], ['BARRA 1', 'BODEGA'])
+        self.assertEqual([botella['folio'] for botella in reporte['almacenes'][0]['data']], ['B00000000001'])
+
+        # (800 - 500) * (2 - 0.95) = 315 ml y (1200 - 500) * (2 - 0.95) = 735 ml a 560.50 / 750 por ml
+        self.assertEqual(reporte['almacenes'][0]['costo_total'], 235.41)
+        self.assertEqual(reporte['almacenes'][1]['costo_total'], 549.29)
+        self.assertEqual(reporte['costo_total'], 784.7)
+
+        # El reporte de cada almacen es el mismo que el de su endpoint individual
+        self.assertEqual(reporte['almacenes'][0], reporte_costo_stock.get_costo_stock(self.barra_magno))
+
+    #-----------------------------------------------------------------------------
+    def test_reporte_restock_cliente(self):
+        """ Testear el reporte de restock de las sucursales de un cliente """
+
+        res = self.client.get(reverse('analytics:get-reporte-restock-02-cliente', args=[self.cliente.id]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(res.data['sucursales']), [self.atomic.id, self.magno.id])
+        self.assertIn('actualizado', res.data['sucursales'][self.magno.id])
+
+        # Se crearon los snapshots de las dos sucursales
+        snapshots = models.SnapshotRestock.objects.filter(sucursal__in=[self.magno, self.atomic])
+        self.assertEqual(snapshots.count(), 2)
+
+        # Con los snapshots vigentes son dos queries: las sucursales y los snapshots
+        with self.assertNumQueries(2):
+            reportes_cliente.get_restock([self.magno.id, self.atomic.id])
+
+        res = self.client.get(reverse('analytics:get-reporte-restock-02-cliente', args=[self.cliente.id]), {'dias': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    #-----------------------------------------------------------------------------
+    def test_reporte_mermas_tiempo_cliente(self):
+        """ Testear el reporte de mermas en el tiempo de las sucursales de un cliente """
+
+        fechas = {'fecha_inicial': '2020-02-01', 'fecha_final': '2020-02-07'}
+
+        with self.assertNumQueries(4):
+            reportes = reportes_cliente.get_mermas_tiempo([self.magno.id, self.atomic.id], datetime.date(2020, 2, 1), datetime.date(2020, 2, 7))
+
+        # ATOMIC-THAI no tiene mermas en el periodo
+        self.assertEqual(reportes[self.atomic.id]['almacenes'], [])
+
+        almacenes = reportes[self.magno.id]['almacenes']
+        self.assertEqual([almacen['almacen'] for almacen in almacenes], ['BARRA 1', 'BODEGA'])
+        self.assertEqual(almacenes[0]['data']['tabla'][0]['Merma'], -120.0)
+        self.assertEqual(almacenes[1]['data']['tabla'][0]['Merma'], -60.0)
+        self.assertEqual(almacenes[1]['data']['series'][0]['data'][0]['Fecha'], '2020-02-02')
+
+        res = self.client.get(reverse('analytics:get-reporte-mermas-tiempo-cliente', kwargs=dict(fechas, cliente_id=self.cliente.id)))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['sucursales'][self.magno.id]['almacenes'], almacenes)
+
+        res = self.client.get(reverse('analytics:get-reporte-mermas-tiempo-cliente', kwargs={'cliente_id': self.cliente.id, 'fecha_inicial': '2020-02-31', 'fecha_final': '2020-03-01'}))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    #-----------------------------------------------------------------------------
+    def test_sucursales_cliente_permisos(self):
+        """ Testear que solo se reportan sucursales del usuario (y del cliente) """
+
+        url_cliente = reverse('analytics:get-reporte-stock-cliente', args=[self.cliente.id])
+        url_sucursales = reverse('analytics:get-reporte-stock-sucursales')
+
+        # Una lista de sucursales dentro del cliente
+        res = self.client.get(url_cliente, {'sucursales': self.magno.id})
+        self.assertEqual(list(res.data['sucursales']), [self.magno.id])
+
+        # Sucursales del cliente sin acceso, o de otro cliente
+        res = self.client.get(url_cliente, {'sucursales': '{},{}'.format(self.magno.id, self.sin_acceso.id)})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        res = self.client.get(url_cliente, {'sucursales': self.otra.id})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        res = self.client.get(url_sucursales, {'sucursales': self.sin_acceso.id})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        # Un cliente sin sucursales del usuario
+        res = self.client.get(reverse('analytics:get-reporte-stock-cliente', args=[models.Cliente.objects.create(nombre='NUEVO').id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        # Sin sucursales o con una lista inválida
+        res = self.client.get(url_sucursales)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(url_sucursales, {'sucursales': '1,a'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ParaleloTests(SimpleTestCase):
+    """ Tests para la ejecución en paralelo de los cálculos por sucursal """
+
+    #-----------------------------------------------------------------------------
+    @override_settings(ANALYTICS_HILOS=2)
+    def test_ejecutar_en_paralelo(self):
+        """ Testear que las tareas corren al mismo tiempo y los resultados van por llave """
+
+        # Cada tarea espera a la otra, así que solo terminan si corren en hilos distintos
+        barrera = threading.Barrier(2, timeout=5)
+
+        def tarea(llave):
+            barrera.wait()
+            return llave * 10
+
+        self.assertEqual(paralelo.ejecutar(tarea, [2, 1]), {2: 20, 1: 10})
+
+    #-----------------------------------------------------------------------------
+    @override_settings(ANALYTICS_HILOS=1)
+    def test_ejecutar_un_hilo(self):
+        """ Testear que con un hilo las tareas corren en el hilo del request """
+
+        hilos = paralelo.ejecutar(lambda llave: threading.get_ident(), [1, 2])
+        self.assertEqual(set(hilos.values()), {threading.get_ident()})
@@ -20,4 +20,20 @@ urlpatterns = [
     path('get-detalle-botellas-merma/merma/<int:merma_id>/', views.get_botellas_merma, name='get-detalle-botellas-merma'),
     path('get-reporte-restock-02/sucursal/<int:sucursal_id>', views.get_reporte_restock_02, name='get-reporte-restock-02'),
     path('get-reporte-mermas-tiempo/almacen/<int:almacen_id>/fecha_inicial/<str:fecha_inicial>/fecha_final/<str:fecha_final>', views.get_reporte_mermas_tiempo, name='get-reporte-mermas-tiempo'),
+    path('exportar-reporte-stock/', views.exportar_reporte_stock, name='exportar-reporte-stock'),
+    path('exportar-reporte-stock/sucursal/<int:sucursal_id>', views.exportar_reporte_stock, name='exportar-reporte-stock-sucursal'),
+    path('exportar-reporte-costo-stock/', views.exportar_reporte_costo_stock, name='exportar-reporte-costo-stock'),
+    path('exportar-reporte-costo-stock/almacen/<int:almacen_id>', views.exportar_reporte_costo_stock, name='exportar-reporte-costo-stock-almacen'),
+    path('exportar-reporte-mermas-tiempo/fecha_inicial/<str:fecha_inicial>/fecha_final/<str:fecha_final>', views.exportar_reporte_mermas_tiempo, name='exportar-reporte-mermas-tiempo'),
+    path('exportar-reporte-mermas-tiempo/almacen/<int:almacen_id>/fecha_inicial/<str:fecha_inicial>/fecha_final/<str:fecha_final>', views.exportar_reporte_mermas_tiempo, name='exportar-reporte-mermas-tiempo-almacen'),
+    path('exportar-reporte-restock-02/', views.exportar_reporte_restock_02, name='exportar-reporte-restock-02'),
+    path('exportar-reporte-restock-02/sucursal/<int:sucursal_id>', views.exportar_reporte_restock_02, name='exportar-reporte-restock-02-sucursal'),
+    path('get-reporte-stock/sucursales/', views.get_reporte_stock_cliente, name='get-reporte-stock-sucursales'),
+    path('get-reporte-stock/cliente/<int:cliente_id>', views.get_reporte_stock_cliente, name='get-reporte-stock-cliente'),
+    path('get-reporte-costo-stock/sucursales/', views.get_reporte_costo_stock_cliente, name='get-reporte-costo-stock-sucursales'),
+    path('get-reporte-costo-stock/cliente/<int:cliente_id>', views.get_reporte_costo_stock_cliente, name='get-reporte-costo-stock-cliente'),
+    path('get-reporte-restock-02/sucursales/', views.get_reporte_restock_02_cliente, name='get-reporte-restock-02-sucursales'),
+    path('get-reporte-restock-02/cliente/<int:cliente_id>', views.get_reporte_restock_02_cliente, name='get-reporte-restock-02-cliente'),
+    path('get-reporte-mermas-tiempo/sucursales/fecha_inicial/<str:fecha_inicial>/fecha_final/<str:fecha_final>', views.get_reporte_mermas_tiempo_cliente, name='get-reporte-mermas-tiempo-sucursales'),
+    path('get-reporte-mermas-tiempo/cliente/<int:cliente_id>/fecha_inicial/<str:fecha_inicial>/fecha_final/<str:fecha_final>', views.get_reporte_mermas_tiempo_cliente, name='get-reporte-mermas-tiempo-cliente'),
 ]
\ No newline at end of file
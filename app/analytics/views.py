@@ -2,13 +2,16 @@ from rest_framework import viewsets, mixins
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, action, permission_classes, authentication_classes
-from rest_framework.authentication import TokenAuthentication
-#from inventarios.permissions import PermisoSucursal
+from users.authentication import CachedTokenAuthentication
+from inventarios.permissions import PermisoSucursal
+from inventarios import permissions
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
+from rest_framework.exceptions import PermissionDenied
 
 from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Func, ExpressionWrapper, DecimalField, Case, When
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
 #from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists
 #from django.shortcuts import get_object_or_404
 #import math
@@ -21,7 +24,11 @@ from analytics import reporte_stock as rs
 from analytics import reporte_restock as restock
 from analytics import reporte_productos_sin_registro as r_sin_registro
 from analytics import reporte_restock_02 as restock_02
+from analytics import motor_restock
+from analytics import snapshots_restock
 from analytics import reporte_mermas_tiempo
+from analytics import exportaciones
+from analytics import reportes_cliente
 from core import models
 
 
@@ -31,8 +38,8 @@ Endpoint para crear un Reporte de Mermas
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_reporte_mermas(request):
 
     if request.method == 'POST':
@@ -64,8 +71,8 @@ Endpoint para ver un Reporte de Mermas especifico
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_mermas(request, reporte_id):
 
     if request.method == 'GET':
@@ -89,29 +96,15 @@ Endpoint para ver los reportes de mermas de un almacen
 ----------------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_lista_reportes_mermas(request, almacen_id):
 
     if request.method == 'GET':
 
-        #inspeccion_id = int(inspeccion_id)
-        almacen = int(almacen_id)
-        almacen = models.Almacen.objects.get(id=almacen_id)
-        usuario = request.user
-
-        sucursal_id = almacen.sucursal.id
-        sucursales_usuario = usuario.sucursales.all()
-        lista_sucursales = [sucursal.id for sucursal in sucursales_usuario]
-
-        if sucursal_id in lista_sucursales:
-            queryset = models.ReporteMermas.objects.filter(almacen=almacen).order_by('-fecha_registro')
-            serializer = serializers.ReporteMermasListSerializer(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        else:
-            mensaje = {'mensaje': 'No estas autorizado para consultar reportes de esta sucursal.'}
-            return Response(mensaje)
+        queryset = models.ReporteMermas.objects.filter(almacen_id=almacen_id).order_by('-fecha_registro')
+        serializer = serializers.ReporteMermasListSerializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     else: 
         Response(status=status.HTTP_400_BAD_REQUEST)
@@ -123,8 +116,8 @@ Endpoint para ver un Reporte de Costo de Stock para un almacen
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_costo_stock(request, almacen_id):
 
     if request.method == 'GET':
@@ -155,8 +148,8 @@ Endpoint para ver el detalle de ventas de una merma dentro de un Reporte de Merm
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_detalle_ventas_merma(request, merma_id):
 
     if request.method == 'GET':
@@ -181,8 +174,8 @@ Endpoint para ver un Reporte de Stock para una sucursal
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_stock(request, sucursal_id):
 
     if request.method == 'GET':
@@ -208,8 +201,8 @@ Endpoint para ver el detalle de un item en el Reporte de Stock
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_detalle_stock(request, producto_id, sucursal_id):
 
     if request.method == 'GET':
@@ -234,8 +227,8 @@ Endpoint para ver el Reporte de Productos Sin Registro
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_productos_sin_registro(request, sucursal_id):
 
     if request.method == 'GET':
@@ -260,8 +253,8 @@ Endpoint para ver todas las instancias de un ProductoSinRegistro
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_detalle_sin_registro(request, codigo_pos, sucursal_id):
 
     if request.method == 'GET':
@@ -275,20 +268,66 @@ def get_detalle_sin_registro(request, codigo_pos, sucursal_id):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+"""
+-----------------------------------------------------------------------------------
+Toma del query string la ventana de demanda ('dias') y el tiempo de entrega del
+proveedor ('dias_entrega') para los reportes de Restock. Retorna None si no son
+válidos.
+-----------------------------------------------------------------------------------
+"""
+MENSAJE_PARAMETROS_RESTOCK = "'dias' debe ser un entero entre 1 y {} y 'dias_entrega' un entero entre 0 y {}.".format(
+    motor_restock.MAX_DIAS, motor_restock.MAX_DIAS_ENTREGA
+)
+
+def get_parametros_restock(request):
+
+    try:
+        dias = int(request.query_params.get('dias', motor_restock.DIAS))
+        dias_entrega = int(request.query_params.get('dias_entrega', motor_restock.DIAS_ENTREGA))
+    except ValueError:
+        return None
+
+    if not 1 <= dias <= motor_restock.MAX_DIAS or not 0 <= dias_entrega <= motor_restock.MAX_DIAS_ENTREGA:
+        return None
+
+    return {'dias': dias, 'dias_entrega': dias_entrega}
+
+
+"""
+-----------------------------------------------------------------------------------
+Toma el SnapshotRestock de la sucursal para los reportes de Restock. Con
+'?refresh=1' se recalcula aunque esté vigente.
+-----------------------------------------------------------------------------------
+"""
+def get_snapshot_restock(request, sucursal_id, parametros):
+
+    refrescar = request.query_params.get('refresh') == '1'
+
+    return snapshots_restock.get_snapshot(sucursal_id, refrescar=refrescar, **parametros)
+
+
 """
 -----------------------------------------------------------------------------------
 Endpoint para el Reporte de Restock
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_restock(request, sucursal_id):
 
     if request.method == 'GET':
 
-        # Ejecutamos el reporte
-        reporte = restock.calcular_restock(sucursal_id)
+        parametros = get_parametros_restock(request)
+        if parametros is None:
+            return Response({'mensaje': MENSAJE_PARAMETROS_RESTOCK}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Tomamos el snapshot del reporte y le damos formato
+        snapshot = get_snapshot_restock(request, sucursal_id, parametros)
+        fecha_actualizacion = timezone.localtime(snapshot.fecha_actualizacion)
+
+        reporte = restock.formatear(snapshot.sucursal, snapshots_restock.get_productos(snapshot), snapshot.dias, fecha_actualizacion.date())
+        reporte['actualizado'] = fecha_actualizacion.isoformat()
 
         return Response(reporte)
 
@@ -303,8 +342,8 @@ Endpoint para el Detalle de Botellas de Merma
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_botellas_merma(request, merma_id):
 
     if request.method == 'GET':
@@ -321,18 +360,27 @@ def get_botellas_merma(request, merma_id):
 """
 -----------------------------------------------------------------------------------
 Endpoint para el Reporte de Restock 02
-- Este reporte utiliza Pandas para optimizar recursos
+- El reporte se toma del SnapshotRestock de la sucursal (ver motor_restock.py
+  y snapshots_restock.py); aquí solo se le da formato
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_restock_02(request, sucursal_id):
 
     if request.method == 'GET':
 
-        # Ejecutamos el reporte
-        reporte = restock_02.calcular_restock(sucursal_id)
+        parametros = get_parametros_restock(request)
+        if parametros is None:
+            return Response({'mensaje': MENSAJE_PARAMETROS_RESTOCK}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Tomamos el snapshot del reporte y le damos formato
+        snapshot = get_snapshot_restock(request, sucursal_id, parametros)
+        fecha_actualizacion = timezone.localtime(snapshot.fecha_actualizacion)
+
+        reporte = restock_02.formatear(snapshot.sucursal, snapshots_restock.get_productos(snapshot), fecha_actualizacion.date())
+        reporte['actualizado'] = fecha_actualizacion.isoformat()
 
         return Response(reporte)
 
@@ -346,8 +394,8 @@ Endpoint para el Reporte de Mermas x Tiempo
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_reporte_mermas_tiempo(request, almacen_id, fecha_inicial, fecha_final):
 
     if request.method == 'GET':
@@ -359,3 +407,211 @@ def get_reporte_mermas_tiempo(request, almacen_id, fecha_inicial, fecha_final):
 
     else:
         return Response(status=status.HTTP_400_BAD_REQUEST)
+
+
+"""
+-----------------------------------------------------------------------------------
+Endpoints para exportar los reportes a CSV (default) o XLSX ('?formato=xlsx').
+
+Sin sucursal o almacen en la URL se exportan todas las sucursales del usuario.
+-----------------------------------------------------------------------------------
+"""
+MENSAJE_FORMATO_EXPORTACION = "'formato' debe ser 'csv' o 'xlsx'."
+
+def get_formato_exportacion(request):
+
+    formato = request.query_params.get('formato', 'csv')
+    return formato if formato in exportaciones.FORMATOS else None
+
+
+def get_sucursales_exportacion(request, sucursal_id=None):
+
+    if sucursal_id is not None:
+        return [int(sucursal_id)]
+
+    # Se exportan sucursales completas: las sucursales del usuario se leen de la base de datos
+    return sorted(permissions.get_sucursales_usuario(request.user, usar_cache=False))
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def exportar_reporte_stock(request, sucursal_id=None):
+
+    formato = get_formato_exportacion(request)
+    if formato is None:
+        return Response({'mensaje': MENSAJE_FORMATO_EXPORTACION}, status=status.HTTP_400_BAD_REQUEST)
+
+    sucursales_id = get_sucursales_exportacion(request, sucursal_id)
+    filas = exportaciones.filas_stock(sucursales_id)
+
+    return exportaciones.respuesta(formato, 'reporte-stock', filas)
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def exportar_reporte_costo_stock(request, almacen_id=None):
+
+    formato = get_formato_exportacion(request)
+    if formato is None:
+        return Response({'mensaje': MENSAJE_FORMATO_EXPORTACION}, status=status.HTTP_400_BAD_REQUEST)
+
+    if almacen_id is not None:
+        filas = exportaciones.filas_costo_stock(almacen_id=almacen_id)
+    else:
+        filas = exportaciones.filas_costo_stock(sucursales_id=get_sucursales_exportacion(request))
+
+    return exportaciones.respuesta(formato, 'reporte-costo-stock', filas)
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def exportar_reporte_mermas_tiempo(request, fecha_inicial, fecha_final, almacen_id=None):
+
+    formato = get_formato_exportacion(request)
+    if formato is None:
+        return Response({'mensaje': MENSAJE_FORMATO_EXPORTACION}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        fecha_inicial = datetime.datetime.strptime(fecha_inicial, '%Y-%m-%d').date()
+        fecha_final = datetime.datetime.strptime(fecha_final, '%Y-%m-%d').date()
+    except ValueError:
+        return Response({'mensaje': 'Las fechas deben tener el formato AAAA-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if almacen_id is not None:
+        filas = exportaciones.filas_mermas_tiempo(fecha_inicial, fecha_final, almacen_id=almacen_id)
+    else:
+        filas = exportaciones.filas_mermas_tiempo(fecha_inicial, fecha_final, sucursales_id=get_sucursales_exportacion(request))
+
+    return exportaciones.respuesta(formato, 'reporte-mermas-tiempo', filas)
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def exportar_reporte_restock_02(request, sucursal_id=None):
+
+    formato = get_formato_exportacion(request)
+    if formato is None:
+        return Response({'mensaje': MENSAJE_FORMATO_EXPORTACION}, status=status.HTTP_400_BAD_REQUEST)
+
+    parametros = get_parametros_restock(request)
+    if parametros is None:
+        return Response({'mensaje': MENSAJE_PARAMETROS_RESTOCK}, status=status.HTTP_400_BAD_REQUEST)
+
+    sucursales_id = get_sucursales_exportacion(request, sucursal_id)
+    filas = exportaciones.filas_restock_02(sucursales_id, **parametros)
+
+    return exportaciones.respuesta(formato, 'reporte-restock', filas)
+
+
+"""
+-----------------------------------------------------------------------------------
+Endpoints de los reportes de varias sucursales en un solo request (ver
+reportes_cliente.py). La respuesta es {sucursal_id: reporte}.
+
+- Con cliente en la URL se toman las sucursales del cliente a las que tiene acceso
+  el usuario, o solo las indicadas en '?sucursales=1,2'
+- Sin cliente se toman las sucursales de '?sucursales=1,2'
+
+Si el usuario no tiene acceso a alguna de las sucursales se responde 403.
+-----------------------------------------------------------------------------------
+"""
+MENSAJE_SUCURSALES_CLIENTE = "'sucursales' debe ser una lista de ids separados por comas."
+
+def get_sucursales_cliente(request, cliente_id=None):
+
+    sucursales = request.query_params.get('sucursales')
+
+    # Sin lista de sucursales tomamos las del cliente que tiene el usuario
+    if sucursales is None:
+        if cliente_id is None:
+            return None
+
+        sucursales_cliente = models.Sucursal.objects.filter(cliente_id=cliente_id).values_list('id', flat=True)
+        sucursales_id = sorted(set(sucursales_cliente) & permissions.get_sucursales_usuario(request.user, usar_cache=False))
+        if len(sucursales_id) == 0:
+            raise PermissionDenied()
+
+        return sucursales_id
+
+    try:
+        sucursales_id = sorted({int(sucursal_id) for sucursal_id in sucursales.split(',')})
+    except ValueError:
+        return None
+
+    if cliente_id is not None:
+        if models.Sucursal.objects.filter(id__in=sucursales_id, cliente_id=cliente_id).count() != len(sucursales_id):
+            raise PermissionDenied()
+
+    if not all(permissions.tiene_sucursal(request.user, sucursal_id) for sucursal_id in sucursales_id):
+        raise PermissionDenied()
+
+    return sucursales_id
+
+
+def respuesta_cliente(reportes):
+
+    return Response({'status': 'success', 'sucursales': reportes})
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def get_reporte_stock_cliente(request, cliente_id=None):
+
+    sucursales_id = get_sucursales_cliente(request, cliente_id)
+    if sucursales_id is None:
+        return Response({'mensaje': MENSAJE_SUCURSALES_CLIENTE}, status=status.HTTP_400_BAD_REQUEST)
+
+    return respuesta_cliente(reportes_cliente.get_stock(sucursales_id))
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def get_reporte_costo_stock_cliente(request, cliente_id=None):
+
+    sucursales_id = get_sucursales_cliente(request, cliente_id)
+    if sucursales_id is None:
+        return Response({'mensaje': MENSAJE_SUCURSALES_CLIENTE}, status=status.HTTP_400_BAD_REQUEST)
+
+    return respuesta_cliente(reportes_cliente.get_costo_stock(sucursales_id))
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def get_reporte_restock_02_cliente(request, cliente_id=None):
+
+    sucursales_id = get_sucursales_cliente(request, cliente_id)
+    if sucursales_id is None:
+        return Response({'mensaje': MENSAJE_SUCURSALES_CLIENTE}, status=status.HTTP_400_BAD_REQUEST)
+
+    parametros = get_parametros_restock(request)
+    if parametros is None:
+        return Response({'mensaje': MENSAJE_PARAMETROS_RESTOCK}, status=status.HTTP_400_BAD_REQUEST)
+
+    refrescar = request.query_params.get('refresh') == '1'
+
+    return respuesta_cliente(reportes_cliente.get_restock(sucursales_id, refrescar=refrescar, **parametros))
+
+
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def get_reporte_mermas_tiempo_cliente(request, fecha_inicial, fecha_final, cliente_id=None):
+
+    sucursales_id = get_sucursales_cliente(request, cliente_id)
+    if sucursales_id is None:
+        return Response({'mensaje': MENSAJE_SUCURSALES_CLIENTE}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        fecha_inicial = datetime.datetime.strptime(fecha_inicial, '%Y-%m-%d').date()
+        fecha_final = datetime.datetime.strptime(fecha_final, '%Y-%m-%d').date()
+    except ValueError:
+        return Response({'mensaje': 'Las fechas deben tener el formato AAAA-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return respuesta_cliente(reportes_cliente.get_mermas_tiempo(sucursales_id, fecha_inicial, fecha_final))
@@ -89,14 +89,26 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
+#
+# DB_CONN_MAX_AGE: segundos que se mantiene abierta una conexión entre requests
+# (0 abre y cierra una conexión por request). Con DB_CONN_HEALTH_CHECKS las
+# conexiones se verifican antes de reutilizarlas (ver core/conexiones.py).
+#
+# DB_POOL=1 indica que la app se conecta a través de PgBouncer en modo
+# 'transaction', que no soporta cursores del lado del servidor
+# (ver docker-compose.pool.yml).
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))),
+        'DISABLE_SERVER_SIDE_CURSORS': bool(int(os.environ.get('DB_POOL', 0))),
     }
 }
 
@@ -143,4 +155,66 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+
+# Autenticación
+# Los tokens se guardan en un cache local de cada proceso durante TOKEN_CACHE_TTL
+# segundos. Si se define TOKEN_CACHE_ALIAS (un alias de CACHES), también se guardan
+# en ese cache, compartido entre procesos (ver users/authentication.py).
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 60))
+
+TOKEN_CACHE_ALIAS = os.environ.get('TOKEN_CACHE_ALIAS') or None
+
+
+# Permisos por sucursal
+# Las sucursales de cada usuario se guardan en cache durante PERMISOS_CACHE_TTL
+# segundos. Si se define PERMISOS_CACHE_ALIAS (un alias de CACHES compartido entre
+# procesos), la invalidación al cambiar las sucursales de un usuario llega a todos
+# los procesos (ver inventarios/permissions.py).
+
+PERMISOS_CACHE_TTL = int(os.environ.get('PERMISOS_CACHE_TTL', 30))
+
+PERMISOS_CACHE_ALIAS = os.environ.get('PERMISOS_CACHE_ALIAS') or None
+
+
+# Procesamiento de reportes de ventas
+# Si está activo, los reportes se guardan como CargaVentas y los procesa el
+# worker 'python manage.py procesar_ventas --loop' en segundo plano
+
+VENTAS_PROCESAMIENTO_ASINCRONO = bool(int(os.environ.get('VENTAS_PROCESAMIENTO_ASINCRONO', 0)))
+
+
+# Reportes de varias sucursales
+# Los cálculos independientes de cada sucursal (p. ej. los snapshots de restock que
+# hay que recalcular) se reparten en hasta ANALYTICS_HILOS hilos, cada uno con su
+# propia conexión a la base de datos (ver analytics/paralelo.py). Con 1 se ejecutan
+# uno por uno.
+
+ANALYTICS_HILOS = int(os.environ.get('ANALYTICS_HILOS', 4))
+
+
+# Parsers de reportes de ventas
+# VENTAS_PARSERS asigna a cada sucursal (por slug) su parser y el almacén de su
+# caja por defecto. Las sucursales que no aparecen aquí usan el parser que
+# corresponde a su slug, p. ej. 'MAGNO-BRASSERIE' -> 'parser_magno_brasserie'.
+#
+#   VENTAS_PARSERS = {
+#       'MAGNO-BRASSERIE': {'parser': 'parser_magno_brasserie', 'almacen': 'BARRA 1', 'caja': 1},
+#   }
+#
+# VENTAS_FORMATOS declara formatos de POS que no necesitan un módulo propio
+# (ver ventas/parsers/declarativo.py).
+
+VENTAS_PARSERS = {}
+
+VENTAS_FORMATOS = {}
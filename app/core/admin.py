@@ -55,4 +55,7 @@ admin.site.register(models.Venta)
 admin.site.register(models.ConsumoRecetaVendida)
 admin.site.register(models.Producto)
 admin.site.register(models.Botella)
-admin.site.register(models.ProductoSinRegistro)
\ No newline at end of file
+admin.site.register(models.ProductoSinRegistro)
+admin.site.register(models.CargaVentas)
+admin.site.register(models.SnapshotRestock)
+admin.site.register(models.MermaDiaria)
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Mantenemos la línea de tiempo de las botellas al guardar o eliminar sus inspecciones
+        from core import linea_tiempo
+        linea_tiempo.conectar()
+        # Verificamos las conexiones persistentes a la base de datos antes de reutilizarlas
+        from core import conexiones
+        conexiones.conectar()
@@ -0,0 +1,32 @@
+import django
+from django.core.signals import request_started
+from django.db import connections
+
+
+"""
+-----------------------------------------------------------------------------------
+Verificación de las conexiones persistentes (CONN_MAX_AGE > 0).
+
+Django 3.2 reutiliza una conexión persistente sin verificar que siga viva, así que
+el primer request después de un reinicio de Postgres (o de PgBouncer, o de un
+timeout del servidor) falla con un error de conexión. Si la base de datos tiene
+'CONN_HEALTH_CHECKS', al inicio de cada request verificamos las conexiones que se
+van a reutilizar y cerramos las que ya no sirven, para que Django abra una nueva.
+
+Django 4.1 ya hace esta verificación con el mismo setting, así que ahí no se conecta.
+-----------------------------------------------------------------------------------
+"""
+def verificar_conexiones(**kwargs):
+
+    for conexion in connections.all():
+        if not conexion.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if conexion.connection is None or conexion.in_atomic_block:
+            continue
+        if not conexion.is_usable():
+            conexion.close()
+
+
+def conectar():
+    if django.VERSION < (4, 1):
+        request_started.connect(verificar_conexiones, dispatch_uid='core_verificar_conexiones')
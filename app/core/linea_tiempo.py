@@ -0,0 +1,211 @@
+import collections
+
+from django.db import transaction
+from django.db.models import F, Q, Count, Subquery, OuterRef, Case, When, Value, IntegerField
+from django.db.models.functions import NullIf
+from django.db.models.signals import post_save, post_delete
+
+from core import models
+
+
+"""
+-----------------------------------------------------------------------------------
+Línea de tiempo de inspecciones por botella.
+
+Los reportes necesitan el peso de la última, penúltima y primera inspección de
+cada botella. En lugar de calcularlos con subqueries correlacionados por botella,
+los guardamos en LineaTiempoBotella y los recalculamos cada vez que cambian los
+ItemInspeccion de la botella.
+
+Las operaciones masivas (bulk_create, update) no disparan señales, así que quien
+las use debe llamar 'actualizar()' con las botellas afectadas.
+
+Dos requests pueden recalcular la misma botella al mismo tiempo (p. ej. dos
+ItemInspeccion de la botella que se guardan a la vez). Para que no choquen al
+reemplazar la línea de tiempo, primero se bloquean las filas de las botellas.
+-----------------------------------------------------------------------------------
+"""
+
+
+"""
+-----------------------------------------------------------------------------------
+Resume las inspecciones de una botella. 'inspecciones' es una lista de tuplas
+(peso_botella, timestamp_inspeccion) ordenada de la más antigua a la más reciente.
+-----------------------------------------------------------------------------------
+"""
+def resumir(inspecciones):
+
+    pesadas = [inspeccion for inspeccion in inspecciones if inspeccion[0] is not None]
+    sin_peso = [inspeccion for inspeccion in inspecciones if inspeccion[0] is None]
+
+    def tomar(lista, posicion, campo):
+        try:
+            return lista[posicion][campo]
+        except IndexError:
+            return None
+
+    return {
+        'num_inspecciones': len(inspecciones),
+        'num_pesadas': len(pesadas),
+        'timestamp_primera_inspeccion': tomar(inspecciones, 0, 1),
+        'timestamp_ultima_inspeccion': tomar(inspecciones, -1, 1),
+        'peso_primera_inspeccion': tomar(inspecciones, 0, 0),
+        'peso_ultima_inspeccion': tomar(inspecciones, -1, 0),
+        'peso_penultima_inspeccion': tomar(inspecciones, -2, 0) if len(inspecciones) > 1 else None,
+        'timestamp_ultima_pesada': tomar(pesadas, -1, 1),
+        'peso_primera_pesada': tomar(pesadas, 0, 0),
+        'peso_ultima_pesada': tomar(pesadas, -1, 0),
+        'peso_penultima_pesada': tomar(pesadas, -2, 0) if len(pesadas) > 1 else None,
+        'timestamp_ultima_sin_peso': tomar(sin_peso, -1, 1),
+    }
+
+
+"""
+-----------------------------------------------------------------------------------
+Bloquea las filas de las botellas hasta que termine la transacción. Se bloquean
+en orden de id para que dos transacciones no se esperen una a la otra.
+-----------------------------------------------------------------------------------
+"""
+def bloquear(botellas_id):
+
+    return list(models.Botella.objects
+                .select_for_update()
+                .filter(id__in=botellas_id)
+                .order_by('id')
+                .values_list('id', flat=True)
+            )
+
+
+"""
+-----------------------------------------------------------------------------------
+Recalcula la línea de tiempo de las botellas indicadas con una sola lectura de
+sus ItemInspeccion. Las botellas sin inspecciones se quedan sin línea de tiempo.
+-----------------------------------------------------------------------------------
+"""
+def actualizar(botellas_id):
+
+    botellas_id = set(botellas_id)
+    if not botellas_id:
+        return
+
+    with transaction.atomic():
+        # Leemos los items ya con las botellas bloqueadas para ver lo último confirmado
+        bloquear(botellas_id)
+
+        items = (models.ItemInspeccion.objects
+                    .filter(botella__in=botellas_id)
+                    .order_by('botella', 'timestamp_inspeccion', 'id')
+                    .values_list('botella', 'peso_botella', 'timestamp_inspeccion')
+                )
+
+        inspecciones = collections.defaultdict(list)
+        for botella_id, peso_botella, timestamp_inspeccion in items:
+            inspecciones[botella_id].append((peso_botella, timestamp_inspeccion))
+
+        lineas = [
+            models.LineaTiempoBotella(botella_id=botella_id, **resumir(inspecciones_botella))
+            for botella_id, inspecciones_botella in inspecciones.items()
+        ]
+
+        models.LineaTiempoBotella.objects.filter(botella__in=botellas_id).delete()
+        models.LineaTiempoBotella.objects.bulk_create(lineas)
+
+
+"""
+-----------------------------------------------------------------------------------
+Agrega a la línea de tiempo de las botellas los ItemInspeccion (todavía sin peso)
+que se acaban de crear en bloque para la inspección. Como son las inspecciones más
+recientes de cada botella, basta con recorrer la última inspección a la penúltima,
+sin volver a leer el historial de las botellas.
+-----------------------------------------------------------------------------------
+"""
+def agregar_inspeccion(inspeccion, botellas_id):
+
+    botellas_id = set(botellas_id)
+
+    timestamp_item = Subquery(models.ItemInspeccion.objects
+                        .filter(inspeccion=inspeccion, botella=OuterRef('botella'))
+                        .values('timestamp_inspeccion')[:1]
+                    )
+
+    with transaction.atomic():
+        bloquear(botellas_id)
+
+        lineas = models.LineaTiempoBotella.objects.filter(botella__in=botellas_id)
+        botellas_con_linea = set(lineas.values_list('botella', flat=True))
+
+        lineas.update(
+            num_inspecciones=F('num_inspecciones') + 1,
+            peso_penultima_inspeccion=F('peso_ultima_inspeccion'),
+            peso_ultima_inspeccion=None,
+            timestamp_ultima_inspeccion=timestamp_item,
+            timestamp_ultima_sin_peso=timestamp_item
+        )
+
+        # Las botellas sin inspecciones previas solo tienen el item nuevo
+        actualizar(botellas_id - botellas_con_linea)
+
+
+def actualizar_item(sender, instance, **kwargs):
+    actualizar([instance.botella_id])
+
+
+def conectar():
+    post_save.connect(actualizar_item, sender=models.ItemInspeccion, dispatch_uid='linea_tiempo_item_save')
+    post_delete.connect(actualizar_item, sender=models.ItemInspeccion, dispatch_uid='linea_tiempo_item_delete')
+
+
+"""
+-----------------------------------------------------------------------------------
+Expresiones para anotar un queryset de Botellas con los datos de sus inspecciones
+dentro del periodo [fecha_inicial, fecha_final]:
+
+- 'inspecciones_periodo': número de inspecciones (None si no hay)
+- 'inspecciones_peso_ok_count': número de inspecciones con peso (None si no hay)
+- 'peso_primera_inspeccion': peso de la primera inspección
+- 'peso_primera_pesada': peso de la primera inspección con peso
+
+Si todas las inspecciones de la botella quedan dentro o fuera del periodo, los
+valores salen de la línea de tiempo. Solo las botellas con inspecciones antes y
+dentro del periodo se resuelven con un subquery sobre sus ItemInspeccion.
+-----------------------------------------------------------------------------------
+"""
+def expresiones_periodo(fecha_inicial, fecha_final):
+
+    fuera_periodo = (
+        Q(linea_tiempo=None) |
+        Q(linea_tiempo__timestamp_ultima_inspeccion__lt=fecha_inicial) |
+        Q(linea_tiempo__timestamp_primera_inspeccion__gt=fecha_final)
+    )
+    dentro_periodo = Q(
+        linea_tiempo__timestamp_primera_inspeccion__gte=fecha_inicial,
+        linea_tiempo__timestamp_ultima_inspeccion__lte=fecha_final
+    )
+
+    items_periodo = models.ItemInspeccion.objects.filter(
+        botella=OuterRef('pk'),
+        timestamp_inspeccion__gte=fecha_inicial,
+        timestamp_inspeccion__lte=fecha_final
+    )
+    items_pesados_periodo = items_periodo.exclude(peso_botella=None)
+
+    def periodo(valor_linea_tiempo, subquery):
+        return Case(
+            When(fuera_periodo, then=Value(None)),
+            When(dentro_periodo, then=valor_linea_tiempo),
+            default=Subquery(subquery),
+            output_field=IntegerField()
+        )
+
+    def conteo(items):
+        return items.order_by().values('botella').annotate(conteo=Count('id')).values('conteo')
+
+    def primer_peso(items):
+        return items.order_by('timestamp_inspeccion', 'id').values('peso_botella')[:1]
+
+    return {
+        'inspecciones_periodo': periodo(NullIf(F('linea_tiempo__num_inspecciones'), 0), conteo(items_periodo)),
+        'inspecciones_peso_ok_count': periodo(NullIf(F('linea_tiempo__num_pesadas'), 0), conteo(items_pesados_periodo)),
+        'peso_primera_inspeccion': periodo(F('linea_tiempo__peso_primera_inspeccion'), primer_peso(items_periodo)),
+        'peso_primera_pesada': periodo(F('linea_tiempo__peso_primera_pesada'), primer_peso(items_pesados_periodo)),
+    }
@@ -0,0 +1,176 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core import models
+
+
+class Command(BaseCommand):
+    """Django command to compare the requests per second of the inspection endpoints with and without persistent connections"""
+
+    help = 'Compara los requests por segundo de los endpoints de inspección con y sin conexiones persistentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests por hilo y endpoint')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos concurrentes (como los workers/threads de uWSGI)')
+        parser.add_argument('--conn-max-age', type=int, default=60, help='CONN_MAX_AGE del modo con conexiones persistentes')
+        parser.add_argument('--botellas', type=int, default=200, help='Botellas de la inspección')
+
+    def handle(self, *args, **options):
+
+        # Los requests pasan por el WSGIHandler (como en uWSGI), así que los datos se
+        # guardan en la base de datos y se eliminan al final
+        self.stdout.write('Generando datos...')
+        datos = self.sembrar(options)
+
+        modos = [('SIN PERSISTENTES', 0), ('CONN_MAX_AGE={}'.format(options['conn_max_age']), options['conn_max_age'])]
+        resultados = {}
+
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                # Un primer request por endpoint para que los caches (token, permisos,
+                # resúmenes, folios) estén igual de calientes en los dos modos
+                self.medir(datos, 0, dict(options, requests=1, hilos=1))
+
+                for nombre, conn_max_age in modos:
+                    self.stdout.write('Midiendo {}...'.format(nombre))
+                    resultados[nombre] = self.medir(datos, conn_max_age, options)
+        finally:
+            self.limpiar(datos)
+
+        self.stdout.write('')
+        encabezado = '{:<22}'.format('ENDPOINT') + ''.join('{:>28}'.format(nombre) for nombre, _ in modos)
+        self.stdout.write(encabezado)
+        self.stdout.write('-' * len(encabezado))
+        for endpoint in datos['urls']:
+            fila = '{:<22}'.format(endpoint)
+            for nombre, _ in modos:
+                resultado = resultados[nombre][endpoint]
+                fila += '{:>14.1f} req/s {:>4} conn'.format(resultado['rps'], resultado['conexiones'])
+            self.stdout.write(fila)
+
+        errores = sum(resultado['errores'] for modo in resultados.values() for resultado in modo.values())
+        if errores:
+            self.stdout.write(self.style.WARNING('{} requests no respondieron 200'.format(errores)))
+
+
+    @transaction.atomic
+    def sembrar(self, options):
+
+        cliente = models.Cliente.objects.create(nombre='BENCHMARK')
+        sucursal = models.Sucursal.objects.create(nombre='BENCHMARK', cliente=cliente)
+        almacen = models.Almacen.objects.create(nombre='BARRA 1', sucursal=sucursal)
+        categoria = models.Categoria.objects.create(nombre='BENCHMARK')
+
+        ingredientes = models.Ingrediente.objects.bulk_create([
+            models.Ingrediente(codigo='BENCHCONN{:04d}'.format(i), nombre='INGREDIENTE {}'.format(i), categoria=categoria, factor_peso=1)
+            for i in range(20)
+        ])
+        productos = models.Producto.objects.bulk_create([
+            models.Producto(folio='BENCH', ingrediente=ingrediente, capacidad=750) for ingrediente in ingredientes
+        ])
+        botellas = models.Botella.objects.bulk_create([
+            models.Botella(
+                folio='BC{:010d}'.format(i),
+                producto=productos[i % len(productos)],
+                sucursal=sucursal,
+                almacen=almacen,
+                estado='2',
+                peso_inicial=1200
+            )
+            for i in range(options['botellas'])
+        ])
+
+        inspeccion = models.Inspeccion.objects.create(almacen=almacen, sucursal=sucursal)
+        models.ItemInspeccion.objects.bulk_create([
+            models.ItemInspeccion(inspeccion=inspeccion, botella=botella) for botella in botellas
+        ])
+
+        usuario = get_user_model().objects.create_user(email='benchmark-conexiones@nubebar.mx', password='benchmark')
+        usuario.sucursales.add(sucursal)
+        token = Token.objects.create(user=usuario)
+
+        return {
+            'cliente': cliente,
+            'sucursal': sucursal,
+            'categoria': categoria,
+            'usuario': usuario,
+            'token': token.key,
+            'urls': {
+                'get_inspeccion': reverse('inventarios:get-inspeccion', args=[inspeccion.id]),
+                'get_items_inspeccion': reverse('inventarios:get-items-inspeccion', args=[inspeccion.id]),
+                'resumen_inspeccion': reverse('inventarios:resumen-inspeccion', args=[inspeccion.id]),
+                'escanear_folio': reverse('inventarios:escanear-folio', args=[inspeccion.id, botellas[0].folio]),
+            },
+        }
+
+
+    def medir(self, datos, conn_max_age, options):
+
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        resultados = {}
+
+        conexiones = []
+        def contar_conexion(sender, **kwargs):
+            conexiones.append(1)
+
+        def pedir(url, errores):
+            # Cada hilo tiene su propia conexión; le asignamos el CONN_MAX_AGE del modo
+            conexion = connections['default']
+            conexion.close()
+            conexion.settings_dict = dict(conexion.settings_dict, CONN_MAX_AGE=conn_max_age)
+
+            for _ in range(options['requests']):
+                environ = factory.get(url, HTTP_AUTHORIZATION='Token {}'.format(datos['token'])).environ
+                respuesta = handler(environ, lambda status, headers: None)
+                b''.join(respuesta)
+                # Al cerrar la respuesta Django cierra o conserva la conexión según CONN_MAX_AGE
+                respuesta.close()
+                if respuesta.status_code != 200:
+                    errores.append(respuesta.status_code)
+
+            conexion.close()
+
+        connection_created.connect(contar_conexion, dispatch_uid='benchmark_conexiones')
+        try:
+            for endpoint, url in datos['urls'].items():
+                conexiones.clear()
+                errores = []
+                hilos = [threading.Thread(target=pedir, args=(url, errores)) for _ in range(options['hilos'])]
+
+                inicio = time.perf_counter()
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+                duracion = time.perf_counter() - inicio
+
+                resultados[endpoint] = {
+                    'rps': options['requests'] * options['hilos'] / duracion,
+                    'conexiones': len(conexiones),
+                    'errores': len(errores),
+                }
+        finally:
+            connection_created.disconnect(dispatch_uid='benchmark_conexiones')
+
+        return resultados
+
+
+    @transaction.atomic
+    def limpiar(self, datos):
+
+        # Las botellas no se eliminan en cascada con su sucursal ni con su producto
+        models.Botella.objects.filter(sucursal=datos['sucursal']).delete()
+        datos['usuario'].delete()
+        datos['cliente'].delete()
+        datos['categoria'].delete()
@@ -0,0 +1,257 @@
+import datetime
+import random
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q, Sum, OuterRef, Subquery
+from django.utils import timezone
+
+from core import models
+
+
+# Modelos con índices compuestos / parciales para los reportes (ver migraciones 0025 y 0026)
+MODELOS_INDICES = [
+    models.Receta,
+    models.ConsumoRecetaVendida,
+    models.Botella,
+    models.ItemInspeccion,
+    models.MermaIngrediente,
+]
+
+
+class Command(BaseCommand):
+    """Django command to compare the query plans of the reports with and without the composite indexes"""
+
+    help = 'Compara los planes de ejecución de las consultas de reportes con y sin los índices compuestos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursales', type=int, default=20, help='Número de sucursales a generar')
+        parser.add_argument('--botellas', type=int, default=500, help='Botellas por sucursal')
+        parser.add_argument('--inspecciones', type=int, default=10, help='Inspecciones por botella')
+        parser.add_argument('--ventas', type=int, default=2000, help='Ventas por sucursal')
+        parser.add_argument('--planes', action='store_true', help='Muestra el plan completo de cada consulta')
+
+    def handle(self, *args, **options):
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('El benchmark requiere PostgreSQL (EXPLAIN ANALYZE y DDL transaccional).')
+
+        random.seed(0)
+
+        # Todo ocurre dentro de una transacción que se revierte al final: la base de datos no cambia
+        with transaction.atomic():
+
+            self.stdout.write('Generando datos...')
+            datos = self.sembrar(options)
+
+            self.analizar()
+            con_indices = self.explicar(datos)
+
+            self.quitar_indices()
+            self.analizar()
+            sin_indices = self.explicar(datos)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('')
+        self.stdout.write('{:<28} {:>14} {:>14}'.format('CONSULTA', 'SIN ÍNDICES', 'CON ÍNDICES'))
+        self.stdout.write('-' * 58)
+        for nombre in con_indices:
+            self.stdout.write('{:<28} {:>11.3f} ms {:>11.3f} ms'.format(nombre, sin_indices[nombre]['tiempo'], con_indices[nombre]['tiempo']))
+
+        if options['planes']:
+            for nombre in con_indices:
+                self.stdout.write('')
+                self.stdout.write(self.style.MIGRATE_HEADING('{} (sin índices)'.format(nombre)))
+                self.stdout.write(sin_indices[nombre]['plan'])
+                self.stdout.write(self.style.MIGRATE_HEADING('{} (con índices)'.format(nombre)))
+                self.stdout.write(con_indices[nombre]['plan'])
+
+
+    def sembrar(self, options):
+
+        hoy = timezone.now()
+
+        cliente = models.Cliente.objects.create(nombre='BENCHMARK')
+        categoria = models.Categoria.objects.create(nombre='BENCHMARK')
+        ingredientes = models.Ingrediente.objects.bulk_create([
+            models.Ingrediente(codigo='BENCH{:04d}'.format(i), nombre='INGREDIENTE {}'.format(i), categoria=categoria, factor_peso=1)
+            for i in range(50)
+        ])
+        productos = models.Producto.objects.bulk_create([
+            models.Producto(folio='BENCH', ingrediente=ingrediente, capacidad=750) for ingrediente in ingredientes
+        ])
+
+        sucursales = []
+        for i in range(options['sucursales']):
+            sucursal = models.Sucursal.objects.create(nombre='BENCHMARK {}'.format(i), cliente=cliente)
+            almacen = models.Almacen.objects.create(nombre='BARRA 1', sucursal=sucursal)
+            caja = models.Caja.objects.create(nombre='CAJA 1', almacen=almacen)
+            inspeccion = models.Inspeccion.objects.create(almacen=almacen, sucursal=sucursal)
+            sucursales.append((sucursal, almacen, caja, inspeccion))
+
+            recetas = models.Receta.objects.bulk_create([
+                models.Receta(codigo_pos='{:05d}'.format(j), nombre='RECETA {}'.format(j), sucursal=sucursal)
+                for j in range(200)
+            ])
+
+            botellas = models.Botella.objects.bulk_create([
+                models.Botella(
+                    folio='B{:03d}{:07d}'.format(i, j),
+                    producto=random.choice(productos),
+                    sucursal=sucursal,
+                    almacen=almacen,
+                    estado=random.choice(['0', '1', '1', '2', '3']),
+                    peso_inicial=1200
+                )
+                for j in range(options['botellas'])
+            ])
+
+            items = models.ItemInspeccion.objects.bulk_create([
+                models.ItemInspeccion(
+                    inspeccion=inspeccion,
+                    botella=botella,
+                    peso_botella=random.choice([None, random.randint(500, 1200)]),
+                )
+                for botella in botellas
+                for _ in range(options['inspecciones'])
+            ])
+            # 'timestamp_inspeccion' es auto_now, así que repartimos las fechas con un update
+            ids = [item.id for item in items]
+            for k in range(0, len(ids), 1000):
+                models.ItemInspeccion.objects.filter(id__in=ids[k:k + 1000]).update(
+                    timestamp_inspeccion=hoy - datetime.timedelta(days=random.randint(0, 365))
+                )
+
+            ventas = models.Venta.objects.bulk_create([
+                models.Venta(
+                    receta=random.choice(recetas),
+                    sucursal=sucursal,
+                    fecha=(hoy - datetime.timedelta(days=random.randint(0, 365))).date(),
+                    unidades=1,
+                    importe=100,
+                    caja=caja
+                )
+                for _ in range(options['ventas'])
+            ])
+            models.ConsumoRecetaVendida.objects.bulk_create([
+                models.ConsumoRecetaVendida(
+                    ingrediente=random.choice(ingredientes),
+                    receta=venta.receta,
+                    venta=venta,
+                    fecha=venta.fecha,
+                    volumen=60,
+                    almacen=almacen,
+                    sucursal=sucursal
+                )
+                for venta in ventas
+            ])
+
+            reporte = models.ReporteMermas.objects.create(inspeccion=inspeccion, almacen=almacen)
+            models.MermaIngrediente.objects.bulk_create([
+                models.MermaIngrediente(
+                    ingrediente=random.choice(ingredientes),
+                    reporte=reporte,
+                    almacen=almacen,
+                    fecha_inicial=(hoy - datetime.timedelta(days=d + 1)).date(),
+                    fecha_final=(hoy - datetime.timedelta(days=d)).date(),
+                    consumo_ventas=100,
+                    consumo_real=90,
+                    merma=10,
+                    porcentaje=10
+                )
+                for d in range(365)
+            ])
+
+        sucursal, almacen, caja, inspeccion = sucursales[len(sucursales) // 2]
+
+        return {
+            'sucursal': sucursal,
+            'almacen': almacen,
+            'ingrediente': ingredientes[0],
+            'producto': productos[0],
+            'botella': models.Botella.objects.filter(sucursal=sucursal).first(),
+            'timestamp_inicial': hoy - datetime.timedelta(days=30),
+            'fecha_inicial': (hoy - datetime.timedelta(days=30)).date(),
+            'fecha_final': hoy.date(),
+        }
+
+
+    def consultas(self, datos):
+
+        sucursal = datos['sucursal']
+        almacen = datos['almacen']
+        fecha_inicial = datos['fecha_inicial']
+        fecha_final = datos['fecha_final']
+
+        return {
+            'consumos_ingrediente': (models.ConsumoRecetaVendida.objects
+                .filter(ingrediente=datos['ingrediente'], fecha__gte=fecha_inicial, fecha__lte=fecha_final, almacen=almacen)
+                .values('ingrediente')
+                .annotate(volumen=Sum('volumen'))
+            ),
+            'ultima_inspeccion': (models.ItemInspeccion.objects
+                .filter(botella=datos['botella'])
+                .order_by('-timestamp_inspeccion')
+                .values('peso_botella')[:1]
+            ),
+            'primera_inspeccion_pesada': (models.ItemInspeccion.objects
+                .filter(botella=datos['botella'], timestamp_inspeccion__gte=datos['timestamp_inicial'])
+                .exclude(peso_botella=None)
+                .order_by('timestamp_inspeccion')
+                .values('peso_botella')[:1]
+            ),
+            'ultimas_inspecciones': (models.Botella.objects
+                .filter(almacen=almacen, estado='1')
+                .annotate(peso=Subquery(models.ItemInspeccion.objects
+                    .filter(botella=OuterRef('pk'))
+                    .order_by('-timestamp_inspeccion')
+                    .values('peso_botella')[:1]
+                ))
+                .values('folio', 'peso')
+            ),
+            'botellas_sucursal_estado': (models.Botella.objects
+                .filter(sucursal=sucursal, estado='2')
+                .values('folio')
+            ),
+            'stock_producto': (models.Botella.objects
+                .filter(sucursal=sucursal, producto=datos['producto'])
+                .exclude(Q(estado='0') | Q(estado='3'))
+                .values('folio')
+            ),
+            'recetas_codigo_pos': (models.Receta.objects
+                .filter(sucursal=sucursal, codigo_pos__in=['00010', '00020', '00030'])
+            ),
+            'mermas_tiempo': (models.MermaIngrediente.objects
+                .filter(almacen=almacen, fecha_final__gte=fecha_inicial, fecha_final__lte=fecha_final)
+            ),
+        }
+
+
+    def explicar(self, datos):
+
+        resultados = {}
+
+        for nombre, queryset in self.consultas(datos).items():
+            plan = queryset.explain(analyze=True)
+            tiempo = re.search(r'Execution Time: ([\d.]+) ms', plan)
+
+            resultados[nombre] = {'plan': plan, 'tiempo': float(tiempo.group(1)) if tiempo else 0.0}
+
+        return resultados
+
+
+    def quitar_indices(self):
+
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for modelo in MODELOS_INDICES:
+                for indice in modelo._meta.indexes:
+                    schema_editor.remove_index(modelo, indice)
+
+
+    def analizar(self):
+
+        with connection.cursor() as cursor:
+            for modelo in MODELOS_INDICES:
+                cursor.execute('ANALYZE {}'.format(connection.ops.quote_name(modelo._meta.db_table)))
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_auto_20191113_1752'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaVentas',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(upload_to='reportes_ventas/')),
+                ('estado', models.CharField(choices=[('0', 'PENDIENTE'), ('1', 'PROCESANDO'), ('2', 'TERMINADA'), ('3', 'ERROR')], default='0', max_length=1)),
+                ('filas_parseadas', models.IntegerField(default=0)),
+                ('ventas_registradas', models.IntegerField(default=0)),
+                ('productos_sin_registro', models.IntegerField(default=0)),
+                ('mensaje_error', models.TextField(blank=True)),
+                ('timestamp_alta', models.DateTimeField(auto_now_add=True)),
+                ('timestamp_inicio', models.DateTimeField(blank=True, default=None, null=True)),
+                ('timestamp_fin', models.DateTimeField(blank=True, default=None, null=True)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cargas_ventas', to='core.sucursal')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cargas_ventas_usuario', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'CargasVentas',
+            },
+        ),
+    ]
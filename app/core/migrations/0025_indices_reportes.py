@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_cargaventas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='botella',
+            index=models.Index(fields=['sucursal', 'estado'], name='botella_sucursal_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='botella',
+            index=models.Index(fields=['almacen', 'estado'], name='botella_almacen_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='botella',
+            index=models.Index(condition=models.Q(models.Q(('estado', '0'), _negated=True), models.Q(('estado', '3'), _negated=True)), fields=['sucursal', 'producto'], name='botella_activa_producto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consumorecetavendida',
+            index=models.Index(fields=['ingrediente', 'fecha'], name='consumo_ingrediente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='iteminspeccion',
+            index=models.Index(fields=['botella', 'timestamp_inspeccion'], name='item_botella_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='iteminspeccion',
+            index=models.Index(condition=models.Q(('peso_botella__isnull', False)), fields=['botella', 'timestamp_inspeccion'], name='item_botella_pesada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mermaingrediente',
+            index=models.Index(fields=['almacen', 'fecha_final'], name='merma_almacen_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receta',
+            index=models.Index(fields=['sucursal', 'codigo_pos'], name='receta_sucursal_codigo_idx'),
+        ),
+    ]
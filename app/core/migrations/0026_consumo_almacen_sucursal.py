@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_indices_reportes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumorecetavendida',
+            name='almacen',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='consumos_almacen', to='core.almacen'),
+        ),
+        migrations.AddField(
+            model_name='consumorecetavendida',
+            name='sucursal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='consumos_sucursal', to='core.sucursal'),
+        ),
+        migrations.AddIndex(
+            model_name='consumorecetavendida',
+            index=models.Index(fields=['almacen', 'ingrediente', 'fecha'], name='consumo_almacen_ingr_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:34
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+# Número de consumos que se actualizan por query
+TAMANO_LOTE = 10000
+
+
+def copiar_almacen_sucursal(apps, schema_editor):
+    """
+    Copia a cada ConsumoRecetaVendida el almacén (de la caja) y la sucursal de su venta
+    """
+    ConsumoRecetaVendida = apps.get_model('core', 'ConsumoRecetaVendida')
+    Venta = apps.get_model('core', 'Venta')
+
+    ventas = Venta.objects.filter(id=OuterRef('venta_id'))
+    consumos = ConsumoRecetaVendida.objects.filter(almacen__isnull=True)
+
+    ultimo_id = consumos.order_by('-id').values_list('id', flat=True).first() or 0
+
+    # Actualizamos por rangos de id para no bloquear toda la tabla en una sola
+    # transacción (la migración no es atómica, así que cada lote se confirma solo)
+    for inicio in range(0, ultimo_id + 1, TAMANO_LOTE):
+        consumos.filter(id__gte=inicio, id__lt=inicio + TAMANO_LOTE).update(
+            almacen=Subquery(ventas.values('caja__almacen')[:1]),
+            sucursal=Subquery(ventas.values('sucursal')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0026_consumo_almacen_sucursal'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_almacen_sucursal, migrations.RunPython.noop),
+    ]
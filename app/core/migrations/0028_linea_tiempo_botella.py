@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_backfill_consumo_almacen_sucursal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LineaTiempoBotella',
+            fields=[
+                ('botella', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='linea_tiempo', serialize=False, to='core.botella')),
+                ('num_inspecciones', models.IntegerField(default=0)),
+                ('num_pesadas', models.IntegerField(default=0)),
+                ('timestamp_primera_inspeccion', models.DateTimeField(blank=True, null=True)),
+                ('timestamp_ultima_inspeccion', models.DateTimeField(blank=True, null=True)),
+                ('peso_primera_inspeccion', models.IntegerField(blank=True, null=True)),
+                ('peso_ultima_inspeccion', models.IntegerField(blank=True, null=True)),
+                ('peso_penultima_inspeccion', models.IntegerField(blank=True, null=True)),
+                ('timestamp_ultima_pesada', models.DateTimeField(blank=True, null=True)),
+                ('peso_primera_pesada', models.IntegerField(blank=True, null=True)),
+                ('peso_ultima_pesada', models.IntegerField(blank=True, null=True)),
+                ('peso_penultima_pesada', models.IntegerField(blank=True, null=True)),
+                ('timestamp_ultima_sin_peso', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
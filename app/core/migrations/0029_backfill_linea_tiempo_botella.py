@@ -0,0 +1,78 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:42
+
+import collections
+
+from django.db import migrations
+
+
+# Número de botellas que se procesan por lote
+TAMANO_LOTE = 2000
+
+
+def resumir(inspecciones):
+    """
+    Copia de core.linea_tiempo.resumir al momento de esta migración, para que
+    los cambios futuros a ese módulo no cambien el backfill
+    """
+    pesadas = [inspeccion for inspeccion in inspecciones if inspeccion[0] is not None]
+    sin_peso = [inspeccion for inspeccion in inspecciones if inspeccion[0] is None]
+
+    def tomar(lista, posicion, campo):
+        try:
+            return lista[posicion][campo]
+        except IndexError:
+            return None
+
+    return {
+        'num_inspecciones': len(inspecciones),
+        'num_pesadas': len(pesadas),
+        'timestamp_primera_inspeccion': tomar(inspecciones, 0, 1),
+        'timestamp_ultima_inspeccion': tomar(inspecciones, -1, 1),
+        'peso_primera_inspeccion': tomar(inspecciones, 0, 0),
+        'peso_ultima_inspeccion': tomar(inspecciones, -1, 0),
+        'peso_penultima_inspeccion': tomar(inspecciones, -2, 0) if len(inspecciones) > 1 else None,
+        'timestamp_ultima_pesada': tomar(pesadas, -1, 1),
+        'peso_primera_pesada': tomar(pesadas, 0, 0),
+        'peso_ultima_pesada': tomar(pesadas, -1, 0),
+        'peso_penultima_pesada': tomar(pesadas, -2, 0) if len(pesadas) > 1 else None,
+        'timestamp_ultima_sin_peso': tomar(sin_peso, -1, 1),
+    }
+
+
+def construir_lineas_tiempo(apps, schema_editor):
+    """
+    Construye la LineaTiempoBotella de cada botella que ya tiene inspecciones
+    """
+    ItemInspeccion = apps.get_model('core', 'ItemInspeccion')
+    LineaTiempoBotella = apps.get_model('core', 'LineaTiempoBotella')
+
+    botellas_id = list(ItemInspeccion.objects.order_by('botella').values_list('botella', flat=True).distinct())
+
+    for inicio in range(0, len(botellas_id), TAMANO_LOTE):
+        lote = botellas_id[inicio:inicio + TAMANO_LOTE]
+
+        items = (ItemInspeccion.objects
+                    .filter(botella__in=lote)
+                    .order_by('botella', 'timestamp_inspeccion', 'id')
+                    .values_list('botella', 'peso_botella', 'timestamp_inspeccion')
+                )
+
+        inspecciones = collections.defaultdict(list)
+        for botella_id, peso_botella, timestamp_inspeccion in items:
+            inspecciones[botella_id].append((peso_botella, timestamp_inspeccion))
+
+        LineaTiempoBotella.objects.bulk_create([
+            LineaTiempoBotella(botella_id=botella_id, **resumir(inspecciones_botella))
+            for botella_id, inspecciones_botella in inspecciones.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_linea_tiempo_botella'),
+    ]
+
+    operations = [
+        migrations.RunPython(construir_lineas_tiempo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_backfill_linea_tiempo_botella'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotRestock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias', models.IntegerField(default=7)),
+                ('dias_entrega', models.IntegerField(default=0)),
+                ('productos', models.JSONField(default=list)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_restock', to='core.sucursal')),
+            ],
+            options={
+                'verbose_name_plural': 'SnapshotsRestock',
+                'unique_together': {('sucursal', 'dias', 'dias_entrega')},
+            },
+        ),
+    ]
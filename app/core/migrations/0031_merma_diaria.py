@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_snapshot_restock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MermaDiaria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('consumo_ventas', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('consumo_real', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('merma', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('porcentaje', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('num_mermas', models.IntegerField(default=0)),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mermas_diarias', to='core.almacen')),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mermas_diarias', to='core.ingrediente')),
+            ],
+            options={
+                'verbose_name_plural': 'MermasDiarias',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mermadiaria',
+            index=models.Index(fields=['almacen', 'fecha'], name='merma_diaria_almacen_fecha_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mermadiaria',
+            unique_together={('almacen', 'ingrediente', 'fecha')},
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:20
+
+from django.db import migrations
+from django.db.models import Sum, Count
+
+import decimal
+
+
+# Número de celdas que se insertan por lote
+TAMANO_LOTE = 2000
+
+
+def calcular_merma(consumo_ventas, consumo_real):
+    """
+    Copia de core.models.calcular_merma al momento de esta migración, para que
+    los cambios futuros a esa función no cambien el backfill
+    """
+    try:
+        merma = consumo_ventas - consumo_real
+        porcentaje = (merma / consumo_ventas) * 100
+
+    except (TypeError, ZeroDivisionError):
+
+        if (consumo_ventas is None) & (consumo_real is None):
+            merma = decimal.Decimal(0)
+            porcentaje = decimal.Decimal(0)
+
+        elif consumo_ventas is None:
+            merma = decimal.Decimal(0) - consumo_real
+            porcentaje = decimal.Decimal(-100)
+
+        elif consumo_real is None:
+            merma = consumo_ventas
+            porcentaje = decimal.Decimal(100)
+
+        else:
+            merma = consumo_ventas - consumo_real
+            porcentaje = decimal.Decimal(-100)
+
+    return merma, porcentaje
+
+
+def construir_mermas_diarias(apps, schema_editor):
+    """
+    Construye el cubo de MermaDiaria con las MermaIngrediente que ya existen
+    """
+    MermaIngrediente = apps.get_model('core', 'MermaIngrediente')
+    MermaDiaria = apps.get_model('core', 'MermaDiaria')
+
+    celdas = (MermaIngrediente.objects
+                .exclude(fecha_final=None)
+                .values('almacen', 'ingrediente', 'fecha_final')
+                .annotate(suma_ventas=Sum('consumo_ventas'), suma_real=Sum('consumo_real'), num_mermas=Count('id'))
+                .order_by('almacen', 'ingrediente', 'fecha_final')
+            )
+
+    lote = []
+    for celda in celdas.iterator():
+        merma, porcentaje = calcular_merma(celda['suma_ventas'], celda['suma_real'])
+        lote.append(MermaDiaria(
+            almacen_id=celda['almacen'],
+            ingrediente_id=celda['ingrediente'],
+            fecha=celda['fecha_final'],
+            consumo_ventas=celda['suma_ventas'],
+            consumo_real=celda['suma_real'],
+            merma=merma,
+            porcentaje=porcentaje,
+            num_mermas=celda['num_mermas']
+        ))
+
+        if len(lote) == TAMANO_LOTE:
+            MermaDiaria.objects.bulk_create(lote)
+            lote = []
+
+    MermaDiaria.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_merma_diaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(construir_mermas_diarias, migrations.RunPython.noop),
+    ]
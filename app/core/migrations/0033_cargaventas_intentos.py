@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_backfill_merma_diaria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargaventas',
+            name='intentos',
+            field=models.IntegerField(default=0),
+        ),
+    ]
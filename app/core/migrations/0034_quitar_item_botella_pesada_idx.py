@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:56
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_cargaventas_intentos'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='iteminspeccion',
+            name='item_botella_pesada_idx',
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 from django.conf import settings
@@ -177,6 +178,11 @@ class Receta(models.Model):
 	sucursal 		= models.ForeignKey(Sucursal, related_name='recetas', on_delete=models.CASCADE)
 	ingredientes 	= models.ManyToManyField(Ingrediente, through='IngredienteReceta')
 
+	class Meta:
+		indexes = [
+			# Registro de ventas: receta de cada 'codigo_pos' del reporte
+			models.Index(fields=['sucursal', 'codigo_pos'], name='receta_sucursal_codigo_idx'),
+		]
 
 	def __str__(self):
 		nombre_sucursal = self.sucursal.nombre
@@ -285,6 +291,28 @@ class ConsumoRecetaVendida(models.Model):
 	venta 			= models.ForeignKey(Venta, related_name='consumos_venta', on_delete=models.CASCADE)
 	fecha 			= models.DateField()
 	volumen 		= models.IntegerField()
+	# Copiados de la venta para filtrar los consumos sin pasar por Venta y Caja
+	almacen 		= models.ForeignKey(Almacen, related_name='consumos_almacen', blank=True, null=True, on_delete=models.CASCADE)
+	sucursal 		= models.ForeignKey(Sucursal, related_name='consumos_sucursal', blank=True, null=True, on_delete=models.CASCADE)
+
+	class Meta:
+		indexes = [
+			# Reportes de mermas y restock: consumos de un ingrediente en un periodo
+			models.Index(fields=['ingrediente', 'fecha'], name='consumo_ingrediente_fecha_idx'),
+			# Reportes de mermas e inspecciones: consumos de un almacén
+			models.Index(fields=['almacen', 'ingrediente', 'fecha'], name='consumo_almacen_ingr_fecha_idx'),
+		]
+
+	def save(self, *args, **kwargs):
+
+		# Tomamos el almacén y la sucursal de la venta si no se especificaron
+		if self.almacen_id is None:
+			self.almacen_id = self.venta.caja.almacen_id
+
+		if self.sucursal_id is None:
+			self.sucursal_id = self.venta.sucursal_id
+
+		super(ConsumoRecetaVendida, self).save(*args, **kwargs)
 
 	def __str__(self):
 		nombre_ingrediente = self.ingrediente.nombre
@@ -389,6 +417,18 @@ class Botella(models.Model):
 	proveedor 					= models.ForeignKey(Proveedor, related_name='botellas_proveedor', blank=True, null=True, on_delete=models.SET_NULL)
 	ingrediente 				= models.CharField(max_length=255, blank=True)
 	categoria 					= models.CharField(max_length=255, blank=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['sucursal', 'estado'], name='botella_sucursal_estado_idx'),
+			models.Index(fields=['almacen', 'estado'], name='botella_almacen_estado_idx'),
+			# Reportes de stock: botellas de un producto que no están vacías ni perdidas
+			models.Index(
+				fields=['sucursal', 'producto'],
+				name='botella_activa_producto_idx',
+				condition=~Q(estado='0') & ~Q(estado='3')
+			),
+		]
 	
 
 	def save(self, *args, **kwargs):
@@ -491,6 +531,12 @@ class ItemInspeccion(models.Model):
 	peso_botella            = models.IntegerField(null=True, blank=True)
 	timestamp_inspeccion    = models.DateTimeField(auto_now=True)
 	inspeccionado 			= models.BooleanField(default=False)
+
+	class Meta:
+		indexes = [
+			# Primera / última inspección (con o sin peso) de una botella en un periodo
+			models.Index(fields=['botella', 'timestamp_inspeccion'], name='item_botella_timestamp_idx'),
+		]
 	
 	def __str__(self):
 		fecha_inspeccion = self.inspeccion.fecha_alta
@@ -498,6 +544,42 @@ class ItemInspeccion(models.Model):
 		return 'FECHA: {} - FOLIO: {} - PESO: {}'.format(fecha_inspeccion, folio_botella, self.peso_botella)
 
 
+"""
+------------------------------------------------------------------------------
+La LineaTiempoBotella resume las inspecciones de una botella: cuántas tiene y
+los pesos de la primera, última y penúltima inspección (con y sin descartar
+las inspecciones sin peso). Se recalcula cada vez que se guarda o elimina un
+ItemInspeccion de la botella (ver core/linea_tiempo.py) para que los reportes
+no tengan que buscar estos pesos con subqueries por cada botella.
+------------------------------------------------------------------------------
+"""
+
+class LineaTiempoBotella(models.Model):
+
+	botella 						= models.OneToOneField(Botella, related_name='linea_tiempo', on_delete=models.CASCADE, primary_key=True)
+	num_inspecciones 				= models.IntegerField(default=0)
+	num_pesadas 					= models.IntegerField(default=0)
+
+	# Todas las inspecciones
+	timestamp_primera_inspeccion 	= models.DateTimeField(null=True, blank=True)
+	timestamp_ultima_inspeccion 	= models.DateTimeField(null=True, blank=True)
+	peso_primera_inspeccion 		= models.IntegerField(null=True, blank=True)
+	peso_ultima_inspeccion 			= models.IntegerField(null=True, blank=True)
+	peso_penultima_inspeccion 		= models.IntegerField(null=True, blank=True)
+
+	# Solo las inspecciones con peso registrado
+	timestamp_ultima_pesada 		= models.DateTimeField(null=True, blank=True)
+	peso_primera_pesada 			= models.IntegerField(null=True, blank=True)
+	peso_ultima_pesada 				= models.IntegerField(null=True, blank=True)
+	peso_penultima_pesada 			= models.IntegerField(null=True, blank=True)
+
+	# Solo las inspecciones sin peso
+	timestamp_ultima_sin_peso 		= models.DateTimeField(null=True, blank=True)
+
+	def __str__(self):
+		return 'BOTELLA: {} - INSPECCIONES: {} - ULTIMO PESO: {}'.format(self.botella_id, self.num_inspecciones, self.peso_ultima_pesada)
+
+
 """
 ------------------------------------------------------------------------------
 Un ProductoSinRegistro es un item del reporte de ventas que no está registrado
@@ -518,6 +600,67 @@ class ProductoSinRegistro(models.Model):
 		return 'SUCURSAL: {} - CODIGO: {} - NOMBRE: {}'.format(self.sucursal.nombre, self.codigo_pos, self.nombre)
 
 
+"""
+------------------------------------------------------------------------------
+Una CargaVentas es un reporte de ventas subido por el usuario que se procesa
+en segundo plano. Funciona como cola de trabajos en la base de datos.
+------------------------------------------------------------------------------
+"""
+
+class CargaVentas(models.Model):
+
+	# Estados que puede tener una CargaVentas
+	PENDIENTE = '0'
+	PROCESANDO = '1'
+	TERMINADA = '2'
+	ERROR = '3'
+	ESTADOS_CARGA = ((PENDIENTE, 'PENDIENTE'), (PROCESANDO, 'PROCESANDO'), (TERMINADA, 'TERMINADA'), (ERROR, 'ERROR'))
+
+	sucursal 				= models.ForeignKey(Sucursal, related_name='cargas_ventas', on_delete=models.CASCADE)
+	usuario 				= models.ForeignKey(settings.AUTH_USER_MODEL, related_name='cargas_ventas_usuario', blank=True, null=True, on_delete=models.SET_NULL)
+	archivo 				= models.FileField(upload_to='reportes_ventas/')
+	estado 					= models.CharField(max_length=1, choices=ESTADOS_CARGA, default=PENDIENTE)
+	filas_parseadas 		= models.IntegerField(default=0)
+	ventas_registradas 		= models.IntegerField(default=0)
+	productos_sin_registro 	= models.IntegerField(default=0)
+	intentos 				= models.IntegerField(default=0)
+	mensaje_error 			= models.TextField(blank=True)
+	timestamp_alta 			= models.DateTimeField(auto_now_add=True)
+	timestamp_inicio 		= models.DateTimeField(blank=True, null=True, default=None)
+	timestamp_fin 			= models.DateTimeField(blank=True, null=True, default=None)
+
+	class Meta:
+		verbose_name_plural = 'CargasVentas'
+
+	def __str__(self):
+		return 'CARGA: {} - SUCURSAL: {} - ESTADO: {} - FECHA: {}'.format(self.id, self.sucursal.nombre, self.estado, self.timestamp_alta)
+
+
+"""
+------------------------------------------------------------------------------
+Un SnapshotRestock guarda el último cálculo del motor de restock de una
+sucursal para la ventana de demanda ('dias') y el tiempo de entrega
+('dias_entrega') default. Los reportes de Restock lo leen en lugar de
+recalcular (ver analytics/snapshots_restock.py).
+------------------------------------------------------------------------------
+"""
+
+class SnapshotRestock(models.Model):
+
+	sucursal 				= models.ForeignKey(Sucursal, related_name='snapshots_restock', on_delete=models.CASCADE)
+	dias 					= models.IntegerField(default=7)
+	dias_entrega 			= models.IntegerField(default=0)
+	productos 				= models.JSONField(default=list)
+	fecha_actualizacion 	= models.DateTimeField(auto_now=True)
+
+	class Meta:
+		verbose_name_plural = 'SnapshotsRestock'
+		unique_together = ['sucursal', 'dias', 'dias_entrega']
+
+	def __str__(self):
+		return 'SUCURSAL: {} - DIAS: {} - ENTREGA: {} - ACTUALIZADO: {}'.format(self.sucursal_id, self.dias, self.dias_entrega, self.fecha_actualizacion)
+
+
 """
 --------------------------------------------------------------------------
 Un ReporteMermas es el reporte de mermas de una Inspeccion
@@ -547,6 +690,38 @@ de hacer una Inspeccion
 --------------------------------------------------------------------------
 """
 
+def calcular_merma(consumo_ventas, consumo_real):
+	"""
+	Retorna la merma (ml) y el porcentaje de merma de un ingrediente a partir
+	de su consumo de ventas y su consumo real. Cualquiera de los consumos puede
+	ser None si no hubo ventas o no hubo consumo registrado.
+	"""
+
+	try:
+		merma = consumo_ventas - consumo_real
+		porcentaje = (merma / consumo_ventas) * 100
+
+	except (TypeError, ZeroDivisionError):
+
+		if (consumo_ventas is None) & (consumo_real is None):
+			merma = decimal.Decimal(0)
+			porcentaje = decimal.Decimal(0)
+
+		elif consumo_ventas is None:
+			merma = decimal.Decimal(0) - consumo_real
+			porcentaje = decimal.Decimal(-100)
+
+		elif consumo_real is None:
+			merma = consumo_ventas
+			porcentaje = decimal.Decimal(100)
+
+		else:
+			merma = consumo_ventas - consumo_real
+			porcentaje = decimal.Decimal(-100)
+
+	return merma, porcentaje
+
+
 class MermaIngrediente(models.Model):
 
 	ingrediente 	= models.ForeignKey(Ingrediente, related_name='mermas_ingrediente', on_delete=models.CASCADE)
@@ -561,35 +736,15 @@ class MermaIngrediente(models.Model):
 
 	class Meta:
 		verbose_name_plural = 'MermasIngredientes'
+		indexes = [
+			# Reporte de mermas en el tiempo
+			models.Index(fields=['almacen', 'fecha_final'], name='merma_almacen_fecha_idx'),
+		]
 
 	def save(self, *args, **kwargs):
 
-		try:
-			self.merma = self.consumo_ventas - self.consumo_real
-			self.porcentaje = (self.merma / self.consumo_ventas) * 100
-			super(MermaIngrediente, self).save(*args, **kwargs)
-
-		except (TypeError, ZeroDivisionError):
-
-			if (self.consumo_ventas is None) & (self.consumo_real is None):
-				self.merma = decimal.Decimal(0)
-				self.porcentaje = decimal.Decimal(0)
-				super(MermaIngrediente, self).save(*args, **kwargs)
-
-			elif self.consumo_ventas is None:
-				self.merma = decimal.Decimal(0) - self.consumo_real
-				self.porcentaje = decimal.Decimal(-100)
-				super(MermaIngrediente, self).save(*args, **kwargs)
-
-			elif self.consumo_real is None:
-				self.merma = self.consumo_ventas
-				self.porcentaje = decimal.Decimal(100)
-				super(MermaIngrediente, self).save(*args, **kwargs)
-
-			else:
-				self.merma = self.consumo_ventas - self.consumo_real
-				self.porcentaje = decimal.Decimal(-100)
-				super(MermaIngrediente, self).save(*args, **kwargs)
+		self.merma, self.porcentaje = calcular_merma(self.consumo_ventas, self.consumo_real)
+		super(MermaIngrediente, self).save(*args, **kwargs)
 
 
 	def __str__(self):
@@ -612,3 +767,35 @@ class MermaIngrediente(models.Model):
 		# except ZeroDivisionError, Exception:
 		# 	self.porcentaje = decimal.Decimal(0)
 		# 	super(MermaIngrediente, self).save(*args, **kwargs)
+
+
+"""
+--------------------------------------------------------------------------
+Una MermaDiaria acumula las mermas de un ingrediente en un almacen para un
+día ('fecha' es la fecha final de las mermas). Es el cubo que lee el
+reporte de mermas en el tiempo; se recalcula cada vez que cambian las
+MermaIngrediente del día (ver analytics/cubo_mermas.py).
+--------------------------------------------------------------------------
+"""
+
+class MermaDiaria(models.Model):
+
+	almacen 		= models.ForeignKey(Almacen, related_name='mermas_diarias', on_delete=models.CASCADE)
+	ingrediente 	= models.ForeignKey(Ingrediente, related_name='mermas_diarias', on_delete=models.CASCADE)
+	fecha 			= models.DateField()
+	consumo_ventas 	= models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+	consumo_real 	= models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+	merma 			= models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+	porcentaje 		= models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+	num_mermas 		= models.IntegerField(default=0)
+
+	class Meta:
+		verbose_name_plural = 'MermasDiarias'
+		unique_together = ['almacen', 'ingrediente', 'fecha']
+		indexes = [
+			# Reporte de mermas en el tiempo
+			models.Index(fields=['almacen', 'fecha'], name='merma_diaria_almacen_fecha_idx'),
+		]
+
+	def __str__(self):
+		return 'ALMACEN: {} - INGREDIENTE: {} - FECHA: {} - MERMA: {} ml'.format(self.almacen_id, self.ingrediente_id, self.fecha, self.merma)
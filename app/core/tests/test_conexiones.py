@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from core import conexiones
+
+
+class VerificarConexionesTests(SimpleTestCase):
+    """ Tests para la verificación de las conexiones persistentes (fuera de una transacción) """
+
+    databases = {'default'}
+
+    def setUp(self):
+        connection.ensure_connection()
+
+    def test_conexion_caida(self):
+        """ Testear que una conexión que ya no sirve se cierra antes del request """
+
+        with patch.dict(connection.settings_dict, CONN_HEALTH_CHECKS=True):
+            with patch.object(connection, 'is_usable', return_value=False):
+                conexiones.verificar_conexiones()
+
+        self.assertIsNone(connection.connection)
+
+    def test_conexion_viva(self):
+        """ Testear que una conexión que sirve se reutiliza """
+
+        with patch.dict(connection.settings_dict, CONN_HEALTH_CHECKS=True):
+            conexiones.verificar_conexiones()
+
+        self.assertIsNotNone(connection.connection)
+
+    def test_sin_health_checks(self):
+        """ Testear que sin CONN_HEALTH_CHECKS no se verifica la conexión """
+
+        with patch.dict(connection.settings_dict, CONN_HEALTH_CHECKS=False):
+            with patch.object(connection, 'is_usable', return_value=False) as is_usable:
+                conexiones.verificar_conexiones()
+
+        is_usable.assert_not_called()
+        self.assertIsNotNone(connection.connection)
@@ -0,0 +1,50 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from core import models
+
+import io
+import unittest
+
+
+class IndicesReportesTests(TestCase):
+
+    def indices_tabla(self, modelo):
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, modelo._meta.db_table)
+
+
+    def test_indices_creados(self):
+        """ Testear que la migración crea los índices compuestos de los reportes """
+
+        indices = {
+            models.Receta: ['receta_sucursal_codigo_idx'],
+            models.ConsumoRecetaVendida: ['consumo_ingrediente_fecha_idx'],
+            models.Botella: ['botella_sucursal_estado_idx', 'botella_almacen_estado_idx', 'botella_activa_producto_idx'],
+            models.ItemInspeccion: ['item_botella_timestamp_idx'],
+            models.MermaIngrediente: ['merma_almacen_fecha_idx'],
+        }
+
+        for modelo, nombres in indices.items():
+            indices_db = self.indices_tabla(modelo)
+            for nombre in nombres:
+                self.assertIn(nombre, indices_db)
+
+        self.assertEqual(self.indices_tabla(models.ConsumoRecetaVendida)['consumo_ingrediente_fecha_idx']['columns'], ['ingrediente_id', 'fecha'])
+
+        # El índice parcial de inspecciones con peso se quitó (ver migración 0034)
+        self.assertNotIn('item_botella_pesada_idx', self.indices_tabla(models.ItemInspeccion))
+
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'El benchmark requiere PostgreSQL')
+    def test_benchmark_indices(self):
+        """ Testear que el benchmark compara los planes y no deja rastro en la base de datos """
+
+        salida = io.StringIO()
+        call_command('benchmark_indices', sucursales=2, botellas=20, inspecciones=2, ventas=20, planes=True, stdout=salida)
+
+        self.assertIn('consumos_ingrediente (sin índices)', salida.getvalue())
+        self.assertIn('consumos_ingrediente (con índices)', salida.getvalue())
+        self.assertEqual(models.Botella.objects.count(), 0)
+        self.assertIn('consumo_ingrediente_fecha_idx', self.indices_tabla(models.ConsumoRecetaVendida))
@@ -0,0 +1,169 @@
+from django.db.models import Count, Subquery, OuterRef, IntegerField
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from freezegun import freeze_time
+
+from core import models
+from core import linea_tiempo
+
+import datetime
+
+
+class LineaTiempoBotellaTests(TestCase):
+
+    def setUp(self):
+
+        cliente = models.Cliente.objects.create(nombre='MAGNO BRASSERIE')
+        self.sucursal = models.Sucursal.objects.create(nombre='MAGNO-BRASSERIE', cliente=cliente)
+        self.almacen = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.sucursal)
+        categoria = models.Categoria.objects.create(nombre='WHISKY')
+        ingrediente = models.Ingrediente.objects.create(codigo='WHIS001', nombre='JOHNNIE WALKER BLACK', categoria=categoria, factor_peso=0.95)
+        self.producto = models.Producto.objects.create(folio='Ii0000000001', ingrediente=ingrediente, capacidad=750)
+
+        with freeze_time('2019-05-01'):
+            self.inspeccion_1 = models.Inspeccion.objects.create(almacen=self.almacen, sucursal=self.sucursal)
+        with freeze_time('2019-06-01'):
+            self.inspeccion_2 = models.Inspeccion.objects.create(almacen=self.almacen, sucursal=self.sucursal)
+        with freeze_time('2019-06-05'):
+            self.inspeccion_3 = models.Inspeccion.objects.create(almacen=self.almacen, sucursal=self.sucursal)
+
+
+    def crear_botella(self, folio):
+        return models.Botella.objects.create(
+            folio=folio,
+            producto=self.producto,
+            sucursal=self.sucursal,
+            almacen=self.almacen,
+            peso_inicial=1500
+        )
+
+
+    def inspeccionar(self, botella, inspeccion, fecha, peso_botella):
+        with freeze_time(fecha):
+            return models.ItemInspeccion.objects.create(inspeccion=inspeccion, botella=botella, peso_botella=peso_botella)
+
+
+    def test_resumir(self):
+        """ Testear el resumen de una lista de inspecciones """
+
+        t1, t2, t3, t4 = [datetime.datetime(2019, 6, dia) for dia in range(1, 5)]
+
+        resumen = linea_tiempo.resumir([(None, t1), (1200, t2), (1100, t3), (None, t4)])
+
+        self.assertEqual(resumen['num_inspecciones'], 4)
+        self.assertEqual(resumen['num_pesadas'], 2)
+        self.assertEqual(resumen['timestamp_primera_inspeccion'], t1)
+        self.assertEqual(resumen['timestamp_ultima_inspeccion'], t4)
+        self.assertIsNone(resumen['peso_primera_inspeccion'])
+        self.assertIsNone(resumen['peso_ultima_inspeccion'])
+        self.assertEqual(resumen['peso_penultima_inspeccion'], 1100)
+        self.assertEqual(resumen['peso_primera_pesada'], 1200)
+        self.assertEqual(resumen['peso_ultima_pesada'], 1100)
+        self.assertEqual(resumen['peso_penultima_pesada'], 1200)
+        self.assertEqual(resumen['timestamp_ultima_pesada'], t3)
+        self.assertEqual(resumen['timestamp_ultima_sin_peso'], t4)
+
+        # Con una sola inspección no hay penúltimo peso
+        resumen = linea_tiempo.resumir([(1200, t1)])
+        self.assertEqual(resumen['peso_ultima_inspeccion'], 1200)
+        self.assertIsNone(resumen['peso_penultima_inspeccion'])
+        self.assertIsNone(resumen['peso_penultima_pesada'])
+        self.assertIsNone(resumen['timestamp_ultima_sin_peso'])
+
+
+    def test_linea_tiempo_se_actualiza(self):
+        """ Testear que la línea de tiempo se recalcula al guardar y eliminar inspecciones """
+
+        botella = self.crear_botella('Ii0000000001')
+        self.assertFalse(models.LineaTiempoBotella.objects.filter(botella=botella).exists())
+
+        self.inspeccionar(botella, self.inspeccion_1, '2019-05-01', 1400)
+        item = self.inspeccionar(botella, self.inspeccion_2, '2019-06-01', None)
+
+        linea = models.LineaTiempoBotella.objects.get(botella=botella)
+        self.assertEqual(linea.num_inspecciones, 2)
+        self.assertEqual(linea.num_pesadas, 1)
+        self.assertIsNone(linea.peso_ultima_inspeccion)
+        self.assertEqual(linea.peso_penultima_inspeccion, 1400)
+        self.assertEqual(linea.peso_ultima_pesada, 1400)
+
+        # Registramos el peso de la segunda inspección
+        with freeze_time('2019-06-02'):
+            item.peso_botella = 1300
+            item.save()
+
+        linea.refresh_from_db()
+        self.assertEqual(linea.num_pesadas, 2)
+        self.assertEqual(linea.peso_ultima_inspeccion, 1300)
+        self.assertEqual(linea.peso_ultima_pesada, 1300)
+        self.assertEqual(linea.peso_penultima_pesada, 1400)
+        self.assertIsNone(linea.timestamp_ultima_sin_peso)
+
+        # Al eliminar todas las inspecciones, la botella se queda sin línea de tiempo
+        botella.inspecciones_botella.all().delete()
+        self.assertFalse(models.LineaTiempoBotella.objects.filter(botella=botella).exists())
+
+
+    def test_actualizar_bloquea_botellas(self):
+        """ Testear que las botellas se bloquean antes de leer y reemplazar su línea de tiempo """
+
+        botella = self.crear_botella('Ii0000000001')
+        self.inspeccionar(botella, self.inspeccion_1, '2019-05-01', 1400)
+
+        with CaptureQueriesContext(connection) as queries:
+            linea_tiempo.actualizar([botella.id])
+
+        sql = [query['sql'] for query in queries.captured_queries]
+        bloqueo = next(i for i, query in enumerate(sql) if 'FOR UPDATE' in query)
+        lectura = next(i for i, query in enumerate(sql) if 'FROM "core_iteminspeccion"' in query)
+        borrado = next(i for i, query in enumerate(sql) if query.startswith('DELETE FROM "core_lineatiempobotella"'))
+
+        self.assertIn('"core_botella"', sql[bloqueo])
+        self.assertLess(bloqueo, lectura)
+        self.assertLess(lectura, borrado)
+        self.assertEqual(models.LineaTiempoBotella.objects.get(botella=botella).peso_ultima_pesada, 1400)
+
+
+    def test_expresiones_periodo(self):
+        """ Testear que los valores del periodo coinciden con los calculados sobre los ItemInspeccion """
+
+        fecha_inicial = datetime.date(2019, 5, 25)
+        fecha_final = datetime.date(2019, 6, 6)
+
+        # Botella con todas sus inspecciones dentro del periodo
+        dentro = self.crear_botella('Ii0000000001')
+        self.inspeccionar(dentro, self.inspeccion_2, '2019-06-01', None)
+        self.inspeccionar(dentro, self.inspeccion_3, '2019-06-05', 1100)
+
+        # Botella con inspecciones antes y dentro del periodo
+        mixta = self.crear_botella('Ii0000000002')
+        self.inspeccionar(mixta, self.inspeccion_1, '2019-05-01', 1400)
+        self.inspeccionar(mixta, self.inspeccion_2, '2019-06-01', 1300)
+        self.inspeccionar(mixta, self.inspeccion_3, '2019-06-05', None)
+
+        # Botella con inspecciones solo antes del periodo
+        fuera = self.crear_botella('Ii0000000003')
+        self.inspeccionar(fuera, self.inspeccion_1, '2019-05-01', 1400)
+
+        # Botella sin inspecciones
+        self.crear_botella('Ii0000000004')
+
+        items_periodo = models.ItemInspeccion.objects.filter(
+            botella=OuterRef('pk'),
+            timestamp_inspeccion__gte=fecha_inicial,
+            timestamp_inspeccion__lte=fecha_final
+        )
+        esperado = models.Botella.objects.annotate(
+            inspecciones_periodo=Subquery(items_periodo.order_by().values('botella').annotate(n=Count('id')).values('n'), output_field=IntegerField()),
+            inspecciones_peso_ok_count=Subquery(items_periodo.exclude(peso_botella=None).order_by().values('botella').annotate(n=Count('id')).values('n'), output_field=IntegerField()),
+            peso_primera_inspeccion=Subquery(items_periodo.order_by('timestamp_inspeccion').values('peso_botella')[:1]),
+            peso_primera_pesada=Subquery(items_periodo.exclude(peso_botella=None).order_by('timestamp_inspeccion').values('peso_botella')[:1]),
+        )
+
+        campos = ['folio', 'inspecciones_periodo', 'inspecciones_peso_ok_count', 'peso_primera_inspeccion', 'peso_primera_pesada']
+        obtenido = models.Botella.objects.annotate(**linea_tiempo.expresiones_periodo(fecha_inicial, fecha_final))
+
+        self.assertEqual(list(obtenido.order_by('folio').values(*campos)), list(esperado.order_by('folio').values(*campos)))
+        self.assertEqual(obtenido.get(folio='Ii0000000002').peso_primera_inspeccion, 1300)
+        self.assertIsNone(obtenido.get(folio='Ii0000000003').inspecciones_periodo)
@@ -537,6 +537,10 @@ class ModelTests(TestCase):
         self.assertEqual(consumos_receta.count(), 1)
         self.assertEqual(consumos_venta.count(), 1)
 
+        # El almacén y la sucursal se toman de la venta
+        self.assertEqual(consumo_receta_vendida.almacen, venta.caja.almacen)
+        self.assertEqual(consumo_receta_vendida.sucursal, venta.sucursal)
+
 
     def test_crear_producto(self):
         """ Testear que se crea un Producto """
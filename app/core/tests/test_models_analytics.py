@@ -742,3 +742,21 @@ class ModelsAnalyticsTests(TestCase):
         self.assertAlmostEqual(float(merma_ingrediente.porcentaje), 0.00)
 
 
+
+
+    #---------------------------------------------------------------------------------------------------------------
+    def test_calcular_merma(self):
+        """
+        Testear el cálculo de merma y porcentaje para los casos con consumos None o en cero
+        """
+
+        casos = [
+            ((Decimal(100), Decimal(90)), (Decimal(10), Decimal(10))),
+            ((None, Decimal(90)), (Decimal(-90), Decimal(-100))),
+            ((Decimal(100), None), (Decimal(100), Decimal(100))),
+            ((Decimal(0), Decimal(90)), (Decimal(-90), Decimal(-100))),
+            ((None, None), (Decimal(0), Decimal(0))),
+        ]
+
+        for (consumo_ventas, consumo_real), esperado in casos:
+            self.assertEqual(models.calcular_merma(consumo_ventas, consumo_real), esperado)
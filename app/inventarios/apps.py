@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class InventariosConfig(AppConfig):
     name = 'inventarios'
+
+    def ready(self):
+        # Mantenemos el mapa de folios de una inspección al guardar o eliminar sus items
+        from inventarios import folios, permissions
+        folios.conectar()
+        # Invalidamos el cache de sucursales de un usuario cuando cambian sus sucursales
+        permissions.conectar()
@@ -0,0 +1,161 @@
+import collections
+import re
+import threading
+import time
+
+from django.db.models.signals import post_save, post_delete
+
+from core import models
+
+
+"""
+-----------------------------------------------------------------------------------
+Mapa folio -> ItemInspeccion de cada inspección, para resolver los escaneos de
+botellas sin consultar la base de datos.
+
+El mapa de una inspección se construye con una sola query (al crear la inspección
+o en el primer escaneo) y se guarda en un LRU local del proceso. Si el mapa no está
+en el LRU (otro proceso, expiró o fue desplazado), se vuelve a construir desde la
+base de datos.
+
+El LRU se mantiene al día con las señales de ItemInspeccion. Las operaciones
+masivas (bulk_update) no disparan señales, así que quien las use debe llamar
+'marcar_inspeccionados()'. Como cada proceso tiene su propio LRU, los mapas
+expiran después de TTL_MAPA segundos para no arrastrar cambios de otros procesos.
+-----------------------------------------------------------------------------------
+"""
+MAX_INSPECCIONES = 64
+TTL_MAPA = 60
+
+# Resultados de un escaneo
+PENDIENTE = 'PENDIENTE'
+INSPECCIONADA = 'INSPECCIONADA'
+NO_ES_PARTE = 'NO_ES_PARTE'
+
+_mapas = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+"""
+-----------------------------------------------------------------------------------
+Construye el mapa de una inspección:
+
+{
+    'sucursal_id': 1,
+    'items': {'Ii0000000001': {'item_inspeccion': 10, 'botella': 5, 'ingrediente': 'LICOR 43', 'inspeccionado': False}},
+    'folios': {10: 'Ii0000000001'},
+}
+
+Si no se conoce la sucursal de la inspección, se consulta. Retorna None si la
+inspección no existe.
+-----------------------------------------------------------------------------------
+"""
+def construir(inspeccion_id, sucursal_id=None):
+
+    if sucursal_id is None:
+        inspeccion = models.Inspeccion.objects.filter(id=inspeccion_id).values('sucursal_id').first()
+        if inspeccion is None:
+            return None
+        sucursal_id = inspeccion['sucursal_id']
+
+    items = (models.ItemInspeccion.objects
+                .filter(inspeccion__id=inspeccion_id)
+                .values_list('id', 'botella_id', 'botella__folio', 'botella__producto__ingrediente__nombre', 'inspeccionado')
+            )
+
+    mapa = {'sucursal_id': sucursal_id, 'items': {}, 'folios': {}, 'creado': time.monotonic()}
+    for item_id, botella_id, folio, ingrediente, inspeccionado in items:
+        mapa['items'][folio] = {
+            'item_inspeccion': item_id,
+            'botella': botella_id,
+            'ingrediente': ingrediente,
+            'inspeccionado': inspeccionado
+        }
+        mapa['folios'][item_id] = folio
+
+    with _lock:
+        _mapas[inspeccion_id] = mapa
+        _mapas.move_to_end(inspeccion_id)
+        while len(_mapas) > MAX_INSPECCIONES:
+            _mapas.popitem(last=False)
+
+    return mapa
+
+
+def get_mapa(inspeccion_id):
+
+    with _lock:
+        mapa = _mapas.get(inspeccion_id)
+        if mapa is not None and time.monotonic() - mapa['creado'] < TTL_MAPA:
+            _mapas.move_to_end(inspeccion_id)
+            return mapa
+
+    return construir(inspeccion_id)
+
+
+def invalidar(inspeccion_id):
+    with _lock:
+        _mapas.pop(inspeccion_id, None)
+
+
+"""
+-----------------------------------------------------------------------------------
+Resuelve el folio escaneado durante una inspección. Los folios custom (solo
+números) se completan con el id de la sucursal de la inspección.
+
+Retorna una tupla (resultado, item), donde 'resultado' es PENDIENTE, INSPECCIONADA
+o NO_ES_PARTE e 'item' son los datos del folio en el mapa (None si no es parte de
+la inspección).
+-----------------------------------------------------------------------------------
+"""
+def resolver(inspeccion_id, folio):
+
+    mapa = get_mapa(inspeccion_id)
+    if mapa is None:
+        return NO_ES_PARTE, None
+
+    if re.match('^[0-9]*$', folio):
+        folio = str(mapa['sucursal_id']) + folio
+
+    item = mapa['items'].get(folio)
+    if item is None:
+        return NO_ES_PARTE, None
+
+    return (INSPECCIONADA if item['inspeccionado'] else PENDIENTE), dict(item, folio=folio)
+
+
+"""
+-----------------------------------------------------------------------------------
+Marca como inspeccionados los items indicados en el mapa de su inspección (si el
+mapa está en el LRU)
+-----------------------------------------------------------------------------------
+"""
+def marcar_inspeccionados(inspeccion_id, items_id, inspeccionado=True):
+
+    with _lock:
+        mapa = _mapas.get(inspeccion_id)
+        if mapa is None:
+            return
+
+        for item_id in items_id:
+            folio = mapa['folios'].get(item_id)
+            if folio is not None:
+                mapa['items'][folio]['inspeccionado'] = inspeccionado
+
+
+def actualizar_item(sender, instance, created=False, **kwargs):
+
+    # Un item nuevo no está en el mapa: lo reconstruimos en el siguiente escaneo
+    if created:
+        invalidar(instance.inspeccion_id)
+    else:
+        marcar_inspeccionados(instance.inspeccion_id, [instance.id], instance.inspeccionado)
+
+
+def eliminar_item(sender, instance, **kwargs):
+    invalidar(instance.inspeccion_id)
+
+
+def conectar():
+    post_save.connect(actualizar_item, sender=models.ItemInspeccion, dispatch_uid='folios_inspeccion_item_save')
+    post_delete.connect(eliminar_item, sender=models.ItemInspeccion, dispatch_uid='folios_inspeccion_item_delete')
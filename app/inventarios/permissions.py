@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db.models.signals import m2m_changed
+from rest_framework import permissions
+
+from core import models
+
+
+"""
+-----------------------------------------------------------------------------------
+Autorización usuario -> sucursal.
+
+Las sucursales asignadas a cada usuario se guardan en cache como un conjunto de
+ids, para no consultar 'usuario.sucursales' en cada request. El cache de un usuario
+se invalida cada vez que cambian sus sucursales (señal m2m_changed), ya sea desde
+el usuario (usuario.sucursales.add()) o desde la sucursal (sucursal.user_set.add()).
+
+La sucursal a la que pertenece un almacén, inspección, reporte o merma tampoco
+cambia en la práctica, así que también se guarda en cache para resolver los
+permisos sin ir a la base de datos.
+
+Se usa el cache PERMISOS_CACHE_ALIAS (un alias de CACHES compartido entre procesos,
+p. ej. Redis) o, si no se define, el cache default. El default es local de cada
+proceso y la invalidación solo llega al proceso que hace el cambio, por eso los
+registros duran PERMISOS_CACHE_TTL segundos: los demás procesos dejan de usar un
+permiso retirado a más tardar en ese tiempo.
+
+Los endpoints que reportan todas las sucursales del usuario (exportaciones y
+reportes de varias sucursales) no usan el cache (ver get_sucursales_usuario).
+-----------------------------------------------------------------------------------
+"""
+def get_cache():
+    alias = getattr(settings, 'PERMISOS_CACHE_ALIAS', None)
+    return caches[alias] if alias else cache
+
+
+def get_ttl():
+    return getattr(settings, 'PERMISOS_CACHE_TTL', 30)
+
+
+def llave_cache(usuario_id):
+    return 'sucursales_usuario_{}'.format(usuario_id)
+
+
+def get_sucursales_usuario(usuario, usar_cache=True):
+
+    llave = llave_cache(usuario.id)
+    sucursales = get_cache().get(llave) if usar_cache else None
+
+    if sucursales is None:
+        sucursales = frozenset(usuario.sucursales.values_list('id', flat=True))
+        get_cache().set(llave, sucursales, get_ttl())
+
+    return sucursales
+
+
+def tiene_sucursal(usuario, sucursal_id):
+
+    if int(sucursal_id) in get_sucursales_usuario(usuario):
+        return True
+
+    # Antes de negar el acceso confirmamos con la base de datos, por si el cache está desfasado
+    invalidar(usuario.id)
+    return int(sucursal_id) in get_sucursales_usuario(usuario)
+
+
+def invalidar(usuario_id):
+    get_cache().delete(llave_cache(usuario_id))
+
+
+def invalidar_sucursales_usuario(sender, instance, action, reverse, pk_set, **kwargs):
+
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+
+    # Desde el usuario: 'instance' es el usuario
+    if not reverse:
+        invalidar(instance.id)
+        return
+
+    # Desde la sucursal: 'pk_set' son los usuarios (en un clear hay que consultarlos antes)
+    if action == 'pre_clear':
+        pk_set = instance.user_set.values_list('id', flat=True)
+
+    for usuario_id in pk_set or ():
+        invalidar(usuario_id)
+
+
+def conectar():
+    m2m_changed.connect(
+        invalidar_sucursales_usuario,
+        sender=get_user_model().sucursales.through,
+        dispatch_uid='permisos_sucursales_usuario'
+    )
+
+
+"""
+-----------------------------------------------------------------------------------
+Parámetros (de la URL o del body) que identifican la sucursal de un request, con
+el modelo y el campo para obtener la sucursal a partir de su id
+-----------------------------------------------------------------------------------
+"""
+PARAMETROS_SUCURSAL = (
+    ('sucursal_id', None, None),
+    ('sucursal', None, None),
+    ('almacen_id', models.Almacen, 'sucursal_id'),
+    ('almacen', models.Almacen, 'sucursal_id'),
+    ('inspeccion_id', models.Inspeccion, 'sucursal_id'),
+    ('inspeccion', models.Inspeccion, 'sucursal_id'),
+    ('item_inspeccion', models.ItemInspeccion, 'inspeccion__sucursal_id'),
+    ('reporte_id', models.ReporteMermas, 'almacen__sucursal_id'),
+    ('merma_id', models.MermaIngrediente, 'almacen__sucursal_id'),
+)
+
+
+def llave_cache_objeto(modelo, objeto_id):
+    return 'sucursal_{}_{}'.format(modelo._meta.model_name, objeto_id)
+
+
+def get_sucursal_objeto(modelo, campo, objeto_id, usar_cache=True):
+
+    sucursal_id = get_cache().get(llave_cache_objeto(modelo, objeto_id)) if usar_cache else None
+
+    if sucursal_id is None:
+        sucursal_id = modelo.objects.filter(id=objeto_id).values_list(campo, flat=True).first()
+        if sucursal_id is not None:
+            guardar_sucursal_objeto(modelo, objeto_id, sucursal_id)
+
+    return sucursal_id
+
+
+# Para dejar en cache la sucursal de un objeto recién creado
+def guardar_sucursal_objeto(modelo, objeto_id, sucursal_id):
+    get_cache().set(llave_cache_objeto(modelo, objeto_id), sucursal_id, get_ttl())
+
+
+def get_sucursales_request(request, view, usar_cache=True):
+
+    datos = request.data if isinstance(request.data, dict) else {}
+    sucursales = []
+
+    for parametro, modelo, campo in PARAMETROS_SUCURSAL:
+        valor = view.kwargs.get(parametro, datos.get(parametro))
+        try:
+            valor = int(valor)
+        except (TypeError, ValueError):
+            continue
+
+        sucursal_id = valor if modelo is None else get_sucursal_objeto(modelo, campo, valor, usar_cache)
+        if sucursal_id is not None:
+            sucursales.append(sucursal_id)
+
+    return sucursales
+
+
+class PermisoSucursal(permissions.BasePermission):
+    """
+    Checa que el usuario tenga asignadas las sucursales del request. Si el request
+    no hace referencia a una sucursal (o el objeto no existe) se deja pasar, para que
+    la vista responda como corresponda (404, 400, etc.)
+    """
+    message = 'No estás autorizado para consultar esta sucursal.'
+
+    def has_permission(self, request, view):
+
+        if self.autorizado(request, view):
+            return True
+
+        # Antes de negar el acceso confirmamos con la base de datos, por si el cache está desfasado
+        invalidar(request.user.id)
+        return self.autorizado(request, view, usar_cache=False)
+
+    def autorizado(self, request, view, usar_cache=True):
+
+        sucursales_usuario = get_sucursales_usuario(request.user)
+        sucursales = get_sucursales_request(request, view, usar_cache)
+
+        return all(sucursal_id in sucursales_usuario for sucursal_id in sucursales)
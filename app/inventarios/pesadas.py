@@ -0,0 +1,114 @@
+from django.db import transaction
+from django.utils import timezone
+
+from core import models
+from core import linea_tiempo
+from inventarios import folios
+from inventarios import permissions
+from inventarios import serializers
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna el peso a registrar para una pesada validada. Las botellas VACIAS y NUEVAS
+sin peso toman el 'peso_cristal' o el 'peso_nueva' de la Botella.
+-----------------------------------------------------------------------------------
+"""
+def get_peso(datos, botella):
+
+    peso_botella = datos.get('peso_botella')
+
+    if peso_botella is None:
+        peso_botella = botella.peso_cristal if datos['estado'] == models.Botella.VACIA else botella.peso_nueva
+
+    return peso_botella
+
+
+"""
+-----------------------------------------------------------------------------------
+Registra en bloque los pesos de varias botellas inspeccionadas.
+
+'pesadas' es una lista de dicts {item_inspeccion, peso_botella, estado}, con los
+mismos datos que reciben 'update_peso_botella' y 'update_botella_nueva_vacia'.
+Cada pesada se valida por separado y las válidas se guardan con un bulk_update de
+ItemInspeccion y otro de Botella dentro de una transacción.
+
+Retorna una lista con el resultado de cada pesada, en el mismo orden del input:
+
+    {'item_inspeccion': 10, 'procesado': True, 'peso_botella': 1200, 'estado': '1'}
+    {'item_inspeccion': 11, 'procesado': False, 'errores': {...}}
+-----------------------------------------------------------------------------------
+"""
+def registrar(pesadas, usuario):
+
+    resultados = []
+    validas = {}
+
+    for pesada in pesadas:
+        serializer = serializers.PesadaSerializer(data=pesada)
+
+        if serializer.is_valid():
+            resultado = {'item_inspeccion': serializer.validated_data['item_inspeccion'], 'procesado': True}
+
+            # Si el item se repite en el lote, nos quedamos con la última pesada
+            if resultado['item_inspeccion'] in validas:
+                _, resultado_anterior = validas[resultado['item_inspeccion']]
+                resultado_anterior.update({'procesado': False, 'errores': {'item_inspeccion': ['El item tiene una pesada posterior en el lote.']}})
+
+            validas[resultado['item_inspeccion']] = (serializer.validated_data, resultado)
+        else:
+            resultado = {'item_inspeccion': pesada.get('item_inspeccion') if isinstance(pesada, dict) else None, 'procesado': False, 'errores': serializer.errors}
+
+        resultados.append(resultado)
+
+    # Tomamos los items con sus botellas en una sola query
+    items = (models.ItemInspeccion.objects
+                .filter(id__in=validas.keys())
+                .select_related('botella', 'inspeccion')
+                .in_bulk()
+            )
+
+    ahora = timezone.now()
+    items_actualizar = []
+    botellas_actualizar = []
+
+    for item_id, (datos, resultado) in validas.items():
+        item = items.get(item_id)
+
+        if item is None:
+            resultado.update({'procesado': False, 'errores': {'item_inspeccion': ['El ItemInspeccion no existe.']}})
+            continue
+
+        if not permissions.tiene_sucursal(usuario, item.inspeccion.sucursal_id):
+            resultado.update({'procesado': False, 'errores': {'item_inspeccion': ['No estás autorizado para modificar este ItemInspeccion.']}})
+            continue
+
+        botella = item.botella
+        estado = datos['estado']
+        peso_botella = get_peso(datos, botella)
+
+        item.peso_botella = peso_botella
+        item.inspeccionado = True
+        # 'timestamp_inspeccion' es auto_now, pero bulk_update no lo actualiza
+        item.timestamp_inspeccion = ahora
+
+        botella.estado = estado
+        botella.peso_actual = peso_botella
+        if estado == models.Botella.VACIA:
+            botella.fecha_baja = ahora
+
+        items_actualizar.append(item)
+        botellas_actualizar.append(botella)
+        resultado.update({'peso_botella': peso_botella, 'estado': estado})
+
+    with transaction.atomic():
+        models.ItemInspeccion.objects.bulk_update(items_actualizar, ['peso_botella', 'inspeccionado', 'timestamp_inspeccion'])
+        models.Botella.objects.bulk_update(botellas_actualizar, ['estado', 'peso_actual', 'fecha_baja'])
+
+        # bulk_update no dispara señales: actualizamos la línea de tiempo y el mapa de folios
+        linea_tiempo.actualizar([item.botella_id for item in items_actualizar])
+
+    for inspeccion_id in {item.inspeccion_id for item in items_actualizar}:
+        folios.marcar_inspeccionados(inspeccion_id, [item.id for item in items_actualizar if item.inspeccion_id == inspeccion_id])
+
+    return resultados
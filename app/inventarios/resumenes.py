@@ -0,0 +1,173 @@
+from django.core.cache import cache
+from django.db.models import Q, Count, Max
+
+from core import models
+
+
+"""
+-----------------------------------------------------------------------------------
+Resumen de los ItemInspeccion de una inspección, agrupados por categoría,
+ingrediente y estado de conteo.
+
+Los endpoints 'resumen_inspeccion', 'resumen_inspeccion_no_contado',
+'resumen_inspeccion_contado' y 'resumen_botellas_conteo' se construyen a partir
+del mismo resumen, que se calcula con un solo GROUP BY y se guarda en cache.
+
+La llave del cache incluye la versión de los items de la inspección (número de
+items, número de items contados y último 'timestamp_inspeccion'), que se lee de la
+base de datos con un query sin GROUP BY. Al registrar un peso cambia la versión y
+el resumen se recalcula en todos los procesos, aunque el cache sea local de cada
+uno y aunque el cambio se haga con una operación masiva (bulk_update).
+-----------------------------------------------------------------------------------
+"""
+TIMEOUT_CACHE = 60 * 60
+
+
+def llave_cache(inspeccion_id, version):
+    return 'resumen_inspeccion_{}_{}'.format(inspeccion_id, version)
+
+
+def get_version(inspeccion_id):
+
+    version = models.ItemInspeccion.objects.filter(inspeccion__id=inspeccion_id).aggregate(
+        items=Count('id'),
+        contados=Count('id', filter=Q(inspeccionado=True)),
+        ultimo_cambio=Max('timestamp_inspeccion')
+    )
+
+    ultimo_cambio = version['ultimo_cambio'].timestamp() if version['ultimo_cambio'] is not None else 0
+    return '{}_{}_{}'.format(version['items'], version['contados'], ultimo_cambio)
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna una lista de tuplas
+(categoria_id, categoria, ingrediente_id, ingrediente, inspeccionado, cantidad)
+ordenada por categoría e ingrediente
+-----------------------------------------------------------------------------------
+"""
+def calcular(inspeccion_id):
+
+    filas = (models.ItemInspeccion.objects
+                .filter(inspeccion__id=inspeccion_id)
+                .values_list(
+                    'botella__producto__ingrediente__categoria__id',
+                    'botella__producto__ingrediente__categoria__nombre',
+                    'botella__producto__ingrediente__id',
+                    'botella__producto__ingrediente__nombre',
+                    'inspeccionado'
+                )
+                .annotate(cantidad=Count('id'))
+                .order_by('botella__producto__ingrediente__categoria__id', 'botella__producto__ingrediente__id', 'inspeccionado')
+            )
+
+    return list(filas)
+
+
+def get_resumen(inspeccion_id):
+
+    llave = llave_cache(inspeccion_id, get_version(inspeccion_id))
+    filas = cache.get(llave)
+
+    if filas is None:
+        filas = calcular(inspeccion_id)
+        cache.set(llave, filas, TIMEOUT_CACHE)
+
+    return filas
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna los ingredientes del catálogo de las categorías del resumen,
+{categoria_id: [(ingrediente_id, ingrediente)]}, ordenados por id
+-----------------------------------------------------------------------------------
+"""
+def catalogo(filas):
+
+    categorias = {fila[0] for fila in filas}
+    ingredientes = (models.Ingrediente.objects
+        .filter(categoria__id__in=categorias)
+        .values_list('categoria__id', 'id', 'nombre')
+        .order_by('categoria__id', 'id')
+    )
+
+    resultado = {}
+    for categoria_id, ingrediente_id, ingrediente in ingredientes:
+        resultado.setdefault(categoria_id, []).append((ingrediente_id, ingrediente))
+
+    return resultado
+
+
+"""
+-----------------------------------------------------------------------------------
+Construye el árbol categoría -> ingredientes en una sola pasada sobre el resumen.
+Si 'inspeccionado' es True o False, solo se toman en cuenta los items contados o
+no contados, respectivamente.
+
+Con 'ingredientes' (ver catalogo()) se listan todos los ingredientes de cada
+categoría, como antes de usar el resumen. Con 'con_id' se incluye 'ingrediente_id'.
+
+Ejemplo:
+
+[
+    {
+        'categoria': 'LICOR',
+        'total_botellas': 4,
+        'botellas': [
+            {'ingrediente_id': 1, 'ingrediente': 'LICOR 43', 'cantidad': 3},
+            {'ingrediente_id': 2, 'ingrediente': 'CAMPARI', 'cantidad': 1},
+        ]
+    },
+]
+-----------------------------------------------------------------------------------
+"""
+def arbol(filas, inspeccionado=None, ingredientes=None, con_id=True):
+
+    # Acumulamos las botellas de cada categoría y de cada uno de sus ingredientes
+    categorias = {}
+    for categoria_id, categoria, ingrediente_id, ingrediente, item_inspeccionado, cantidad in filas:
+
+        if inspeccionado is not None and item_inspeccionado != inspeccionado:
+            continue
+
+        obj_categoria = categorias.setdefault(categoria_id, {'categoria': categoria, 'total_botellas': 0, 'cantidades': {}})
+        obj_categoria['total_botellas'] += cantidad
+
+        nombre, total = obj_categoria['cantidades'].get(ingrediente_id, (ingrediente, 0))
+        obj_categoria['cantidades'][ingrediente_id] = (nombre, total + cantidad)
+
+    resumen = []
+    for categoria_id, obj_categoria in categorias.items():
+
+        cantidades = obj_categoria['cantidades']
+
+        # Con el catálogo se listan todos los ingredientes de la categoría (los que no
+        # tienen botellas con cantidad None); sin él, solo los que tienen botellas
+        if ingredientes is not None:
+            lista = [(ingrediente_id, nombre, cantidades.get(ingrediente_id, (None, None))[1]) for ingrediente_id, nombre in ingredientes.get(categoria_id, [])]
+        else:
+            lista = [(ingrediente_id, nombre, cantidad) for ingrediente_id, (nombre, cantidad) in cantidades.items()]
+
+        botellas = []
+        for ingrediente_id, nombre, cantidad in lista:
+            obj_ingrediente = {'ingrediente_id': ingrediente_id} if con_id else {}
+            obj_ingrediente['ingrediente'] = nombre
+            obj_ingrediente['cantidad'] = cantidad
+            botellas.append(obj_ingrediente)
+
+        resumen.append({'categoria': obj_categoria['categoria'], 'total_botellas': obj_categoria['total_botellas'], 'botellas': botellas})
+
+    return resumen
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna la cantidad de botellas contadas y no contadas del resumen
+-----------------------------------------------------------------------------------
+"""
+def conteo(filas):
+
+    contados = sum(fila[5] for fila in filas if fila[4])
+    no_contados = sum(fila[5] for fila in filas if not fila[4])
+
+    return {'botellas_contadas': contados, 'botellas_no_contadas': no_contados}
@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework import serializers
 from core import models
+from core import linea_tiempo
+from inventarios import folios
+from inventarios import permissions
 import datetime
 import re
 from django.utils.timezone import make_aware
@@ -82,26 +86,11 @@ class InspeccionPostSerializer(serializers.ModelSerializer):
                 """
                 if (estado_ultima_inspeccion == '1') and (fecha_hoy > fecha_ultima_inspeccion):
                     #inspeccion = models.Inspeccion.objects.create(usuario_alta=usuario, **validated_data)
-                    inspeccion = models.Inspeccion.objects.create(**validated_data)
-                    #print('::: CREAMOS UNA INSPECCION :::')
-                    #print(inspeccion)
-
                     #print('::: LISTA DE BOTELLAS :::')
                     #print(botellas)
 
-                    # Creamos los ItemInspeccion
-                    for botella in botellas:
-                        # Tomamos el id de la botella
-                        botella_id = botella.id
-                        # Creamos el ItemInspeccion
-                        ii = models.ItemInspeccion.objects.create(inspeccion=inspeccion, botella=botella)
-                        #print('::: ITEM INSPECCION :::')
-                        #print(ii)
-
-                    #print(inspeccion.items_inspeccionados.all())
-                    #print(inspeccion.items_inspeccionados.count())
-
-                    return inspeccion
+                    # Creamos la inspección y sus ItemInspeccion
+                    return self.crear_inspeccion(validated_data, botellas)
 
                 # Si la fecha de hoy es igual o menor que la de la inspección previa, marcar error
                 elif estado_ultima_inspeccion == '1' and fecha_hoy <= fecha_ultima_inspeccion:
@@ -116,9 +105,7 @@ class InspeccionPostSerializer(serializers.ModelSerializer):
             (creamos la primera inspección ever)
             """
         
-            inspeccion = models.Inspeccion.objects.create(**validated_data)
             #print('::: NO HAY INSPECCIONES REGISTRADAS :::')
-            #print(inspeccion)
             # Tomamos la información extra del contexto
             botellas = self.context['lista_botellas_inspeccionar']
             #usuario = self.context['usuario']
@@ -126,13 +113,8 @@ class InspeccionPostSerializer(serializers.ModelSerializer):
             #print('::: LISTA DE BOTELLAS (no hay inspecciones previas) :::')
             #print(botellas)
 
-
-            # Creamos los ItemInspeccion
-            for botella in botellas:
-                botella_id = botella.id
-                models.ItemInspeccion.objects.create(inspeccion=inspeccion, botella=botella)
-
-            return inspeccion
+            # Creamos la inspección y sus ItemInspeccion
+            return self.crear_inspeccion(validated_data, botellas)
 
         """
         Si no hay botellas que inspeccionar, NO hacemos ninguna inspección
@@ -140,6 +122,31 @@ class InspeccionPostSerializer(serializers.ModelSerializer):
         #print('::: NO HAY BOTELLAS QUE INSPECCIONAR :::')
         raise serializers.ValidationError('No se puede crear una nueva inspección porque no hubo consumo de alcohol.')
 
+    def crear_inspeccion(self, validated_data, botellas):
+        """
+        Crea la Inspeccion y sus ItemInspeccion en una sola transacción. Los items
+        se insertan con un solo bulk_create. 'botellas' puede ser una lista (o un
+        queryset 'values_list') de ids de Botella, o una lista de Botellas.
+        """
+        botellas_id = [getattr(botella, 'id', botella) for botella in botellas]
+
+        with transaction.atomic():
+            inspeccion = models.Inspeccion.objects.create(**validated_data)
+
+            models.ItemInspeccion.objects.bulk_create([
+                models.ItemInspeccion(inspeccion=inspeccion, botella_id=botella_id)
+                for botella_id in botellas_id
+            ])
+
+            # bulk_create no dispara señales, así que actualizamos la línea de tiempo de las botellas
+            linea_tiempo.agregar_inspeccion(inspeccion, botellas_id)
+
+        # Dejamos listo el mapa de folios para los escaneos de la inspección
+        folios.construir(inspeccion.id, inspeccion.sucursal_id)
+        permissions.guardar_sucursal_objeto(models.Inspeccion, inspeccion.id, inspeccion.sucursal_id)
+
+        return inspeccion
+
 
 
 #-----------------------------------------------------------------
@@ -203,6 +210,62 @@ class InspeccionDetalleSerializer(serializers.ModelSerializer):
             'items_inspeccionados'
         )
 
+#------------------------------------------------------------------
+class ItemInspeccionCompactoSerializer(serializers.ModelSerializer):
+    """
+    Versión compacta de ItemInspeccion para listar los items de una inspección.
+    El argumento opcional 'fields' limita los campos del output.
+    """
+
+    # Relaciones que necesita cada campo (para el 'select_related' del queryset)
+    RELACIONES = {
+        'folio': 'botella',
+        'estado_botella': 'botella',
+        'capacidad': 'botella',
+        'ingrediente_id': 'botella__producto',
+        'ingrediente': 'botella__producto__ingrediente',
+        'categoria': 'botella__producto__ingrediente__categoria',
+    }
+
+    folio = serializers.CharField(source='botella.folio', read_only=True)
+    estado_botella = serializers.CharField(source='botella.estado', read_only=True)
+    capacidad = serializers.IntegerField(source='botella.capacidad', read_only=True)
+    ingrediente_id = serializers.IntegerField(source='botella.producto.ingrediente_id', read_only=True, allow_null=True)
+    ingrediente = serializers.CharField(source='botella.producto.ingrediente.nombre', read_only=True, allow_null=True)
+    categoria = serializers.CharField(source='botella.producto.ingrediente.categoria.nombre', read_only=True, allow_null=True)
+
+    class Meta:
+        model = models.ItemInspeccion
+        fields = (
+            'id',
+            'botella',
+            'folio',
+            'estado_botella',
+            'capacidad',
+            'ingrediente_id',
+            'ingrediente',
+            'categoria',
+            'peso_botella',
+            'inspeccionado',
+            'timestamp_inspeccion',
+        )
+
+    def __init__(self, *args, **kwargs):
+        campos = kwargs.pop('fields', None)
+        super(ItemInspeccionCompactoSerializer, self).__init__(*args, **kwargs)
+
+        if campos is not None:
+            for campo in set(self.fields) - set(campos):
+                self.fields.pop(campo)
+
+    @classmethod
+    def get_relaciones(cls, campos=None):
+        """ Retorna las relaciones a incluir en el 'select_related' para los campos solicitados """
+        if campos is None:
+            campos = cls.Meta.fields
+
+        return sorted({cls.RELACIONES[campo] for campo in campos if campo in cls.RELACIONES})
+
 #------------------------------------------------------------------
 class ItemInspeccionSerializer(serializers.ModelSerializer):
     """ Despliega el detalle de un ItemInspeccion """
@@ -410,6 +473,33 @@ class ItemInspeccionUpdateSerializer2(serializers.ModelSerializer):
         return instance
 
 
+#------------------------------------------------------------------
+class PesadaSerializer(serializers.Serializer):
+    """
+    Valida una pesada del lote de 'update_peso_botellas'. Si no se envía el peso,
+    las botellas VACIAS toman su 'peso_cristal' y las NUEVAS su 'peso_nueva'.
+    """
+
+    item_inspeccion = serializers.IntegerField()
+    peso_botella = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+    estado = serializers.ChoiceField(choices=models.Botella.ESTADOS_BOTELLA)
+
+    def validate(self, data):
+        peso_botella = data.get('peso_botella')
+        estado = data['estado']
+
+        if peso_botella is None and estado not in (models.Botella.VACIA, models.Botella.NUEVA):
+            raise serializers.ValidationError('El peso de la botella es obligatorio para este estado.')
+
+        return data
+
+
+class CambioSincronizacionSerializer(PesadaSerializer):
+    """ Una pesada registrada sin conexión, con el 'timestamp_inspeccion' del item en el snapshot de la app """
+
+    timestamp_inspeccion = serializers.DateTimeField()
+
+
 #------------------------------------------------------------------
 class IngredienteSerializer(serializers.ModelSerializer):
 
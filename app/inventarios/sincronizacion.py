@@ -0,0 +1,195 @@
+from django.db import transaction
+from django.db.models import Count, Max
+
+from core import models
+from inventarios import pesadas
+from inventarios import serializers
+
+
+"""
+-----------------------------------------------------------------------------------
+Sincronización offline de una inspección.
+
+1. La app descarga un snapshot de la inspección ('get_snapshot') con sus items,
+   el peso esperado de cada botella y un token de versión.
+2. La app registra las pesadas sin conexión y después sube solo los cambios
+   ('sincronizar'). Cada cambio incluye el 'timestamp_inspeccion' del item en el
+   snapshot que descargó.
+
+Al sincronizar, cada cambio se compara contra el item en el servidor:
+
+- Si el item ya tiene exactamente los datos del cambio, no se hace nada (reenviar
+  el mismo lote es seguro).
+- Si la inspección ya se cerró, el cambio no se aplica y se reporta como
+  conflicto: las mermas y el restock ya se calcularon con los pesos del cierre.
+- Si el 'timestamp_inspeccion' del item cambió desde el snapshot, alguien más lo
+  modificó: se reporta un conflicto con los datos del servidor y no se aplica.
+- En otro caso, el cambio se registra con 'pesadas.registrar'.
+-----------------------------------------------------------------------------------
+"""
+
+
+"""
+-----------------------------------------------------------------------------------
+Token de versión de la inspección: cambia cada vez que se agrega, elimina o
+modifica uno de sus items
+-----------------------------------------------------------------------------------
+"""
+def get_version(inspeccion):
+
+    datos = models.ItemInspeccion.objects.filter(inspeccion=inspeccion).aggregate(
+        items=Count('id'),
+        ultimo_cambio=Max('timestamp_inspeccion')
+    )
+    ultimo_cambio = datos['ultimo_cambio'].timestamp() if datos['ultimo_cambio'] is not None else 0
+
+    return '{}-{}-{}'.format(inspeccion.id, datos['items'], int(ultimo_cambio * 1000000))
+
+
+def get_snapshot(inspeccion):
+
+    items = (models.ItemInspeccion.objects
+                .filter(inspeccion=inspeccion)
+                .order_by('id')
+                .values(
+                    'id',
+                    'botella_id',
+                    'botella__folio',
+                    'botella__producto__ingrediente__nombre',
+                    'botella__estado',
+                    'botella__peso_actual',
+                    'peso_botella',
+                    'inspeccionado',
+                    'timestamp_inspeccion'
+                )
+            )
+
+    return {
+        'inspeccion': inspeccion.id,
+        'estado': inspeccion.estado,
+        'version': get_version(inspeccion),
+        'items': [
+            {
+                'id': item['id'],
+                'botella': item['botella_id'],
+                'folio': item['botella__folio'],
+                'ingrediente': item['botella__producto__ingrediente__nombre'],
+                'estado': item['botella__estado'],
+                'peso_esperado': item['botella__peso_actual'],
+                'peso_botella': item['peso_botella'],
+                'inspeccionado': item['inspeccionado'],
+                'timestamp_inspeccion': item['timestamp_inspeccion'],
+            }
+            for item in items
+        ]
+    }
+
+
+"""
+-----------------------------------------------------------------------------------
+Aplica los cambios subidos por la app y retorna el resultado de cada uno (en el
+mismo orden del input) junto con la nueva versión y el estado de la inspección
+-----------------------------------------------------------------------------------
+"""
+def get_datos_servidor(item):
+
+    return {
+        'peso_botella': item.peso_botella,
+        'inspeccionado': item.inspeccionado,
+        'estado': item.botella.estado,
+        'timestamp_inspeccion': item.timestamp_inspeccion,
+    }
+
+
+def sincronizar(inspeccion, version, cambios, usuario):
+
+    resultados = [None] * len(cambios)
+    validos = {}
+
+    for posicion, cambio in enumerate(cambios):
+        serializer = serializers.CambioSincronizacionSerializer(data=cambio)
+
+        if serializer.is_valid():
+            validos[posicion] = serializer.validated_data
+        else:
+            item_id = cambio.get('item_inspeccion') if isinstance(cambio, dict) else None
+            resultados[posicion] = {'item_inspeccion': item_id, 'procesado': False, 'errores': serializer.errors}
+
+    with transaction.atomic():
+        # Bloqueamos la inspección para que no se cierre a la mitad de la sincronización
+        estado_inspeccion = (models.Inspeccion.objects
+                                .select_for_update()
+                                .values_list('estado', flat=True)
+                                .get(id=inspeccion.id)
+                            )
+        cerrada = estado_inspeccion == models.Inspeccion.CERRADA
+
+        # Bloqueamos los items para que otra sincronización no los modifique a la mitad
+        items = (models.ItemInspeccion.objects
+                    .select_for_update()
+                    .filter(inspeccion=inspeccion, id__in=[datos['item_inspeccion'] for datos in validos.values()])
+                    .select_related('botella')
+                    .in_bulk()
+                )
+        version_servidor = get_version(inspeccion)
+
+        aplicar = []
+        posiciones_aplicar = []
+
+        for posicion, datos in validos.items():
+            item = items.get(datos['item_inspeccion'])
+
+            if item is None:
+                resultados[posicion] = {
+                    'item_inspeccion': datos['item_inspeccion'],
+                    'procesado': False,
+                    'errores': {'item_inspeccion': ['El ItemInspeccion no pertenece a la inspección.']}
+                }
+
+            elif (item.inspeccionado and
+                    item.peso_botella == pesadas.get_peso(datos, item.botella) and
+                    item.botella.estado == datos['estado']):
+                # El cambio ya estaba aplicado (por ejemplo, un lote reenviado)
+                resultados[posicion] = {
+                    'item_inspeccion': item.id,
+                    'procesado': True,
+                    'peso_botella': item.peso_botella,
+                    'estado': item.botella.estado
+                }
+
+            elif cerrada:
+                resultados[posicion] = {
+                    'item_inspeccion': item.id,
+                    'procesado': False,
+                    'conflicto': True,
+                    'errores': {'inspeccion': ['La inspección ya está cerrada.']},
+                    'servidor': get_datos_servidor(item)
+                }
+
+            elif item.timestamp_inspeccion != datos['timestamp_inspeccion']:
+                resultados[posicion] = {
+                    'item_inspeccion': item.id,
+                    'procesado': False,
+                    'conflicto': True,
+                    'servidor': get_datos_servidor(item)
+                }
+
+            else:
+                aplicar.append({
+                    'item_inspeccion': datos['item_inspeccion'],
+                    'peso_botella': datos.get('peso_botella'),
+                    'estado': datos['estado']
+                })
+                posiciones_aplicar.append(posicion)
+
+        for posicion, resultado in zip(posiciones_aplicar, pesadas.registrar(aplicar, usuario)):
+            resultados[posicion] = resultado
+
+    return {
+        # Si el snapshot de la app ya no estaba vigente, conviene que lo vuelva a descargar
+        'snapshot_vigente': version == version_servidor,
+        'version': get_version(inspeccion),
+        'estado': estado_inspeccion,
+        'conflictos': sum(1 for resultado in resultados if resultado.get('conflicto')),
+        'resultados': resultados,
+    }
@@ -1,4 +1,8 @@
 from django.test import TestCase
+from django.conf import settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -836,6 +840,59 @@ class InspeccionesTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
 
 
+    #--------------------------------------------------------------------------
+    def test_items_inspeccion_paginados(self):
+        """
+        - Test para el endpoint 'get_items_inspeccion'
+        Testear que los items se paginan con cursor y sin queries por item
+        """
+
+        inspeccion_1 = models.Inspeccion.objects.create(
+            almacen=self.barra_1,
+            sucursal=self.magno_brasserie,
+            usuario_alta=self.usuario
+        )
+        botellas = [self.botella_licor43, self.botella_herradura_blanco, self.botella_herradura_blanco_2]
+        for botella in botellas:
+            models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=botella, peso_botella=1000)
+
+        url = reverse('inventarios:get-items-inspeccion', args=[inspeccion_1.id])
+
+        # Primera página: el número de queries no depende del número de items
+        # (incluye las queries de los permisos, que después quedan en cache)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, {'page_size': 2})
+        selects_items = [q for q in queries.captured_queries if 'FROM "core_iteminspeccion"' in q['sql']]
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(selects_items), 1)
+        self.assertEqual(len(queries.captured_queries), 4)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertEqual(res.data['results'][0]['folio'], 'Ii0000000001')
+        self.assertEqual(res.data['results'][0]['ingrediente'], 'LICOR 43')
+        self.assertEqual(res.data['results'][0]['categoria'], 'LICOR')
+        self.assertIsNone(res.data['previous'])
+
+        # Segunda página con el cursor del response
+        res = self.client.get(res.data['next'])
+        self.assertEqual([item['folio'] for item in res.data['results']], ['Nn0000000002'])
+        self.assertIsNone(res.data['next'])
+
+        # Sparse fieldset: solo los campos solicitados y sin JOINs innecesarios
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, {'fields': 'id,peso_botella'})
+        selects_items = [q['sql'] for q in queries.captured_queries if 'FROM "core_iteminspeccion"' in q['sql']]
+
+        self.assertEqual(set(res.data['results'][0].keys()), {'id', 'peso_botella'})
+        self.assertNotIn('JOIN', selects_items[0])
+
+        # Un usuario de otra sucursal no puede ver los items
+        otro_usuario = get_user_model().objects.create(email='otro@foodstack.mx', password='password123')
+        self.client.force_authenticate(otro_usuario)
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
 
     #--------------------------------------------------------------------------
     def test_queryset(self):
@@ -1589,6 +1646,78 @@ class InspeccionesTests(TestCase):
         self.assertEqual(len(response.data), 1)
 
 
+    #--------------------------------------------------------------------------------
+    def test_resumen_inspeccion_cache(self):
+        """
+        Testear que los resúmenes de una inspección comparten un resumen en cache
+        que se recalcula cuando cambian los items, aunque el cambio no dispare señales
+        """
+
+        don_julio = models.Ingrediente.objects.create(codigo='TEQU002', nombre='DON JULIO BLANCO', categoria=self.categoria_tequila, factor_peso=0.95)
+
+        inspeccion_1 = models.Inspeccion.objects.create(
+            almacen=self.barra_1,
+            sucursal=self.magno_brasserie,
+            usuario_alta=self.usuario
+        )
+        item_licor43 = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_licor43)
+        item_herradura = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_herradura_blanco)
+
+        url_resumen = reverse('inventarios:resumen-inspeccion', args=[inspeccion_1.id])
+        url_conteo = reverse('inventarios:resumen-botellas-conteo', args=[inspeccion_1.id])
+        url_no_contado = reverse('inventarios:resumen-inspeccion-no-contado', args=[inspeccion_1.id])
+
+        def agrupados(queries):
+            return [q for q in queries.captured_queries if 'FROM "core_iteminspeccion"' in q['sql'] and 'GROUP BY' in q['sql']]
+
+        # El primer resumen se calcula con un solo GROUP BY
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url_resumen)
+        self.assertEqual(len(agrupados(queries)), 1)
+
+        # Se listan todos los ingredientes de las categorías, como antes del resumen en cache
+        self.assertEqual(response.data, [
+            {'categoria': 'LICOR', 'total_botellas': 1, 'botellas': [{'ingrediente': 'LICOR 43', 'cantidad': 1}]},
+            {'categoria': 'TEQUILA', 'total_botellas': 1, 'botellas': [
+                {'ingrediente': 'HERRADURA BLANCO', 'cantidad': 1},
+                {'ingrediente': 'DON JULIO BLANCO', 'cantidad': None}
+            ]},
+        ])
+
+        # Con '?compacto=1' solo los ingredientes con botellas, con su id
+        response = self.client.get(url_resumen, {'compacto': '1'})
+        self.assertEqual(response.data[1]['botellas'], [{'ingrediente_id': self.herradura_blanco.id, 'ingrediente': 'HERRADURA BLANCO', 'cantidad': 1}])
+
+        # Los demás resúmenes salen del cache
+        with CaptureQueriesContext(connection) as queries:
+            response_conteo = self.client.get(url_conteo)
+            response_no_contado = self.client.get(url_no_contado)
+        self.assertFalse(agrupados(queries))
+        self.assertEqual(response_conteo.data, {'botellas_contadas': 0, 'botellas_no_contadas': 2})
+        self.assertEqual(len(response_no_contado.data), 2)
+        self.assertEqual(response_no_contado.data[1]['botellas'][1], {'ingrediente_id': don_julio.id, 'ingrediente': 'DON JULIO BLANCO', 'cantidad': None})
+
+        # Al registrar el peso de una botella, el resumen se recalcula
+        payload = {
+            'item_inspeccion': item_licor43.id,
+            'peso_botella': 1000,
+            'estado': '1'
+        }
+        response = self.client.patch(reverse('inventarios:update-peso-botella'), payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response_conteo = self.client.get(url_conteo)
+        response_no_contado = self.client.get(url_no_contado)
+        self.assertEqual(response_conteo.data, {'botellas_contadas': 1, 'botellas_no_contadas': 1})
+        self.assertEqual(len(response_no_contado.data), 1)
+        self.assertEqual(response_no_contado.data[0]['categoria'], 'TEQUILA')
+
+        # También con un update masivo, sin señales (p. ej. desde otro proceso)
+        models.ItemInspeccion.objects.filter(id=item_herradura.id).update(inspeccionado=True, timestamp_inspeccion=timezone.now())
+        response_conteo = self.client.get(url_conteo)
+        self.assertEqual(response_conteo.data, {'botellas_contadas': 2, 'botellas_no_contadas': 0})
+
+
     #--------------------------------------------------------------------------------
     def test_lista_botellas_no_contadas(self):
         """
@@ -2023,12 +2152,155 @@ class InspeccionesTests(TestCase):
         response = self.client.get(url)
 
         #print('::: RESPONSE DATA :::')
-        #print(response.data)        
+        #print(response.data)
 
         # Checamos que el request sea exitoso
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+    #-----------------------------------------------------------------------------
+    def test_escanear_folio(self):
+        """
+        Testear el endpoint 'escanear_folio': los escaneos se resuelven con el
+        mapa de folios de la inspección sin consultar la base de datos
+        """
+
+        # Creamos la inspección con el endpoint para que su mapa de folios quede construido
+        payload = {
+            'almacen': self.barra_1.id,
+            'sucursal': self.magno_brasserie.id,
+            'tipo_inspeccion': 'TOTAL',
+        }
+        res = self.client.post(reverse('inventarios:inspeccion-total-list'), payload)
+        inspeccion_id = res.data['id']
+
+        def escanear(folio):
+            url = reverse('inventarios:escanear-folio', kwargs={'inspeccion_id': inspeccion_id, 'folio_id': folio})
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(len(queries.captured_queries), 0)
+            return response.data
+
+        response = escanear(self.botella_licor43.folio)
+        self.assertEqual(response['resultado'], 'PENDIENTE')
+        self.assertEqual(response['item']['ingrediente'], 'LICOR 43')
+
+        # La botella vacía no forma parte de la inspección
+        response = escanear(self.botella_herradura_blanco_2.folio)
+        self.assertEqual(response['resultado'], 'NO_ES_PARTE')
+        self.assertIsNone(response['item'])
+
+        # Después de pesar la botella, el escaneo avisa que ya fue inspeccionada
+        payload = {
+            'item_inspeccion': models.ItemInspeccion.objects.get(inspeccion__id=inspeccion_id, botella=self.botella_licor43).id,
+            'peso_botella': 900,
+            'estado': '1'
+        }
+        self.client.patch(reverse('inventarios:update-peso-botella'), payload)
+
+        response = escanear(self.botella_licor43.folio)
+        self.assertEqual(response['resultado'], 'INSPECCIONADA')
+
+        # Lo mismo con el endpoint de pesadas en bloque (bulk_update, sin señales)
+        payload = {'pesadas': [{'item_inspeccion': models.ItemInspeccion.objects.get(inspeccion__id=inspeccion_id, botella=self.botella_herradura_blanco).id, 'peso_botella': 900, 'estado': '1'}]}
+        self.client.patch(reverse('inventarios:update-peso-botellas'), payload, format='json')
+
+        response = escanear(self.botella_herradura_blanco.folio)
+        self.assertEqual(response['resultado'], 'INSPECCIONADA')
+
+
+    #-----------------------------------------------------------------------------
+    def test_detalle_botella_inspeccion_otro_proceso(self):
+        """
+        Testear que 'detalle_botella_inspeccion' confirma con la base de datos lo
+        que dice el mapa de folios, que puede no tener los cambios de otro proceso
+        """
+
+        payload = {
+            'almacen': self.barra_1.id,
+            'sucursal': self.magno_brasserie.id,
+            'tipo_inspeccion': 'TOTAL',
+        }
+        res = self.client.post(reverse('inventarios:inspeccion-total-list'), payload)
+        inspeccion_id = res.data['id']
+
+        def detalle(folio):
+            return self.client.get(reverse('inventarios:get-detalle-botella-inspeccion', kwargs={'inspeccion_id': inspeccion_id, 'folio_id': folio})).data
+
+        def escanear(folio):
+            return self.client.get(reverse('inventarios:escanear-folio', kwargs={'inspeccion_id': inspeccion_id, 'folio_id': folio})).data
+
+        # Otro proceso registra la pesada: el mapa de este proceso no se entera
+        models.ItemInspeccion.objects.filter(inspeccion__id=inspeccion_id, botella=self.botella_licor43).update(peso_botella=900, inspeccionado=True)
+        self.assertEqual(escanear(self.botella_licor43.folio)['resultado'], 'PENDIENTE')
+
+        self.assertEqual(detalle(self.botella_licor43.folio), {'mensaje': 'Esta botella ya fue inspeccionada.'})
+        # De paso se corrige el mapa de este proceso
+        self.assertEqual(escanear(self.botella_licor43.folio)['resultado'], 'INSPECCIONADA')
+
+        # Otro proceso agrega un item a la inspección
+        models.ItemInspeccion.objects.bulk_create([models.ItemInspeccion(inspeccion_id=inspeccion_id, botella=self.botella_herradura_blanco_2)])
+        self.assertEqual(escanear(self.botella_herradura_blanco_2.folio)['resultado'], 'NO_ES_PARTE')
+
+        response = detalle(self.botella_herradura_blanco_2.folio)
+        self.assertEqual(response['botella']['folio'], self.botella_herradura_blanco_2.folio)
+
+
+    #-----------------------------------------------------------------------------
+    def test_permiso_sucursal(self):
+        """
+        Testear el permiso 'PermisoSucursal': las sucursales del usuario se toman
+        del cache y el cache se invalida al asignar una sucursal
+        """
+
+        atomic_thai = models.Sucursal.objects.create(nombre='ATOMIC-THAI', cliente=self.operadora_magno)
+        url = reverse('analytics:get-reporte-stock', kwargs={'sucursal_id': atomic_thai.id})
+
+        # El usuario no tiene asignada la sucursal
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        # Al asignarle la sucursal ya tiene acceso
+        self.usuario.sucursales.add(atomic_thai)
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # La segunda vez el permiso se resuelve sin consultar las sucursales del usuario
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries.captured_queries if 'sucursales' in q['sql']])
+
+        # Al quitarle la sucursal (desde la sucursal) pierde el acceso
+        atomic_thai.user_set.remove(self.usuario)
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+    #-----------------------------------------------------------------------------
+    def test_permiso_sucursal_ttl(self):
+        """
+        Testear que un permiso retirado sin invalidar el cache de este proceso (p. ej.
+        desde otro worker) deja de valer a más tardar en PERMISOS_CACHE_TTL segundos
+        """
+
+        atomic_thai = models.Sucursal.objects.create(nombre='ATOMIC-THAI', cliente=self.operadora_magno)
+        self.usuario.sucursales.add(atomic_thai)
+        url = reverse('analytics:get-reporte-stock', kwargs={'sucursal_id': atomic_thai.id})
+
+        with freeze_time('2020-01-01 12:00:00') as reloj:
+
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            # Borramos la asignación sin disparar m2m_changed
+            get_user_model().sucursales.through.objects.filter(user=self.usuario, sucursal=atomic_thai).delete()
+
+            reloj.tick(datetime.timedelta(seconds=settings.PERMISOS_CACHE_TTL + 1))
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
     #-----------------------------------------------------------------------------
     def test_lista_sucursales(self):
         """ Testear que se muestra la lista de sucursales asignadas al usuario del request """
@@ -2139,7 +2411,194 @@ class InspeccionesTests(TestCase):
         # Checamos que el nuevo peso de la botella sea correcto
         self.assertEqual(self.botella_licor43.peso_actual, payload['peso_botella'])
 
-    
+
+    #-----------------------------------------------------------------------------
+    def test_update_peso_botellas(self):
+        """
+        Test para el view 'update_peso_botellas'.
+        Testear que las pesadas de un lote se guardan en bloque y que se reporta
+        el resultado de cada una
+        """
+
+        inspeccion_1 = models.Inspeccion.objects.create(
+            almacen=self.barra_1,
+            sucursal=self.magno_brasserie,
+            usuario_alta=self.usuario
+        )
+        item_licor43 = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_licor43)
+        item_herradura = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_herradura_blanco)
+        self.botella_herradura_blanco.peso_cristal = 480
+        self.botella_herradura_blanco.save()
+
+        payload = {
+            'pesadas': [
+                {'item_inspeccion': item_licor43.id, 'peso_botella': 800, 'estado': '1'},
+                # Botella VACIA sin peso: toma el peso del cristal
+                {'item_inspeccion': item_herradura.id, 'estado': '0'},
+                # Pesadas con error
+                {'item_inspeccion': 999999, 'peso_botella': 800, 'estado': '1'},
+                {'item_inspeccion': item_licor43.id, 'peso_botella': -5, 'estado': '1'},
+                {'item_inspeccion': item_licor43.id, 'estado': '1'},
+            ]
+        }
+
+        url = reverse('inventarios:update-peso-botellas')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, payload, format='json')
+        updates_items = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "core_iteminspeccion"')]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(updates_items), 1)
+
+        resultados = response.data['resultados']
+        self.assertEqual([resultado['procesado'] for resultado in resultados], [True, True, False, False, False])
+        self.assertEqual(resultados[1]['peso_botella'], 480)
+        self.assertIn('item_inspeccion', resultados[2]['errores'])
+        self.assertIn('peso_botella', resultados[3]['errores'])
+
+        item_licor43.refresh_from_db()
+        item_herradura.refresh_from_db()
+        self.botella_licor43.refresh_from_db()
+        self.botella_herradura_blanco.refresh_from_db()
+
+        self.assertEqual(item_licor43.peso_botella, 800)
+        self.assertTrue(item_licor43.inspeccionado)
+        self.assertEqual(self.botella_licor43.peso_actual, 800)
+        self.assertEqual(item_herradura.peso_botella, 480)
+        self.assertEqual(self.botella_herradura_blanco.estado, '0')
+        self.assertIsNotNone(self.botella_herradura_blanco.fecha_baja)
+
+        # La línea de tiempo y el resumen de la inspección reflejan los nuevos pesos
+        self.assertEqual(models.LineaTiempoBotella.objects.get(botella=self.botella_licor43).peso_ultima_pesada, 800)
+        response = self.client.get(reverse('inventarios:resumen-botellas-conteo', args=[inspeccion_1.id]))
+        self.assertEqual(response.data, {'botellas_contadas': 2, 'botellas_no_contadas': 0})
+
+        # Un usuario de otra sucursal no puede registrar pesadas
+        otro_usuario = get_user_model().objects.create(email='otro@foodstack.mx', password='password123')
+        self.client.force_authenticate(otro_usuario)
+        payload = {'pesadas': [{'item_inspeccion': item_licor43.id, 'peso_botella': 700, 'estado': '1'}]}
+        response = self.client.patch(url, payload, format='json')
+        self.assertFalse(response.data['resultados'][0]['procesado'])
+        item_licor43.refresh_from_db()
+        self.assertEqual(item_licor43.peso_botella, 800)
+
+        # Si otro proceso le asigna la sucursal, se confirma con la base de datos antes de negar
+        get_user_model().sucursales.through.objects.create(user=otro_usuario, sucursal=self.magno_brasserie)
+        response = self.client.patch(url, payload, format='json')
+        self.assertTrue(response.data['resultados'][0]['procesado'])
+
+        # Con el cache caliente, las sucursales del usuario no se consultan en cada lote
+        payload = {'pesadas': [{'item_inspeccion': item_licor43.id, 'peso_botella': 650, 'estado': '1'}]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, payload, format='json')
+        self.assertTrue(response.data['resultados'][0]['procesado'])
+        self.assertFalse([q for q in queries.captured_queries if 'sucursales' in q['sql']])
+
+
+    #-----------------------------------------------------------------------------
+    def test_sincronizar_inspeccion(self):
+        """
+        Test para el view 'sincronizar_inspeccion'.
+        Testear el snapshot, la aplicación idempotente de los cambios y la
+        detección de conflictos
+        """
+
+        with freeze_time("2019-05-01"):
+            inspeccion_1 = models.Inspeccion.objects.create(
+                almacen=self.barra_1,
+                sucursal=self.magno_brasserie,
+                usuario_alta=self.usuario
+            )
+            item_licor43 = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_licor43)
+            item_herradura = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_herradura_blanco)
+
+        url = reverse('inventarios:sincronizar-inspeccion', args=[inspeccion_1.id])
+
+        # Descargamos el snapshot de la inspección
+        snapshot = self.client.get(url).data
+        self.assertEqual([item['folio'] for item in snapshot['items']], ['Ii0000000001', 'Nn0000000001'])
+        timestamps = {item['id']: item['timestamp_inspeccion'] for item in snapshot['items']}
+
+        # Otro usuario pesa la botella de Herradura mientras la app está sin conexión
+        with freeze_time("2019-05-02"):
+            item_herradura.peso_botella = 900
+            item_herradura.save()
+
+        cambios = [
+            {'item_inspeccion': item_licor43.id, 'peso_botella': 800, 'estado': '1', 'timestamp_inspeccion': timestamps[item_licor43.id]},
+            {'item_inspeccion': item_herradura.id, 'peso_botella': 700, 'estado': '1', 'timestamp_inspeccion': timestamps[item_herradura.id]},
+        ]
+        payload = {'version': snapshot['version'], 'cambios': cambios}
+
+        response = self.client.post(url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['snapshot_vigente'])
+        self.assertEqual(response.data['conflictos'], 1)
+        self.assertTrue(response.data['resultados'][0]['procesado'])
+        self.assertTrue(response.data['resultados'][1]['conflicto'])
+        self.assertEqual(response.data['resultados'][1]['servidor']['peso_botella'], 900)
+        self.assertNotEqual(response.data['version'], snapshot['version'])
+        self.assertEqual(response.data['estado'], models.Inspeccion.ABIERTA)
+
+        item_licor43.refresh_from_db()
+        item_herradura.refresh_from_db()
+        self.assertEqual(item_licor43.peso_botella, 800)
+        self.assertEqual(item_herradura.peso_botella, 900)
+
+        # Reenviar el mismo lote no vuelve a aplicar la pesada ni reporta conflicto
+        timestamp_licor43 = item_licor43.timestamp_inspeccion
+        response = self.client.post(url, payload, format='json')
+        self.assertTrue(response.data['resultados'][0]['procesado'])
+        item_licor43.refresh_from_db()
+        self.assertEqual(item_licor43.timestamp_inspeccion, timestamp_licor43)
+
+
+    #-----------------------------------------------------------------------------
+    def test_sincronizar_inspeccion_cerrada(self):
+        """
+        Test para el view 'sincronizar_inspeccion'.
+        Testear que los cambios que llegan después del cierre de la inspección
+        se reportan como conflicto y no se aplican
+        """
+
+        with freeze_time("2019-05-01"):
+            inspeccion_1 = models.Inspeccion.objects.create(
+                almacen=self.barra_1,
+                sucursal=self.magno_brasserie,
+                usuario_alta=self.usuario
+            )
+            item_licor43 = models.ItemInspeccion.objects.create(inspeccion=inspeccion_1, botella=self.botella_licor43)
+
+        url = reverse('inventarios:sincronizar-inspeccion', args=[inspeccion_1.id])
+        snapshot = self.client.get(url).data
+        self.assertEqual(snapshot['estado'], models.Inspeccion.ABIERTA)
+
+        # La inspección se cierra mientras la app está sin conexión
+        response = self.client.patch(reverse('inventarios:cerrar-inspeccion'), {'inspeccion': inspeccion_1.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.botella_licor43.refresh_from_db()
+        peso_actual = self.botella_licor43.peso_actual
+
+        cambios = [{'item_inspeccion': item_licor43.id, 'peso_botella': 800, 'estado': '1', 'timestamp_inspeccion': snapshot['items'][0]['timestamp_inspeccion']}]
+        response = self.client.post(url, {'version': snapshot['version'], 'cambios': cambios}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['estado'], models.Inspeccion.CERRADA)
+        self.assertEqual(response.data['conflictos'], 1)
+        self.assertFalse(response.data['resultados'][0]['procesado'])
+        self.assertTrue(response.data['resultados'][0]['conflicto'])
+        self.assertEqual(response.data['resultados'][0]['errores'], {'inspeccion': ['La inspección ya está cerrada.']})
+
+        # Ni el item ni la botella cambiaron
+        item_licor43.refresh_from_db()
+        self.botella_licor43.refresh_from_db()
+        self.assertFalse(item_licor43.inspeccionado)
+        self.assertIsNone(item_licor43.peso_botella)
+        self.assertEqual(self.botella_licor43.peso_actual, peso_actual)
+
+
     #-----------------------------------------------------------------------------
     def test_cerrar_inspeccion(self):
         """
@@ -2411,6 +2870,51 @@ class InspeccionesTests(TestCase):
         # Checamos que el tipo de Inspeccion sea 'TOTAL'
         self.assertEqual(inspeccion.tipo, '1')
 
+    #-----------------------------------------------------------------------------
+    def test_crear_inspeccion_total_bulk(self):
+        """ Testear que los ItemInspeccion se crean con un solo INSERT y actualizan la línea de tiempo """
+
+        with freeze_time("2019-04-30"):
+            inspeccion_previa = models.Inspeccion.objects.create(
+                almacen=self.barra_1,
+                sucursal=self.magno_brasserie,
+                usuario_alta=self.usuario_2,
+                estado='1'
+            )
+            # La botella ya tenía un peso registrado en la inspección previa
+            models.ItemInspeccion.objects.create(inspeccion=inspeccion_previa, botella=self.botella_licor43, peso_botella=1000)
+
+        payload = {
+            'almacen': self.barra_1.id,
+            'sucursal': self.magno_brasserie.id,
+            'tipo_inspeccion': 'TOTAL',
+        }
+
+        url = reverse('inventarios:inspeccion-total-list')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(url, payload)
+
+        inserts_items = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "core_iteminspeccion"')]
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(inserts_items), 1)
+
+        inspeccion = models.Inspeccion.objects.get(id=res.data['id'])
+        items = inspeccion.items_inspeccionados.all()
+        self.assertEqual(items.count(), 2)
+
+        # La línea de tiempo de cada botella refleja la nueva inspección (todavía sin peso)
+        for item in items:
+            linea = models.LineaTiempoBotella.objects.get(botella=item.botella)
+            self.assertIsNone(linea.peso_ultima_inspeccion)
+            self.assertEqual(linea.timestamp_ultima_inspeccion, item.timestamp_inspeccion)
+            self.assertEqual(linea.timestamp_ultima_sin_peso, item.timestamp_inspeccion)
+
+        linea_licor43 = models.LineaTiempoBotella.objects.get(botella=self.botella_licor43)
+        self.assertEqual(linea_licor43.num_inspecciones, 2)
+        self.assertEqual(linea_licor43.peso_penultima_inspeccion, 1000)
+        self.assertEqual(linea_licor43.peso_ultima_pesada, 1000)
+
     #-----------------------------------------------------------------------------
     def test_crear_inspeccion_ok(self):
         """ Testear que se crea una inspección de forma exitosa """
@@ -2464,6 +2968,55 @@ class InspeccionesTests(TestCase):
         self.assertEqual(inspeccion.items_inspeccionados.count(), 2)
 
 
+    #-----------------------------------------------------------------------------
+    def test_crear_inspeccion_diaria_botellas_consumidas(self):
+        """
+        Testear que las botellas de una inspección DIARIA se seleccionan con una sola query
+        y que la última inspección se consulta una sola vez
+        """
+
+        with freeze_time("2019-04-30"):
+            models.Inspeccion.objects.create(
+                almacen=self.barra_1,
+                sucursal=self.magno_brasserie,
+                usuario_alta=self.usuario_2,
+                estado='1'
+            )
+
+        # Botella de un ingrediente sin consumos: no se debe inspeccionar
+        producto_jw_black = models.Producto.objects.create(folio='Ii0000000009', ingrediente=self.jw_black, capacidad=750)
+        models.Botella.objects.create(
+            folio='Ii0000000009',
+            producto=producto_jw_black,
+            sucursal=self.magno_brasserie,
+            almacen=self.barra_1
+        )
+
+        payload = {
+            'almacen': self.barra_1.id,
+            'sucursal': self.magno_brasserie.id,
+            'tipo_inspeccion': 'DIARIA'
+        }
+
+        url = reverse('inventarios:inspeccion-total-list')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(url, payload)
+
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        selects_inspeccion = [sql for sql in selects if 'FROM "core_inspeccion"' in sql and 'ORDER BY' in sql]
+        selects_consumos = [sql for sql in selects if sql.split(' WHERE ')[0].endswith('FROM "core_consumorecetavendida"')]
+        selects_botellas = [sql for sql in selects if 'FROM "core_botella"' in sql and '"core_consumorecetavendida"' in sql]
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(selects_inspeccion), 1)
+        self.assertEqual(len(selects_consumos), 0)
+        self.assertEqual(len(selects_botellas), 1)
+
+        inspeccion = models.Inspeccion.objects.get(id=res.data['id'])
+        botellas_inspeccionadas = set(inspeccion.items_inspeccionados.values_list('botella__folio', flat=True))
+        self.assertEqual(botellas_inspeccionadas, {'Ii0000000001', 'Nn0000000001'})
+
+
     #--------------------------------------------------------------------------
     def test_crear_inspeccion_error_fecha(self):
         """
@@ -23,6 +23,7 @@ app_name = 'inventarios'
 urlpatterns = [
     path('', include(router.urls)),
     path('get-inspeccion/inspeccion/<int:inspeccion_id>', views.get_inspeccion, name='get-inspeccion'),
+    path('get-items-inspeccion/inspeccion/<int:inspeccion_id>', views.get_items_inspeccion, name='get-items-inspeccion'),
     path('get-lista-inspecciones/almacen/<int:almacen_id>/tipo/<str:tipo_id>', views.get_lista_inspecciones, name='get-lista-inspecciones'),
     path('get-resumen-inspeccion/inspeccion/<int:inspeccion_id>', views.resumen_inspeccion, name='resumen-inspeccion'),
     path('get-resumen-inspeccion-no-contado/inspeccion/<int:inspeccion_id>', views.resumen_inspeccion_no_contado, name='resumen-inspeccion-no-contado'),
@@ -32,9 +33,12 @@ urlpatterns = [
     path('get-botellas-contadas/inspeccion/<int:inspeccion_id>/ingrediente/<int:ingrediente_id>', views.lista_botellas_contadas, name='botellas-contadas'),
     path('get-inspecciones-botella/folio/<str:folio_id>', views.lista_inspecciones_botella, name='get-inspecciones-botella'),
     path('get-detalle-botella-inspeccion/inspeccion/<int:inspeccion_id>/folio/<str:folio_id>', views.detalle_botella_inspeccion, name='get-detalle-botella-inspeccion'),
+    path('escanear-folio/inspeccion/<int:inspeccion_id>/folio/<str:folio_id>', views.escanear_folio, name='escanear-folio'),
     path('get-lista-sucursales', views.lista_sucursales, name='get-lista-sucursales'),
     path('get-lista-sucursales-almacenes', views.lista_sucursales_almacenes, name='get-lista-sucursales-almacenes'),
     path('update-peso-botella/', views.update_peso_botella, name='update-peso-botella'),
+    path('update-peso-botellas/', views.update_peso_botellas, name='update-peso-botellas'),
+    path('sincronizar-inspeccion/inspeccion/<int:inspeccion_id>', views.sincronizar_inspeccion, name='sincronizar-inspeccion'),
     path('cerrar-inspeccion/', views.cerrar_inspeccion, name='cerrar-inspeccion'),
     path('update-botella-nueva-vacia/', views.update_botella_nueva_vacia, name='update-botella-nueva-vacia'),
     path('get-marbete-sat/folio/<str:folio_id>', views.get_marbete_sat, name='get-marbete-sat'),
@@ -2,12 +2,14 @@ from rest_framework import viewsets, mixins
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, action, permission_classes, authentication_classes
-from rest_framework.authentication import TokenAuthentication
+from users.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
+from rest_framework.pagination import CursorPagination
 
+from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists
+from django.db.models import F, Q, QuerySet, Avg, Count, Sum, Subquery, OuterRef, Exists, Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 import math
 import json
@@ -15,167 +17,132 @@ import re
 
 from inventarios import serializers
 from inventarios import scrapper, scrapper_2
+from inventarios import resumenes
+from inventarios import folios
+from inventarios import pesadas
+from inventarios import sincronizacion
+from inventarios.permissions import PermisoSucursal
+from inventarios import permissions
 from core import models
+from analytics import snapshots_restock
 
 
 
 
 """
 ------------------------------------------------------------------
-Crea una nueva Inspección y le adjunta sus ItemInspeccion
-correspondientes.
+Selección de las botellas a inspeccionar, compartida por
+InspeccionViewSet e InspeccionTotalViewSet.
+
+La última inspección del almacén se consulta una sola vez por
+request y las botellas de los ingredientes consumidos se
+seleccionan con una sola query.
 ------------------------------------------------------------------
 """
-class InspeccionViewSet(viewsets.ModelViewSet):
-
-    serializer_class = serializers.InspeccionPostSerializer
-    authentication_classes = (TokenAuthentication,)
-    permission_classes = (IsAuthenticated,)
-    #queryset = models.Inspeccion.objects.all()
-
-    def get_queryset(self):
-        sucursal_id = self.request.data['sucursal']
-        almacen_id = self.request.data['almacen']
-        usuario = self.request.user
-        sucursales_usuario = usuario.sucursales.all()
-        lista_sucursales = [sucursal.id for sucursal in sucursales_usuario]
-
-        if sucursal_id in lista_sucursales:
-            inspecciones = models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id)
-
-        return inspecciones
-
+class BotellasInspeccionarMixin:
 
+    #----------------------------------------------------------------------------------
     def checar_ultima_inspeccion(self):
         """
         Retorna los datos de la última inspección realizada en la sucursal y almacén
         del request
         """
 
-        sucursal_id = self.request.data['sucursal']
-        almacen_id = self.request.data['almacen']
+        # El viewset se instancia en cada request, así que guardamos el resultado en él
+        if not hasattr(self, '_ultima_inspeccion'):
 
-        # Si existe al menos una inspección registrada en la base de datos, tomamos su fecha y estado
-        if models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id).exists():
-            ultima_inspeccion = models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id).latest('fecha_alta')
-            fecha_ultima_inspeccion = ultima_inspeccion.fecha_alta
-            estado_ultima_inspeccion = ultima_inspeccion.estado
-
-            return {
-                        'sucursal_id': sucursal_id,
-                        'almacen_id': almacen_id,
-                        'fecha': fecha_ultima_inspeccion,
-                        'estado': estado_ultima_inspeccion
-                    }
-        
-        return None
+            sucursal_id = self.request.data['sucursal']
+            almacen_id = self.request.data['almacen']
+
+            ultima_inspeccion = (models.Inspeccion.objects
+                                    .filter(sucursal__id=sucursal_id, almacen__id=almacen_id)
+                                    .order_by('-fecha_alta')
+                                    .values('fecha_alta', 'estado')
+                                    .first()
+                                )
+
+            # Si existe al menos una inspección registrada en la base de datos, tomamos su fecha y estado
+            if ultima_inspeccion is None:
+                self._ultima_inspeccion = None
+            else:
+                self._ultima_inspeccion = {
+                    'sucursal_id': sucursal_id,
+                    'almacen_id': almacen_id,
+                    'fecha': ultima_inspeccion['fecha_alta'],
+                    'estado': ultima_inspeccion['estado']
+                }
+
+        return self._ultima_inspeccion
 
     #----------------------------------------------------------------------------------
     def get_ultimos_consumos(self):
         """
-        Retorna un queryset con los últimos consumos registrados en la sucursal y almacén del request
+        Retorna un queryset con los últimos consumos registrados en el almacén del request.
+        Si no hay inspecciones previas (la primera inspección ever), retorna todos los
+        consumos del almacén.
         """
+        almacen_id = self.request.data['almacen']
+        ultimos_consumos = models.ConsumoRecetaVendida.objects.filter(almacen__id=almacen_id)
 
         info_ultima_inspeccion = self.checar_ultima_inspeccion()
-
-        # Si existe una inspección previa
         if info_ultima_inspeccion is not None:
+            ultimos_consumos = ultimos_consumos.filter(fecha__gte=info_ultima_inspeccion['fecha'])
 
-            fecha_ultima_inspeccion = info_ultima_inspeccion['fecha']
-            sucursal_id = info_ultima_inspeccion['sucursal_id']
-            almacen_id = info_ultima_inspeccion['almacen_id']
-
-            # Checamos si hay consumos registrados después de la última inspección
-            try:
-                models.ConsumoRecetaVendida.objects.filter(
-                    venta__caja__almacen__id=almacen_id,
-                    fecha__gte=fecha_ultima_inspeccion
-                )
+        return ultimos_consumos
 
-            except ObjectDoesNotExist:
-                return None
+    #----------------------------------------------------------------------------------
+    def get_botellas_consumidas(self):
+        """
+        Retorna los ids de las botellas del almacén (excepto las VACIAS y PERDIDAS) cuyo
+        ingrediente tuvo consumos después de la última inspección
+        """
+        sucursal_id = self.request.data['sucursal']
+        almacen_id = self.request.data['almacen']
 
-            else:
-                ultimos_consumos = models.ConsumoRecetaVendida.objects.filter(
-                    venta__caja__almacen__id=almacen_id,
-                    fecha__gte=fecha_ultima_inspeccion
-                )
+        ingredientes_consumidos = self.get_ultimos_consumos().values('ingrediente')
 
-                return ultimos_consumos
+        botellas = models.Botella.objects.filter(
+            sucursal__id=sucursal_id,
+            almacen__id=almacen_id,
+            producto__ingrediente__in=ingredientes_consumidos
+        )
+        botellas = botellas.exclude(estado='0')
+        botellas = botellas.exclude(estado='3')
 
-        """
-        Si no hay inspecciones previas registradas, retornamos todos los consumos registrados
-        para el almacén del request. Significa que apenas se va a realizar la primera inspección ever.
-        """
-        try:
-            almacen_id = self.request.data['almacen']
-            models.ConsumoRecetaVendida.objects.filter(venta__caja__almacen__id=almacen_id)
+        return botellas.values_list('id', flat=True)
 
-        # Si no hay consumos registrados, entonces retornamos None
-        except ObjectDoesNotExist:
-            return None
 
-        else:
-            ultimos_consumos = models.ConsumoRecetaVendida.objects.filter(venta__caja__almacen__id=almacen_id)
+"""
+------------------------------------------------------------------
+Crea una nueva Inspección y le adjunta sus ItemInspeccion
+correspondientes.
+------------------------------------------------------------------
+"""
+class InspeccionViewSet(BotellasInspeccionarMixin, viewsets.ModelViewSet):
 
-            return ultimos_consumos 
+    serializer_class = serializers.InspeccionPostSerializer
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, PermisoSucursal)
+    #queryset = models.Inspeccion.objects.all()
 
-    #----------------------------------------------------------------------------------
-    def get_botellas_inspeccionar(self):
-        """
-        Esta función construye una lista con todas las botellas a inspeccionar
-        en la sucursal y almacén del request
-        """
+    def get_queryset(self):
         sucursal_id = self.request.data['sucursal']
         almacen_id = self.request.data['almacen']
+        usuario = self.request.user
 
-        # Tomamos los datos de la última inspección
-        #info_ultima_inspeccion = self.checar_ultima_inspeccion()
+        if permissions.tiene_sucursal(usuario, sucursal_id):
+            inspecciones = models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id)
 
-        """
-        Si existe al menos una inspección registrada:
+        return inspecciones
 
-        - Tomamos sus datos
-        - Tomamos los últimos consumos registrados después de la última inspección
-        - Tomamos los ingredientes de dichos consumos
-        - Generamos una lista de las botellas que contienen los ingredientes consumidos
 
+    #----------------------------------------------------------------------------------
+    def get_botellas_inspeccionar(self):
         """
-
-
-        # if info_ultima_inspeccion is not None:
-        #     fecha_ultima_inspeccion = info_ultima_inspeccion['fecha']
-        #     sucursal_id = info_ultima_inspeccion['sucursal_id']
-        #     almacen__id = info_ultima_inspeccion['almacen_id']
-
-        # Tomamos los consumos registrados después de la última inspección
-        ultimos_consumos = self.get_ultimos_consumos()
-
-        # Si hay consumos registrados después de la última inspección:
-        if ultimos_consumos is not None:
-            # Tomamos los ingredientes de dichos consumos y los guardamos en una lista
-            lista_ingredientes = [consumo.ingrediente for consumo in ultimos_consumos]
-            # Creamos un set con ingredientes únicos
-            ingredientes_unicos = set(lista_ingredientes)
-
-            # Tomamos las botellas del almacén que contengan los ingredientes consumidos
-            botellas = []
-            for ingrediente in ingredientes_unicos:
-                # Seleccionamos las botellas del ingrediente en cuestión
-                qs_botellas_ingrediente = models.Botella.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id, producto__ingrediente__id=ingrediente.id)
-                # Excluimos las botellas VACIAS
-                qs_botellas_ingrediente = qs_botellas_ingrediente.exclude(estado='0')
-                # Excluimos las botellas PERDIDAS
-                qs_botellas_ingrediente = qs_botellas_ingrediente.exclude(estado='3')
-                # Guardamos las botellas del ingrediente en una lista
-                botellas_ingrediente = [botella for botella in qs_botellas_ingrediente]
-                # Agregamos las botellas a la lista maestra de botellas
-                botellas += botellas_ingrediente
-
-            return botellas
-
-        # Si no hay consumos registrados, no retornamos ninguna botella (no hay nada que inspeccionar)
-        return None
+        Esta función retorna los ids de todas las botellas a inspeccionar
+        en la sucursal y almacén del request
+        """
+        return self.get_botellas_consumidas()
     #----------------------------------------------------------------------------------
     
     def get_serializer_context(self):
@@ -238,7 +205,7 @@ class InspeccionViewSet(viewsets.ModelViewSet):
 # """
 # class InspeccionDisplayViewSet(viewsets.ModelViewSet):
 
-#     authentication_classes = (TokenAuthentication,)
+#     authentication_classes = (CachedTokenAuthentication,)
 #     permission_classes = (IsAuthenticated,)
 #     #queryset = models.Inspeccion.objects.all()
 
@@ -280,7 +247,7 @@ Esta clase despliega la lista de inspecciones de un almacén
 
 class ListaInspeccionesView(viewsets.GenericViewSet, mixins.ListModelMixin):
 
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = serializers.InspeccionListSerializer
 
@@ -291,10 +258,8 @@ class ListaInspeccionesView(viewsets.GenericViewSet, mixins.ListModelMixin):
         almacen = models.Almacen.objects.get(id=almacen_id)
         sucursal_id = almacen.sucursal.id
         usuario = self.request.user
-        sucursales_usuario = usuario.sucursales.all()
-        lista_sucursales = [sucursal.id for sucursal in sucursales_usuario]
 
-        if sucursal_id in lista_sucursales:
+        if permissions.tiene_sucursal(usuario, sucursal_id):
             queryset = queryset.filter(almacen__id=almacen_id).order_by('-fecha_alta')
             return queryset
 
@@ -310,7 +275,7 @@ Esta endpoint despliega la lista de inspecciones DIARIAS o TOTALES de un almacé
 """
 @api_view(['GET'])
 @permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@authentication_classes((CachedTokenAuthentication,))
 def get_lista_inspecciones(request, almacen_id, tipo_id):
 
     if request.method == 'GET':
@@ -320,11 +285,9 @@ def get_lista_inspecciones(request, almacen_id, tipo_id):
         usuario = request.user
 
         almacen = models.Almacen.objects.get(id=almacen_id)
-        sucursal_id = almacen.sucursal.id
-        sucursales_usuario = usuario.sucursales.all()
-        lista_sucursales = [sucursal.id for sucursal in sucursales_usuario]
+        sucursal_id = almacen.sucursal_id
 
-        if sucursal_id in lista_sucursales:
+        if permissions.tiene_sucursal(usuario, sucursal_id):
             queryset = models.Inspeccion.objects.filter(almacen__id=almacen_id, tipo=tipo_id).order_by('-fecha_alta')
             serializer = serializers.InspeccionListSerializer(queryset, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -346,17 +309,14 @@ INPUTS:
 --------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_inspeccion(request, inspeccion_id):
 
     if request.method == 'GET':
         
         # Tomamos el usuario del request
         usuario = request.user
-        # Tomamos todas las sucursales asignadas al usuario
-        sucursales_usuario = usuario.sucursales.all()
-        lista_sucursales = [sucursal.id for sucursal in sucursales_usuario]
 
         # Checamos que la inspección exista
         inspeccion_id = int(inspeccion_id)
@@ -374,7 +334,17 @@ def get_inspeccion(request, inspeccion_id):
             Si la sucursal de la inspección está en la lista de 
             sucursales autorizadas para el usuario, retornar los datos de la inspección
             """
-            if sucursal_id in lista_sucursales:
+            if permissions.tiene_sucursal(usuario, sucursal_id):
+                # Cargamos los items con sus botellas y relaciones en una sola query
+                items = models.ItemInspeccion.objects.select_related(
+                    'botella__producto',
+                    'botella__usuario_alta',
+                    'botella__sucursal',
+                    'botella__almacen',
+                    'botella__proveedor'
+                ).order_by('id')
+                prefetch_related_objects([inspeccion], Prefetch('items_inspeccionados', queryset=items))
+
                 serializer = serializers.InspeccionDetalleSerializer(inspeccion)
                 return Response(serializer.data)
             
@@ -393,6 +363,51 @@ def get_inspeccion(request, inspeccion_id):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+"""
+--------------------------------------------------------------------------
+Despliega los ItemInspeccion de una inspección en páginas y en formato
+compacto (para inspecciones con muchas botellas)
+
+INPUTS:
+- ID de la Inspeccion deseada
+
+PARÁMETROS (opcionales):
+- cursor: cursor de la página a consultar ('next' y 'previous' del response)
+- page_size: número de items por página (máximo 500)
+- fields: campos a incluir separados por comas. Ej: fields=id,folio,peso_botella
+--------------------------------------------------------------------------
+"""
+class ItemsInspeccionPagination(CursorPagination):
+
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = 'id'
+
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def get_items_inspeccion(request, inspeccion_id):
+
+    inspeccion = get_object_or_404(models.Inspeccion, id=int(inspeccion_id))
+
+    campos = request.query_params.get('fields')
+    campos = [campo.strip() for campo in campos.split(',')] if campos else None
+
+    # Solo hacemos JOIN con las relaciones que necesitan los campos solicitados
+    relaciones = serializers.ItemInspeccionCompactoSerializer.get_relaciones(campos)
+    queryset = models.ItemInspeccion.objects.filter(inspeccion=inspeccion)
+    if relaciones:
+        queryset = queryset.select_related(*relaciones)
+
+    paginator = ItemsInspeccionPagination()
+    items = paginator.paginate_queryset(queryset, request)
+    serializer = serializers.ItemInspeccionCompactoSerializer(items, many=True, fields=campos)
+
+    return paginator.get_paginated_response(serializer.data)
+
+
 
 """
 --------------------------------------------------------------------------
@@ -402,7 +417,7 @@ Despliega el detalle de una inspección
 
 class DetalleInspeccionView(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
 
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = serializers.InspeccionDetalleSerializer
     queryset = models.Inspeccion.objects.all()
@@ -443,6 +458,24 @@ class DetalleInspeccionView(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
     #         return inspeccion
 
 
+"""
+--------------------------------------------------------------------------
+Construye el resumen de una inspección para los endpoints de resumen. Se listan
+todos los ingredientes de cada categoría (con cantidad None si no tienen
+botellas); con '?compacto=1' solo los que tienen botellas, con su
+'ingrediente_id'.
+--------------------------------------------------------------------------
+"""
+def get_arbol_resumen(request, inspeccion_id, inspeccionado=None, con_id=True):
+
+    filas = resumenes.get_resumen(inspeccion_id)
+
+    if request.query_params.get('compacto') == '1':
+        return resumenes.arbol(filas, inspeccionado)
+
+    return resumenes.arbol(filas, inspeccionado, ingredientes=resumenes.catalogo(filas), con_id=con_id)
+
+
 """
 --------------------------------------------------------------------------
 Despliega la vista de resumen de una inspeccion
@@ -459,97 +492,16 @@ TEQUILA (2)
 --------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def resumen_inspeccion(request, inspeccion_id):
 
     inspeccion_id = int(inspeccion_id)
 
     if request.method == 'GET':
-        # Tomamos la Inspeccion a visualizar
-        inspeccion_1 = models.Inspeccion.objects.get(id=inspeccion_id)
-
-        #---------------------------------------------------------------
-        # Definimos los querysets a utilizar
-        #---------------------------------------------------------------
-
-        # QUERYSET 1: Cantidad de items a inspeccionar por tipo de ingrediente
-        queryset_1 = models.Ingrediente.objects.annotate(
-            items_inspeccion=Subquery(models.ItemInspeccion.objects
-                .filter(inspeccion=inspeccion_1, botella__producto__ingrediente=OuterRef('pk'))
-                .values('botella__producto__ingrediente')
-                .annotate(count=Count('botella__producto__ingrediente'))
-                .values('count')
-            )
-        )
-
-        # QUERYSET 2: Categorías que contienen items a inspeccionar
-        queryset_2 = models.Categoria.objects.annotate(
-            items_inspeccion=Exists(models.ItemInspeccion.objects
-                .filter(inspeccion=inspeccion_1, botella__producto__ingrediente__categoria=OuterRef('pk'))
-                .values('botella__producto__ingrediente__categoria')
-                .annotate(count=Count('botella__producto__ingrediente__categoria'))
-                .values('count')
-            )
-        ).filter(items_inspeccion=True)
-
-        # QUERYSET 2A: Numero de items a inspeccionar por categoría
-        queryset_2a = queryset_2.annotate(
-            items_inspeccion=Subquery(models.ItemInspeccion.objects
-                .filter(inspeccion=inspeccion_1, botella__producto__ingrediente__categoria=OuterRef('pk'))
-                .values('botella__producto__ingrediente__categoria')
-                .annotate(count=Count('botella__producto__ingrediente__categoria'))
-                .values('count')
-            )
-        )
 
-        #---------------------------------------------------------------
-        # Construimos el JSON del response
-        #---------------------------------------------------------------
-
-        # Tomamos las categorías que contienen items a inspeccionar
-        categorias = queryset_2a
-        # Tomamos los ingredientes que contienen items a inspeccionar
-        ingredientes = queryset_1 
-
-        # Una lista donde guardaremos el output a renderearse por el Response
-        resumen_inspeccion = []
-
-        # Iteramos por el queryset de las categorias
-        for categoria in categorias:
-            # Creamos un objecto en donde guardaremos la categoría y sus items a inspeccionar
-            obj = {}
-            lista_ingredientes = []
-            # Tomamos el nombre de la categoria
-            nombre_categoria = categoria.nombre
-            # Tomamos el total de items a inspeccionar de la categoria
-            total_items_inspeccion = categoria.items_inspeccion
-            # Guardamos las variables en un diccionario
-            obj['categoria'] = nombre_categoria
-            obj['total_botellas'] = total_items_inspeccion
-
-            # Iteramos por el queryset de los ingredientes
-            for ingrediente in ingredientes:
-                obj_ingrediente = {}
-                # Si la categoría del ingrediente es igual a la categoría del loop:
-                if ingrediente.categoria.id == categoria.id:
-                    # Tomamos el nombre del ingrediente y sus items inspeccion
-                    nombre_ingrediente = ingrediente.nombre
-                    cantidad = ingrediente.items_inspeccion
-                    # Los guardamos en un diccionario
-                    obj_ingrediente['ingrediente'] = nombre_ingrediente
-                    obj_ingrediente['cantidad'] = cantidad
-                    # Guardamos el diccionario en una lista de ingredientes
-                    lista_ingredientes.append(obj_ingrediente)
-            
-            # Guardamos la lista de ingredientes en la categoría actual
-            obj['botellas'] = lista_ingredientes
-            # Guardamos el objecto en la lista del output del Response
-            resumen_inspeccion.append(obj)
-        
-        #---------------------------------------------------------------
-        # Construimos el Response
-        #---------------------------------------------------------------
+        # Construimos el JSON del response con todos los items de la inspección
+        resumen_inspeccion = get_arbol_resumen(request, inspeccion_id, con_id=False)
 
         return Response(resumen_inspeccion)
 
@@ -568,8 +520,8 @@ EJEMPLO:
 --------------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def resumen_botellas_conteo(request, inspeccion_id):
 
     if request.method == 'GET':
@@ -577,19 +529,9 @@ def resumen_botellas_conteo(request, inspeccion_id):
         # Tomamos el id de la Inspección del URL
         inspeccion_id = int(inspeccion_id) 
 
-        #items_inspeccionar = models.ItemInspeccion.objects.filter(inspeccion__id=inspeccion_id).count()
-
-        # QUERYSET 1: Botellas no contadas
-        no_contados = models.ItemInspeccion.objects.filter(inspeccion__id=inspeccion_id, inspeccionado=False).count()
-        # QUERYSET 2: Botellas contadas
-        contados = models.ItemInspeccion.objects.filter(inspeccion__id=inspeccion_id, inspeccionado=True).count()
-
-        # Creamos un objeto para guardar la cantidad de botellas contadas y no contadas
-        resumen_botellas = {}
-
-        # Guardamos la cantidad de botellas contadas y no contadas en el objecto
-        resumen_botellas['botellas_contadas'] = contados
-        resumen_botellas['botellas_no_contadas'] = no_contados
+        # Tomamos la cantidad de botellas contadas y no contadas del resumen de la inspección
+        filas = resumenes.get_resumen(inspeccion_id)
+        resumen_botellas = resumenes.conteo(filas)
 
         # Creamos un response con la info
         return Response(resumen_botellas)
@@ -614,116 +556,19 @@ TEQUILA (2)
 --------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def resumen_inspeccion_no_contado(request, inspeccion_id):
 
     inspeccion_id = int(inspeccion_id)
 
     if request.method == 'GET':
-        # Tomamos la Inspeccion a visualizar
-        inspeccion_1 = models.Inspeccion.objects.get(id=inspeccion_id)
-
-        #---------------------------------------------------------------
-        # Definimos los querysets a utilizar
-        #---------------------------------------------------------------
-
-        # QUERYSET: ItemsInspeccion que pertenecen a nuestra Inspeccion
-        items = models.ItemInspeccion.objects.filter(inspeccion=inspeccion_1)
-
-        # QUERYSET: ItemsInspeccion NO CONTADOS/NO INSPECCIONADOS (excluimos los CONTADOS)
-        items = items.exclude(inspeccionado=True)
-
-        # QUERYSET 1: Cantidad de items a inspeccionar por tipo de ingrediente
-        queryset_1 = models.Ingrediente.objects.annotate(
-            items_inspeccion=Subquery(items
-                .filter(botella__producto__ingrediente=OuterRef('pk'))
-                .values('botella__producto__ingrediente')
-                .annotate(count=Count('botella__producto__ingrediente'))
-                .values('count')
-            )
-        )
-        #print('::: QUERYSET 1 - ORIGINAL :::')
-        #print(queryset_1)
-
-        #QUERYSET 1 AJUSTADO: Excluimos ingredientes donde 'items_inspeccion' = 0
-        queryset_1 = queryset_1.exclude(items_inspeccion=0)
-        #print('::: QUERYSET 1 - FIX :::')
-        #print(queryset_1)
-
-        # QUERYSET 2: Categorías que contienen items a inspeccionar
-        queryset_2 = models.Categoria.objects.annotate(
-            has_items_inspeccion=Exists(items
-                .filter(botella__producto__ingrediente__categoria=OuterRef('pk'))
-                .values('botella__producto__ingrediente__categoria')
-                .annotate(count=Count('botella__producto__ingrediente__categoria'))
-                .values('count')
-            )
-        ).filter(has_items_inspeccion=True)
-
-        # QUERYSET 2A: Numero de items a inspeccionar por categoría
-        queryset_2a = queryset_2.annotate(
-            items_inspeccion=Subquery(items
-                .filter(botella__producto__ingrediente__categoria=OuterRef('pk'))
-                .values('botella__producto__ingrediente__categoria')
-                .annotate(count=Count('botella__producto__ingrediente__categoria'))
-                .values('count')
-            )
-        )
 
-        #---------------------------------------------------------------
-        # Construimos el JSON del response
-        #---------------------------------------------------------------
+        # Tomamos solo los items NO CONTADOS/NO INSPECCIONADOS del resumen de la inspección
+        resumen_inspeccion = get_arbol_resumen(request, inspeccion_id, inspeccionado=False)
 
         # Checamos que haya categorías con botellas pendientes de inspeccion
-        if queryset_2.exists():
-
-            # Tomamos las categorías que contienen items a inspeccionar
-            categorias = queryset_2a
-            # Tomamos los ingredientes que contienen items a inspeccionar
-            ingredientes = queryset_1 
-
-            # Una lista donde guardaremos el output que enviaremos en el Response
-            resumen_inspeccion = []
-
-            # Iteramos por el queryset de las categorias
-            for categoria in categorias:
-                # Creamos un objecto en donde guardaremos la categoría y sus items a inspeccionar
-                obj = {}
-                lista_ingredientes = []
-                # Tomamos el nombre de la categoria
-                nombre_categoria = categoria.nombre
-                # Tomamos el total de items a inspeccionar de la categoria
-                total_items_inspeccion = categoria.items_inspeccion
-                # Guardamos las variables en un diccionario
-                obj['categoria'] = nombre_categoria
-                obj['total_botellas'] = total_items_inspeccion
-
-                # Iteramos por el queryset de los ingredientes
-                for ingrediente in ingredientes:
-                    obj_ingrediente = {}
-                    # Si la categoría del ingrediente es igual a la categoría del loop:
-                    if ingrediente.categoria.id == categoria.id:
-                        # Tomamos el nombre del ingrediente y sus items inspeccion
-                        ingrediente_id = ingrediente.id
-                        nombre_ingrediente = ingrediente.nombre
-                        cantidad = ingrediente.items_inspeccion
-                        # Los guardamos en un diccionario
-                        obj_ingrediente['ingrediente_id'] = ingrediente_id
-                        obj_ingrediente['ingrediente'] = nombre_ingrediente
-                        obj_ingrediente['cantidad'] = cantidad
-                        # Guardamos el diccionario en una lista de ingredientes
-                        lista_ingredientes.append(obj_ingrediente)
-                
-                # Guardamos la lista de ingredientes en la categoría actual
-                obj['botellas'] = lista_ingredientes
-                # Guardamos el objecto en la lista del output del Response
-                resumen_inspeccion.append(obj)
-            
-            #---------------------------------------------------------------
-            # Construimos el Response
-            #---------------------------------------------------------------
-
+        if resumen_inspeccion:
             return Response(resumen_inspeccion)
         
         # Si no hay botellas pendientes de inspección, enviamos un reponse con el mensaje
@@ -750,116 +595,19 @@ TEQUILA (2)
 --------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def resumen_inspeccion_contado(request, inspeccion_id):
 
     inspeccion_id = int(inspeccion_id)
 
     if request.method == 'GET':
-        # Tomamos la Inspeccion a visualizar
-        inspeccion_1 = models.Inspeccion.objects.get(id=inspeccion_id)
-
-        #---------------------------------------------------------------
-        # Definimos los querysets a utilizar
-        #---------------------------------------------------------------
-
-        # QUERYSET: ItemsInspeccion que pertenecen a nuestra Inspeccion
-        items = models.ItemInspeccion.objects.filter(inspeccion=inspeccion_1)
-
-        # QUERYSET: ItemsInspeccion CONTADOS/INSPECCIONADOS (excluimos los NO CONTADOS)
-        items = items.exclude(inspeccionado=False)
-
-        # QUERYSET 1: Cantidad de items a inspeccionar por tipo de ingrediente
-        queryset_1 = models.Ingrediente.objects.annotate(
-            items_inspeccion=Subquery(items
-                .filter(botella__producto__ingrediente=OuterRef('pk'))
-                .values('botella__producto__ingrediente')
-                .annotate(count=Count('botella__producto__ingrediente'))
-                .values('count')
-            )
-        )
-        #print('::: QUERYSET 1 - ORIGINAL :::')
-        #print(queryset_1)
-
-        #QUERYSET 1 AJUSTADO: Excluimos ingredientes donde 'items_inspeccion' = 0
-        queryset_1 = queryset_1.exclude(items_inspeccion=0)
-        #print('::: QUERYSET 1 - FIX :::')
-        #print(queryset_1)
-
-        # QUERYSET 2: Categorías que contienen items a inspeccionar
-        queryset_2 = models.Categoria.objects.annotate(
-            has_items_inspeccion=Exists(items
-                .filter(botella__producto__ingrediente__categoria=OuterRef('pk'))
-                .values('botella__producto__ingrediente__categoria')
-                .annotate(count=Count('botella__producto__ingrediente__categoria'))
-                .values('count')
-            )
-        ).filter(has_items_inspeccion=True)
-
-        # QUERYSET 2A: Numero de items a inspeccionar por categoría
-        queryset_2a = queryset_2.annotate(
-            items_inspeccion=Subquery(items
-                .filter(botella__producto__ingrediente__categoria=OuterRef('pk'))
-                .values('botella__producto__ingrediente__categoria')
-                .annotate(count=Count('botella__producto__ingrediente__categoria'))
-                .values('count')
-            )
-        )
 
-        #---------------------------------------------------------------
-        # Construimos el JSON del response
-        #---------------------------------------------------------------
+        # Tomamos solo los items CONTADOS/INSPECCIONADOS del resumen de la inspección
+        resumen_inspeccion = get_arbol_resumen(request, inspeccion_id, inspeccionado=True)
 
         # Checamos si existen categorías con ItemsInspeccion YA CONTADOS
-        if queryset_2.exists():
-
-            # Tomamos las categorías que contienen items a inspeccionar
-            categorias = queryset_2a
-            # Tomamos los ingredientes que contienen items a inspeccionar
-            ingredientes = queryset_1 
-
-            # Una lista donde guardaremos el output a renderearse por el Response
-            resumen_inspeccion = []
-
-            # Iteramos por el queryset de las categorias
-            for categoria in categorias:
-                # Creamos un objecto en donde guardaremos la categoría y sus items a inspeccionar
-                obj = {}
-                lista_ingredientes = []
-                # Tomamos el nombre de la categoria
-                nombre_categoria = categoria.nombre
-                # Tomamos el total de items a inspeccionar de la categoria
-                total_items_inspeccion = categoria.items_inspeccion
-                # Guardamos las variables en un diccionario
-                obj['categoria'] = nombre_categoria
-                obj['total_botellas'] = total_items_inspeccion
-
-                # Iteramos por el queryset de los ingredientes
-                for ingrediente in ingredientes:
-                    obj_ingrediente = {}
-                    # Si la categoría del ingrediente es igual a la categoría del loop:
-                    if ingrediente.categoria.id == categoria.id:
-                        # Tomamos el nombre del ingrediente y sus items inspeccion
-                        ingrediente_id = ingrediente.id
-                        nombre_ingrediente = ingrediente.nombre
-                        cantidad = ingrediente.items_inspeccion
-                        # Los guardamos en un diccionario
-                        obj_ingrediente['ingrediente'] = nombre_ingrediente
-                        obj_ingrediente['ingrediente'] = nombre_ingrediente
-                        obj_ingrediente['cantidad'] = cantidad
-                        # Guardamos el diccionario en una lista de ingredientes
-                        lista_ingredientes.append(obj_ingrediente)
-                
-                # Guardamos la lista de ingredientes en la categoría actual
-                obj['botellas'] = lista_ingredientes
-                # Guardamos el objecto en la lista del output del Response
-                resumen_inspeccion.append(obj)
-            
-            #---------------------------------------------------------------
-            # Construimos el Response
-            #---------------------------------------------------------------
-
+        if resumen_inspeccion:
             return Response(resumen_inspeccion)
 
         # Si no hay categorías con ItemsInspeccion YA CONTADOS
@@ -892,7 +640,7 @@ INPUTS:
 """
 # class ListaBotellasNoContadasView(viewsets.GenericViewSet, mixins.ListModelMixin):
 
-#     authentication_classes = (TokenAuthentication,)
+#     authentication_classes = (CachedTokenAuthentication,)
 #     permission_classes = (IsAuthenticated,)
 #     serializer_class = serializers.ItemInspeccionDetalleSerializer
 
@@ -905,8 +653,8 @@ INPUTS:
 
 
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def lista_botellas_no_contadas(request, inspeccion_id, ingrediente_id):
 
     if request.method == 'GET':
@@ -930,8 +678,8 @@ ya inspeccionadas
 -----------------------------------------------------------------------------
 """
 @api_view(['GET'])
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def lista_botellas_contadas(request, inspeccion_id, ingrediente_id):
 
     if request.method == 'GET':
@@ -957,7 +705,7 @@ de inspecciones
 """
 # class InspeccionesBotellaViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
 
-#     authentication_classes = (TokenAuthentication,)
+#     authentication_classes = (CachedTokenAuthentication,)
 #     permission_classes = (IsAuthenticated,)
 #     serializer_class = serializers.BotellaItemInspeccionSerializer
 #     lookup_field = 'folio'
@@ -984,8 +732,8 @@ de inspecciones
 -----------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def lista_inspecciones_botella(request, folio_id):
 
     if request.method == 'GET':
@@ -1009,34 +757,42 @@ Inspección en curso, se notifica que la botella no es parte de la Inpección.
 -----------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def detalle_botella_inspeccion(request, inspeccion_id, folio_id):
 
     if request.method == 'GET':
 
         inspeccion_id = int(inspeccion_id)
 
-        # Si se trata de un folio custom, le adjuntamos el numero de la sucursal
-        if re.match('^[0-9]*$', folio_id):
-
-            inspeccion = models.Inspeccion.objects.get(id=inspeccion_id)
-            sucursal_id = str(inspeccion.sucursal.id)
-            folio_id = sucursal_id + folio_id
-
-        # Checamos que la botella escaneada pertenezca a la Inspección en curso
-        if models.ItemInspeccion.objects.filter(inspeccion__id=inspeccion_id, botella__folio=folio_id).exists():
-            item_inspeccion = models.ItemInspeccion.objects.get(inspeccion__id=inspeccion_id, botella__folio=folio_id)
-             
-            # Si la botella escaneada no ha sido inspeccionada, mostramos su ficha técnica
-            if item_inspeccion.inspeccionado == False:
-                serializer = serializers.ItemInspeccionDetalleSerializer(item_inspeccion)
-                return Response(serializer.data)
-            
-            # Si la botella ya fue inspecionada, notificamos al usuario
-            else:
+        # Resolvemos el folio con el mapa de folios de la inspección (incluye los folios custom)
+        resultado, item = folios.resolver(inspeccion_id, folio_id)
+
+        # El mapa es local del proceso: si el folio no aparece, lo reconstruimos por si
+        # otro proceso agregó el item
+        if resultado == folios.NO_ES_PARTE:
+            folios.invalidar(inspeccion_id)
+            resultado, item = folios.resolver(inspeccion_id, folio_id)
+
+        # Si la botella escaneada no ha sido inspeccionada, mostramos su ficha técnica
+        if resultado == folios.PENDIENTE:
+            item_inspeccion = (models.ItemInspeccion.objects
+                                .select_related('botella__producto', 'botella__usuario_alta', 'botella__sucursal', 'botella__almacen', 'botella__proveedor')
+                                .get(id=item['item_inspeccion'])
+                            )
+
+            # Otro proceso pudo registrar la pesada sin que se enterara el mapa de este
+            if item_inspeccion.inspeccionado:
+                folios.marcar_inspeccionados(inspeccion_id, [item_inspeccion.id])
                 return Response({'mensaje': 'Esta botella ya fue inspeccionada.'})
 
+            serializer = serializers.ItemInspeccionDetalleSerializer(item_inspeccion)
+            return Response(serializer.data)
+
+        # Si la botella ya fue inspecionada, notificamos al usuario
+        elif resultado == folios.INSPECCIONADA:
+            return Response({'mensaje': 'Esta botella ya fue inspeccionada.'})
+
         # Si la botella no pertenece a la Inspección en curso, notificamos al usuario
         else:
             return Response({'mensaje': 'Esta botella no es parte de la inspección.'})
@@ -1045,6 +801,29 @@ def detalle_botella_inspeccion(request, inspeccion_id, folio_id):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+"""
+-----------------------------------------------------------------------------
+Endpoint para escanear una botella durante una Inspeccion. Responde solo con
+el mapa de folios de la inspección (sin consultar la base de datos mientras
+el mapa esté en memoria).
+
+EJEMPLO DE RESPONSE:
+
+{
+    'resultado': 'PENDIENTE',   # 'PENDIENTE', 'INSPECCIONADA' o 'NO_ES_PARTE'
+    'item': {'item_inspeccion': 10, 'botella': 5, 'folio': 'Ii0000000001', 'ingrediente': 'LICOR 43', 'inspeccionado': False}
+}
+-----------------------------------------------------------------------------
+"""
+@api_view(['GET'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def escanear_folio(request, inspeccion_id, folio_id):
+
+    resultado, item = folios.resolver(int(inspeccion_id), folio_id)
+
+    return Response({'resultado': resultado, 'item': item}, status=status.HTTP_200_OK)
+
 
 """
 -----------------------------------------------------------------------------
@@ -1053,8 +832,8 @@ puede accesar a aquellas sucursales que tiene asignadas.
 -----------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def lista_sucursales(request):
 
     if request.method == 'GET':
@@ -1077,8 +856,8 @@ El usuario solamente puede accesar a aquellas sucursales que tiene asignadas.
 -----------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def lista_sucursales_almacenes(request):
 
     if request.method == 'GET':
@@ -1101,8 +880,8 @@ Endpoint que actualiza el peso de una botella cuando se inspecciona
 ----------------------------------------------------------------------------- 
 """
 @api_view(['PATCH'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def update_peso_botella(request):
 
     if request.method == 'PATCH':
@@ -1139,14 +918,81 @@ def update_peso_botella(request):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+"""
+-----------------------------------------------------------------------------
+Endpoint que registra en bloque los pesos de varias botellas inspeccionadas
+(por ejemplo, las pesadas que la app guardó sin conexión)
+
+INPUT:
+{
+    'pesadas': [
+        {'item_inspeccion': 10, 'peso_botella': 1200, 'estado': '1'},
+        {'item_inspeccion': 11, 'estado': '0'},
+    ]
+}
+
+El response incluye el resultado de cada pesada ('procesado' y 'errores')
+-----------------------------------------------------------------------------
+"""
+@api_view(['PATCH'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def update_peso_botellas(request):
+
+    lista_pesadas = request.data.get('pesadas')
+
+    if not isinstance(lista_pesadas, list):
+        return Response({'mensaje': 'Se requiere una lista de pesadas.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    resultados = pesadas.registrar(lista_pesadas, request.user)
+
+    return Response({'resultados': resultados}, status=status.HTTP_200_OK)
+
+
+"""
+-----------------------------------------------------------------------------
+Endpoints de sincronización offline de una inspección (ver
+inventarios/sincronizacion.py)
+
+GET: snapshot de la inspección con sus items y su token de versión
+
+POST: aplica los cambios registrados sin conexión
+{
+    'version': '<version del snapshot>',
+    'cambios': [
+        {'item_inspeccion': 10, 'peso_botella': 1200, 'estado': '1', 'timestamp_inspeccion': '<timestamp del snapshot>'},
+    ]
+}
+-----------------------------------------------------------------------------
+"""
+@api_view(['GET', 'POST'],)
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
+def sincronizar_inspeccion(request, inspeccion_id):
+
+    inspeccion = get_object_or_404(models.Inspeccion, id=int(inspeccion_id))
+
+    if request.method == 'GET':
+        return Response(sincronizacion.get_snapshot(inspeccion), status=status.HTTP_200_OK)
+
+    cambios = request.data.get('cambios')
+
+    if not isinstance(cambios, list):
+        return Response({'mensaje': 'Se requiere una lista de cambios.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    resultado = sincronizacion.sincronizar(inspeccion, request.data.get('version'), cambios, request.user)
+
+    return Response(resultado, status=status.HTTP_200_OK)
+
+
 """
 -----------------------------------------------------------------------------
 Endpoint que modifica el estado de una Inspeccion a 'CERRADA'
 -----------------------------------------------------------------------------
 """
 @api_view(['PATCH'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def cerrar_inspeccion(request):
 
     if request.method == 'PATCH':
@@ -1169,6 +1015,9 @@ def cerrar_inspeccion(request):
         if serializer.is_valid():
             # Actualizamos los datos de nuestro ItemInspeccion
             serializer.save()
+            # Con la inspección cerrada recalculamos los snapshots de restock de la sucursal
+            sucursal_id = inspeccion.sucursal_id
+            transaction.on_commit(lambda: snapshots_restock.actualizar_sucursal(sucursal_id))
             # Creamos el response
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -1189,8 +1038,8 @@ modifica su peso ad hoc
 -----------------------------------------------------------------------------------
 """
 @api_view(['PATCH'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def update_botella_nueva_vacia_2(request):
 
     if request.method == 'PATCH':
@@ -1255,8 +1104,8 @@ NOTAS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_marbete_sat(request, folio_id):
 
     """
@@ -1395,8 +1244,8 @@ Endpoint que muestra la lista de Categorías de destilados disponibles
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_categorias(request):
 
     if request.method == 'GET':
@@ -1417,8 +1266,8 @@ Endpoint que muestra la lista de Ingredientes de una Categoría específica
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_ingredientes_categoria(request, categoria_id):
 
     if request.method == 'GET':
@@ -1445,8 +1294,8 @@ Endpoint para crear una Botella nueva, especificando su Producto asociado en el
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_botella(request):
 
     if request.method == 'POST':
@@ -1556,8 +1405,8 @@ NOTAS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_marbete_sat_producto(request, folio_id):
 
     if request.method == 'GET':
@@ -1588,8 +1437,8 @@ NOTAS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_marbete_sat_producto_v2(request, folio_id):
 
     if request.method == 'GET':
@@ -1631,7 +1480,7 @@ Endpoint para crear y actualizar Productos
 class ProductoViewSet(viewsets.ModelViewSet):
 
     serializer_class = serializers.ProductoWriteSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = models.Producto.objects.all()
 
@@ -1645,8 +1494,8 @@ o importadas
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_producto(request):
 
     if request.method == 'POST':
@@ -1744,8 +1593,8 @@ o importadas
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_producto_v2(request):
 
     if request.method == 'POST':
@@ -1846,21 +1695,19 @@ Un payload con las variables:
 
 ------------------------------------------------------------------------------------------------------
 """
-class InspeccionTotalViewSet(viewsets.ModelViewSet):
+class InspeccionTotalViewSet(BotellasInspeccionarMixin, viewsets.ModelViewSet):
 
     serializer_class = serializers.InspeccionPostSerializer
-    authentication_classes = (TokenAuthentication,)
-    permission_classes = (IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, PermisoSucursal)
     #queryset = models.Inspeccion.objects.all()
 
     def get_queryset(self):
         sucursal_id = self.request.data['sucursal']
         almacen_id = self.request.data['almacen']
         usuario = self.request.user
-        sucursales_usuario = usuario.sucursales.all()
-        lista_sucursales = [sucursal.id for sucursal in sucursales_usuario]
 
-        if sucursal_id in lista_sucursales:
+        if permissions.tiene_sucursal(usuario, sucursal_id):
             inspecciones = models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id)
             return inspecciones
 
@@ -1869,89 +1716,12 @@ class InspeccionTotalViewSet(viewsets.ModelViewSet):
             return queryset
 
 
-    #----------------------------------------------------------------------------------
-    def checar_ultima_inspeccion(self):
-        """
-        Esta función retorna los datos de la última inspección realizada en la sucursal y almacén
-        del request
-        """
-
-        sucursal_id = self.request.data['sucursal']
-        almacen_id = self.request.data['almacen']
-
-        # Si existe al menos una inspección registrada en la base de datos, tomamos su fecha y estado
-        if models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id).exists():
-            ultima_inspeccion = models.Inspeccion.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id).latest('fecha_alta')
-            fecha_ultima_inspeccion = ultima_inspeccion.fecha_alta
-            estado_ultima_inspeccion = ultima_inspeccion.estado
-
-            return {
-                        'sucursal_id': sucursal_id,
-                        'almacen_id': almacen_id,
-                        'fecha': fecha_ultima_inspeccion,
-                        'estado': estado_ultima_inspeccion
-                    }
-        
-        return None
-
-    
-    #----------------------------------------------------------------------------------
-    def get_ultimos_consumos(self):
-        """
-        Retorna un queryset con los últimos consumos registrados en la sucursal y almacén del request
-        """
-
-        info_ultima_inspeccion = self.checar_ultima_inspeccion()
-
-        # Si existe una inspección previa
-        if info_ultima_inspeccion is not None:
-
-            fecha_ultima_inspeccion = info_ultima_inspeccion['fecha']
-            sucursal_id = info_ultima_inspeccion['sucursal_id']
-            almacen_id = info_ultima_inspeccion['almacen_id']
-
-            # Checamos si hay consumos registrados después de la última inspección
-            try:
-                models.ConsumoRecetaVendida.objects.filter(
-                    venta__caja__almacen__id=almacen_id,
-                    fecha__gte=fecha_ultima_inspeccion
-                )
-
-            except ObjectDoesNotExist:
-                return None
-
-            else:
-                ultimos_consumos = models.ConsumoRecetaVendida.objects.filter(
-                    venta__caja__almacen__id=almacen_id,
-                    fecha__gte=fecha_ultima_inspeccion
-                )
-
-                return ultimos_consumos
-
-        """
-        Si no hay inspecciones previas registradas, retornamos todos los consumos registrados
-        para el almacén del request. Significa que apenas se va a realizar la primera inspección ever.
-        """
-        try:
-            almacen_id = self.request.data['almacen']
-            models.ConsumoRecetaVendida.objects.filter(venta__caja__almacen__id=almacen_id)
-
-        # Si no hay consumos registrados, entonces retornamos None
-        except ObjectDoesNotExist:
-            return None
-
-        else:
-            ultimos_consumos = models.ConsumoRecetaVendida.objects.filter(venta__caja__almacen__id=almacen_id)
-
-            return ultimos_consumos 
-
     #----------------------------------------------------------------------------------
     def get_botellas_inspeccionar(self):
         """
-        Esta función construye una lista con todas las botellas a inspeccionar
+        Esta función retorna los ids de todas las botellas a inspeccionar
         en en el almacén especificado
         """
-        sucursal_id = self.request.data['sucursal']
         almacen_id = self.request.data['almacen']
         tipo_inspeccion = self.request.data['tipo_inspeccion']
 
@@ -1959,52 +1729,17 @@ class InspeccionTotalViewSet(viewsets.ModelViewSet):
         Si el tipo de inspección solicitada es 'TOTAL', retornamos todas las botellas del almacén:
         """
         if tipo_inspeccion == 'TOTAL':
-            
-            # Checamos si hay botellas registradas en el almacén
-            try:
-
-                botellas = models.Botella.objects.filter(almacen__id=almacen_id)
-                botellas = botellas.exclude(estado='0')
-                botellas = botellas.exclude(estado='3')
-                return botellas
 
-            # Si no hay botellas registradas en el almacén, no retornamos ninguna botella
-            except ObjectDoesNotExist:
-                return None
+            botellas = models.Botella.objects.filter(almacen__id=almacen_id)
+            botellas = botellas.exclude(estado='0')
+            botellas = botellas.exclude(estado='3')
+            # Solo necesitamos los ids para crear los ItemInspeccion
+            return botellas.values_list('id', flat=True)
 
         """
         Si el tipo de inspección solicitada es 'DIARIA', retornamos solo las botellas de ingredientes vendidos
         """
-        #else:
-
-        # Tomamos los consumos registrados después de la última inspección
-        ultimos_consumos = self.get_ultimos_consumos()
-
-        # Si hay consumos registrados después de la última inspección:
-        if ultimos_consumos is not None:
-            # Tomamos los ingredientes de dichos consumos y los guardamos en una lista
-            lista_ingredientes = [consumo.ingrediente for consumo in ultimos_consumos]
-            # Creamos un set con ingredientes únicos
-            ingredientes_unicos = set(lista_ingredientes)
-
-            # Tomamos las botellas del almacén que contengan los ingredientes consumidos
-            botellas = []
-            for ingrediente in ingredientes_unicos:
-                # Seleccionamos las botellas del ingrediente en cuestión
-                qs_botellas_ingrediente = models.Botella.objects.filter(sucursal__id=sucursal_id, almacen__id=almacen_id, producto__ingrediente__id=ingrediente.id)
-                # Excluimos las botellas VACIAS
-                qs_botellas_ingrediente = qs_botellas_ingrediente.exclude(estado='0')
-                # Excluimos las botellas PERDIDAS
-                qs_botellas_ingrediente = qs_botellas_ingrediente.exclude(estado='3')
-                # Guardamos las botellas del ingrediente en una lista
-                botellas_ingrediente = [botella for botella in qs_botellas_ingrediente]
-                # Agregamos las botellas a la lista maestra de botellas
-                botellas += botellas_ingrediente
-
-            return botellas
-
-        # Si no hay consumos registrados, no retornamos ninguna botella (no hay nada que inspeccionar)
-        return None
+        return self.get_botellas_consumidas()
 
     #----------------------------------------------------------------------------------
     def get_serializer_context(self):
@@ -2075,8 +1810,8 @@ Endpoint para consultar el detalle de una Botella del inventario
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def consultar_botella(request, folio_id):
 
     if request.method == 'GET':
@@ -2108,8 +1843,8 @@ Endpoint para crear un Traspaso
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_traspaso(request):
 
     if request.method == 'POST':
@@ -2202,8 +1937,8 @@ Endpoint para crear un Ingrediente
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_ingrediente(request):
 
     if request.method == 'POST':
@@ -2238,8 +1973,8 @@ Endpoint para desplegar la lista de proveedores
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_proveedores(request):
 
     if request.method == 'GET':
@@ -2259,8 +1994,8 @@ Endpoint que despliega la lista de SERVICIOS disponibles para el usuario
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_servicios_usuario(request):
 
     if request.method == 'GET':
@@ -2301,8 +2036,8 @@ NOTAS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_marbete_sat_v2(request, folio_id):
  
     """
@@ -2442,8 +2177,8 @@ OUTPUTS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_peso_botella_nueva(request, producto_id):
 
     if request.method == 'GET':
@@ -2523,8 +2258,8 @@ OUTPUTS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_producto(request, codigo_barras):
 
     if request.method == 'GET':
@@ -2563,8 +2298,8 @@ Endpoint para crear una Botella nueva
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_botella_nueva(request):
 
     if request.method == 'POST':
@@ -2650,8 +2385,8 @@ Endpoint para crear un Producto nuevo sin necesidad de scrapear el SAT
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_producto_v3(request):
 
     if request.method == 'POST':
@@ -2704,8 +2439,8 @@ NOTAS:
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_match_botella(request, folio_id):
  
     """
@@ -2858,8 +2593,8 @@ Endpoint para crear una Botella usada
 -----------------------------------------------------------------------------------
 """
 @api_view(['POST'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def crear_botella_usada(request):
 
     if request.method == 'POST':
@@ -2938,8 +2673,8 @@ modifica su peso ad hoc
 -----------------------------------------------------------------------------------
 """
 @api_view(['PATCH'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def update_botella_nueva_vacia(request):
 
     if request.method == 'PATCH':
@@ -2999,8 +2734,8 @@ Endpoint que muestra una lista con los números de folios custom más recientes
 -----------------------------------------------------------------------------------
 """
 @api_view(['GET'],)
-@permission_classes((IsAuthenticated,))
-@authentication_classes((TokenAuthentication,))
+@permission_classes((IsAuthenticated, PermisoSucursal))
+@authentication_classes((CachedTokenAuthentication,))
 def get_folios_especiales(request, sucursal_id):
 
     if request.method == 'GET':
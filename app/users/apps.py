@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = 'users'
+
+    def ready(self):
+        # Invalidamos el cache de autenticación al eliminar un token o guardar un usuario
+        from users import authentication
+        authentication.conectar()
@@ -0,0 +1,136 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+"""
+-----------------------------------------------------------------------------------
+Autenticación por token con cache.
+
+'TokenAuthentication' consulta 'authtoken_token' y 'core_user' en cada request.
+Aquí el token (con su usuario) se guarda en un cache local del proceso durante
+TOKEN_CACHE_TTL segundos y, si se configura TOKEN_CACHE_ALIAS, también en ese cache
+de Django (p. ej. Redis o Memcached), compartido entre procesos.
+
+El cache de un token se invalida al eliminar el token o al guardar su usuario (por
+ejemplo, al desactivarlo). La invalidación llega al cache compartido y al cache
+local del proceso que la hace; los demás procesos dejan de usar su copia local a
+más tardar en TOKEN_CACHE_TTL segundos.
+-----------------------------------------------------------------------------------
+"""
+MAX_TOKENS = 1024
+
+_tokens = {}
+_lock = threading.Lock()
+
+
+def get_ttl():
+    return getattr(settings, 'TOKEN_CACHE_TTL', 60)
+
+
+def get_cache_compartido():
+    alias = getattr(settings, 'TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def llave_cache(key):
+    return 'token_auth_{}'.format(key)
+
+
+def get_token(key):
+
+    with _lock:
+        registro = _tokens.get(key)
+        if registro is not None:
+            token, expira = registro
+            if time.monotonic() < expira:
+                return token
+            del _tokens[key]
+
+    cache_compartido = get_cache_compartido()
+    if cache_compartido is not None:
+        token = cache_compartido.get(llave_cache(key))
+        if token is not None:
+            guardar_local(key, token)
+            return token
+
+    return None
+
+
+def guardar_local(key, token):
+
+    with _lock:
+        # Si el cache está lleno descartamos los tokens más viejos
+        if len(_tokens) >= MAX_TOKENS:
+            for llave in list(_tokens)[:MAX_TOKENS // 4]:
+                del _tokens[llave]
+        _tokens[key] = (token, time.monotonic() + get_ttl())
+
+
+def guardar(key, token):
+
+    guardar_local(key, token)
+
+    cache_compartido = get_cache_compartido()
+    if cache_compartido is not None:
+        cache_compartido.set(llave_cache(key), token, get_ttl())
+
+
+def invalidar(key):
+
+    with _lock:
+        _tokens.pop(key, None)
+
+    cache_compartido = get_cache_compartido()
+    if cache_compartido is not None:
+        cache_compartido.delete(llave_cache(key))
+
+
+def invalidar_token(sender, instance, **kwargs):
+    invalidar(instance.key)
+
+
+def invalidar_usuario(sender, instance, created=False, **kwargs):
+
+    if created:
+        return
+
+    for key in Token.objects.filter(user_id=instance.id).values_list('key', flat=True):
+        invalidar(key)
+
+
+def conectar():
+    post_delete.connect(invalidar_token, sender=Token, dispatch_uid='token_auth_token_delete')
+    post_save.connect(invalidar_usuario, sender=get_user_model(), dispatch_uid='token_auth_usuario_save')
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    'TokenAuthentication' que toma el token y su usuario del cache. Solo consulta
+    la base de datos cuando el token no está en cache.
+    """
+
+    def authenticate_credentials(self, key):
+
+        token = get_token(key)
+
+        if token is None:
+            token = super().authenticate_credentials(key)[1]
+            guardar(key, token)
+
+        # Cada request trabaja con su propia copia del token y del usuario
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return (token.user, token)
@@ -2,8 +2,12 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 
 
 CREATE_USER_URL = reverse('users:create')
@@ -114,3 +118,45 @@ class PublicUserApiTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class CachedTokenAuthenticationTest(TestCase):
+    """ Tests para la autenticación por token con cache """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='test@foodstack.mx', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('inventarios:get-lista-sucursales')
+
+    def test_token_cache(self):
+        """ Testear que después del primer request el token no se consulta """
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries.captured_queries if 'authtoken_token' in q['sql']])
+
+    def test_token_cache_usuario_inactivo(self):
+        """ Testear que un usuario desactivado ya no se autentica """
+
+        self.client.get(self.url)
+
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_cache_token_eliminado(self):
+        """ Testear que un token eliminado ya no autentica """
+
+        self.client.get(self.url)
+
+        self.token.delete()
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
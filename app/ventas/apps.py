@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class VentasConfig(AppConfig):
     name = 'ventas'
+
+    def ready(self):
+        # Importamos y validamos los parsers de ventas una sola vez al arrancar
+        from ventas import registro_parsers
+        registro_parsers.cargar()
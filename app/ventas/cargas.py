@@ -0,0 +1,233 @@
+from django.db import transaction
+from django.utils import timezone
+
+from core import models
+from ventas import registro_parsers
+from ventas import ventas_consumos
+from ventas.parsers import etapas
+
+import datetime
+
+
+# Minutos que una carga puede estar en PROCESANDO antes de reclamarla
+MINUTOS_ATORADA = 30
+
+# Veces que se toma una carga antes de marcarla como ERROR
+MAX_INTENTOS = 3
+
+
+class CargaReclamada(Exception):
+    pass
+
+
+"""
+-----------------------------------------------------------------------------------
+Cola de procesamiento de reportes de ventas.
+
+La view guarda el archivo y crea una CargaVentas en estado PENDIENTE. Un worker
+(comando 'procesar_ventas') toma las cargas pendientes, corre el parser de la
+sucursal y registra las ventas, actualizando el progreso de la carga.
+
+Si un worker se cae a media carga, la carga se queda en PROCESANDO. Cada vuelta
+del worker reclama las cargas atoradas y las regresa a PENDIENTE; el registro de
+las ventas solo se confirma si la carga sigue siendo del worker que la tomó.
+-----------------------------------------------------------------------------------
+"""
+def encolar(archivo, sucursal, usuario=None):
+
+    carga = models.CargaVentas.objects.create(
+        sucursal=sucursal,
+        usuario=usuario,
+        archivo=archivo
+    )
+
+    return carga
+
+
+"""
+-----------------------------------------------------------------------------------
+Toma la siguiente carga pendiente y la marca como PROCESANDO. Usamos
+'skip_locked' para que varios workers puedan trabajar sin tomar la misma carga.
+-----------------------------------------------------------------------------------
+"""
+def tomar_siguiente():
+
+    with transaction.atomic():
+        carga = (models.CargaVentas.objects
+                    .select_for_update(skip_locked=True)
+                    .filter(estado=models.CargaVentas.PENDIENTE)
+                    .order_by('timestamp_alta')
+                    .first()
+                )
+
+        if carga is None:
+            return None
+
+        carga.estado = models.CargaVentas.PROCESANDO
+        carga.timestamp_inicio = timezone.now()
+        carga.intentos += 1
+        carga.save(update_fields=['estado', 'timestamp_inicio', 'intentos'])
+
+    return carga
+
+
+"""
+-----------------------------------------------------------------------------------
+Regresa a PENDIENTE las cargas que llevan más de 'minutos' en PROCESANDO (su
+worker se cayó) y marca como ERROR las que ya agotaron sus intentos. Retorna
+cuántas cargas se reclamaron.
+-----------------------------------------------------------------------------------
+"""
+def reclamar_atoradas(minutos=MINUTOS_ATORADA):
+
+    limite = timezone.now() - datetime.timedelta(minutes=minutos)
+    atoradas = models.CargaVentas.objects.filter(estado=models.CargaVentas.PROCESANDO, timestamp_inicio__lt=limite)
+
+    with transaction.atomic():
+        atoradas.filter(intentos__gte=MAX_INTENTOS).update(
+            estado=models.CargaVentas.ERROR,
+            mensaje_error='El procesamiento de la carga se interrumpió {} veces.'.format(MAX_INTENTOS),
+            timestamp_fin=timezone.now()
+        )
+        reclamadas = atoradas.update(estado=models.CargaVentas.PENDIENTE, timestamp_inicio=None)
+
+    return reclamadas
+
+
+"""
+-----------------------------------------------------------------------------------
+Guarda el estado final de la carga solo si sigue siendo de este worker: si fue
+reclamada (y quizá ya la tomó otro worker) no se toca y se arroja CargaReclamada.
+
+Dentro de la transacción del registro, el UPDATE bloquea la fila de la carga
+hasta que se confirman las ventas.
+-----------------------------------------------------------------------------------
+"""
+def terminar(carga, estado, mensaje_error=''):
+
+    timestamp_fin = timezone.now()
+
+    actualizadas = (models.CargaVentas.objects
+                    .filter(id=carga.id, estado=models.CargaVentas.PROCESANDO, timestamp_inicio=carga.timestamp_inicio)
+                    .update(
+                        estado=estado,
+                        mensaje_error=mensaje_error,
+                        timestamp_fin=timestamp_fin,
+                        filas_parseadas=carga.filas_parseadas,
+                        ventas_registradas=carga.ventas_registradas,
+                        productos_sin_registro=carga.productos_sin_registro
+                    )
+                )
+
+    if actualizadas == 0:
+        raise CargaReclamada()
+
+    carga.estado = estado
+    carga.mensaje_error = mensaje_error
+    carga.timestamp_fin = timestamp_fin
+
+    return carga
+
+
+def confirmar(carga):
+    return terminar(carga, models.CargaVentas.TERMINADA)
+
+
+"""
+-----------------------------------------------------------------------------------
+Marca la carga como ERROR. Si la carga ya fue reclamada, el error de este worker
+se descarta.
+-----------------------------------------------------------------------------------
+"""
+def fallar(carga, mensaje_error):
+
+    try:
+        return terminar(carga, models.CargaVentas.ERROR, mensaje_error)
+    except CargaReclamada:
+        return carga
+
+
+"""
+-----------------------------------------------------------------------------------
+Parsea y registra el reporte de ventas de una carga. Si el parser de la
+sucursal soporta lectura por lotes, el reporte se registra lote por lote sin
+cargarlo completo en memoria.
+-----------------------------------------------------------------------------------
+"""
+def procesar(carga):
+
+    sucursal = carga.sucursal
+
+    try:
+        # Tomamos el parser de la sucursal del registro de parsers
+        parser_lotes = registro_parsers.get_parser_lotes(sucursal)
+        parser_sucursal = registro_parsers.get_parser(sucursal)
+
+        if parser_lotes is not None:
+            return procesar_lotes(carga, parser_lotes)
+
+        if parser_sucursal is None:
+            return fallar(carga, 'No hay un parser configurado para esta sucursal.')
+
+        with carga.archivo.open('rb') as archivo:
+            resultado_parser = parser_sucursal(archivo, sucursal)
+
+        # Si hay un error con el reporte de ventas, lo registramos en la carga
+        if resultado_parser['procesado'] == False:
+            return fallar(carga, 'Hubo un error al procesar el reporte de ventas.')
+
+        df_ventas = resultado_parser['df_ventas']
+
+        with transaction.atomic():
+            resultado = ventas_consumos.registrar(df_ventas, sucursal)
+
+            carga.filas_parseadas = len(df_ventas)
+            carga.ventas_registradas = len(resultado['ventas_consumos'])
+            carga.productos_sin_registro = len(resultado['productos_no_registrados'])
+            return confirmar(carga)
+
+    except CargaReclamada:
+        return carga
+
+    except Exception as e:
+        return fallar(carga, str(e))
+
+
+def procesar_lotes(carga, parser_lotes):
+
+    try:
+        with carga.archivo.open('rb') as archivo, transaction.atomic():
+            lotes = parser_lotes(archivo, carga.sucursal)
+            totales = ventas_consumos.registrar_lotes(lotes, carga.sucursal)
+
+            carga.filas_parseadas = totales['filas']
+            carga.ventas_registradas = totales['ventas']
+            carga.productos_sin_registro = totales['productos_no_registrados']
+            return confirmar(carga)
+
+    except CargaReclamada:
+        return carga
+
+    except etapas.ErrorParser:
+        return fallar(carga, 'Hubo un error al procesar el reporte de ventas.')
+
+    except Exception as e:
+        return fallar(carga, str(e))
+
+
+"""
+-----------------------------------------------------------------------------------
+Procesa todas las cargas pendientes y retorna cuántas se procesaron
+-----------------------------------------------------------------------------------
+"""
+def procesar_pendientes():
+
+    procesadas = 0
+    carga = tomar_siguiente()
+
+    while carga is not None:
+        procesar(carga)
+        procesadas += 1
+        carga = tomar_siguiente()
+
+    return procesadas
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from ventas import cargas
+
+
+class Command(BaseCommand):
+    """Django command to process the pending sales report uploads"""
+
+    help = 'Procesa los reportes de ventas pendientes (CargaVentas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Sigue esperando nuevas cargas en vez de terminar')
+        parser.add_argument('--intervalo', type=int, default=5, help='Segundos de espera entre revisiones de la cola')
+        parser.add_argument(
+            '--minutos-atoradas', type=int, default=cargas.MINUTOS_ATORADA,
+            help='Minutos en PROCESANDO después de los cuales una carga se vuelve a encolar (su worker se cayó)'
+        )
+
+    def handle(self, *args, **options):
+
+        while True:
+            reclamadas = cargas.reclamar_atoradas(options['minutos_atoradas'])
+
+            if reclamadas:
+                self.stdout.write(self.style.WARNING('Cargas atoradas reclamadas: %s' % reclamadas))
+
+            procesadas = cargas.procesar_pendientes()
+
+            if procesadas:
+                self.stdout.write(self.style.SUCCESS('Cargas procesadas: %s' % procesadas))
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['intervalo'])
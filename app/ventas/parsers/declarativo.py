@@ -0,0 +1,101 @@
+from django.core.exceptions import ImproperlyConfigured
+
+import pandas as pd
+from ventas import registro_parsers
+from ventas.parsers import etapas
+
+
+"""
+-----------------------------------------------------------------------------------
+Construye un parser a partir de un formato declarado en VENTAS_FORMATOS.
+
+Ejemplo de formato:
+
+    'parser_bar_ejemplo': {
+        'lector': 'csv',                                # 'csv' o 'excel'
+        'opciones_lectura': {'dtype': {'Clave': str}},  # kwargs de pd.read_csv / pd.read_excel
+        'columnas': {                                   # columna original -> columna normalizada
+            'Clave': 'codigo_pos',
+            'Descripcion': 'nombre',
+            'Grupo': 'categoria',
+            'Cantidad': 'unidades',
+            'Total': 'importe',
+        },
+        'excluir': {'categoria': ['REFRESCOS', 'CERVEZAS']},  # filas a eliminar por columna
+        'excluir_prefijos': False,                      # True: los patrones solo aplican al inicio del texto
+        'omitir_unidades_cero': True,
+        'almacen': 'BARRA 1',                           # almacén de la caja por defecto
+    }
+
+El parser retornado tiene la misma firma y output que los módulos de 'ventas.parsers'
+y su versión por lotes está disponible en 'parser.parser_lotes'.
+-----------------------------------------------------------------------------------
+"""
+COLUMNAS_REQUERIDAS = {'codigo_pos', 'nombre', 'unidades', 'importe'}
+LECTORES = {'csv': pd.read_csv, 'excel': pd.read_excel}
+LECTORES_LOTES = {'csv': etapas.leer_csv_por_lotes, 'excel': etapas.leer_excel_por_lotes}
+
+
+def construir_parser(nombre, formato):
+
+    if formato.get('lector') not in LECTORES:
+        raise ImproperlyConfigured('El formato {} debe usar un lector {}.'.format(nombre, list(LECTORES)))
+
+    faltantes = COLUMNAS_REQUERIDAS - set(formato.get('columnas', {}).values())
+    if faltantes:
+        raise ImproperlyConfigured('Al formato {} le faltan las columnas {}.'.format(nombre, sorted(faltantes)))
+
+    lector = LECTORES[formato['lector']]
+    lector_lotes = LECTORES_LOTES[formato['lector']]
+    opciones_lectura = formato.get('opciones_lectura', {})
+    columnas = formato['columnas']
+    excluir = formato.get('excluir', {})
+
+    def transformar(df_ventas, SUCURSAL_ID, CAJA_ID):
+
+        # Renombramos y nos quedamos solo con las columnas declaradas
+        df_ventas = df_ventas.rename(columns=columnas)
+        df_ventas = df_ventas[list(columnas.values())]
+
+        # Eliminamos items sin 'codigo_pos' y los items excluidos
+        df_ventas = etapas.excluir_nulos(df_ventas, ['codigo_pos'])
+        df_ventas = etapas.excluir(df_ventas, excluir, formato.get('excluir_prefijos', False))
+
+        # Convertimos 'unidades' e 'importe' a INT, descartando símbolos y decimales
+        for columna in ('unidades', 'importe'):
+            columna_limpia = df_ventas[columna].astype(str).str.replace(r'[$,\s]', '', regex=True)
+            df_ventas[columna] = pd.to_numeric(columna_limpia).astype(int)
+
+        if formato.get('omitir_unidades_cero', False):
+            df_ventas = df_ventas[df_ventas.unidades != 0]
+
+        return etapas.normalizar(df_ventas, SUCURSAL_ID, CAJA_ID)
+
+    def parser(ventas_csv, sucursal):
+
+        # Seleccionamos la caja por defecto de la sucursal
+        caja = registro_parsers.get_caja(sucursal, formato.get('almacen'))
+
+        SUCURSAL_ID = sucursal.id
+        CAJA_ID = caja.id
+
+        try:
+            df_ventas = lector(ventas_csv, **opciones_lectura)
+            df_ventas = transformar(df_ventas, SUCURSAL_ID, CAJA_ID)
+
+        except Exception as e:
+            return({'df_ventas': {}, 'procesado': False})
+
+        return({'df_ventas': df_ventas, 'procesado': True})
+
+    def parser_lotes(ventas_csv, sucursal, tamano_lote=etapas.TAMANO_LOTE):
+
+        caja = registro_parsers.get_caja(sucursal, formato.get('almacen'))
+        lotes = lector_lotes(ventas_csv, tamano_lote, **opciones_lectura)
+
+        return etapas.transformar_lotes(lotes, transformar, sucursal.id, caja.id)
+
+    parser.__name__ = nombre
+    parser.parser_lotes = parser_lotes
+
+    return parser
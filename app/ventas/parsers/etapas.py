@@ -0,0 +1,272 @@
+import re
+import itertools
+import functools
+import collections
+
+import pandas as pd
+import xlrd
+
+
+"""
+-----------------------------------------------------------------------------------
+Etapas compartidas por los parsers de reportes de ventas.
+
+Cada parser declara sus exclusiones como un diccionario {columna: [patrones]}
+y las aplica con 'excluir()', que junta todos los patrones de una columna en
+una sola expresión regular compilada y filtra el dataframe una sola vez.
+-----------------------------------------------------------------------------------
+"""
+COLUMNAS_ORDENADAS = ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe']
+
+# Número de filas por lote al leer reportes en modo streaming
+TAMANO_LOTE = 500
+
+
+"""
+-----------------------------------------------------------------------------------
+Error que arrojan los parsers en modo streaming cuando no pueden procesar
+el reporte de ventas
+-----------------------------------------------------------------------------------
+"""
+class ErrorParser(Exception):
+    pass
+
+
+"""
+-----------------------------------------------------------------------------------
+Compila una lista de patrones literales en una sola expresión regular.
+Con 'prefijo=True' los patrones solo se buscan al inicio del texto.
+-----------------------------------------------------------------------------------
+"""
+@functools.lru_cache(maxsize=None)
+def compilar_patron(patrones, prefijo=False):
+
+    patron = '|'.join(re.escape(patron) for patron in patrones)
+
+    if prefijo:
+        return re.compile('^(?:{})'.format(patron))
+
+    return re.compile(patron)
+
+
+"""
+-----------------------------------------------------------------------------------
+Elimina del dataframe las filas cuyas columnas contienen alguno de los patrones
+declarados en 'exclusiones'. Las máscaras de todas las columnas se combinan y
+el dataframe se filtra (y copia) una sola vez.
+-----------------------------------------------------------------------------------
+"""
+def excluir(df_ventas, exclusiones, prefijo=False):
+
+    filtro = None
+
+    for columna, patrones in exclusiones.items():
+        if not patrones:
+            continue
+
+        patron = compilar_patron(tuple(patrones), prefijo)
+        filtro_columna = df_ventas[columna].astype(str).str.contains(patron, na=False)
+
+        filtro = filtro_columna if filtro is None else (filtro | filtro_columna)
+
+    if filtro is None:
+        return df_ventas
+
+    return df_ventas[~filtro]
+
+
+"""
+-----------------------------------------------------------------------------------
+Elimina las filas donde alguna de las columnas indicadas es NaN
+-----------------------------------------------------------------------------------
+"""
+def excluir_nulos(df_ventas, columnas):
+    return df_ventas.dropna(subset=list(columnas))
+
+
+"""
+-----------------------------------------------------------------------------------
+Agrega las columnas 'sucursal_id' y 'caja_id' y ordena las columnas en el
+formato que espera 'ventas_consumos.registrar'
+-----------------------------------------------------------------------------------
+"""
+def normalizar(df_ventas, sucursal_id, caja_id):
+
+    df_ventas = df_ventas.assign(sucursal_id=sucursal_id, caja_id=caja_id)
+
+    return df_ventas.reindex(columns=COLUMNAS_ORDENADAS)
+
+
+"""
+-----------------------------------------------------------------------------------
+Lee un CSV en lotes de 'tamano_lote' filas. Las opciones de lectura son las
+mismas de pd.read_csv.
+-----------------------------------------------------------------------------------
+"""
+def leer_csv_por_lotes(archivo, tamano_lote=TAMANO_LOTE, **opciones):
+
+    for lote in pd.read_csv(archivo, chunksize=tamano_lote, **opciones):
+        yield lote
+
+
+"""
+-----------------------------------------------------------------------------------
+Lee la primera hoja de un Excel fila por fila y la entrega en lotes de
+'tamano_lote' filas. Acepta las mismas opciones de pd.read_excel que usan los
+parsers ('header', 'skiprows', 'skipfooter' y 'dtype') y produce dataframes
+equivalentes a los de pd.read_excel.
+
+Los .xlsx se leen por partes desde el archivo. Los .xls (formato binario de
+Excel 97-2003) no: xlrd carga la hoja completa en memoria aunque se abra con
+'on_demand', así que con un .xls solo los dataframes se arman por lotes.
+-----------------------------------------------------------------------------------
+"""
+def leer_excel_por_lotes(archivo, tamano_lote=TAMANO_LOTE, header=0, skiprows=0, skipfooter=0, dtype=None, **opciones):
+
+    filas = iterar_filas_excel(archivo)
+    filas = itertools.islice(filas, skiprows or 0, None)
+
+    columnas = None
+    if header is not None:
+        filas = itertools.islice(filas, header, None)
+        columnas = list(next(filas))
+
+    filas = descartar_ultimas(filas, skipfooter)
+
+    # Descartamos las filas vacías, igual que pd.read_excel
+    filas = (fila for fila in filas if any(valor is not None for valor in fila))
+
+    while True:
+        lote = list(itertools.islice(filas, tamano_lote))
+        if not lote:
+            break
+
+        df_lote = pd.DataFrame(lote, columns=columnas, dtype=object)
+        if columnas is None:
+            df_lote.columns = range(len(df_lote.columns))
+
+        yield aplicar_dtype(df_lote, dtype)
+
+
+def iterar_filas_excel(archivo):
+
+    if isinstance(archivo, str):
+        with open(archivo, 'rb') as f:
+            yield from iterar_filas_excel(f)
+        return
+
+    # Los .xlsx son archivos zip; openpyxl en modo read-only lee la hoja por partes
+    inicio = archivo.tell()
+    firma = archivo.read(4)
+    archivo.seek(inicio)
+
+    if firma == b'PK\x03\x04':
+        yield from iterar_filas_xlsx(archivo)
+        return
+
+    libro = xlrd.open_workbook(file_contents=archivo.read(), on_demand=True)
+    hoja = libro.sheet_by_index(0)
+
+    for i in range(hoja.nrows):
+        yield [valor_celda_xls(celda, libro.datemode) for celda in hoja.row(i)]
+
+    libro.release_resources()
+
+
+def iterar_filas_xlsx(archivo):
+
+    import openpyxl
+
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    hoja = libro.worksheets[0]
+
+    for fila in hoja.iter_rows(values_only=True):
+        yield list(fila)
+
+    libro.close()
+
+
+def valor_celda_xls(celda, datemode):
+
+    if celda.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return None
+
+    if celda.ctype == xlrd.XL_CELL_NUMBER and celda.value == int(celda.value):
+        return int(celda.value)
+
+    if celda.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate.xldate_as_datetime(celda.value, datemode)
+
+    if celda.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(celda.value)
+
+    if celda.ctype == xlrd.XL_CELL_ERROR:
+        return None
+
+    if celda.value == '':
+        return None
+
+    return celda.value
+
+
+def descartar_ultimas(filas, n):
+
+    if not n:
+        yield from filas
+        return
+
+    pendientes = collections.deque()
+    for fila in filas:
+        pendientes.append(fila)
+        if len(pendientes) > n:
+            yield pendientes.popleft()
+
+
+def aplicar_dtype(df_lote, dtype):
+
+    if dtype is None:
+        return inferir_tipos(df_lote)
+
+    if not isinstance(dtype, dict):
+        return df_lote.astype(dtype)
+
+    # Convertimos a texto antes de inferir tipos para no convertir los enteros en flotantes
+    for columna, tipo in dtype.items():
+        if columna in df_lote.columns and tipo is str:
+            df_lote[columna] = df_lote[columna].map(lambda valor: valor if pd.isnull(valor) else str(valor))
+
+    df_lote = inferir_tipos(df_lote)
+    for columna, tipo in dtype.items():
+        if columna in df_lote.columns and tipo is not str:
+            df_lote[columna] = df_lote[columna].astype(tipo)
+
+    return df_lote
+
+
+def inferir_tipos(df_lote):
+
+    df_lote = df_lote.infer_objects()
+
+    # Las columnas vacías quedan como NaN flotantes, igual que en pd.read_excel
+    for columna in df_lote.columns[df_lote.isnull().all()]:
+        df_lote[columna] = df_lote[columna].astype(float)
+
+    return df_lote
+
+
+"""
+-----------------------------------------------------------------------------------
+Aplica la función 'transformar' de un parser a cada lote leído y entrega solo
+los lotes con ventas. Cualquier error se reporta como ErrorParser.
+-----------------------------------------------------------------------------------
+"""
+def transformar_lotes(lotes, transformar, sucursal_id, caja_id):
+
+    try:
+        for df_lote in lotes:
+            df_lote = transformar(df_lote, sucursal_id, caja_id)
+            if len(df_lote) > 0:
+                yield df_lote
+
+    except Exception as e:
+        raise ErrorParser(str(e)) from e
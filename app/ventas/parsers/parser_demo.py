@@ -1,12 +1,18 @@
 import pandas as pd
 from core.models import Sucursal, Almacen, Caja
+from ventas import registro_parsers
+from ventas.parsers import etapas
+
+def transformar(df_ventas, SUCURSAL_ID, CAJA_ID):
+
+    # Agregamos las columnas 'sucursal_id' y 'caja_id' y ordenamos las columnas
+    return etapas.normalizar(df_ventas, SUCURSAL_ID, CAJA_ID)
+
 
 def parser(ventas_csv, sucursal):
 
-    # Seleccionamos la Barra Principal y su caja
-    almacenes = sucursal.almacenes.all()
-    barra = almacenes.filter(nombre='BARRA DEMO')[0]
-    caja = barra.cajas.all()[0]
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA DEMO')
 
     # Tomamos los IDs de la Sucursal y la Caja
     SUCURSAL_ID = sucursal.id
@@ -14,15 +20,7 @@ def parser(ventas_csv, sucursal):
 
     try:
         df_ventas = pd.read_csv(ventas_csv)
-
-        # Añadimos columnas 'sucursal_id' y 'caja_id'
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'sucursal_id'], fill_value=SUCURSAL_ID)
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'caja_id'], fill_value=CAJA_ID)
-
-        # Ordenamos las columnas
-        columnas_ordenadas = ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe']
-        df_ventas = df_ventas.reindex(columns=columnas_ordenadas)
-
+        df_ventas = transformar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
     # Si hay algún error con el archivo CSV, arrojamos una excepción
     except Exception as e:
@@ -31,4 +29,14 @@ def parser(ventas_csv, sucursal):
         return({'df_ventas': {}, 'procesado': False})
 
     # Si todo sale OK, retornamos el dataframe con los datos parseados
-    return({'df_ventas': df_ventas, 'procesado': True})
\ No newline at end of file
+    return({'df_ventas': df_ventas, 'procesado': True})
+
+
+def parser_lotes(ventas_csv, sucursal, tamano_lote=etapas.TAMANO_LOTE):
+
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA DEMO')
+
+    lotes = etapas.leer_csv_por_lotes(ventas_csv, tamano_lote)
+
+    return etapas.transformar_lotes(lotes, transformar, sucursal.id, caja.id)
@@ -1,69 +1,60 @@
 import pandas as pd
 from core.models import Sucursal, Almacen, Caja
+from ventas import registro_parsers
+from ventas.parsers import etapas
 
-def parser(ventas_csv, sucursal):
 
-    # Seleccionamos la Barra Principal y su caja
-    almacenes = sucursal.almacenes.all()
-    barra = almacenes.filter(nombre='BARRA 1')[0]
-    caja = barra.cajas.all()[0]
+# Categorías y subcategorías que no son bebidas alcohólicas
+EXCLUSIONES = {
+    'categoria': ['Comida'],
+    'subcat': ['NO Alcoholico', 'Cervezas'],
+}
 
-    # Tomamos los IDs de la Sucursal y la Caja
-    SUCURSAL_ID = sucursal.id
-    CAJA_ID = caja.id
 
-    # Intentamos procesar el archivo de Excel de las ventas
-    try:
+def transformar(df_ventas, SUCURSAL_ID, CAJA_ID):
 
-        df_ventas = pd.read_excel(ventas_csv, header=None, skiprows=1, dtype=object, engine='xlrd')
+    # Eliminamos las columnas innecesarias
+    to_drop = [0, 1, 2, 4, 9, 11]
+    df_ventas = df_ventas.drop(to_drop, axis=1)
+    
+    # Renombramos las columnas
+    nombres_columnas_ok = ['nombre', 'codigo_pos','categoria', 'subcat', 'unidades', 'importe']
+    df_ventas.columns = nombres_columnas_ok
 
-        # Eliminamos las columnas innecesarias
-        to_drop = [0, 1, 2, 4, 9, 11]
-        df_ventas = df_ventas.drop(to_drop, axis=1)
-        
-        # Renombramos las columnas
-        nombres_columnas_ok = ['nombre', 'codigo_pos','categoria', 'subcat', 'unidades', 'importe']
-        df_ventas.columns = nombres_columnas_ok
+    # Eliminamos items sin categoría o sin 'codigo_pos' (NaN)
+    df_ventas = etapas.excluir_nulos(df_ventas, ['categoria', 'codigo_pos'])
 
-        # Eliminamos items de comida
-        filtro_comida = df_ventas.loc[:,'categoria'].str.contains('Comida', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_comida]
+    # Eliminamos comida, bebidas sin alcohol y cervezas
+    df_ventas = etapas.excluir(df_ventas, EXCLUSIONES)
 
-        # Eliminamos items sin categoría (NaN)
-        filtro_nan = (df_ventas.categoria).isnull()
-        df_ventas = df_ventas[~filtro_nan]
+    # Agregamos las columnas 'sucursal_id' y 'caja_id' y ordenamos las columnas
+    df_ventas = etapas.normalizar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
-        # Eliminamos items sin 'codigo_pos'
-        filtro_nan = (df_ventas.codigo_pos).isnull()
-        df_ventas = df_ventas[~filtro_nan]
+    # Convertimos las columnas 'unidades' e 'importe' a tipo INT
+    columna_int = df_ventas.loc[:, 'unidades'].astype(int)
+    df_ventas['unidades'] = columna_int
 
-        # Eliminamos bebidas sin alcohol y cervezas
-        filtro_sin_alcohol = df_ventas.loc[:, 'subcat'].str.contains('NO Alcoholico', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_sin_alcohol]
+    columna_int = df_ventas.loc[:, 'importe'].astype(int)
+    df_ventas['importe'] = columna_int
 
-        filtro_cervezas = df_ventas.loc[:, 'subcat'].str.contains('Cervezas', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_cervezas]
+    return df_ventas
 
-        # Añadimos columnas 'sucursal_id' y 'caja_id'
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'sucursal_id'], fill_value=SUCURSAL_ID)
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'caja_id'], fill_value=CAJA_ID)
 
-        # Eliminamos la columna 'categoria'
-        df_ventas = df_ventas.drop('categoria', axis=1)
+def parser(ventas_csv, sucursal):
 
-        # Eliminamos la columna 'subcat'
-        df_ventas = df_ventas.drop('subcat', axis=1)
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA 1')
 
-        # Ordenamos las columnas
-        columnas_ordenadas = ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe']
-        df_ventas = df_ventas.reindex(columns=columnas_ordenadas)
+    # Tomamos los IDs de la Sucursal y la Caja
+    SUCURSAL_ID = sucursal.id
+    CAJA_ID = caja.id
 
-        # Convertimos las columnas 'unidades' e 'importe' a tipo INT
-        columna_int = df_ventas.loc[:, 'unidades'].astype(int)
-        df_ventas['unidades'] = columna_int
+    # Intentamos procesar el archivo de Excel de las ventas
+    try:
+
+        df_ventas = pd.read_excel(ventas_csv, header=None, skiprows=1, dtype=object, engine='xlrd')
 
-        columna_int = df_ventas.loc[:, 'importe'].astype(int)
-        df_ventas['importe'] = columna_int
+        df_ventas = transformar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
     # Si hay algún error con el Excel, arrojamos una excepción
     except Exception as e:
@@ -74,3 +65,12 @@ def parser(ventas_csv, sucursal):
     # Si todo sale OK, retornamos el dataframe con los datos parseados
     return({'df_ventas': df_ventas, 'procesado': True})
 
+
+def parser_lotes(ventas_csv, sucursal, tamano_lote=etapas.TAMANO_LOTE):
+
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA 1')
+
+    lotes = etapas.leer_excel_por_lotes(ventas_csv, tamano_lote, header=None, skiprows=1, dtype=object)
+
+    return etapas.transformar_lotes(lotes, transformar, sucursal.id, caja.id)
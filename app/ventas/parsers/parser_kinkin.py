@@ -1,80 +1,80 @@
 import pandas as pd
 from core.models import Sucursal, Almacen, Caja
+from ventas import registro_parsers
+from ventas.parsers import etapas
 
-def parser(ventas_csv, sucursal):
 
-    # Seleccionamos la Barra Principal y su caja
-    almacenes = sucursal.almacenes.all()
-    barra = almacenes.filter(nombre='BARRA 1')[0]
-    caja = barra.cajas.all()[0]
+# Divisiones que no son bebidas alcohólicas
+EXCLUSIONES = {
+    'Division': ['CERVEZA/Be', 'SIN ALCOHOL', 'ENERGY DRINKS'],
+}
 
-    # Tomamos los IDs de la Sucursal y la Caja
-    SUCURSAL_ID = sucursal.id
-    CAJA_ID = caja.id
 
-    # Intentamos procesar el archivo CSV de las ventas
-    try:
+def transformar(df_ventas, SUCURSAL_ID, CAJA_ID):
 
-        df_ventas = pd.read_csv(ventas_csv, lineterminator='\r')
+    # Eliminamos cervezas, bebidas sin alcohol y energy drinks
+    df_ventas = etapas.excluir(df_ventas, EXCLUSIONES)
+
+    # Eliminamos columnas innecesarias
+    to_drop = ['Column1', 'Division']
+    df_ventas = df_ventas.drop(to_drop, axis=1)
 
-        # Eliminamos cervezas
-        filtro_cerveza = df_ventas.loc[:,'Division'].str.contains('CERVEZA/Be', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_cerveza]
+    # Duplicamos columna 'Producto' y la renombramos 'codigo_pos'
+    columna_duplicada = df_ventas['Producto']
+    df_ventas['codigo_pos'] = columna_duplicada
 
-        # Eliminamos bebidas sin alcohol
-        filtro_sin_alcohol = df_ventas.loc[:,'Division'].str.contains('SIN ALCOHOL', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_sin_alcohol]
+    # Cambiamos el nombre de las columnas
+    nombres_columnas_ok = ['nombre', 'unidades', 'importe', 'codigo_pos']
+    df_ventas.columns = nombres_columnas_ok
 
-        # Eliminamos Energy Drinks
-        filtro_energy_drinks = df_ventas.loc[:,'Division'].str.contains('ENERGY DRINKS', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_energy_drinks]
+    # Eliminamos filas donde 'nombre' == NaN
+    filtro_nan = ((df_ventas.nombre).isnull()) & ((df_ventas.codigo_pos).isnull())
+    df_ventas = df_ventas[~filtro_nan]
 
-        # Eliminamos columnas innecesarias
-        to_drop = ['Column1', 'Division']
-        df_ventas = df_ventas.drop(to_drop, axis=1)
+    # Redondeamos los valores de la columna 'unidades'
+    df_ventas = df_ventas.round({'unidades': 0})
 
-        # Duplicamos columna 'Producto' y la renombramos 'codigo_pos'
-        columna_duplicada = df_ventas['Producto']
-        df_ventas['codigo_pos'] = columna_duplicada
+    # Convertimos columna 'unidades' a INT
+    columna_int = df_ventas.loc[:, 'unidades'].astype(int)
+    df_ventas['unidades'] = columna_int
 
-        # Cambiamos el nombre de las columnas
-        nombres_columnas_ok = ['nombre', 'unidades', 'importe', 'codigo_pos']
-        df_ventas.columns = nombres_columnas_ok
+    # Convertimos columna 'importe' a INT
+    columna_importe = df_ventas.loc[:,'importe'].str.replace('$','')
+    df_ventas['importe'] = columna_importe
+    columna_importe = df_ventas.loc[:,'importe'].str.replace(',','')
+    df_ventas['importe'] = columna_importe
 
-        # Eliminamos filas donde 'nombre' == NaN
-        filtro_nan = ((df_ventas.nombre).isnull()) & ((df_ventas.codigo_pos).isnull())
-        df_ventas = df_ventas[~filtro_nan]
+    def eliminar_decimales(numero):
+        numero = numero.split('.')[0]
+        return numero
 
-        # Redondeamos los valores de la columna 'unidades'
-        df_ventas = df_ventas.round({'unidades': 0})
+    columna_importe = df_ventas['importe'].apply(eliminar_decimales)
+    df_ventas['importe'] = columna_importe
 
-        # Convertimos columna 'unidades' a INT
-        columna_int = df_ventas.loc[:, 'unidades'].astype(int)
-        df_ventas['unidades'] = columna_int
+    columna_importe = df_ventas.loc[:,'importe'].astype(int)
+    df_ventas['importe'] = columna_importe
 
-        # Convertimos columna 'importe' a INT
-        columna_importe = df_ventas.loc[:,'importe'].str.replace('$','')
-        df_ventas['importe'] = columna_importe
-        columna_importe = df_ventas.loc[:,'importe'].str.replace(',','')
-        df_ventas['importe'] = columna_importe
+    # Agregamos las columnas 'sucursal_id' y 'caja_id' y ordenamos las columnas
+    df_ventas = etapas.normalizar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
-        def eliminar_decimales(numero):
-            numero = numero.split('.')[0]
-            return numero
+    return df_ventas
 
-        columna_importe = df_ventas['importe'].apply(eliminar_decimales)
-        df_ventas['importe'] = columna_importe
 
-        columna_importe = df_ventas.loc[:,'importe'].astype(int)
-        df_ventas['importe'] = columna_importe
+def parser(ventas_csv, sucursal):
 
-        # Agregar columnas de 'Sucursal' y 'Caja'
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'sucursal_id'], fill_value=SUCURSAL_ID)
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'caja_id'], fill_value=CAJA_ID)
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA 1')
 
-        # Ordenamos las columnas
-        columnas_ordenadas = ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe']
-        df_ventas = df_ventas.reindex(columns=columnas_ordenadas)
+    # Tomamos los IDs de la Sucursal y la Caja
+    SUCURSAL_ID = sucursal.id
+    CAJA_ID = caja.id
+
+    # Intentamos procesar el archivo CSV de las ventas
+    try:
+
+        df_ventas = pd.read_csv(ventas_csv, lineterminator='\r')
+
+        df_ventas = transformar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
     
     # Si hay algún error con el archivo CSV, arrojamos una excepción
@@ -84,4 +84,14 @@ def parser(ventas_csv, sucursal):
         return({'df_ventas': {}, 'procesado': False})
 
     # Si todo sale OK, retornamos el dataframe con los datos parseados
-    return({'df_ventas': df_ventas, 'procesado': True})
\ No newline at end of file
+    return({'df_ventas': df_ventas, 'procesado': True})
+
+
+def parser_lotes(ventas_csv, sucursal, tamano_lote=etapas.TAMANO_LOTE):
+
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA 1')
+
+    lotes = etapas.leer_csv_por_lotes(ventas_csv, tamano_lote, lineterminator='\r')
+
+    return etapas.transformar_lotes(lotes, transformar, sucursal.id, caja.id)
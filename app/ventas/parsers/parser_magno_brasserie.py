@@ -3,13 +3,68 @@ import os
 import xlrd
 import datetime
 from core.models import Sucursal, Almacen, Caja
+from ventas import registro_parsers
+from ventas.parsers import etapas
+
+
+# Prefijos de 'codigo_pos' que no son bebidas alcohólicas
+EXCLUSIONES = {
+    'codigo_pos': [
+        'PF',   # Platillos Fuertes
+        'ENT',  # Entradas
+        'BEB',  # Bebidas Sin Alcohol
+        'POS',  # Postres
+        'CHA',  # Charcuteria
+        'REF',  # Refrescos
+        'CVZ',  # Cervezas
+        'PAS',  # Pastas
+        'COR',  # Cortesias
+        'MEN',  # Menus
+        'PC',   # PC
+        'BVT',  # Botellas de Vino Tinto
+        'BVB',  # Botellas de Vino Blanco
+        'BVR',  # Botellas de Vino Rosado
+        'BVE',  # Botellas de Vino Espumoso
+        'CVT',  # Copas de Vino Tinto
+        'CVB',  # Copas de Vino Blanco
+        'CVR',  # Copas de Vino Rosado
+        'CVE',  # Copas de Vino Espumoso
+        'CVD',  # Copas de Vino Dulce
+        'EXT',  # EXT
+        'CIG',  # Cigarros
+        'DES',  # Descorche
+    ]
+}
+
+
+def transformar(df_ventas, SUCURSAL_ID, CAJA_ID):
+
+    # Eliminamos columnas innecesarias
+    #to_drop = [0, 4, 6]
+    to_drop = [0, 4, 6, 7, 8]
+    df_ventas = df_ventas.drop(to_drop, axis=1)
+
+    # Renombramos las columnas
+    nombres_columnas_ok = ['codigo_pos', 'nombre', 'unidades', 'importe']
+    df_ventas.columns = nombres_columnas_ok
+
+    # Eliminamos los items que no son bebidas alcohólicas
+    df_ventas = etapas.excluir(df_ventas, EXCLUSIONES)
+
+    # Convertimos columna 'importe' a INT
+    columna_importe = df_ventas.loc[:,'importe'].astype(int)
+    df_ventas.loc[:, 'importe'] = columna_importe
+
+    # Agregamos las columnas 'sucursal_id' y 'caja_id' y ordenamos las columnas
+    df_ventas = etapas.normalizar(df_ventas, SUCURSAL_ID, CAJA_ID)
+
+    return df_ventas
 
 
 def parser(ventas_csv, sucursal):
 
-   # Tomamos los ids de la sucursal y la caja
-    almacen = sucursal.almacenes.all()[0]
-    caja = almacen.cajas.all()[0]
+    # Tomamos la caja por defecto de la sucursal
+    caja = registro_parsers.get_caja(sucursal)
 
     SUCURSAL_ID = sucursal.id
     CAJA_ID = caja.id
@@ -20,125 +75,24 @@ def parser(ventas_csv, sucursal):
         #df_ventas = pd.read_excel(wb, header=None, skiprows=9, skipfooter=5, engine='xlrd')
         df_ventas = pd.read_excel(ventas_csv, header=None, skiprows=9, skipfooter=5, engine='xlrd')
 
-        # Eliminamos columnas innecesarias
-        #to_drop = [0, 4, 6]
-        to_drop = [0, 4, 6, 7, 8]
-        df_ventas = df_ventas.drop(to_drop, axis=1)
+        df_ventas = transformar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
-        # Renombramos las columnas
-        nombres_columnas_ok = ['codigo_pos', 'nombre', 'unidades', 'importe']
-        df_ventas.columns = nombres_columnas_ok
-
-        # Eliminamos Platillos Fuertes
-        filtro_platillo_fuerte = df_ventas.loc[:,'codigo_pos'].str.contains('PF', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_platillo_fuerte]
-
-        # Eliminamos Entradas
-        filtro_entrada = df_ventas.loc[:,'codigo_pos'].str.contains('ENT', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_entrada]
-
-        # Eliminamos Bebidas Sin Alcohol
-        filtro_sin_alcohol = df_ventas.loc[:,'codigo_pos'].str.contains('BEB', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_sin_alcohol]
-
-        # Eliminamos Postres
-        filtro_postre = df_ventas.loc[:,'codigo_pos'].str.contains('POS', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_postre]
-
-        # Eliminamos Charcuteria
-        filtro_charcuteria = df_ventas.loc[:,'codigo_pos'].str.contains('CHA', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_charcuteria]
-
-        # Eliminamos Refrescos
-        filtro_refresco = df_ventas.loc[:,'codigo_pos'].str.contains('REF', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_refresco]
-
-        # Eliminamos Cervezas
-        filtro_cerveza = df_ventas.loc[:,'codigo_pos'].str.contains('CVZ', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_cerveza]
-
-        # Eliminamos Pastas
-        filtro_pasta = df_ventas.loc[:,'codigo_pos'].str.contains('PAS', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_pasta]
-
-        # Eliminamos Cortesias
-        filtro_cortesia = df_ventas.loc[:,'codigo_pos'].str.contains('COR', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_cortesia]
-
-        # Eliminamos Menus
-        filtro_menu = df_ventas.loc[:,'codigo_pos'].str.contains('MEN', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_menu]
-
-        # Eliminamos PC
-        filtro_pc = df_ventas.loc[:,'codigo_pos'].str.contains('PC', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_pc]
-
-        # Eliminamos Botellas de Vino Tinto
-        filtro_vino_tinto = df_ventas.loc[:,'codigo_pos'].str.contains('BVT', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_vino_tinto]
-
-        # Eliminamos Botellas de Vino Blanco
-        filtro_vino_blanco = df_ventas.loc[:,'codigo_pos'].str.contains('BVB', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_vino_blanco]
-
-        # Eliminamos Botellas de Vino Rosado
-        filtro_vino_rosado = df_ventas.loc[:,'codigo_pos'].str.contains('BVR', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_vino_rosado]
-
-        # Eliminamos Botellas de Vino Espumoso
-        filtro_vino_espumoso = df_ventas.loc[:,'codigo_pos'].str.contains('BVE', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_vino_espumoso]
-
-        # Eliminamos Copas de Vino Tinto
-        filtro_copa_vino_tinto = df_ventas.loc[:,'codigo_pos'].str.contains('CVT', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_copa_vino_tinto]
-
-        # Eliminamos Copas de Vino Blanco
-        filtro_copa_vino_blanco = df_ventas.loc[:,'codigo_pos'].str.contains('CVB', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_copa_vino_blanco]
-
-        # Eliminamos Copas de Vino Rosado
-        filtro_copa_vino_rosado = df_ventas.loc[:,'codigo_pos'].str.contains('CVR', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_copa_vino_rosado]
-
-        # Eliminamos Copas de Vino Espumoso
-        filtro_copa_vino_espumoso = df_ventas.loc[:,'codigo_pos'].str.contains('CVE', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_copa_vino_espumoso]
-
-        # Eliminamos Copas de Vino Dulce
-        filtro_copa_vino_dulce = df_ventas.loc[:,'codigo_pos'].str.contains('CVD', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_copa_vino_dulce]
-
-        # Eliminamos EXT
-        filtro_ext = df_ventas.loc[:,'codigo_pos'].str.contains('EXT', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_ext]
+    except Exception as e:
+        return({'df_ventas': {}, 'procesado': False})
 
-        # Eliminamos Cigarros
-        filtro_cigarros = df_ventas.loc[:,'codigo_pos'].str.contains('CIG', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_cigarros]
 
-        # Eliminamos Descorche
-        filtro_descorche = df_ventas.loc[:,'codigo_pos'].str.contains('DES', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_descorche]
+    return({'df_ventas': df_ventas, 'procesado': True})
 
-        # Convertimos columna 'importe' a INT
-        columna_importe = df_ventas.loc[:,'importe'].astype(int)
-        df_ventas.loc[:, 'importe'] = columna_importe
 
-        # Agregar columnas de 'Sucursal' y 'Caja'
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'sucursal_id'], fill_value=SUCURSAL_ID)
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'caja_id'], fill_value=CAJA_ID)
+def parser_lotes(ventas_csv, sucursal, tamano_lote=etapas.TAMANO_LOTE):
 
-        # Ordenamos las columnas
-        columnas_ordenadas = ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe']
-        df_ventas = df_ventas.reindex(columns=columnas_ordenadas)
+    # Tomamos la caja por defecto de la sucursal
+    caja = registro_parsers.get_caja(sucursal)
 
+    lotes = etapas.leer_excel_por_lotes(ventas_csv, tamano_lote, header=None, skiprows=9, skipfooter=5)
 
-    except Exception as e:
-        return({'df_ventas': {}, 'procesado': False})
-
+    return etapas.transformar_lotes(lotes, transformar, sucursal.id, caja.id)
 
-    return({'df_ventas': df_ventas, 'procesado': True})
 
 
 
@@ -1,79 +1,81 @@
 import pandas as pd
 from core.models import Sucursal, Almacen, Caja
+from ventas import registro_parsers
+from ventas.parsers import etapas
 
-def parser(ventas_csv, sucursal):
 
-    # Seleccionamos la Barra Principal y su caja
-    almacenes = sucursal.almacenes.all()
-    barra = almacenes.filter(nombre='BARRA 1')[0]
-    caja = barra.cajas.all()[0]
+# Categorías que no son bebidas alcohólicas
+EXCLUSIONES = {
+    'categoria': ['REFRESCOS', 'CERVEZAS'],
+}
 
-    # Tomamos los IDs de la Sucursal y la Caja
-    SUCURSAL_ID = sucursal.id
-    CAJA_ID = caja.id
 
-    try:
-        
-        df_ventas = pd.read_excel(ventas_csv, header=4, skipfooter=1, dtype={'CLAVE': str, 'VENTA_TOTAL': str}, engine='xlrd')
+def transformar(df_ventas, SUCURSAL_ID, CAJA_ID):
 
-        # Eliminamos las columnas innecesarias
-        to_drop = [
-            'PRECIO',
-            'COSTO',
-            'COSTO_TOTAL',
-            'VENTA_COSTO',
-            'PRECIO_DE_VENTA',
-            'PRECIO_DE_CATALOGO',
-            'VENTA_TOTAL_PRECIO_CATALOGO',
-            'TASA_IVA'
-            ]
-        
-        df_ventas = df_ventas.drop(to_drop, axis=1)
+    # Eliminamos las columnas innecesarias
+    to_drop = [
+        'PRECIO',
+        'COSTO',
+        'COSTO_TOTAL',
+        'VENTA_COSTO',
+        'PRECIO_DE_VENTA',
+        'PRECIO_DE_CATALOGO',
+        'VENTA_TOTAL_PRECIO_CATALOGO',
+        'TASA_IVA'
+        ]
+    
+    df_ventas = df_ventas.drop(to_drop, axis=1)
+
+    # Renombramos las columnas
+    nombres_columnas_ok = ['codigo_pos', 'nombre', 'categoria', 'unidades', 'importe']
+    df_ventas.columns = nombres_columnas_ok
 
-        # Renombramos las columnas
-        nombres_columnas_ok = ['codigo_pos', 'nombre', 'categoria', 'unidades', 'importe']
-        df_ventas.columns = nombres_columnas_ok
+    # Creamos una función para eliminar los decimales de un string
+    def drop_decimals(numero):
+        numero = str(numero)
+        numero = numero.split('.')[0]
+        return numero
 
-        # Creamos una función para eliminar los decimales de un string
-        def drop_decimals(numero):
-            numero = str(numero)
-            numero = numero.split('.')[0]
-            return numero
+    # Aplicamos la funcion a la columna 'importe'
+    df_ventas['importe'] = df_ventas.importe.apply(drop_decimals)
 
-        # Aplicamos la funcion a la columna 'importe'
-        df_ventas['importe'] = df_ventas.importe.apply(drop_decimals)
+    # Convertimos la columna 'importe' a INT
+    columna_int = df_ventas.loc[:, 'importe'].astype(int)
+    df_ventas['importe'] = columna_int
 
-        # Convertimos la columna 'importe' a INT
-        columna_int = df_ventas.loc[:, 'importe'].astype(int)
-        df_ventas['importe'] = columna_int
+    # Aplicamos la funcion a la columna 'unidades'
+    df_ventas['unidades'] = df_ventas.unidades.apply(drop_decimals)
 
-        # Aplicamos la funcion a la columna 'unidades'
-        df_ventas['unidades'] = df_ventas.unidades.apply(drop_decimals)
+    # Convertimos la columna 'unidades' a INT
+    columna_int = df_ventas.loc[:, 'unidades'].astype(int)
+    df_ventas['unidades'] = columna_int
 
-        # Convertimos la columna 'unidades' a INT
-        columna_int = df_ventas.loc[:, 'unidades'].astype(int)
-        df_ventas['unidades'] = columna_int
+    # Eliminamos REFRESCOS y CERVEZAS
+    df_ventas = etapas.excluir(df_ventas, EXCLUSIONES)
 
-        # Eliminamos REFRESCOS y CERVEZAS
-        filtro_refrescos = df_ventas.loc[:,'categoria'].str.contains('REFRESCOS', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_refrescos]
+    # Eliminamos items donde 'unidades' = 0
+    df_ventas = df_ventas.loc[df_ventas.unidades!=0, :]
 
-        filtro_cervezas = df_ventas.loc[:,'categoria'].str.contains('CERVEZAS', na=False, regex=True)
-        df_ventas = df_ventas[~filtro_cervezas]
+    # Agregamos las columnas 'sucursal_id' y 'caja_id' y ordenamos las columnas
+    df_ventas = etapas.normalizar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
-        # Eliminamos items donde 'unidades' = 0
-        df_ventas = df_ventas.loc[df_ventas.unidades!=0, :]
+    return df_ventas
 
-        # Eliminamos la columna 'categoria'
-        df_ventas = df_ventas.drop('categoria', axis=1)
 
-        # Añadimos columnas 'sucursal_id' y 'caja_id'
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'sucursal_id'], fill_value=SUCURSAL_ID)
-        df_ventas = df_ventas.reindex(columns=[*df_ventas.columns.tolist(), 'caja_id'], fill_value=CAJA_ID)
+def parser(ventas_csv, sucursal):
 
-        # Ordenamos las columnas
-        columnas_ordenadas = ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe']
-        df_ventas = df_ventas.reindex(columns=columnas_ordenadas)
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA 1')
+
+    # Tomamos los IDs de la Sucursal y la Caja
+    SUCURSAL_ID = sucursal.id
+    CAJA_ID = caja.id
+
+    try:
+        
+        df_ventas = pd.read_excel(ventas_csv, header=4, skipfooter=1, dtype={'CLAVE': str, 'VENTA_TOTAL': str}, engine='xlrd')
+
+        df_ventas = transformar(df_ventas, SUCURSAL_ID, CAJA_ID)
 
     # Si hay algún error con el Excel, arrojamos una excepción
     except Exception as e:
@@ -83,3 +85,14 @@ def parser(ventas_csv, sucursal):
 
     # Si todo sale OK, retornamos el dataframe con los datos parseados
     return({'df_ventas': df_ventas, 'procesado': True})
+
+
+def parser_lotes(ventas_csv, sucursal, tamano_lote=etapas.TAMANO_LOTE):
+
+    # Seleccionamos la caja de la Barra Principal
+    caja = registro_parsers.get_caja(sucursal, 'BARRA 1')
+
+    lotes = etapas.leer_excel_por_lotes(ventas_csv, tamano_lote, header=4, skipfooter=1, dtype={'CLAVE': str, 'VENTA_TOTAL': str})
+
+    return etapas.transformar_lotes(lotes, transformar, sucursal.id, caja.id)
+
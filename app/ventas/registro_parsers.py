@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from importlib import import_module
+import pkgutil
+
+from core import models
+
+
+"""
+-----------------------------------------------------------------------------------
+Registro de parsers de reportes de ventas.
+
+Los parsers se importan y validan una sola vez al arrancar la app (VentasConfig).
+Cada Sucursal se asigna a un parser y a su almacén por defecto con el setting
+VENTAS_PARSERS; si una sucursal no está configurada usamos el parser que
+corresponde a su slug ('MAGNO-BRASSERIE' -> 'parser_magno_brasserie').
+
+Los formatos declarados en VENTAS_FORMATOS se convierten en parsers sin
+necesidad de escribir un módulo nuevo (ver 'ventas.parsers.declarativo').
+-----------------------------------------------------------------------------------
+"""
+
+# Módulos de 'ventas.parsers' indexados por nombre
+MODULOS_PARSERS = {}
+
+# Parsers construidos a partir de VENTAS_FORMATOS indexados por nombre
+PARSERS_DECLARATIVOS = {}
+
+
+def cargar():
+
+    from ventas import parsers
+    from ventas.parsers import declarativo
+
+    MODULOS_PARSERS.clear()
+    PARSERS_DECLARATIVOS.clear()
+
+    # Importamos y validamos todos los módulos 'parser_*'
+    for modulo_info in pkgutil.iter_modules(parsers.__path__):
+        nombre = modulo_info.name
+        if not nombre.startswith('parser_'):
+            continue
+
+        modulo = import_module('ventas.parsers.' + nombre)
+        if not callable(getattr(modulo, 'parser', None)):
+            raise ImproperlyConfigured('El módulo ventas.parsers.{} no define una función parser().'.format(nombre))
+
+        MODULOS_PARSERS[nombre] = modulo
+
+    # Construimos los parsers declarativos
+    for nombre, formato in getattr(settings, 'VENTAS_FORMATOS', {}).items():
+        if nombre in MODULOS_PARSERS:
+            raise ImproperlyConfigured('El formato {} tiene el mismo nombre que un módulo de ventas.parsers.'.format(nombre))
+
+        PARSERS_DECLARATIVOS[nombre] = declarativo.construir_parser(nombre, formato)
+
+    # Validamos que cada sucursal configurada apunte a un parser existente
+    for slug, configuracion in getattr(settings, 'VENTAS_PARSERS', {}).items():
+        nombre = configuracion.get('parser', nombre_parser_default(slug))
+        if nombre not in MODULOS_PARSERS and nombre not in PARSERS_DECLARATIVOS:
+            raise ImproperlyConfigured('La sucursal {} usa el parser {} que no existe.'.format(slug, nombre))
+
+
+def nombre_parser_default(slug):
+    return 'parser_' + slug.replace('-', '_').lower()
+
+
+def get_configuracion(sucursal):
+    return getattr(settings, 'VENTAS_PARSERS', {}).get(sucursal.slug, {})
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna la función parser() de una sucursal. Si la sucursal no tiene un parser
+registrado, retorna None.
+-----------------------------------------------------------------------------------
+"""
+def get_parser(sucursal):
+
+    nombre = get_configuracion(sucursal).get('parser', nombre_parser_default(sucursal.slug))
+
+    if nombre in PARSERS_DECLARATIVOS:
+        return PARSERS_DECLARATIVOS[nombre]
+
+    # Tomamos la función del módulo al momento de usarla para respetar cualquier reemplazo (p. ej. en tests)
+    modulo = MODULOS_PARSERS.get(nombre)
+    if modulo is None:
+        return None
+
+    return modulo.parser
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna la función parser_lotes() de una sucursal, que lee el reporte de ventas
+por lotes. Si el parser de la sucursal no soporta lectura por lotes, retorna None.
+-----------------------------------------------------------------------------------
+"""
+def get_parser_lotes(sucursal):
+
+    nombre = get_configuracion(sucursal).get('parser', nombre_parser_default(sucursal.slug))
+
+    if nombre in PARSERS_DECLARATIVOS:
+        return PARSERS_DECLARATIVOS[nombre].parser_lotes
+
+    modulo = MODULOS_PARSERS.get(nombre)
+    if modulo is None:
+        return None
+
+    return getattr(modulo, 'parser_lotes', None)
+
+
+"""
+-----------------------------------------------------------------------------------
+Retorna la Caja por defecto de una sucursal. El almacén configurado en
+VENTAS_PARSERS tiene prioridad sobre el que propone el parser; si no hay ninguno
+tomamos el primer almacén de la sucursal.
+
+Se consulta una vez por reporte (no por fila), así que no la guardamos en cache:
+un cache por proceso no se enteraría de los cambios hechos en otros procesos.
+-----------------------------------------------------------------------------------
+"""
+def get_caja(sucursal, almacen=None):
+
+    configuracion = get_configuracion(sucursal)
+    almacen = configuracion.get('almacen', almacen)
+
+    cajas = models.Caja.objects.filter(almacen__sucursal=sucursal).order_by('almacen__id', 'id')
+    if almacen is not None:
+        cajas = cajas.filter(almacen__nombre=almacen)
+    if 'caja' in configuracion:
+        cajas = cajas.filter(numero=configuracion['caja'])
+
+    return cajas[0]
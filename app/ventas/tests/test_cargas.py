@@ -0,0 +1,288 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from freezegun import freeze_time
+
+from core import models
+from ventas import cargas
+from ventas.parsers import etapas
+
+import datetime
+import tempfile
+import pandas as pd
+
+
+MEDIA_ROOT_TESTS = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT_TESTS)
+class CargasVentasTests(TestCase):
+
+    def setUp(self):
+
+        self.client = Client()
+        self.usuario = get_user_model().objects.create_superuser('admin@foodstack.mx', 'password123')
+        self.client.force_login(user=self.usuario)
+
+        # Cliente
+        self.operadora_magno = models.Cliente.objects.create(nombre='MAGNO BRASSERIE')
+        # Sucursal
+        self.magno_brasserie = models.Sucursal.objects.create(nombre='MAGNO-BRASSERIE', cliente=self.operadora_magno)
+        self.usuario.sucursales.add(self.magno_brasserie)
+        # Almacen
+        self.barra_1 = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.magno_brasserie)
+        # Caja
+        self.caja_1 = models.Caja.objects.create(numero=1, nombre='CAJA 1', almacen=self.barra_1)
+
+        # Categorías
+        self.categoria_licor = models.Categoria.objects.create(nombre='LICOR')
+
+        # Ingredientes
+        self.licor_43 = models.Ingrediente.objects.create(
+            codigo='LICO001',
+            nombre='LICOR 43',
+            categoria=self.categoria_licor,
+            factor_peso=1.05
+        )
+
+        # Recetas
+        self.trago_licor_43 = models.Receta.objects.create(
+            codigo_pos='00081',
+            nombre='LICOR 43 DERECHO',
+            sucursal=self.magno_brasserie
+        )
+        self.carajillo = models.Receta.objects.create(
+            codigo_pos='00050',
+            nombre='CARAJILLO',
+            sucursal=self.magno_brasserie
+        )
+
+        # Ingredientes-Recetas
+        models.IngredienteReceta.objects.create(receta=self.trago_licor_43, ingrediente=self.licor_43, volumen=60)
+        models.IngredienteReceta.objects.create(receta=self.carajillo, ingrediente=self.licor_43, volumen=45)
+
+        # Dataframe que retorna el parser en los tests
+        payload = {
+            'sucursal_id': [self.magno_brasserie.id, self.magno_brasserie.id, self.magno_brasserie.id],
+            'caja_id': [self.caja_1.id, self.caja_1.id, self.caja_1.id],
+            'codigo_pos': ['00050', '00081', '00457'],
+            'nombre': ['CARAJILLO', 'LICOR 43', 'APEROL SPRITZ'],
+            'unidades': [3, 1, 1],
+            'importe': [285, 170, 125]
+        }
+        self.df_ventas = pd.DataFrame(payload)
+
+
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
+    def test_procesar_carga_ok(self, mock_parser_lotes):
+        """ Testear que el worker parsea y registra una carga pendiente """
+
+        mock_parser_lotes.return_value = iter([self.df_ventas[:2], self.df_ventas[2:]])
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        carga = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+
+        self.assertEqual(carga.estado, models.CargaVentas.PENDIENTE)
+
+        procesadas = cargas.procesar_pendientes()
+        carga.refresh_from_db()
+
+        self.assertEqual(procesadas, 1)
+        self.assertEqual(carga.estado, models.CargaVentas.TERMINADA)
+        self.assertEqual(carga.filas_parseadas, 3)
+        self.assertEqual(carga.ventas_registradas, 2)
+        self.assertEqual(carga.productos_sin_registro, 1)
+        self.assertEqual(models.Venta.objects.count(), 2)
+
+
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
+    def test_procesar_carga_error_parser(self, mock_parser_lotes):
+        """ Testear que un error del parser se registra en la carga """
+
+        def lotes_con_error(archivo, sucursal):
+            yield self.df_ventas[:2]
+            raise etapas.ErrorParser('Columna inexistente')
+
+        mock_parser_lotes.side_effect = lotes_con_error
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        carga = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+
+        call_command('procesar_ventas')
+        carga.refresh_from_db()
+
+        self.assertEqual(carga.estado, models.CargaVentas.ERROR)
+        self.assertEqual(carga.mensaje_error, 'Hubo un error al procesar el reporte de ventas.')
+        self.assertEqual(models.Venta.objects.count(), 0)
+
+
+    @patch('ventas.registro_parsers.get_parser_lotes', return_value=None)
+    @patch('ventas.parsers.parser_magno_brasserie.parser')
+    def test_procesar_carga_sin_lotes(self, mock_parser, mock_get_parser_lotes):
+        """ Testear que un parser sin lectura por lotes procesa el reporte completo """
+
+        mock_parser.return_value = {'df_ventas': self.df_ventas, 'procesado': True}
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        carga = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+
+        cargas.procesar_pendientes()
+        carga.refresh_from_db()
+
+        self.assertTrue(mock_parser.called)
+        self.assertEqual(carga.estado, models.CargaVentas.TERMINADA)
+        self.assertEqual(carga.filas_parseadas, 3)
+        self.assertEqual(carga.ventas_registradas, 2)
+        self.assertEqual(carga.productos_sin_registro, 1)
+
+
+    @patch('ventas.registro_parsers.get_parser_lotes', return_value=None)
+    @patch('ventas.parsers.parser_magno_brasserie.parser')
+    def test_procesar_carga_sin_lotes_error(self, mock_parser, mock_get_parser_lotes):
+        """ Testear que el error de un parser sin lectura por lotes se registra en la carga """
+
+        mock_parser.return_value = {'df_ventas': {}, 'procesado': False}
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        carga = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+
+        cargas.procesar_pendientes()
+        carga.refresh_from_db()
+
+        self.assertEqual(carga.estado, models.CargaVentas.ERROR)
+        self.assertEqual(carga.mensaje_error, 'Hubo un error al procesar el reporte de ventas.')
+
+
+    @override_settings(VENTAS_PROCESAMIENTO_ASINCRONO=True)
+    @patch('ventas.parsers.parser_magno_brasserie.parser')
+    def test_upload_encola_reporte(self, mock_parser):
+        """ Testear que en modo asíncrono el upload solo encola el reporte """
+
+        url = reverse('ventas:upload_ventas', kwargs={'nombre_sucursal': self.magno_brasserie.slug})
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+
+        res = self.client.post(url, {'ventas_csv': archivo})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTemplateUsed(res, 'ventas/carga.html')
+        self.assertFalse(mock_parser.called)
+        self.assertEqual(models.CargaVentas.objects.filter(estado=models.CargaVentas.PENDIENTE).count(), 1)
+        self.assertEqual(models.Venta.objects.count(), 0)
+
+        # Sin archivo la forma no es válida y no se encola nada
+        res = self.client.post(url, {})
+        self.assertEqual(res.context['mensaje_error'], 'Selecciona el reporte de ventas a subir.')
+        self.assertEqual(models.CargaVentas.objects.count(), 1)
+
+
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
+    def test_estado_carga(self, mock_parser_lotes):
+        """ Testear que el endpoint retorna el progreso de la carga """
+
+        mock_parser_lotes.return_value = iter([self.df_ventas])
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        carga = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+        cargas.procesar_pendientes()
+
+        url = reverse('ventas:estado_carga', kwargs={'carga_id': carga.id})
+        res = self.client.get(url)
+        json_response = res.json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json_response['estado'], 'TERMINADA')
+        self.assertEqual(json_response['filas_parseadas'], 3)
+        self.assertEqual(json_response['ventas_registradas'], 2)
+        self.assertEqual(json_response['productos_sin_registro'], 1)
+
+        # La carga de una sucursal que no es del usuario no se muestra
+        otra_sucursal = models.Sucursal.objects.create(nombre='OTRA', cliente=self.operadora_magno)
+        otra_carga = cargas.encolar(SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV'), otra_sucursal, self.usuario)
+        res = self.client.get(reverse('ventas:estado_carga', kwargs={'carga_id': otra_carga.id}))
+        self.assertEqual(res.status_code, 404)
+
+
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
+    def test_reclamar_cargas_atoradas(self, mock_parser_lotes):
+        """ Testear que las cargas de un worker caído se vuelven a encolar y después se procesan """
+
+        mock_parser_lotes.return_value = iter([self.df_ventas])
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        carga = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+        agotada = cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+
+        # Dos cargas que un worker tomó hace una hora y nunca terminó
+        hace_una_hora = timezone.now() - datetime.timedelta(hours=1)
+        models.CargaVentas.objects.filter(id=carga.id).update(estado=models.CargaVentas.PROCESANDO, timestamp_inicio=hace_una_hora, intentos=1)
+        models.CargaVentas.objects.filter(id=agotada.id).update(estado=models.CargaVentas.PROCESANDO, timestamp_inicio=hace_una_hora, intentos=cargas.MAX_INTENTOS)
+
+        call_command('procesar_ventas', '--minutos-atoradas', '30')
+        carga.refresh_from_db()
+        agotada.refresh_from_db()
+
+        self.assertEqual(carga.estado, models.CargaVentas.TERMINADA)
+        self.assertEqual(carga.intentos, 2)
+        self.assertEqual(models.Venta.objects.count(), 2)
+        self.assertEqual(agotada.estado, models.CargaVentas.ERROR)
+
+
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
+    def test_carga_reclamada_durante_procesamiento(self, mock_parser_lotes):
+        """ Testear que un worker lento no registra una carga que ya fue reclamada """
+
+        mock_parser_lotes.return_value = iter([self.df_ventas])
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+        carga = cargas.tomar_siguiente()
+
+        # La carga se reclama antes de que el worker termine de registrarla
+        self.assertEqual(cargas.reclamar_atoradas(minutos=-1), 1)
+        cargas.procesar(carga)
+
+        carga.refresh_from_db()
+        self.assertEqual(carga.estado, models.CargaVentas.PENDIENTE)
+        self.assertEqual(models.Venta.objects.count(), 0)
+
+
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
+    def test_carga_reclamada_error_worker_anterior(self, mock_parser_lotes):
+        """ Testear que el error de un worker lento no pisa la carga que ya tomó otro worker """
+
+        def lotes_con_error(archivo, sucursal):
+            yield self.df_ventas
+            raise etapas.ErrorParser('reporte defectuoso')
+
+        mock_parser_lotes.side_effect = lotes_con_error
+
+        archivo = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+        cargas.encolar(archivo, self.magno_brasserie, self.usuario)
+
+        with freeze_time('2020-01-01 10:00'):
+            carga_anterior = cargas.tomar_siguiente()
+
+        # La carga se reclama y la toma otro worker
+        with freeze_time('2020-01-01 11:00'):
+            self.assertEqual(cargas.reclamar_atoradas(minutos=30), 1)
+            carga_nueva = cargas.tomar_siguiente()
+        self.assertEqual(carga_nueva.id, carga_anterior.id)
+
+        # El worker anterior falla después de la reclamación
+        cargas.procesar(carga_anterior)
+
+        carga_nueva.refresh_from_db()
+        self.assertEqual(carga_nueva.estado, models.CargaVentas.PROCESANDO)
+        self.assertEqual(carga_nueva.mensaje_error, '')
+        self.assertIsNone(carga_nueva.timestamp_fin)
+        self.assertEqual(carga_nueva.intentos, 2)
+
+        # El worker nuevo sí puede registrar su resultado
+        cargas.procesar(carga_nueva)
+        carga_nueva.refresh_from_db()
+        self.assertEqual(carga_nueva.estado, models.CargaVentas.ERROR)
+        self.assertEqual(carga_nueva.mensaje_error, 'Hubo un error al procesar el reporte de ventas.')
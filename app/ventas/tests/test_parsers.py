@@ -6,8 +6,10 @@ from ventas.parsers import parser_gambinos_saopaulo
 from ventas.parsers import parser_pecos
 from ventas.parsers import parser_kinkin
 from ventas.parsers import parser_demo
+from ventas.parsers import etapas
 
 from core import models
+import io
 import os
 import json
 import pandas as pd
@@ -493,3 +495,164 @@ class ParserDemoTests(TestCase):
         # Comparamos el output esperado contra el real
         self.assertEqual(output_esperado, output_parser)
 
+
+class EtapasTests(TestCase):
+
+    def setUp(self):
+
+        self.df_ventas = pd.DataFrame({
+            'codigo_pos': ['PF001', 'AYD000', 'CVZ002', 'XBEB01', None, 'AYD009'],
+            'nombre': ['PESCADO', 'MAGNO SPRITZ', 'CERVEZA', 'AGUA', 'SIN CODIGO', 'CHARTREUSE VERDE'],
+            'categoria': ['Comida', 'Bebidas', 'Bebidas', 'Bebidas', 'Bebidas', 'Comida'],
+            'unidades': [1, 8, 2, 3, 1, 1],
+            'importe': [280, 1400, 90, 75, 10, 270]
+        })
+
+
+    def test_excluir_igual_a_filtros_secuenciales(self):
+        """ Testear que las exclusiones en una sola pasada equivalen a aplicar los filtros uno por uno """
+
+        exclusiones = {'codigo_pos': ['PF', 'CVZ', 'BEB']}
+
+        df_secuencial = self.df_ventas
+        for patron in exclusiones['codigo_pos']:
+            filtro = df_secuencial.loc[:, 'codigo_pos'].str.contains(patron, na=False, regex=True)
+            df_secuencial = df_secuencial[~filtro]
+
+        df_etapas = etapas.excluir(self.df_ventas, exclusiones)
+
+        self.assertTrue(df_etapas.equals(df_secuencial))
+        self.assertEqual(list(df_etapas.nombre), ['MAGNO SPRITZ', 'SIN CODIGO', 'CHARTREUSE VERDE'])
+
+
+    def test_excluir_varias_columnas(self):
+        """ Testear exclusiones declaradas sobre varias columnas """
+
+        exclusiones = {'codigo_pos': ['CVZ'], 'categoria': ['Comida']}
+
+        df_etapas = etapas.excluir(self.df_ventas, exclusiones)
+
+        self.assertEqual(list(df_etapas.nombre), ['MAGNO SPRITZ', 'AGUA', 'SIN CODIGO'])
+
+
+    def test_excluir_prefijos(self):
+        """ Testear que con prefijo=True solo se excluyen los códigos que inician con el patrón """
+
+        df_etapas = etapas.excluir(self.df_ventas, {'codigo_pos': ['BEB']}, prefijo=True)
+        self.assertIn('AGUA', list(df_etapas.nombre))
+
+        df_etapas = etapas.excluir(self.df_ventas, {'codigo_pos': ['XBEB']}, prefijo=True)
+        self.assertNotIn('AGUA', list(df_etapas.nombre))
+
+
+    def test_excluir_columna_numerica(self):
+        """ Testear que las exclusiones también se aplican a columnas que no son de texto """
+
+        df_etapas = etapas.excluir(self.df_ventas, {'importe': ['90', '75']})
+
+        self.assertEqual(list(df_etapas.nombre), ['PESCADO', 'MAGNO SPRITZ', 'SIN CODIGO', 'CHARTREUSE VERDE'])
+
+
+    def test_normalizar(self):
+        """ Testear que se agregan los ids y se ordenan las columnas """
+
+        df_ventas = etapas.excluir_nulos(self.df_ventas, ['codigo_pos'])
+        df_ventas = etapas.normalizar(df_ventas, 1, 2)
+
+        self.assertEqual(list(df_ventas.columns), ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe'])
+        self.assertEqual(len(df_ventas), 5)
+        self.assertEqual(set(df_ventas.sucursal_id), {1})
+        self.assertEqual(set(df_ventas.caja_id), {2})
+
+
+class ParserLotesTests(TestCase):
+
+    def setUp(self):
+
+        self.directorio = os.path.dirname(os.path.realpath(__file__))
+
+        # Cliente
+        self.operadora = models.Cliente.objects.create(nombre='OPERADORA')
+        # Sucursales, almacenes y cajas de cada parser
+        self.sucursales = {}
+        for nombre in ('MAGNO-BRASSERIE', 'GAMBINOS-SAOPAULO', 'PECOS', 'KINKIN', 'DEMO'):
+            sucursal = models.Sucursal.objects.create(nombre=nombre, cliente=self.operadora)
+            almacen = models.Almacen.objects.create(nombre='BARRA DEMO' if nombre == 'DEMO' else 'BARRA 1', numero=1, sucursal=sucursal)
+            models.Caja.objects.create(numero=1, nombre='CAJA 1', almacen=almacen)
+            self.sucursales[nombre] = sucursal
+
+
+    def comparar(self, modulo, archivo, sucursal, df_completo, tamano_lote=7):
+        """ Compara el output por lotes contra el reporte completo transformado de una sola vez """
+
+        caja = sucursal.almacenes.all()[0].cajas.all()[0]
+        df_esperado = modulo.transformar(df_completo, sucursal.id, caja.id).reset_index(drop=True)
+
+        lotes = list(modulo.parser_lotes(os.path.join(self.directorio, archivo), sucursal, tamano_lote=tamano_lote))
+        df_lotes = pd.concat(lotes, ignore_index=True)
+
+        self.assertGreater(len(lotes), 1)
+        self.assertTrue(all(len(lote) <= tamano_lote for lote in lotes))
+        pd.testing.assert_frame_equal(df_esperado, df_lotes)
+
+
+    def test_lotes_csv(self):
+        """ Testear que los parsers de CSV producen el mismo output leyendo por lotes """
+
+        archivo = os.path.join(self.directorio, 'ventas_kinkin.csv')
+        self.comparar(parser_kinkin, 'ventas_kinkin.csv', self.sucursales['KINKIN'], pd.read_csv(archivo, lineterminator='\r'))
+
+        archivo = os.path.join(self.directorio, 'ventas_demo.csv')
+        self.comparar(parser_demo, 'ventas_demo.csv', self.sucursales['DEMO'], pd.read_csv(archivo), tamano_lote=2)
+
+
+    def test_lotes_excel(self):
+        """ Testear que los parsers de Excel producen el mismo output leyendo fila por fila """
+
+        archivo = os.path.join(self.directorio, 'ventas_pecos.XLS')
+        df_completo = pd.read_excel(archivo, header=4, skipfooter=1, dtype={'CLAVE': str, 'VENTA_TOTAL': str})
+        self.comparar(parser_pecos, 'ventas_pecos.XLS', self.sucursales['PECOS'], df_completo)
+
+        # Leer fila por fila produce el mismo dataframe que pd.read_excel
+        archivo = os.path.join(self.directorio, 'ventas_magno_brasserie.xls')
+        df_completo = pd.read_excel(archivo, header=None, skiprows=9, skipfooter=5)
+        df_lotes = pd.concat(etapas.leer_excel_por_lotes(archivo, 10, header=None, skiprows=9, skipfooter=5), ignore_index=True)
+        pd.testing.assert_frame_equal(df_completo, df_lotes)
+
+
+    def test_lotes_xlsx(self):
+        """ Testear la lectura fila por fila de archivos .xlsx """
+
+        archivo = os.path.join(self.directorio, 'ventas_gambinos_saopaulo.xlsx')
+        df_completo = pd.read_excel(archivo, header=None, skiprows=1, dtype=object, engine='openpyxl')
+        self.comparar(parser_gambinos_saopaulo, 'ventas_gambinos_saopaulo.xlsx', self.sucursales['GAMBINOS-SAOPAULO'], df_completo)
+
+
+    def test_lotes_xlsx_archivo(self):
+        """ Testear que un .xlsx se lee desde el archivo sin cargarlo completo en memoria """
+
+        lecturas = []
+
+        class Archivo(io.FileIO):
+            def read(self, size=-1):
+                datos = super().read(size)
+                lecturas.append(len(datos))
+                return datos
+
+        ruta = os.path.join(self.directorio, 'ventas_gambinos_saopaulo.xlsx')
+        with Archivo(ruta) as archivo:
+            df_lotes = pd.concat(etapas.leer_excel_por_lotes(archivo, 10, header=None, skiprows=1, dtype=object), ignore_index=True)
+
+        df_completo = pd.read_excel(ruta, header=None, skiprows=1, dtype=object, engine='openpyxl')
+        pd.testing.assert_frame_equal(df_completo, df_lotes)
+        # Ninguna lectura trae el archivo completo
+        self.assertLess(max(lecturas), os.path.getsize(ruta))
+
+
+    def test_lotes_error(self):
+        """ Testear que un reporte defectuoso arroja ErrorParser """
+
+        archivo = os.path.join(self.directorio, 'reporte_defectuoso.csv')
+
+        with self.assertRaises(etapas.ErrorParser):
+            list(parser_kinkin.parser_lotes(archivo, self.sucursales['KINKIN']))
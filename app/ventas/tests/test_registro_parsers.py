@@ -0,0 +1,148 @@
+from django.test import TestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
+
+from core import models
+from ventas import registro_parsers
+from ventas.parsers import parser_magno_brasserie
+
+import io
+
+
+FORMATOS_TEST = {
+    'parser_formato_test': {
+        'lector': 'csv',
+        'opciones_lectura': {'dtype': {'Clave': str}},
+        'columnas': {
+            'Clave': 'codigo_pos',
+            'Descripcion': 'nombre',
+            'Grupo': 'categoria',
+            'Cantidad': 'unidades',
+            'Total': 'importe',
+        },
+        'excluir': {'categoria': ['REFRESCOS', 'CERVEZAS']},
+        'omitir_unidades_cero': True,
+        'almacen': 'BARRA 1',
+    }
+}
+
+
+class RegistroParsersTests(TestCase):
+
+    def setUp(self):
+
+        # Cliente
+        self.operadora_magno = models.Cliente.objects.create(nombre='MAGNO BRASSERIE')
+        # Sucursal
+        self.magno_brasserie = models.Sucursal.objects.create(nombre='MAGNO-BRASSERIE', cliente=self.operadora_magno)
+        # Almacenes
+        self.bodega = models.Almacen.objects.create(nombre='BODEGA', numero=2, sucursal=self.magno_brasserie, tipo='0')
+        self.barra_1 = models.Almacen.objects.create(nombre='BARRA 1', numero=1, sucursal=self.magno_brasserie)
+        # Cajas
+        self.caja_bodega = models.Caja.objects.create(numero=1, nombre='CAJA BODEGA', almacen=self.bodega)
+        self.caja_1 = models.Caja.objects.create(numero=1, nombre='CAJA 1', almacen=self.barra_1)
+
+
+    def tearDown(self):
+        # Regresamos el registro a la configuración original
+        registro_parsers.cargar()
+
+
+    def test_parser_default_slug(self):
+        """ Testear que una sucursal sin configuración usa el parser de su slug """
+
+        parser = registro_parsers.get_parser(self.magno_brasserie)
+
+        self.assertEqual(parser, parser_magno_brasserie.parser)
+
+
+    def test_parser_configurado(self):
+        """ Testear que VENTAS_PARSERS asigna el parser de la sucursal """
+
+        with override_settings(VENTAS_PARSERS={'MAGNO-BRASSERIE': {'parser': 'parser_pecos'}}):
+            parser = registro_parsers.get_parser(self.magno_brasserie)
+
+        self.assertEqual(parser.__module__, 'ventas.parsers.parser_pecos')
+
+
+    def test_parser_inexistente(self):
+        """ Testear que una sucursal sin parser retorna None """
+
+        sucursal = models.Sucursal.objects.create(nombre='SIN PARSER', cliente=self.operadora_magno)
+
+        self.assertIsNone(registro_parsers.get_parser(sucursal))
+
+
+    def test_configuracion_invalida(self):
+        """ Testear que la configuración se valida al cargar el registro """
+
+        with override_settings(VENTAS_PARSERS={'MAGNO-BRASSERIE': {'parser': 'parser_no_existe'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                registro_parsers.cargar()
+
+
+    def test_caja_un_query(self):
+        """ Testear que la caja por defecto se consulta con un solo query """
+
+        with self.assertNumQueries(1):
+            caja = registro_parsers.get_caja(self.magno_brasserie, 'BARRA 1')
+
+        self.assertEqual(caja, self.caja_1)
+
+
+    def test_caja_almacen_configurado(self):
+        """ Testear que el almacén de VENTAS_PARSERS tiene prioridad sobre el del parser """
+
+        with override_settings(VENTAS_PARSERS={'MAGNO-BRASSERIE': {'almacen': 'BODEGA'}}):
+            caja = registro_parsers.get_caja(self.magno_brasserie, 'BARRA 1')
+
+        self.assertEqual(caja, self.caja_bodega)
+
+
+    def test_caja_actualizada(self):
+        """ Testear que al modificar las cajas se toma la caja nueva """
+
+        registro_parsers.get_caja(self.magno_brasserie, 'BARRA 1')
+        self.caja_1.delete()
+        caja_2 = models.Caja.objects.create(numero=2, nombre='CAJA 2', almacen=self.barra_1)
+
+        self.assertEqual(registro_parsers.get_caja(self.magno_brasserie, 'BARRA 1'), caja_2)
+
+
+    def test_parser_declarativo(self):
+        """ Testear un formato de POS declarado en VENTAS_FORMATOS """
+
+        with override_settings(
+            VENTAS_FORMATOS=FORMATOS_TEST,
+            VENTAS_PARSERS={'MAGNO-BRASSERIE': {'parser': 'parser_formato_test'}}
+        ):
+            registro_parsers.cargar()
+            parser = registro_parsers.get_parser(self.magno_brasserie)
+
+        reporte = io.StringIO(
+            'Clave,Descripcion,Grupo,Cantidad,Total\n'
+            '00081,LICOR 43,LICORES,2,"$1,340.50"\n'
+            '00900,COCA COLA,REFRESCOS,5,$150.00\n'
+            '00050,CARAJILLO,LICORES,0,$0.00\n'
+            ',SIN CODIGO,LICORES,1,$10.00\n'
+            '00126,HERRADURA BLANCO,TEQUILAS,1.0,$112.00\n'
+        )
+
+        resultado = parser(reporte, self.magno_brasserie)
+        df_ventas = resultado['df_ventas']
+
+        self.assertTrue(resultado['procesado'])
+        self.assertEqual(list(df_ventas.columns), ['sucursal_id', 'caja_id', 'codigo_pos', 'nombre', 'unidades', 'importe'])
+        self.assertEqual(list(df_ventas.codigo_pos), ['00081', '00126'])
+        self.assertEqual(list(df_ventas.unidades), [2, 1])
+        self.assertEqual(list(df_ventas.importe), [1340, 112])
+        self.assertEqual(list(df_ventas.caja_id), [self.caja_1.id, self.caja_1.id])
+
+
+    def test_formato_invalido(self):
+        """ Testear que un formato sin las columnas requeridas no se acepta """
+
+        formato = {'parser_incompleto': {'lector': 'csv', 'columnas': {'Clave': 'codigo_pos'}}}
+
+        with override_settings(VENTAS_FORMATOS=formato):
+            with self.assertRaises(ImproperlyConfigured):
+                registro_parsers.cargar()
@@ -11,6 +11,7 @@ from ventas import views
 from ventas import parsers
 from ventas import ventas_consumos
 from ventas import forms
+from ventas.parsers import etapas
 from ventas.views import UploadVentas
 
 
@@ -187,8 +188,9 @@ class TemplateTests(TestCase):
 
 
     #@patch('ventas.views.parser_ventas.parser') # Mockeamos el modulo 'parser_ventas' y su método 'parser' 
+    @patch('ventas.registro_parsers.get_parser_lotes', return_value=None)
     @patch('ventas.parsers.parser_magno_brasserie.parser')
-    def test_post_reporte_ventas(self, mock_parser):
+    def test_post_reporte_ventas(self, mock_parser, mock_get_parser_lotes):
         """ Testear que se sube el reporte de ventas correctamente """
 
         # Definimos el dataframe fake arrojado por el módulo 'parser_magno_braserie'
@@ -241,8 +243,46 @@ class TemplateTests(TestCase):
         #mock_parser.assert_called_with(archivo_subido, sucursal)
         
 
+    @patch('ventas.parsers.parser_magno_brasserie.parser_lotes')
     @patch('ventas.parsers.parser_magno_brasserie.parser')
-    def test_post_reporte_ventas_parser_error(self, mock_parser):
+    def test_post_reporte_ventas_lotes(self, mock_parser, mock_parser_lotes):
+        """ Testear que el upload registra por lotes cuando el parser de la sucursal lo soporta """
+
+        df_ventas_dummy = pd.DataFrame({
+            'sucursal_id': [self.magno_brasserie.id, self.magno_brasserie.id],
+            'caja_id': [self.caja_1.id, self.caja_1.id],
+            'codigo_pos': ['00050', '00081'],
+            'nombre': ['CARAJILLO', 'LICOR 43'],
+            'unidades': [3, 1],
+            'importe': [285, 170]
+        })
+        mock_parser_lotes.return_value = iter([df_ventas_dummy.iloc[:1], df_ventas_dummy.iloc[1:]])
+
+        url = reverse('ventas:upload_ventas', kwargs={'nombre_sucursal': self.magno_brasserie.slug})
+        archivo_ventas = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+
+        res = self.client.post(url, {'ventas_csv': archivo_ventas}, follow=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(mock_parser.called)
+        self.assertEqual(res.context['resultado_parser']['procesado'], True)
+        self.assertEqual(res.context['resultado_parser']['totales']['filas'], 2)
+
+        # Un error en cualquier lote se reporta al usuario
+        def lotes_con_error(archivo, sucursal):
+            yield df_ventas_dummy
+            raise etapas.ErrorParser('reporte defectuoso')
+
+        mock_parser_lotes.side_effect = lotes_con_error
+        archivo_ventas = SimpleUploadedFile('ventas.csv', b'Este es un archivo CSV')
+
+        res = self.client.post(url, {'ventas_csv': archivo_ventas}, follow=True)
+        self.assertEqual(res.context['mensaje_error'], 'Hubo un error al procesar el reporte de ventas.')
+
+
+    @patch('ventas.registro_parsers.get_parser_lotes', return_value=None)
+    @patch('ventas.parsers.parser_magno_brasserie.parser')
+    def test_post_reporte_ventas_parser_error(self, mock_parser, mock_get_parser_lotes):
         """ Testear cuando el parser retorna error al procesar el reporte de ventas """
 
         # Definimos la respuesta predeterminada del mock_parser
@@ -184,7 +184,127 @@ class VentasConsumosTests(TestCase):
         self.assertEqual(productos_sin_registro, 1)
 
 
+    def test_consumos_multiples_ingredientes(self):
+        """ Testear que se registra el consumo de cada ingrediente de la receta """
 
+        # Agregamos un segundo ingrediente al carajillo
+        models.IngredienteReceta.objects.create(receta=self.carajillo, ingrediente=self.herradura_blanco, volumen=15)
 
+        payload = {
+            'sucursal_id': [self.magno_brasserie.id, self.magno_brasserie.id],
+            'caja_id': [self.caja_1.id, self.caja_1.id],
+            'codigo_pos': ['00050', '00081'],
+            'nombre': ['CARAJILLO', 'LICOR 43'],
+            'unidades': [3, 1],
+            'importe': [285, 170]
+        }
+
+        df_test = pd.DataFrame(payload)
+
+        resultado = ventas_consumos.registrar(df_test, self.magno_brasserie)
+
+        venta_carajillo = models.Venta.objects.get(receta=self.carajillo)
+        consumos_carajillo = models.ConsumoRecetaVendida.objects.filter(venta=venta_carajillo)
+
+        self.assertEqual(consumos_carajillo.count(), 2)
+        self.assertEqual(consumos_carajillo.get(ingrediente=self.licor_43).volumen, 135)
+        self.assertEqual(consumos_carajillo.get(ingrediente=self.herradura_blanco).volumen, 45)
+        self.assertEqual(len(resultado['ventas_consumos']), 2)
+        self.assertEqual(len(resultado['ventas_consumos'][0]['consumos']), 2)
+
+
+    def test_numero_queries_constante(self):
+        """ Testear que el número de queries no depende del número de filas del reporte """
+
+        codigos = ['00050', '00126', '00167', '00081', '00457']
+        filas = 200
+
+        payload = {
+            'sucursal_id': [self.magno_brasserie.id] * filas,
+            'caja_id': [self.caja_1.id] * filas,
+            'codigo_pos': [codigos[i % len(codigos)] for i in range(filas)],
+            'nombre': ['PRODUCTO {}'.format(i) for i in range(filas)],
+            'unidades': [1] * filas,
+            'importe': [100] * filas
+        }
+
+        df_test = pd.DataFrame(payload)
+
+        # 3 lecturas (recetas, cajas, ingredientes) + 3 bulk inserts + savepoint
+        with self.assertNumQueries(8):
+            resultado = ventas_consumos.registrar(df_test, self.magno_brasserie)
+
+        self.assertEqual(models.Venta.objects.count(), 160)
+        self.assertEqual(models.ConsumoRecetaVendida.objects.count(), 160)
+        self.assertEqual(len(resultado['productos_no_registrados']), 40)
+
+
+    def test_registrar_lotes(self):
+        """ Testear que el registro por lotes reutiliza el catálogo y retorna los totales """
+
+        codigos = ['00050', '00126', '00167', '00081', '00457']
+        filas = 200
+
+        payload = {
+            'sucursal_id': [self.magno_brasserie.id] * filas,
+            'caja_id': [self.caja_1.id] * filas,
+            'codigo_pos': [codigos[i % len(codigos)] for i in range(filas)],
+            'nombre': ['PRODUCTO {}'.format(i) for i in range(filas)],
+            'unidades': [1] * filas,
+            'importe': [100] * filas
+        }
+
+        df_test = pd.DataFrame(payload)
+        lotes = (df_test[i:i + 50] for i in range(0, filas, 50))
+
+        # El primer lote resuelve el catálogo (3 lecturas); cada lote hace 3 bulk inserts; + savepoint
+        with self.assertNumQueries(3 + 4 * 3 + 2):
+            totales = ventas_consumos.registrar_lotes(lotes, self.magno_brasserie)
+
+        self.assertEqual(totales, {'filas': 200, 'ventas': 160, 'consumos': 160, 'productos_no_registrados': 40})
+        self.assertEqual(models.Venta.objects.count(), 160)
+        self.assertEqual(models.ConsumoRecetaVendida.objects.count(), 160)
+        self.assertEqual(models.ProductoSinRegistro.objects.count(), 40)
+
+
+    def test_registrar_lotes_error(self):
+        """ Testear que si un lote falla no se registra ningún lote del reporte """
+
+        payload = {
+            'sucursal_id': [self.magno_brasserie.id] * 2,
+            'caja_id': [self.caja_1.id] * 2,
+            'codigo_pos': ['00050', '00081'],
+            'nombre': ['CARAJILLO', 'LICOR 43'],
+            'unidades': [1, 1],
+            'importe': [100, 100]
+        }
+
+        def lotes():
+            yield pd.DataFrame(payload)
+            raise ValueError('Reporte incompleto')
+
+        with self.assertRaises(ValueError):
+            ventas_consumos.registrar_lotes(lotes(), self.magno_brasserie)
+
+        self.assertEqual(models.Venta.objects.count(), 0)
+        self.assertEqual(models.ConsumoRecetaVendida.objects.count(), 0)
+
+
+    def test_consumos_almacen_sucursal(self):
+        """ Testear que los consumos registrados guardan el almacén y la sucursal de la venta """
+
+        payload = {
+            'sucursal_id': [self.magno_brasserie.id] * 2,
+            'caja_id': [self.caja_1.id] * 2,
+            'codigo_pos': ['00050', '00081'],
+            'nombre': ['CARAJILLO', 'LICOR 43'],
+            'unidades': [1, 1],
+            'importe': [100, 100]
+        }
+
+        ventas_consumos.registrar(pd.DataFrame(payload), self.magno_brasserie)
 
+        consumos = models.ConsumoRecetaVendida.objects.all()
 
+        self.assertTrue(consumos.exists())
+        self.assertEqual(consumos.filter(almacen=self.caja_1.almacen, sucursal=self.magno_brasserie).count(), consumos.count())
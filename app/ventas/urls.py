@@ -8,5 +8,6 @@ app_name = 'ventas'
 urlpatterns = [
     path('upload/', views.upload, name='upload'),
     path('upload/<slug:nombre_sucursal>/', views.upload_reporte_ventas, name='upload_ventas'),
-    path('upload-class/<slug:nombre_sucursal>/', views.UploadVentas.as_view(), name='upload_file')
+    path('upload-class/<slug:nombre_sucursal>/', views.UploadVentas.as_view(), name='upload_file'),
+    path('cargas/<int:carga_id>/', views.estado_carga, name='estado_carga'),
 ]
\ No newline at end of file
@@ -1,103 +1,187 @@
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 
 import pandas as pd
 import datetime
 from core import models
 
 
-# def registrar(df_ventas, sucursal):
-#     df_ventas = df_ventas
-#     sucursal = sucursal
+"""
+-----------------------------------------------------------------------------------
+Registra las ventas y consumos de un reporte de ventas parseado.
 
-#     return True
+El registro se hace por lotes: primero resolvemos todas las recetas, cajas e
+ingredientes del reporte con unas cuantas queries y después guardamos las
+Ventas, ConsumosRecetaVendida y ProductosSinRegistro con 'bulk_create' dentro
+de una sola transacción.
+-----------------------------------------------------------------------------------
+"""
+def registrar(df_ventas, sucursal):
 
+    ayer = datetime.date.today() - datetime.timedelta(days=1)
 
-def registrar(df_ventas, sucursal):
+    with transaction.atomic():
+        consumos_ventas, productos_no_registrados = registrar_lote(df_ventas, sucursal, ayer, nuevo_catalogo())
 
     total_ventas_consumos = []
+    for (venta, consumos) in consumos_ventas:
+        total_ventas_consumos.append({'venta': str(venta), 'consumos': [str(consumo) for consumo in consumos]})
+
+    return {'ventas_consumos': total_ventas_consumos, 'productos_no_registrados': productos_no_registrados}
+
+
+"""
+-----------------------------------------------------------------------------------
+Registra las ventas y consumos de un reporte leído por lotes (ver
+'parser_lotes' en 'ventas.parsers'). Cada lote se guarda y se descarta antes de
+leer el siguiente, así que la memoria no crece con el tamaño del reporte. Las
+recetas, cajas e ingredientes ya resueltos se reutilizan entre lotes.
+
+Todos los lotes se registran en una sola transacción: si un lote falla no se
+guarda nada del reporte. Retorna el número de filas, ventas, consumos y
+productos sin registro.
+-----------------------------------------------------------------------------------
+"""
+def registrar_lotes(lotes, sucursal):
+
     ayer = datetime.date.today() - datetime.timedelta(days=1)
+    catalogo = nuevo_catalogo()
+
+    totales = {'filas': 0, 'ventas': 0, 'consumos': 0, 'productos_no_registrados': 0}
+
+    with transaction.atomic():
+        for df_lote in lotes:
+            consumos_ventas, productos_no_registrados = registrar_lote(df_lote, sucursal, ayer, catalogo)
+
+            totales['filas'] += len(df_lote)
+            totales['ventas'] += len(consumos_ventas)
+            totales['consumos'] += sum(len(consumos) for (_, consumos) in consumos_ventas)
+            totales['productos_no_registrados'] += len(productos_no_registrados)
+
+    return totales
+
+
+"""
+-----------------------------------------------------------------------------------
+Catálogo de recetas, cajas e ingredientes ya consultados durante un registro
+-----------------------------------------------------------------------------------
+"""
+def nuevo_catalogo():
+    return {
+        'recetas': {},              # codigo_pos -> Receta
+        'codigos_sin_receta': set(),
+        'cajas': {},                # caja_id -> Caja
+        'ingredientes': {},         # receta_id -> [(Ingrediente, volumen)]
+    }
+
+
+def actualizar_catalogo(catalogo, filas, sucursal):
+
+    recetas = catalogo['recetas']
+    cajas = catalogo['cajas']
+    ingredientes_recetas = catalogo['ingredientes']
+
+    # Tomamos los códigos POS y las cajas que todavía no conocemos
+    codigos_pos = {str(codigo_pos) for (_, _, codigo_pos, _, _, _) in filas}
+    codigos_pos = codigos_pos - recetas.keys() - catalogo['codigos_sin_receta']
+    cajas_id = {caja_id for (_, caja_id, _, _, _, _) in filas} - cajas.keys()
+
+    if codigos_pos:
+        # Mapeamos cada 'codigo_pos' a su Receta. Si hay códigos repetidos nos quedamos con la primera receta
+        recetas_nuevas = {}
+        for receta in models.Receta.objects.filter(sucursal=sucursal, codigo_pos__in=codigos_pos).order_by('id'):
+            recetas_nuevas.setdefault(receta.codigo_pos, receta)
+
+        recetas.update(recetas_nuevas)
+        catalogo['codigos_sin_receta'].update(codigos_pos - recetas_nuevas.keys())
+
+        # Mapeamos cada receta a sus ingredientes y el volumen de cada uno
+        ingredientes_receta_qs = models.IngredienteReceta.objects.filter(receta__in=recetas_nuevas.values()).select_related('ingrediente').order_by('id')
+        for item in ingredientes_receta_qs:
+            ingredientes_recetas.setdefault(item.receta_id, []).append((item.ingrediente, item.volumen))
+
+    # Mapeamos cada 'caja_id' a su Caja
+    if cajas_id:
+        cajas.update(models.Caja.objects.in_bulk(cajas_id))
+
+
+"""
+-----------------------------------------------------------------------------------
+Registra un lote de ventas. Debe llamarse dentro de una transacción.
+-----------------------------------------------------------------------------------
+"""
+def registrar_lote(df_ventas, sucursal, fecha, catalogo):
+
+    filas = list(df_ventas.itertuples(index=False, name=None))
+
+    """
+    -----------------------------------------------------------
+    Resolvemos recetas, cajas e ingredientes del lote
+    -----------------------------------------------------------
+    """
+    actualizar_catalogo(catalogo, filas, sucursal)
+
+    recetas = catalogo['recetas']
+    cajas = catalogo['cajas']
+    ingredientes_recetas = catalogo['ingredientes']
+
+    """
+    -----------------------------------------------------------
+    Construimos las Ventas y los ProductosSinRegistro
+    -----------------------------------------------------------
+    """
+    ventas = []
     productos_no_registrados = []
 
-    for (sucursal_id, caja_id, codigo_pos, nombre, unidades, importe) in df_ventas.itertuples(index=False, name=None):
+    for (sucursal_id, caja_id, codigo_pos, nombre, unidades, importe) in filas:
 
-        # Checamos si existe la receta en la base de datos
-        try:
-            receta = models.Receta.objects.get(codigo_pos=codigo_pos, sucursal=sucursal)
+        receta = recetas.get(str(codigo_pos))
 
-        # Si la receta no existe
-        except ObjectDoesNotExist:
-            #sin_registro = [sucursal.slug, codigo_pos, nombre]
-            sin_registro = models.ProductoSinRegistro.objects.create(
-                #sucursal=sucursal.slug,
+        # Si la receta no existe, la registramos como ProductoSinRegistro
+        if receta is None:
+            productos_no_registrados.append(models.ProductoSinRegistro(
                 sucursal=sucursal,
                 codigo_pos=codigo_pos,
                 caja=caja_id,
                 nombre=nombre,
                 unidades=unidades,
                 importe=importe
-                )
-            productos_no_registrados.append(sin_registro)
-
+            ))
 
         else:
-
-            """
-            -----------------------------------------------------------
-            Registrar la venta de la receta
-            -----------------------------------------------------------
-            """
-            receta = models.Receta.objects.get(codigo_pos=codigo_pos, sucursal=sucursal)
-            caja = models.Caja.objects.get(id=caja_id)
-
-            venta = models.Venta.objects.create(
+            ventas.append(models.Venta(
                 receta=receta,
                 sucursal=sucursal,
-                fecha=ayer,
+                fecha=fecha,
                 unidades=unidades,
                 importe=importe,
-                caja=caja
+                caja=cajas[caja_id]
+            ))
+
+    """
+    -----------------------------------------------------------
+    Guardamos el lote
+    -----------------------------------------------------------
+    """
+    productos_no_registrados = models.ProductoSinRegistro.objects.bulk_create(productos_no_registrados)
+    ventas = models.Venta.objects.bulk_create(ventas)
+
+    # Tomamos el volumen consumido por ingrediente y lo multiplicamos por las unidades vendidas
+    consumos_ventas = []
+    for venta in ventas:
+        consumos = [
+            models.ConsumoRecetaVendida(
+                ingrediente=ingrediente,
+                receta=venta.receta,
+                venta=venta,
+                fecha=fecha,
+                volumen=volumen * venta.unidades,
+                almacen_id=venta.caja.almacen_id,
+                sucursal=sucursal
             )
+            for (ingrediente, volumen) in ingredientes_recetas.get(venta.receta_id, [])
+        ]
+        consumos_ventas.append((venta, consumos))
 
+    models.ConsumoRecetaVendida.objects.bulk_create([consumo for (_, consumos) in consumos_ventas for consumo in consumos])
 
-            """
-            -----------------------------------------------------------
-            Registrar el consumo de ingredientes generado por la venta
-            -----------------------------------------------------------
-            """
-            # Seleccionamos los ingredientes de la receta
-            ingredientes_receta = receta.ingredientes.all()
-
-            # Tomamos el volumen consumido por ingrediente y lo multiplicamos por las unidades vendidas
-            for item in ingredientes_receta:
-                consumos = []
-                ingrediente = item
-                it = models.IngredienteReceta.objects.get(receta=receta, ingrediente=ingrediente)
-                volumen = it.volumen
-                volumen_total = volumen * unidades
-
-                # Guardamos el consumo en la base de datos
-                consumo = models.ConsumoRecetaVendida.objects.create(
-                    ingrediente=ingrediente,
-                    receta=receta,
-                    venta=venta,
-                    fecha=ayer,
-                    volumen=volumen_total
-                )
-
-                #consumos.append(consumo)
-                consumos.append(str(consumo))
-
-            #total_ventas_consumos.append({'venta': venta, 'consumos': consumos})
-            total_ventas_consumos.append({'venta': str(venta), 'consumos': consumos})
-            
-    return {'ventas_consumos': total_ventas_consumos, 'productos_no_registrados': productos_no_registrados}
-        
-
-
-
-
-
-
-
-
-
+    return consumos_ventas, productos_no_registrados
@@ -1,14 +1,18 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseForbidden, HttpResponseRedirect
+from django.http import Http404, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views import View
+from django.conf import settings
 
-from importlib import import_module
-from core.models import Sucursal
+from core.models import Sucursal, CargaVentas
 from ventas import forms
+from ventas import cargas
+from ventas import registro_parsers
 from ventas import parser_ventas
 from ventas import parsers
 from ventas import ventas_consumos
+from ventas.parsers import etapas
+from inventarios import permissions
 
 
 def upload(request):
@@ -35,8 +39,16 @@ def upload_reporte_ventas(request, nombre_sucursal):
 
     if request.method == 'POST':
 
+        # Validamos el archivo con la forma antes de parsearlo o encolarlo
+        # (el input del template se llama 'ventas_csv')
+        form = forms.VentasForm(request.POST, {'reporte_ventas': request.FILES.get('ventas_csv')})
+
+        if not form.is_valid():
+            mensaje_error = 'Selecciona el reporte de ventas a subir.'
+            return render(request, 'ventas/upload_ventas.html', {'mensaje_error': mensaje_error})
+
         # Guardamos el reporte de ventas en una variable
-        ventas_csv = request.FILES['ventas_csv']
+        ventas_csv = form.cleaned_data['reporte_ventas']
 
         # Definimos los tipos de archivos permitidos
         extensiones_permitidas = ['csv', 'xlsx', 'xls', 'XLS']
@@ -52,21 +64,39 @@ def upload_reporte_ventas(request, nombre_sucursal):
 
         sucursal = Sucursal.objects.get(slug=nombre_sucursal)
 
-        # Creamos nuestra forma con los datos del POST request
-        form = forms.VentasForm(request.POST, request.FILES)
+        # Si el procesamiento asíncrono está activo, encolamos el reporte y
+        # dejamos que el worker lo parsee y registre
+        if settings.VENTAS_PROCESAMIENTO_ASINCRONO:
+            carga = cargas.encolar(ventas_csv, sucursal, request.user)
+            return render(request, 'ventas/carga.html', {'carga': carga, 'sucursal': sucursal})
 
         """
         ------------------------------------------------------
         PARSEAMOS EL REPORTE DE VENTAS
         ------------------------------------------------------
         """
-        # Construimos el nombre del parser a importar y lo importamos dinámicamente
-        nombre_parser = 'parser_' + (sucursal.slug).replace('-', '_').lower()
-        parser_ventas = import_module('ventas.parsers.' + nombre_parser)
+        # Si el parser de la sucursal lee por lotes, registramos el reporte lote por
+        # lote sin cargarlo completo en memoria
+        parser_lotes = registro_parsers.get_parser_lotes(sucursal)
+
+        if parser_lotes is not None:
+            try:
+                totales = ventas_consumos.registrar_lotes(parser_lotes(ventas_csv, sucursal), sucursal)
+            except etapas.ErrorParser:
+                mensaje_error = 'Hubo un error al procesar el reporte de ventas.'
+                return render(request, 'ventas/upload_ventas.html', {'mensaje_error': mensaje_error})
+
+            return render(request, 'ventas/success.html', {'resultado_parser': {'procesado': True, 'totales': totales}})
+
+        # Tomamos el parser de la sucursal del registro de parsers
+        parser_sucursal = registro_parsers.get_parser(sucursal)
+
+        if parser_sucursal is None:
+            mensaje_error = 'No hay un parser configurado para esta sucursal.'
+            return render(request, 'ventas/upload_ventas.html', {'mensaje_error': mensaje_error})
 
         # Alimentamos el reporte de ventas al parser y lo corremos
-        #resultado_parser = parser_ventas.parser(ventas_csv, sucursal)
-        resultado_parser = parser_ventas.parser(ventas_csv, sucursal)
+        resultado_parser = parser_sucursal(ventas_csv, sucursal)
 
         # Si hay un error con el reporte de ventas, notificar al usuario
         if resultado_parser['procesado'] == False:
@@ -91,6 +121,37 @@ def upload_reporte_ventas(request, nombre_sucursal):
         return render (request, 'ventas/success.html', {'resultado_parser': resultado_parser})
 
 
+"""
+-----------------------------------------------------------------------------------
+VIEW QUE RETORNA EL PROGRESO DE UNA CARGA DE VENTAS
+-----------------------------------------------------------------------------------
+"""
+@login_required
+def estado_carga(request, carga_id):
+
+    carga = get_object_or_404(CargaVentas, id=carga_id)
+
+    # Solo se muestran las cargas de las sucursales del usuario
+    if not permissions.tiene_sucursal(request.user, carga.sucursal_id):
+        raise Http404()
+
+    data = {
+        'id': carga.id,
+        'sucursal': carga.sucursal_id,
+        'estado': carga.get_estado_display(),
+        'intentos': carga.intentos,
+        'filas_parseadas': carga.filas_parseadas,
+        'ventas_registradas': carga.ventas_registradas,
+        'productos_sin_registro': carga.productos_sin_registro,
+        'mensaje_error': carga.mensaje_error,
+        'timestamp_alta': carga.timestamp_alta,
+        'timestamp_inicio': carga.timestamp_inicio,
+        'timestamp_fin': carga.timestamp_fin,
+    }
+
+    return JsonResponse(data)
+
+
 """
 --------------------------------------
 CLASS-BASED VIEW DE UPLOAD_VENTAS